@@ -0,0 +1,381 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+API性能测试
+
+在进程内启动完整的应用（含全部中间件），连接一个预先生成数据的临时SQLite数据库，
+用 httpx.ASGITransport 按真实比例混合请求：
+
+    登录、我的工单、工单详情、完成工单、统计、工作内容/材料搜索
+
+每个并发用户先登录，再在测试时长内随机发起请求。结果按接口统计
+请求数、错误数、p50/p95/p99/平均延迟和请求/秒，写入JSON文件
+（键有序、每个接口一行，便于在不同提交之间diff），
+并可与之前的结果对比。
+
+使用方法:
+    cd backend
+    python benchmarks/api_benchmark.py --concurrency 20 --duration 30 --output api_benchmark.json
+    python benchmarks/api_benchmark.py --compare api_benchmark.json --output api_benchmark_new.json
+    python benchmarks/api_benchmark.py --database /path/to/generated.db   # 使用已有数据库
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND_DIR))
+
+BENCHMARK_PASSWORD = "benchmark"
+
+# 请求类型及权重
+MIX = [
+    ("login", 5),
+    ("my_tasks", 30),
+    ("task_detail", 25),
+    ("complete_task", 5),
+    ("statistics", 10),
+    ("catalog_search", 25),
+]
+
+SEARCH_TERMS = ["光缆", "电杆", "管道", "接头", "开挖", "敷设", "熔接", "标石"]
+
+
+def seed(db_path, users, tasks, lines_per_task, seed_value=42):
+    """写入测试数据，所有用户使用同一个密码"""
+    from passlib.context import CryptContext
+
+    rnd = random.Random(seed_value)
+    hashed = CryptContext(schemes=["bcrypt"], deprecated="auto").hash(BENCHMARK_PASSWORD)
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+
+    cursor.executemany(
+        "INSERT INTO users (id, username, email, hashed_password, full_name, role, is_active) "
+        "VALUES (?, ?, ?, ?, ?, ?, 1)",
+        [(i, f"user{i}", f"user{i}@example.com", hashed, f"施工人员{i}", "admin" if i == 1 else "worker")
+         for i in range(1, users + 1)]
+    )
+    catalog_size = 500
+    cursor.executemany(
+        "INSERT INTO work_items (id, category, project_number, name, unit, unit_price, "
+        "skilled_labor_days, unskilled_labor_days, is_active) VALUES (?, '线路', ?, ?, '米', ?, 0.1, 0.2, 1)",
+        [(i, f"TXL-{i:05d}", f"{rnd.choice(SEARCH_TERMS)}工作{i}", round(rnd.uniform(5, 500), 2))
+         for i in range(1, catalog_size + 1)]
+    )
+    cursor.executemany(
+        "INSERT INTO materials (id, category, code, name, unit, unit_price, supply_type, is_active) "
+        "VALUES (?, '其他', ?, ?, '个', ?, '两者皆可', 1)",
+        [(i, f"CL-{i:05d}", f"{rnd.choice(SEARCH_TERMS)}材料{i}", round(rnd.uniform(1, 200), 2))
+         for i in range(1, catalog_size + 1)]
+    )
+    cursor.executemany(
+        "INSERT INTO projects (id, title, location, status, priority, created_by_id) "
+        "VALUES (?, ?, '测试地点', 'in_progress', 1, 1)",
+        [(i, f"项目{i}") for i in range(1, tasks // 50 + 2)]
+    )
+
+    now = datetime.now()
+    statuses = ["pending", "assigned", "in_progress", "completed", "completed", "completed"]
+    task_rows, work_rows, material_rows = [], [], []
+    for task_id in range(1, tasks + 1):
+        created = now - timedelta(days=rnd.uniform(0, 60))
+        status = rnd.choice(statuses)
+        completed = created + timedelta(hours=rnd.uniform(1, 72)) if status == "completed" else None
+        task_rows.append((task_id, rnd.randint(1, tasks // 50 + 1), f"工单{task_id}", status,
+                          created.isoformat(sep=" "), completed.isoformat(sep=" ") if completed else None,
+                          rnd.randint(1, users)))
+        for _ in range(lines_per_task // 2):
+            work_rows.append((task_id, rnd.randint(1, catalog_size), rnd.randint(1, 20), 10.0, 10.0))
+        for _ in range(lines_per_task - lines_per_task // 2):
+            material_rows.append((task_id, rnd.randint(1, catalog_size), rnd.randint(1, 20), rnd.random() < 0.5, 5.0, 5.0))
+
+    cursor.executemany(
+        "INSERT INTO tasks (id, project_id, title, status, created_at, completed_at, created_by_id, assigned_to_id, "
+        "labor_cost, material_cost, company_material_cost, self_material_cost, total_cost) "
+        "VALUES (?, ?, ?, ?, ?, ?, 1, ?, 0, 0, 0, 0, 0)",
+        task_rows
+    )
+    cursor.executemany(
+        "INSERT INTO task_work_items (task_id, work_item_id, quantity, unit_price, total_price) VALUES (?, ?, ?, ?, ?)",
+        work_rows
+    )
+    cursor.executemany(
+        "INSERT INTO task_materials (task_id, material_id, quantity, is_company_provided, unit_price, total_price) "
+        "VALUES (?, ?, ?, ?, ?, ?)",
+        material_rows
+    )
+    conn.commit()
+    conn.close()
+
+
+def load_user_pool(db_path, users):
+    """读取用于测试的用户名和每个用户的未完成工单"""
+    conn = sqlite3.connect(db_path)
+    usernames = [row[0] for row in conn.execute(
+        "SELECT username FROM users WHERE is_active = 1 ORDER BY id LIMIT ?", (users,)
+    )]
+    open_tasks = {}
+    for task_id, username in conn.execute(
+        "SELECT tasks.id, users.username FROM tasks JOIN users ON users.id = tasks.assigned_to_id "
+        "WHERE tasks.status != 'completed' AND users.username IN (%s)" % ",".join("?" * len(usernames)),
+        usernames
+    ):
+        open_tasks.setdefault(username, []).append(task_id)
+    task_ids = [row[0] for row in conn.execute("SELECT id FROM tasks ORDER BY RANDOM() LIMIT 5000")]
+    catalog = {
+        "work_items": [row[0] for row in conn.execute("SELECT id FROM work_items LIMIT 200")],
+        "materials": [row[0] for row in conn.execute("SELECT id FROM materials LIMIT 200")],
+    }
+    conn.close()
+    return usernames, open_tasks, task_ids, catalog
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(int(round(fraction * (len(sorted_values) - 1))), len(sorted_values) - 1)
+    return sorted_values[index]
+
+
+class VirtualUser:
+    def __init__(self, client, username, open_tasks, task_ids, catalog, rnd, samples, errors):
+        self.client = client
+        self.username = username
+        self.open_tasks = open_tasks
+        self.task_ids = task_ids
+        self.catalog = catalog
+        self.rnd = rnd
+        self.samples = samples
+        self.errors = errors
+        self.headers = {}
+
+    async def timed(self, name, method, url, **kwargs):
+        start = time.perf_counter()
+        try:
+            response = await self.client.request(method, url, **kwargs)
+            ok = response.status_code < 400
+        except Exception:
+            response, ok = None, False
+        self.samples.setdefault(name, []).append(time.perf_counter() - start)
+        if not ok:
+            self.errors[name] = self.errors.get(name, 0) + 1
+        return response if ok else None
+
+    async def login(self):
+        response = await self.timed(
+            "login", "POST", "/api/auth/token",
+            data={"username": self.username, "password": BENCHMARK_PASSWORD}
+        )
+        if response is not None:
+            self.headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+    async def my_tasks(self):
+        await self.timed("my_tasks", "GET", "/api/tasks/my-tasks", headers=self.headers)
+
+    async def task_detail(self):
+        await self.timed("task_detail", "GET", f"/api/tasks/{self.rnd.choice(self.task_ids)}", headers=self.headers)
+
+    async def complete_task(self):
+        if not self.open_tasks:
+            return await self.task_detail()
+        task_id = self.open_tasks.pop()
+        body = {
+            "work_items": [{"work_item_id": self.rnd.choice(self.catalog["work_items"]), "quantity": self.rnd.randint(1, 10)}
+                           for _ in range(3)],
+            "materials": [{"material_id": self.rnd.choice(self.catalog["materials"]), "quantity": self.rnd.randint(1, 10),
+                           "is_company_provided": self.rnd.random() < 0.5} for _ in range(3)],
+        }
+        await self.timed("complete_task", "POST", f"/api/tasks/{task_id}/complete", json=body, headers=self.headers)
+
+    async def statistics(self):
+        endpoint = self.rnd.choice(["projects", "tasks", "materials", "work-items", "teams"])
+        await self.timed("statistics", "GET", f"/api/statistics/{endpoint}", headers=self.headers)
+
+    async def catalog_search(self):
+        catalog = self.rnd.choice(["work-items", "materials"])
+        await self.timed("catalog_search", "GET", f"/api/{catalog}/",
+                         params={"name": self.rnd.choice(SEARCH_TERMS)}, headers=self.headers)
+
+    async def run(self, deadline):
+        await self.login()
+        names = [name for name, _ in MIX]
+        weights = [weight for _, weight in MIX]
+        while time.perf_counter() < deadline:
+            await getattr(self, self.rnd.choices(names, weights)[0])()
+
+
+async def run_load(app, usernames, open_tasks, task_ids, catalog, concurrency, duration, warmup, seed_value):
+    import httpx
+
+    samples, errors = {}, {}
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://benchmark") as client:
+        # 预热：每个接口请求几次，不计入结果
+        warm = VirtualUser(client, usernames[0], [], task_ids, catalog, random.Random(0), {}, {})
+        await warm.run(time.perf_counter() + warmup)
+
+        rnd = random.Random(seed_value)
+        users = [
+            VirtualUser(client, usernames[i % len(usernames)], open_tasks.get(usernames[i % len(usernames)], []),
+                        task_ids, catalog, random.Random(rnd.random()), samples, errors)
+            for i in range(concurrency)
+        ]
+        start = time.perf_counter()
+        await asyncio.gather(*(user.run(start + duration) for user in users))
+        elapsed = time.perf_counter() - start
+    return samples, errors, elapsed
+
+
+def summarize(samples, errors, elapsed):
+    endpoints = {}
+    all_latencies = []
+    for name in sorted(samples):
+        latencies = sorted(samples[name])
+        all_latencies.extend(latencies)
+        endpoints[name] = {
+            "requests": len(latencies),
+            "errors": errors.get(name, 0),
+            "rps": round(len(latencies) / elapsed, 2),
+            "p50_ms": round(percentile(latencies, 0.50) * 1000, 2),
+            "p95_ms": round(percentile(latencies, 0.95) * 1000, 2),
+            "p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+            "mean_ms": round(sum(latencies) / len(latencies) * 1000, 2),
+        }
+    all_latencies.sort()
+    total = {
+        "requests": len(all_latencies),
+        "errors": sum(errors.values()),
+        "rps": round(len(all_latencies) / elapsed, 2),
+        "p50_ms": round(percentile(all_latencies, 0.50) * 1000, 2),
+        "p95_ms": round(percentile(all_latencies, 0.95) * 1000, 2),
+        "p99_ms": round(percentile(all_latencies, 0.99) * 1000, 2),
+    }
+    return endpoints, total
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=str(BACKEND_DIR), stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def write_report(path, report):
+    """写入JSON：每个接口的结果占一行，便于diff"""
+    lines = ["{"]
+    lines.append(f'  "meta": {json.dumps(report["meta"], ensure_ascii=False, sort_keys=True)},')
+    lines.append(f'  "total": {json.dumps(report["total"], sort_keys=True)},')
+    lines.append('  "endpoints": {')
+    items = list(report["endpoints"].items())
+    for index, (name, stats) in enumerate(items):
+        comma = "," if index < len(items) - 1 else ""
+        lines.append(f'    "{name}": {json.dumps(stats, sort_keys=True)}{comma}')
+    lines.append("  }")
+    lines.append("}")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("\n".join(lines) + "\n")
+
+
+def print_report(endpoints, total, baseline=None):
+    print(f"\n{'接口':<16}{'请求数':>8}{'错误':>6}{'请求/秒':>10}{'p50(ms)':>10}{'p95(ms)':>10}{'p99(ms)':>10}")
+    rows = list(endpoints.items()) + [("合计", total)]
+    for name, stats in rows:
+        line = (f"{name:<16}{stats['requests']:>8}{stats['errors']:>6}{stats['rps']:>10.1f}"
+                f"{stats['p50_ms']:>10.1f}{stats['p95_ms']:>10.1f}{stats['p99_ms']:>10.1f}")
+        old = (baseline or {}).get("endpoints", {}).get(name) if name != "合计" else (baseline or {}).get("total")
+        if old and old.get("p95_ms"):
+            change = (stats["p95_ms"] - old["p95_ms"]) / old["p95_ms"] * 100
+            rps_change = (stats["rps"] - old["rps"]) / old["rps"] * 100 if old.get("rps") else 0
+            line += f"   p95 {change:+.1f}%  请求/秒 {rps_change:+.1f}%"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="API性能测试")
+    parser.add_argument("--concurrency", type=int, default=20, help="并发用户数")
+    parser.add_argument("--duration", type=float, default=30, help="测试时长（秒）")
+    parser.add_argument("--warmup", type=float, default=2, help="预热时长（秒）")
+    parser.add_argument("--users", type=int, default=200, help="生成的用户数")
+    parser.add_argument("--tasks", type=int, default=20000, help="生成的工单数")
+    parser.add_argument("--lines-per-task", type=int, default=6, help="每个工单的明细数")
+    parser.add_argument("--seed", type=int, default=42, help="随机种子")
+    parser.add_argument("--database", help="使用已有的SQLite数据库（会被修改，请使用副本）")
+    parser.add_argument("--output", default="api_benchmark.json", help="结果JSON文件")
+    parser.add_argument("--compare", help="与之前的结果JSON对比")
+    args = parser.parse_args()
+
+    tmp_dir = tempfile.TemporaryDirectory()
+    db_path = os.path.abspath(args.database) if args.database else os.path.join(tmp_dir.name, "api_benchmark.db")
+    # 在导入应用之前指定数据库，并关闭慢查询记录
+    os.environ["DATABASE_URL"] = f"sqlite:///{db_path}"
+    os.environ.setdefault("SLOW_QUERY_THRESHOLD_MS", "0")
+
+    import models  # noqa: F401  注册所有模型
+    from database import Base, engine
+
+    if not args.database:
+        Base.metadata.create_all(bind=engine)
+        print(f"生成测试数据: {args.users} 个用户, {args.tasks} 个工单...")
+        start = time.perf_counter()
+        seed(db_path, args.users, args.tasks, args.lines_per_task, args.seed)
+        print(f"数据生成完成，耗时 {time.perf_counter() - start:.1f}s")
+
+    usernames, open_tasks, task_ids, catalog = load_user_pool(db_path, args.users)
+    if not usernames or not task_ids:
+        print("数据库中没有可用的用户或工单")
+        return
+
+    from main import app
+
+    print(f"并发 {args.concurrency}，时长 {args.duration}s ...")
+    # 部分接口使用 print 输出调试信息，测试期间屏蔽
+    with contextlib.redirect_stdout(io.StringIO()):
+        samples, errors, elapsed = asyncio.run(run_load(
+            app, usernames, open_tasks, task_ids, catalog,
+            args.concurrency, args.duration, args.warmup, args.seed
+        ))
+
+    endpoints, total = summarize(samples, errors, elapsed)
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "date": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "concurrency": args.concurrency,
+            "duration": args.duration,
+            "database": args.database or f"seeded users={args.users} tasks={args.tasks} lines={args.lines_per_task}",
+            "seed": args.seed,
+        },
+        "total": total,
+        "endpoints": endpoints,
+    }
+    write_report(args.output, report)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+    print_report(endpoints, total, baseline)
+    print(f"\n结果已写入 {args.output}")
+    tmp_dir.cleanup()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+工单结算导出性能测试
+
+在临时SQLite数据库中生成指定数量的工单明细，分别导出CSV和XLSX，
+统计首字节时间、总耗时、输出大小和导出过程中进程内存峰值的增长。
+
+使用方法:
+    cd backend
+    python benchmarks/export_benchmark.py --lines 500000
+"""
+
+import argparse
+import os
+import random
+import resource
+import sqlite3
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND_DIR))
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from database import Base
+from models import *  # noqa: F401,F403  注册所有模型
+from utils.export_utils import iter_csv, iter_xlsx
+from utils.task_export import SETTLEMENT_HEADER, build_settlement_query, iter_settlement_rows
+
+
+def seed(db_path, line_count, lines_per_task=10):
+    """直接写入测试数据"""
+    rnd = random.Random(42)
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    cursor.execute("INSERT INTO users (id, username, role, is_active) VALUES (1, 'admin', 'admin', 1)")
+    cursor.executemany(
+        "INSERT INTO teams (id, name, is_active) VALUES (?, ?, 1)",
+        [(i, f"施工队{i}") for i in range(1, 21)]
+    )
+    cursor.executemany(
+        "INSERT INTO work_items (id, project_number, name, unit, unit_price, is_active) VALUES (?, ?, ?, '米', ?, 1)",
+        [(i, f"TXL-{i:04d}", f"工作内容{i}", rnd.uniform(5, 500)) for i in range(1, 501)]
+    )
+    cursor.executemany(
+        "INSERT INTO materials (id, code, name, unit, unit_price, is_active) VALUES (?, ?, ?, '个', ?, 1)",
+        [(i, f"CL-{i:04d}", f"材料{i}", rnd.uniform(1, 200)) for i in range(1, 501)]
+    )
+
+    task_count = max(line_count // lines_per_task, 1)
+    cursor.executemany(
+        "INSERT INTO tasks (id, title, status, created_by_id, team_id, labor_cost, material_cost, "
+        "company_material_cost, self_material_cost, total_cost) VALUES (?, ?, 'completed', 1, ?, 0, 0, 0, 0, 0)",
+        [(i, f"工单{i}", rnd.randint(1, 20)) for i in range(1, task_count + 1)]
+    )
+
+    half = line_count // 2
+    cursor.executemany(
+        "INSERT INTO task_work_items (task_id, work_item_id, quantity, unit_price, total_price) VALUES (?, ?, ?, ?, ?)",
+        ((i % task_count + 1, i % 500 + 1, 2.0, 10.0, 20.0) for i in range(half))
+    )
+    cursor.executemany(
+        "INSERT INTO task_materials (task_id, material_id, quantity, is_company_provided, unit_price, total_price) "
+        "VALUES (?, ?, ?, ?, ?, ?)",
+        ((i % task_count + 1, i % 500 + 1, 3.0, i % 2, 5.0, 15.0) for i in range(line_count - half))
+    )
+    conn.commit()
+    conn.close()
+
+
+def run_export(session_factory, fmt):
+    db = session_factory()
+    try:
+        rows = iter_settlement_rows(db, build_settlement_query())
+        writer = iter_xlsx if fmt == "xlsx" else iter_csv
+        rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        start = time.perf_counter()
+        first_byte = None
+        total_bytes = 0
+        for chunk in writer(SETTLEMENT_HEADER, rows):
+            if first_byte is None and chunk:
+                first_byte = time.perf_counter() - start
+            total_bytes += len(chunk)
+        elapsed = time.perf_counter() - start
+        # ru_maxrss在Linux上以KB为单位
+        peak_growth = (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss_before) * 1024
+        return first_byte, elapsed, total_bytes, peak_growth
+    finally:
+        db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="工单结算导出性能测试")
+    parser.add_argument("--lines", type=int, default=500000, help="明细行数")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_path = os.path.join(tmp_dir, "export_benchmark.db")
+        engine = create_engine(f"sqlite:///{db_path}")
+        Base.metadata.create_all(bind=engine)
+
+        print(f"生成 {args.lines} 条明细...")
+        start = time.perf_counter()
+        seed(db_path, args.lines)
+        print(f"数据生成完成，耗时 {time.perf_counter() - start:.1f}s")
+
+        session_factory = sessionmaker(bind=engine)
+        print(f"\n{'格式':<6}{'首字节(ms)':>12}{'总耗时(s)':>12}{'输出大小(MB)':>14}{'内存峰值增长(MB)':>16}{'行/秒':>12}")
+        for fmt in ("csv", "xlsx"):
+            first_byte, elapsed, total_bytes, peak = run_export(session_factory, fmt)
+            print(f"{fmt:<6}{first_byte * 1000:>12.1f}{elapsed:>12.2f}{total_bytes / 1024 / 1024:>14.1f}"
+                  f"{peak / 1024 / 1024:>16.1f}{args.lines / elapsed:>12.0f}")
+
+
+if __name__ == "__main__":
+    main()
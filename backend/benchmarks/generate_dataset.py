@@ -0,0 +1,370 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+大数据量测试数据生成
+
+绕过API和ORM，用 sqlite3 executemany 直接批量写入新的SQLite数据库，
+在几分钟内生成接近生产规模的数据，用于各项性能测试：
+
+- 用户（管理员、项目经理、施工人员）和班组，每个施工人员属于一个班组
+- 工作内容、材料目录
+- 项目及其负责班组
+- 工单：项目、施工人员和目录条目的分布都有偏斜（少数热门），
+  越早创建的工单越可能已完成，完成耗时为对数正态分布
+- 进行中和已完成工单的工作内容、材料明细，以及汇总费用
+
+同一天内用同样的参数和随机种子生成的数据完全一致。所有用户名为 user<id>，
+密码相同（默认 benchmark，与 api_benchmark.py 一致）。
+
+写入期间关闭日志和同步，先删除索引、写完后再重建，最后执行 ANALYZE。
+
+使用方法:
+    cd backend
+    python benchmarks/generate_dataset.py --output /tmp/large.db
+    python benchmarks/generate_dataset.py --output /tmp/small.db --users 500 --projects 5000 --tasks 100000
+    # 在生成的数据上运行API性能测试（测试会修改数据库，请使用副本）
+    python benchmarks/api_benchmark.py --database /tmp/large.db
+"""
+
+import argparse
+import math
+import os
+import random
+import sqlite3
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND_DIR))
+
+DEFAULT_PASSWORD = "benchmark"
+
+# 每批写入的工单数
+BATCH_TASKS = 20000
+
+# 工单状态：创建超过 RECENT_DAYS 天的工单和近期工单的状态分布
+RECENT_DAYS = 30
+OLD_STATUS_WEIGHTS = (("completed", 88), ("cancelled", 7), ("in_progress", 3), ("assigned", 1), ("pending", 1))
+RECENT_STATUS_WEIGHTS = (("completed", 40), ("in_progress", 25), ("assigned", 20), ("pending", 12), ("cancelled", 3))
+PROJECT_STATUS_WEIGHTS = (("completed", 60), ("in_progress", 30), ("pending", 7), ("cancelled", 3))
+
+WORK_ITEM_CATEGORIES = ["通信电源", "有线通信", "无线通信", "通信线路", "通信管道"]
+MATERIAL_CATEGORIES = ["电缆类", "管道类", "设备类", "工具类", "其他"]
+SUPPLY_TYPES = ["甲供", "自购", "两者皆可"]
+UNITS = ["米", "个", "处", "条", "千米", "套"]
+NAME_TERMS = ["光缆", "电杆", "管道", "接头", "开挖", "敷设", "熔接", "标石", "拉线", "人孔", "基站", "电源"]
+DISTRICTS = ["城东", "城西", "城南", "城北", "开发区", "高新区", "郊县"]
+
+
+def skewed_index(rnd, size, exponent):
+    """返回 [0, size) 内偏向较小值的随机下标，exponent 越大越集中"""
+    return int(size * rnd.random() ** exponent)
+
+
+def weighted_chooser(rnd, weights):
+    """按权重选择的函数（比 random.choices 逐次调用更快）"""
+    values = [value for value, _ in weights]
+    cumulative = []
+    total = 0
+    for _, weight in weights:
+        total += weight
+        cumulative.append(total)
+
+    def choose():
+        point = rnd.random() * total
+        for value, bound in zip(values, cumulative):
+            if point < bound:
+                return value
+        return values[-1]
+    return choose
+
+
+def timestamp(value):
+    return datetime.fromtimestamp(value).isoformat(sep=" ")
+
+
+class DatasetGenerator:
+    def __init__(self, conn, args):
+        self.conn = conn
+        self.args = args
+        self.rnd = random.Random(args.seed)
+        # 以当天零点为结束时间，同一天内重复生成的数据完全一致
+        self.now = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0).timestamp()
+        self.start = self.now - args.days * 86400
+        self.counts = {}
+
+    def insert(self, table, columns, rows):
+        if not rows:
+            return
+        placeholders = ", ".join("?" * len(columns))
+        self.conn.executemany(f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({placeholders})", rows)
+        self.counts[table] = self.counts.get(table, 0) + len(rows)
+
+    def generate_users_and_teams(self):
+        from passlib.context import CryptContext
+
+        args, rnd = self.args, self.rnd
+        hashed = CryptContext(schemes=["bcrypt"], deprecated="auto").hash(args.password)
+        managers = max(1, args.users // 50)
+        users = []
+        for user_id in range(1, args.users + 1):
+            if user_id == 1:
+                role = "admin"
+            elif user_id <= managers + 1:
+                role = "manager"
+            else:
+                role = "worker"
+            users.append((
+                user_id, f"user{user_id}", f"user{user_id}@example.com", hashed, f"用户{user_id}",
+                f"138{user_id:08d}", role, 1 if rnd.random() > 0.02 else 0
+            ))
+        self.insert("users", ("id", "username", "email", "hashed_password", "full_name", "phone", "role", "is_active"),
+                    users)
+
+        self.managers = list(range(2, managers + 2))
+        self.workers = list(range(managers + 2, args.users + 1)) or [1]
+        self.insert("teams", ("id", "name", "description", "created_at", "is_active"), [
+            (team_id, f"{rnd.choice(DISTRICTS)}施工{team_id}班", None, timestamp(self.start), 1)
+            for team_id in range(1, args.teams + 1)
+        ])
+
+        # 施工人员平均分到各班组，每组第一个人为组长
+        self.team_members = {team_id: [] for team_id in range(1, args.teams + 1)}
+        members = []
+        for index, user_id in enumerate(self.workers):
+            team_id = index % args.teams + 1
+            is_leader = not self.team_members[team_id]
+            self.team_members[team_id].append(user_id)
+            members.append((team_id, user_id, is_leader, timestamp(self.start)))
+        self.insert("team_members", ("team_id", "user_id", "is_leader", "joined_at"), members)
+
+    def generate_catalog(self):
+        args, rnd = self.args, self.rnd
+        self.work_item_prices = [round(rnd.lognormvariate(3.5, 1.0), 2) for _ in range(args.work_items)]
+        self.insert(
+            "work_items",
+            ("id", "category", "project_number", "name", "unit", "skilled_labor_days", "unskilled_labor_days",
+             "unit_price", "is_active", "created_at"),
+            [(index + 1, rnd.choice(WORK_ITEM_CATEGORIES), f"TX{index + 1:06d}",
+              f"{rnd.choice(NAME_TERMS)}{rnd.choice(NAME_TERMS)}{index + 1}", rnd.choice(UNITS),
+              round(rnd.uniform(0, 2), 2), round(rnd.uniform(0, 3), 2), price, 1, timestamp(self.start))
+             for index, price in enumerate(self.work_item_prices)]
+        )
+        self.material_prices = [round(rnd.lognormvariate(2.5, 1.2), 2) for _ in range(args.materials)]
+        self.insert(
+            "materials",
+            ("id", "category", "code", "name", "unit", "unit_price", "supply_type", "is_active", "created_at"),
+            [(index + 1, rnd.choice(MATERIAL_CATEGORIES), f"CL{index + 1:06d}",
+              f"{rnd.choice(NAME_TERMS)}材料{index + 1}", rnd.choice(UNITS), price, rnd.choice(SUPPLY_TYPES), 1,
+              timestamp(self.start))
+             for index, price in enumerate(self.material_prices)]
+        )
+
+    def generate_projects(self):
+        args, rnd = self.args, self.rnd
+        choose_status = weighted_chooser(rnd, PROJECT_STATUS_WEIGHTS)
+        span = self.now - self.start
+        projects, project_teams = [], []
+        # 项目按ID顺序创建，ID越大越新
+        self.project_created = [0.0] * (args.projects + 1)
+        self.project_teams = [0] * (args.projects + 1)
+        for project_id in range(1, args.projects + 1):
+            created = self.start + span * (project_id - 1) / args.projects
+            status = choose_status()
+            completed = timestamp(min(created + rnd.expovariate(1 / (30 * 86400)), self.now)) \
+                if status == "completed" else None
+            team_id = skewed_index(rnd, args.teams, 1.5) + 1
+            self.project_created[project_id] = created
+            self.project_teams[project_id] = team_id
+            projects.append((
+                project_id, f"{rnd.choice(DISTRICTS)}{rnd.choice(NAME_TERMS)}工程{project_id}",
+                f"{rnd.choice(DISTRICTS)}{rnd.randint(1, 300)}号", f"联系人{project_id % 1000}",
+                f"139{project_id:08d}", status, rnd.randint(1, 5), timestamp(created), completed,
+                rnd.choice(self.managers)
+            ))
+            project_teams.append((project_id, team_id, timestamp(created)))
+            if len(projects) >= 50000:
+                self.flush_projects(projects, project_teams)
+        self.flush_projects(projects, project_teams)
+
+    def flush_projects(self, projects, project_teams):
+        self.insert(
+            "projects",
+            ("id", "title", "location", "contact_name", "contact_phone", "status", "priority", "created_at",
+             "completed_at", "created_by_id"),
+            projects
+        )
+        self.insert("project_teams", ("project_id", "team_id", "assigned_at"), project_teams)
+        projects.clear()
+        project_teams.clear()
+
+    def generate_tasks(self):
+        args, rnd = self.args, self.rnd
+        choose_old = weighted_chooser(rnd, OLD_STATUS_WEIGHTS)
+        choose_recent = weighted_chooser(rnd, RECENT_STATUS_WEIGHTS)
+        recent_since = self.now - RECENT_DAYS * 86400
+        work_item_count = len(self.work_item_prices)
+        material_count = len(self.material_prices)
+        # 每个工单的明细条数服从均值为 lines_per_task 的几何分布
+        line_p = 1 / (args.lines_per_task / 2 + 1)
+        log_line_p = math.log(1 - line_p)
+
+        tasks, workers, work_lines, material_lines = [], [], [], []
+        started = time.perf_counter()
+        for task_id in range(1, args.tasks + 1):
+            # 热门项目的工单更多
+            project_id = skewed_index(rnd, args.projects, 2.0) + 1
+            project_created = self.project_created[project_id]
+            created = project_created + rnd.random() * (self.now - project_created)
+            status = choose_recent() if created >= recent_since else choose_old()
+
+            team_id = self.project_teams[project_id]
+            # 班组没有成员时从全部施工人员中选
+            team = self.team_members[team_id] or self.workers
+            assignee = team[skewed_index(rnd, len(team), 1.5)] if status != "pending" else None
+            assigned_at = completed_at = None
+            if assignee is not None:
+                assigned = min(created + rnd.expovariate(1 / 7200), self.now)
+                assigned_at = timestamp(assigned)
+                workers.append((task_id, assignee, True, assigned_at))
+                if status == "completed":
+                    completed_at = timestamp(min(assigned + rnd.lognormvariate(10.5, 1.0), self.now))
+
+            labor_cost = company_cost = self_cost = 0.0
+            if status in ("in_progress", "completed"):
+                for _ in range(int(math.log(1 - rnd.random()) / log_line_p)):
+                    work_item_id = skewed_index(rnd, work_item_count, 3.0)
+                    quantity = float(rnd.randint(1, 50))
+                    price = self.work_item_prices[work_item_id]
+                    total = round(quantity * price, 2)
+                    labor_cost += total
+                    work_lines.append((task_id, work_item_id + 1, quantity, price, total))
+                for _ in range(int(math.log(1 - rnd.random()) / log_line_p)):
+                    material_id = skewed_index(rnd, material_count, 3.0)
+                    quantity = float(rnd.randint(1, 100))
+                    price = self.material_prices[material_id]
+                    total = round(quantity * price, 2)
+                    is_company = rnd.random() < 0.6
+                    if is_company:
+                        company_cost += total
+                    else:
+                        self_cost += total
+                    material_lines.append((task_id, material_id + 1, quantity, is_company, price, total))
+
+            material_cost = company_cost + self_cost
+            tasks.append((
+                task_id, project_id, f"工单{task_id}", status, round(labor_cost, 2), round(material_cost, 2),
+                round(company_cost, 2), round(self_cost, 2), round(labor_cost + material_cost, 2),
+                timestamp(created), assigned_at, completed_at, rnd.choice(self.managers), assignee, team_id
+            ))
+
+            if len(tasks) >= BATCH_TASKS:
+                self.flush_tasks(tasks, workers, work_lines, material_lines)
+                elapsed = time.perf_counter() - started
+                print(f"  工单 {task_id}/{args.tasks}，{task_id / elapsed:,.0f} 个/秒", flush=True)
+        self.flush_tasks(tasks, workers, work_lines, material_lines)
+
+    def flush_tasks(self, tasks, workers, work_lines, material_lines):
+        self.insert(
+            "tasks",
+            ("id", "project_id", "title", "status", "labor_cost", "material_cost", "company_material_cost",
+             "self_material_cost", "total_cost", "created_at", "assigned_at", "completed_at", "created_by_id",
+             "assigned_to_id", "team_id"),
+            tasks
+        )
+        self.insert("task_workers", ("task_id", "user_id", "is_primary", "assigned_at"), workers)
+        self.insert("task_work_items", ("task_id", "work_item_id", "quantity", "unit_price", "total_price"),
+                    work_lines)
+        self.insert("task_materials",
+                    ("task_id", "material_id", "quantity", "is_company_provided", "unit_price", "total_price"),
+                    material_lines)
+        for rows in (tasks, workers, work_lines, material_lines):
+            rows.clear()
+
+
+def create_schema(db_path):
+    """用模型定义建表，返回需要在写入后重建的索引"""
+    os.environ["DATABASE_URL"] = f"sqlite:///{db_path}"
+    import models  # noqa: F401  注册所有模型
+    from database import Base, engine
+
+    Base.metadata.create_all(bind=engine)
+    engine.dispose()
+
+    conn = sqlite3.connect(db_path)
+    indexes = conn.execute("SELECT name, sql FROM sqlite_master WHERE type = 'index' AND sql IS NOT NULL").fetchall()
+    for name, _ in indexes:
+        conn.execute(f"DROP INDEX {name}")
+    conn.close()
+    return [sql for _, sql in indexes]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="大数据量测试数据生成")
+    parser.add_argument("--output", required=True, help="生成的SQLite数据库文件")
+    parser.add_argument("--users", type=int, default=5000, help="用户数")
+    parser.add_argument("--teams", type=int, default=500, help="班组数")
+    parser.add_argument("--projects", type=int, default=100000, help="项目数")
+    parser.add_argument("--tasks", type=int, default=2000000, help="工单数")
+    parser.add_argument("--lines-per-task", type=float, default=8, help="进行中和已完成工单的平均明细数")
+    parser.add_argument("--work-items", type=int, default=3000, help="工作内容目录条数")
+    parser.add_argument("--materials", type=int, default=3000, help="材料目录条数")
+    parser.add_argument("--days", type=int, default=730, help="数据覆盖的天数")
+    parser.add_argument("--password", default=DEFAULT_PASSWORD, help="所有用户的密码")
+    parser.add_argument("--seed", type=int, default=42, help="随机种子")
+    parser.add_argument("--force", action="store_true", help="覆盖已存在的文件")
+    args = parser.parse_args()
+
+    if args.users < 3 or args.teams < 1 or args.projects < 1:
+        parser.error("至少需要3个用户、1个班组和1个项目")
+
+    db_path = os.path.abspath(args.output)
+    if os.path.exists(db_path):
+        if not args.force:
+            print(f"{db_path} 已存在，使用 --force 覆盖")
+            return
+        os.remove(db_path)
+
+    total_start = time.perf_counter()
+    index_sql = create_schema(db_path)
+
+    conn = sqlite3.connect(db_path)
+    conn.execute("PRAGMA journal_mode = OFF")
+    conn.execute("PRAGMA synchronous = OFF")
+    conn.execute("PRAGMA cache_size = -200000")
+
+    generator = DatasetGenerator(conn, args)
+    steps = [
+        ("用户和班组", generator.generate_users_and_teams),
+        ("工作内容和材料目录", generator.generate_catalog),
+        ("项目", generator.generate_projects),
+        ("工单和明细", generator.generate_tasks),
+    ]
+    for title, step in steps:
+        start = time.perf_counter()
+        print(f"生成{title}...", flush=True)
+        step()
+        conn.commit()
+        print(f"  完成，耗时 {time.perf_counter() - start:.1f}s", flush=True)
+
+    start = time.perf_counter()
+    print(f"重建 {len(index_sql)} 个索引并收集统计信息...", flush=True)
+    for sql in index_sql:
+        conn.execute(sql)
+    conn.execute("ANALYZE")
+    conn.commit()
+    conn.close()
+    print(f"  完成，耗时 {time.perf_counter() - start:.1f}s")
+
+    print(f"\n数据库: {db_path} ({os.path.getsize(db_path) / 1024 / 1024:.0f}MB)，"
+          f"总耗时 {time.perf_counter() - total_start:.1f}s")
+    for table, count in generator.counts.items():
+        print(f"  {table:<16}{count:>12,}")
+    print(f"所有用户的用户名为 user<ID>，密码为 {args.password}，user1 为管理员")
+
+
+if __name__ == "__main__":
+    main()
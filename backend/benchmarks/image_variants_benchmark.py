@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+图片衍生图传输量测试
+
+模拟一个包含100张现场照片的工单列表，分别统计直接加载原图与加载
+?size=thumb / ?size=web 衍生图时传输的字节数。
+
+使用方法:
+    cd backend
+    python benchmarks/image_variants_benchmark.py --count 100
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND_DIR))
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from PIL import Image, ImageDraw
+
+from utils.image_utils import IMAGE_SIZES
+from utils.static_files import UploadStaticFiles
+
+
+def create_photo(path, width, height, seed):
+    """生成一张带噪点的模拟照片，压缩率接近真实照片"""
+    rnd = random.Random(seed)
+    img = Image.effect_noise((width, height), 40).convert("RGB")
+    draw = ImageDraw.Draw(img)
+    for _ in range(30):
+        x, y = rnd.randrange(width), rnd.randrange(height)
+        color = tuple(rnd.randrange(256) for _ in range(3))
+        draw.rectangle([x, y, x + rnd.randrange(width // 3), y + rnd.randrange(height // 3)], fill=color)
+    img.save(path, "JPEG", quality=90)
+
+
+def format_size(size):
+    for unit in ["B", "KB", "MB", "GB"]:
+        if size < 1024:
+            return f"{size:.1f}{unit}"
+        size /= 1024
+    return f"{size:.1f}TB"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="图片衍生图传输量测试")
+    parser.add_argument("--count", type=int, default=100, help="照片数量")
+    parser.add_argument("--width", type=int, default=4000, help="照片宽度")
+    parser.add_argument("--height", type=int, default=3000, help="照片高度")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as uploads_dir:
+        day_dir = os.path.join(uploads_dir, "20240101")
+        os.makedirs(day_dir)
+
+        print(f"生成 {args.count} 张 {args.width}x{args.height} 模拟照片...")
+        urls = []
+        for i in range(args.count):
+            create_photo(os.path.join(day_dir, f"photo{i}.jpg"), args.width, args.height, i)
+            urls.append(f"/uploads/20240101/photo{i}.jpg")
+
+        app = FastAPI()
+        app.mount("/uploads", UploadStaticFiles(directory=uploads_dir), name="uploads")
+        client = TestClient(app)
+
+        results = {}
+        for size in [None] + list(IMAGE_SIZES):
+            suffix = f"?size={size}" if size else ""
+            label = size or "original"
+
+            # 第一次请求包含按需生成的时间，第二次请求直接命中已生成的衍生图
+            for phase in ("cold", "warm"):
+                total_bytes = 0
+                start = time.perf_counter()
+                for url in urls:
+                    response = client.get(url + suffix)
+                    response.raise_for_status()
+                    total_bytes += len(response.content)
+                elapsed = time.perf_counter() - start
+                results[(label, phase)] = (total_bytes, elapsed)
+
+        print(f"\n{'尺寸':<10}{'阶段':<8}{'传输量':>12}{'耗时':>10}{'相对原图':>10}")
+        original_bytes = results[("original", "warm")][0]
+        for (label, phase), (total_bytes, elapsed) in results.items():
+            ratio = total_bytes / original_bytes if original_bytes else 0
+            print(f"{label:<10}{phase:<8}{format_size(total_bytes):>12}{elapsed:>9.2f}s{ratio:>10.1%}")
+
+
+if __name__ == "__main__":
+    main()
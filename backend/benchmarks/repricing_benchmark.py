@@ -0,0 +1,140 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+工单重新定价性能测试
+
+在临时SQLite数据库中生成指定数量的工单明细（工作内容、材料各一半，
+约30%的工单已完成），调整部分工作内容和材料单价后，分别统计预览差异
+和实际更新的耗时。
+
+使用方法:
+    cd backend
+    python benchmarks/repricing_benchmark.py --lines 1000000 --changed-ratio 0.1
+"""
+
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND_DIR))
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from database import Base
+from models import *  # noqa: F401,F403  注册所有模型
+from utils.repricing import reprice_tasks
+
+CATALOG_SIZE = 2000
+STATUSES = ["pending", "assigned", "in_progress", "completed", "completed", "completed", "pending", "assigned", "in_progress", "cancelled"]
+
+
+def seed(db_path, line_count, lines_per_task=10):
+    """直接写入测试数据"""
+    rnd = random.Random(42)
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    work_prices = [round(rnd.uniform(5, 500), 2) for _ in range(CATALOG_SIZE)]
+    material_prices = [round(rnd.uniform(1, 200), 2) for _ in range(CATALOG_SIZE)]
+    cursor.executemany(
+        "INSERT INTO work_items (id, project_number, name, unit, unit_price, is_active) VALUES (?, ?, ?, '米', ?, 1)",
+        [(i + 1, f"TXL-{i:05d}", f"工作内容{i}", work_prices[i]) for i in range(CATALOG_SIZE)]
+    )
+    cursor.executemany(
+        "INSERT INTO materials (id, code, name, unit, unit_price, is_active) VALUES (?, ?, ?, '个', ?, 1)",
+        [(i + 1, f"CL-{i:05d}", f"材料{i}", material_prices[i]) for i in range(CATALOG_SIZE)]
+    )
+
+    task_count = max(line_count // lines_per_task, 1)
+    labor = [0.0] * (task_count + 1)
+    company = [0.0] * (task_count + 1)
+    self_supplied = [0.0] * (task_count + 1)
+
+    work_lines = []
+    for i in range(line_count // 2):
+        task_id, item = i % task_count + 1, rnd.randrange(CATALOG_SIZE)
+        quantity = rnd.randint(1, 20)
+        total = quantity * work_prices[item]
+        labor[task_id] += total
+        work_lines.append((task_id, item + 1, quantity, work_prices[item], total))
+
+    material_lines = []
+    for i in range(line_count - line_count // 2):
+        task_id, item = i % task_count + 1, rnd.randrange(CATALOG_SIZE)
+        quantity = rnd.randint(1, 20)
+        total = quantity * material_prices[item]
+        if i % 2:
+            company[task_id] += total
+        else:
+            self_supplied[task_id] += total
+        material_lines.append((task_id, item + 1, quantity, i % 2, material_prices[item], total))
+
+    cursor.executemany(
+        "INSERT INTO tasks (id, title, status, created_by_id, labor_cost, material_cost, "
+        "company_material_cost, self_material_cost, total_cost) VALUES (?, ?, ?, 1, ?, ?, ?, ?, ?)",
+        [
+            (i, f"工单{i}", STATUSES[i % len(STATUSES)], labor[i], company[i] + self_supplied[i],
+             company[i], self_supplied[i], labor[i] + company[i] + self_supplied[i])
+            for i in range(1, task_count + 1)
+        ]
+    )
+    cursor.executemany(
+        "INSERT INTO task_work_items (task_id, work_item_id, quantity, unit_price, total_price) VALUES (?, ?, ?, ?, ?)",
+        work_lines
+    )
+    cursor.executemany(
+        "INSERT INTO task_materials (task_id, material_id, quantity, is_company_provided, unit_price, total_price) "
+        "VALUES (?, ?, ?, ?, ?, ?)",
+        material_lines
+    )
+    conn.commit()
+    conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="工单重新定价性能测试")
+    parser.add_argument("--lines", type=int, default=1000000, help="明细行数")
+    parser.add_argument("--changed-ratio", type=float, default=0.1, help="调价的目录项比例")
+    args = parser.parse_args()
+
+    rnd = random.Random(7)
+    changed = max(int(CATALOG_SIZE * args.changed_ratio), 1)
+    work_item_prices = {i: round(rnd.uniform(5, 500), 2) for i in rnd.sample(range(1, CATALOG_SIZE + 1), changed)}
+    material_prices = {i: round(rnd.uniform(1, 200), 2) for i in rnd.sample(range(1, CATALOG_SIZE + 1), changed)}
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_path = os.path.join(tmp_dir, "repricing_benchmark.db")
+        engine = create_engine(f"sqlite:///{db_path}")
+        Base.metadata.create_all(bind=engine)
+
+        print(f"生成 {args.lines} 条明细...")
+        start = time.perf_counter()
+        seed(db_path, args.lines)
+        print(f"数据生成完成，耗时 {time.perf_counter() - start:.1f}s")
+        print(f"调价: {len(work_item_prices)} 个工作内容, {len(material_prices)} 个材料\n")
+
+        session_factory = sessionmaker(bind=engine)
+        for dry_run in (True, False):
+            db = session_factory()
+            try:
+                start = time.perf_counter()
+                result = reprice_tasks(db, work_item_prices, material_prices, dry_run=dry_run)
+                elapsed = time.perf_counter() - start
+            finally:
+                db.close()
+
+            label = "预览差异" if dry_run else "实际更新"
+            lines = result["affected_work_item_lines"] + result["affected_material_lines"]
+            print(f"{label}: 耗时 {elapsed:.2f}s, 明细 {lines} 条, 工单 {result['affected_tasks']} 个, "
+                  f"费用变化 {result['total_cost_delta']:.2f}, {lines / elapsed:.0f} 条/秒")
+
+
+if __name__ == "__main__":
+    main()
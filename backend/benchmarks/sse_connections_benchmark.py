@@ -0,0 +1,231 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+实时事件推送连接测试
+
+在子进程中启动单worker的uvicorn（只包含事件路由，用查询参数代替令牌认证），
+建立指定数量的空闲SSE连接，统计：
+
+- 建立全部连接的耗时和服务端内存占用
+- 心跳是否按时送达所有连接
+- 广播一个事件到全部连接、推送给单个用户的延迟
+- 断线后携带 Last-Event-ID 重连能否补发错过的事件
+
+使用方法:
+    cd backend
+    python benchmarks/sse_connections_benchmark.py --connections 5000
+"""
+
+import argparse
+import asyncio
+import os
+import resource
+import subprocess
+import sys
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND_DIR))
+
+
+def raise_file_limit(required):
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    target = min(max(soft, required), hard)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (target, hard))
+    return target
+
+
+def serve(port):
+    """测试服务端：事件路由 + 发布接口"""
+    import uvicorn
+    from fastapi import FastAPI, Query
+
+    from routers import events
+    from utils.events import broker
+
+    def fake_user(user: int = Query(...)):
+        return SimpleNamespace(id=user, role="worker")
+
+    app = FastAPI()
+    app.include_router(events.router, prefix="/api")
+    app.dependency_overrides[events.get_stream_user] = fake_user
+
+    @app.post("/publish")
+    def publish(user: int = Query(None)):
+        # 同步路由运行在线程池中，与业务接口发布事件的方式一致
+        event = broker.publish("task.assigned", {"task_id": 1, "sent_at": time.time()},
+                               None if user is None else [user])
+        return {"id": event.event_id, "connections": broker.connections}
+
+    raise_file_limit(65536)
+    uvicorn.run(app, host="127.0.0.1", port=port, log_level="warning", backlog=4096)
+
+
+class Connection:
+    def __init__(self, user):
+        self.user = user
+        self.reader = None
+        self.writer = None
+        self.pings = 0
+        self.last_id = None
+        self.events = asyncio.Queue()
+
+    async def open(self, port, last_event_id=None):
+        self.reader, self.writer = await asyncio.open_connection("127.0.0.1", port)
+        headers = f"GET /api/events/stream?user={self.user} HTTP/1.1\r\nHost: 127.0.0.1\r\nAccept: text/event-stream\r\n"
+        if last_event_id is not None:
+            headers += f"Last-Event-ID: {last_event_id}\r\n"
+        self.writer.write((headers + "\r\n").encode())
+        await self.writer.drain()
+        status = await self.reader.readline()
+        if b" 200 " not in status:
+            raise RuntimeError(f"连接失败: {status!r}")
+        while (await self.reader.readline()) not in (b"\r\n", b""):
+            pass
+
+    async def read_forever(self):
+        """解析分块编码的SSE数据流"""
+        buffer = ""
+        try:
+            while True:
+                size_line = await self.reader.readline()
+                if not size_line:
+                    return
+                size = int(size_line.strip() or b"0", 16)
+                chunk = await self.reader.readexactly(size + 2)
+                buffer += chunk[:-2].decode("utf-8")
+                while "\n\n" in buffer:
+                    block, buffer = buffer.split("\n\n", 1)
+                    if block.startswith(": ping"):
+                        self.pings += 1
+                        continue
+                    fields = dict(line.split(": ", 1) for line in block.split("\n") if ": " in line)
+                    if "id" in fields:
+                        self.last_id = fields["id"]
+                        self.events.put_nowait((time.perf_counter(), fields))
+        except (asyncio.IncompleteReadError, ConnectionError):
+            return
+
+    def close(self):
+        self.writer.close()
+
+
+async def http_post(port, path):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(f"POST {path} HTTP/1.1\r\nHost: 127.0.0.1\r\nContent-Length: 0\r\nConnection: close\r\n\r\n".encode())
+    await writer.drain()
+    data = await reader.read()
+    writer.close()
+    return data
+
+
+def server_rss_mb(pid):
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+async def run(args, server_pid):
+    connections = [Connection(user=i % args.users + 1) for i in range(args.connections)]
+    readers = []
+
+    rss_before = server_rss_mb(server_pid)
+    start = time.perf_counter()
+    for offset in range(0, len(connections), 500):
+        batch = connections[offset:offset + 500]
+        await asyncio.gather(*(connection.open(args.port) for connection in batch))
+        readers.extend(asyncio.create_task(connection.read_forever()) for connection in batch)
+    elapsed = time.perf_counter() - start
+    await asyncio.sleep(1)
+    rss_after = server_rss_mb(server_pid)
+    print(f"建立 {len(connections)} 个连接: {elapsed:.2f}s")
+    print(f"服务端内存: {rss_before:.1f}MB -> {rss_after:.1f}MB, "
+          f"每个连接约 {(rss_after - rss_before) * 1024 / len(connections):.1f}KB")
+
+    # 心跳
+    await asyncio.sleep(args.heartbeat * 1.5)
+    with_ping = sum(1 for connection in connections if connection.pings)
+    print(f"心跳: {with_ping}/{len(connections)} 个连接在 {args.heartbeat * 1.5:.1f}s 内收到心跳")
+
+    # 广播
+    start = time.perf_counter()
+    await http_post(args.port, "/publish")
+    arrivals = [(await connection.events.get())[0] for connection in connections]
+    latencies = sorted(arrival - start for arrival in arrivals)
+    print(f"广播到 {len(connections)} 个连接: p50 {latencies[len(latencies) // 2] * 1000:.1f}ms, "
+          f"p99 {latencies[int(len(latencies) * 0.99)] * 1000:.1f}ms, 全部送达 {latencies[-1] * 1000:.1f}ms")
+
+    # 单个用户
+    target = [connection for connection in connections if connection.user == 1]
+    start = time.perf_counter()
+    await http_post(args.port, "/publish?user=1")
+    arrivals = [(await connection.events.get())[0] for connection in target]
+    others = sum(connection.events.qsize() for connection in connections)
+    print(f"推送给单个用户({len(target)} 个连接): {(max(arrivals) - start) * 1000:.1f}ms, 其他连接收到 {others} 个事件")
+
+    # 断线重连补发
+    connection = target[0]
+    last_id = connection.last_id
+    connection.close()
+    await asyncio.sleep(0.2)
+    await http_post(args.port, "/publish?user=1")
+    await http_post(args.port, "/publish?user=2")
+    await http_post(args.port, "/publish?user=1")
+    resumed = Connection(user=1)
+    await resumed.open(args.port, last_event_id=last_id)
+    readers.append(asyncio.create_task(resumed.read_forever()))
+    replayed = [await asyncio.wait_for(resumed.events.get(), timeout=5) for _ in range(2)]
+    print(f"重连补发: Last-Event-ID {last_id}, 补发事件 {[fields['id'] for _, fields in replayed]}")
+
+    for connection in connections + [resumed]:
+        connection.close()
+    for reader in readers:
+        reader.cancel()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="实时事件推送连接测试")
+    parser.add_argument("--connections", type=int, default=5000, help="空闲连接数")
+    parser.add_argument("--users", type=int, default=1000, help="用户数，连接平均分配给用户")
+    parser.add_argument("--heartbeat", type=float, default=5, help="心跳间隔（秒）")
+    parser.add_argument("--port", type=int, default=18790, help="端口")
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.port)
+        return
+
+    limit = raise_file_limit(args.connections + 1024)
+    if limit < args.connections + 100:
+        print(f"文件描述符上限 {limit} 不足以建立 {args.connections} 个连接")
+        return
+
+    env = dict(os.environ, EVENTS_HEARTBEAT_SECONDS=str(args.heartbeat))
+    server = subprocess.Popen(
+        [sys.executable, __file__, "--serve", "--port", str(args.port)],
+        cwd=str(BACKEND_DIR), env=env
+    )
+    try:
+        deadline = time.time() + 30
+        while True:
+            try:
+                asyncio.run(http_post(args.port, "/publish?user=0"))
+                break
+            except OSError:
+                if time.time() > deadline:
+                    raise
+                time.sleep(0.2)
+        asyncio.run(run(args, server.pid))
+    finally:
+        server.terminate()
+        server.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+上传文件下载吞吐量测试
+
+在本机启动uvicorn，分别用原来的 StaticFiles 和新的 UploadStaticFiles 提供同一批
+附件，用多个并发连接下载整个文件和随机Range片段，统计吞吐量。
+
+使用方法:
+    cd backend
+    python benchmarks/uploads_throughput_benchmark.py --files 20 --size-mb 20 --concurrency 8
+"""
+
+import argparse
+import http.client
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND_DIR))
+
+import uvicorn
+from fastapi import FastAPI
+from fastapi.staticfiles import StaticFiles
+
+from utils.static_files import UploadStaticFiles
+
+
+def start_server(app, port):
+    """在后台线程启动uvicorn"""
+    config = uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning")
+    server = uvicorn.Server(config)
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+    return server, thread
+
+
+def download(port, path, headers=None):
+    """下载一个文件，返回接收的字节数"""
+    conn = http.client.HTTPConnection("127.0.0.1", port)
+    try:
+        conn.request("GET", path, headers=headers or {})
+        response = conn.getresponse()
+        total = 0
+        while True:
+            chunk = response.read(1024 * 1024)
+            if not chunk:
+                break
+            total += len(chunk)
+        if response.status not in (200, 206):
+            raise RuntimeError(f"请求失败: {path}, 状态码 {response.status}")
+        return total
+    finally:
+        conn.close()
+
+
+def run_round(port, names, file_size, concurrency, requests_count, use_range):
+    """并发下载，返回 (字节数, 耗时)"""
+    rnd = random.Random(42)
+    jobs = []
+    for _ in range(requests_count):
+        name = rnd.choice(names)
+        headers = None
+        if use_range:
+            start = rnd.randrange(file_size - 65536)
+            headers = {"Range": f"bytes={start}-{start + 65535}"}
+        jobs.append((f"/uploads/{name}", headers))
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        total = sum(executor.map(lambda job: download(port, *job), jobs))
+    return total, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="上传文件下载吞吐量测试")
+    parser.add_argument("--files", type=int, default=20, help="附件数量")
+    parser.add_argument("--size-mb", type=int, default=20, help="每个附件大小(MB)")
+    parser.add_argument("--concurrency", type=int, default=8, help="并发连接数")
+    parser.add_argument("--requests", type=int, default=100, help="每轮请求数")
+    parser.add_argument("--port", type=int, default=18765, help="起始端口")
+    args = parser.parse_args()
+
+    file_size = args.size_mb * 1024 * 1024
+    with tempfile.TemporaryDirectory() as uploads_dir:
+        names = []
+        for i in range(args.files):
+            name = f"drawing{i}.pdf"
+            with open(os.path.join(uploads_dir, name), "wb") as f:
+                f.write(os.urandom(file_size))
+            names.append(name)
+
+        implementations = [
+            ("StaticFiles", StaticFiles),
+            ("UploadStaticFiles", UploadStaticFiles),
+        ]
+
+        print(f"{'实现':<20}{'请求类型':<10}{'传输量(MB)':>12}{'耗时(s)':>10}{'吞吐量(MB/s)':>14}{'请求/秒':>10}")
+        for index, (label, static_class) in enumerate(implementations):
+            app = FastAPI()
+            app.mount("/uploads", static_class(directory=uploads_dir), name="uploads")
+            port = args.port + index
+            server, thread = start_server(app, port)
+            try:
+                for use_range in (False, True):
+                    total, elapsed = run_round(port, names, file_size, args.concurrency, args.requests, use_range)
+                    mb = total / 1024 / 1024
+                    kind = "Range" if use_range else "完整文件"
+                    print(f"{label:<20}{kind:<10}{mb:>12.1f}{elapsed:>10.2f}{mb / elapsed:>14.1f}{args.requests / elapsed:>10.1f}")
+            finally:
+                server.should_exit = True
+                thread.join()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,23 @@
+import os
+
 from sqlalchemy import create_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 
-# SQLite数据库URL
-SQLALCHEMY_DATABASE_URL = "sqlite:///./repair_management.db"
+from utils.slow_queries import install_slow_query_recorder
+
+# 数据库URL，默认使用当前目录下的SQLite数据库（性能测试等场景可通过环境变量指定）
+SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./repair_management.db")
 
 # 创建SQLAlchemy引擎
 engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
+    SQLALCHEMY_DATABASE_URL,
+    connect_args={"check_same_thread": False} if SQLALCHEMY_DATABASE_URL.startswith("sqlite") else {}
 )
 
+# 记录慢查询（阈值等配置见 utils/slow_queries.py）
+install_slow_query_recorder(engine)
+
 # 创建会话本地类
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
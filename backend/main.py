@@ -5,13 +5,20 @@ from sqlalchemy.orm import Session
 import os
 from pathlib import Path
 
-from database import engine, Base, get_db
+from database import engine, Base, get_db, SessionLocal
 from models import *
-from routers import auth, projects, tasks, materials, work_items, teams, statistics, users, upload, health_check
+from routers import auth, projects, tasks, materials, work_items, teams, statistics, users, upload, health_check, events, sync, metrics, profiles
+from utils.static_files import UploadStaticFiles
+from utils.change_feed import register_change_tracking
+from utils.metrics import MetricsMiddleware
+from utils.profiling import ProfilingMiddleware, install_profiling
 
 # 创建数据库表
 Base.metadata.create_all(bind=engine)
 
+# 记录同步数据的变更日志
+register_change_tracking(SessionLocal)
+
 app = FastAPI(title="维修项目管理系统")
 
 # 配置CORS
@@ -43,10 +50,16 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["GET", "POST", "PUT", "DELETE", "OPTIONS", "PATCH"],
     allow_headers=["*"],
-    expose_headers=["Content-Disposition", "Content-Length"],
+    expose_headers=["Content-Disposition", "Content-Length", "Server-Timing", "X-Profile-Id"],
     max_age=600  # 缓存预检请求结果10分钟
 )
 
+# 管理员按请求开启的性能分析
+app.add_middleware(ProfilingMiddleware)
+
+# 请求性能指标（最外层，统计包含其他中间件在内的完整耗时）
+app.add_middleware(MetricsMiddleware)
+
 # 包含路由
 app.include_router(auth.router, prefix="/api", tags=["认证"])
 app.include_router(projects.router, prefix="/api", tags=["维修项目"])
@@ -58,6 +71,10 @@ app.include_router(statistics.router, prefix="/api", tags=["统计"])
 app.include_router(users.router, prefix="/api", tags=["用户管理"])
 app.include_router(upload.router, prefix="/api", tags=["文件上传"])
 app.include_router(health_check.router, prefix="/api", tags=["健康检查"])
+app.include_router(events.router, prefix="/api", tags=["实时事件"])
+app.include_router(sync.router, prefix="/api", tags=["数据同步"])
+app.include_router(metrics.router, prefix="/api", tags=["性能指标"])
+app.include_router(profiles.router, prefix="/api", tags=["性能分析"])
 
 @app.get("/")
 def read_root():
@@ -81,5 +98,8 @@ uploads_dir = Path(__file__).parent / "uploads"
 if not os.path.exists(uploads_dir):
     os.makedirs(uploads_dir)
 
+# 同步路由在线程池中执行，包装后才能记录性能分析
+install_profiling(app)
+
 app.mount("/templates", StaticFiles(directory=str(templates_dir)), name="templates")
-app.mount("/uploads", StaticFiles(directory=str(uploads_dir)), name="uploads")
+app.mount("/uploads", UploadStaticFiles(directory=str(uploads_dir)), name="uploads")
@@ -7,3 +7,4 @@ from models.material import Material
 from models.work_item import WorkItem
 from models.project_team import ProjectTeam
 from models.task_worker import TaskWorker
+from models.change_log import ChangeLog
@@ -0,0 +1,24 @@
+from sqlalchemy import Column, Integer, String, DateTime
+from sqlalchemy.sql import func
+from database import Base
+
+class ChangeOperation:
+    UPSERT = "upsert"  # 新增或修改
+    DELETE = "delete"  # 删除
+
+class ChangeLog(Base):
+    """
+    数据变更日志，供移动端增量同步使用
+
+    每次新增、修改、删除工单、工单明细、材料、工作内容时写入一行，
+    与业务数据在同一个事务中提交；自增ID即单调递增的变更序号
+    """
+    __tablename__ = "change_log"
+    # AUTOINCREMENT 保证序号不会被复用
+    __table_args__ = {"sqlite_autoincrement": True}
+
+    id = Column(Integer, primary_key=True, autoincrement=True)  # 变更序号
+    entity = Column(String, nullable=False)  # 表名
+    entity_id = Column(Integer, nullable=False)  # 记录ID
+    operation = Column(String, nullable=False)  # upsert / delete
+    changed_at = Column(DateTime(timezone=True), server_default=func.now())
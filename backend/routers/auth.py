@@ -17,7 +17,7 @@ from utils.auth import (
 router = APIRouter(prefix="/auth")
 
 @router.post("/token", response_model=Token)
-async def login_for_access_token(
+def login_for_access_token(
     form_data: OAuth2PasswordRequestForm = Depends(),
     db: Session = Depends(get_db)
 ):
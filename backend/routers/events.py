@@ -0,0 +1,86 @@
+from fastapi import APIRouter, Depends, HTTPException, Header, Query, status
+from fastapi.responses import StreamingResponse
+from jose import JWTError, jwt
+from typing import Optional
+
+from database import SessionLocal
+from models.user import User, UserRole
+from utils.auth import SECRET_KEY, ALGORITHM, get_current_active_user
+from utils.events import broker
+
+router = APIRouter(prefix="/events")
+
+def get_stream_user(
+    token: Optional[str] = Query(None, description="访问令牌，EventSource 无法设置请求头时使用"),
+    authorization: Optional[str] = Header(None)
+) -> User:
+    """
+    解析事件流连接的用户
+
+    不使用 get_db 依赖：连接会保持很长时间，查询完用户后立即释放数据库会话
+    """
+    credentials_exception = HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="无效的认证凭据",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+    if not token and authorization and authorization.lower().startswith("bearer "):
+        token = authorization[7:]
+    if not token:
+        raise credentials_exception
+
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        username = payload.get("sub")
+        if username is None:
+            raise credentials_exception
+    except JWTError:
+        raise credentials_exception
+
+    db = SessionLocal()
+    try:
+        user = db.query(User).filter(User.username == username).first()
+        if user is None:
+            raise credentials_exception
+        if not user.is_active:
+            raise HTTPException(status_code=400, detail="用户已被禁用")
+        db.expunge(user)
+        return user
+    finally:
+        db.close()
+
+@router.get("/stream")
+async def event_stream(
+    last_event_id: Optional[str] = Header(None, alias="Last-Event-ID"),
+    last_id: Optional[str] = Query(None, description="最后收到的事件ID，无法设置请求头时使用"),
+    current_user: User = Depends(get_stream_user)
+):
+    """
+    订阅当前用户的工单事件（Server-Sent Events）
+
+    管理员接收所有工单事件，其他用户接收与自己相关的工单事件
+    """
+    is_admin = current_user.role == UserRole.ADMIN.value
+    return StreamingResponse(
+        broker.stream(current_user.id, is_admin, last_event_id if last_event_id is not None else last_id),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            # 关闭nginx的响应缓冲，事件立即送达
+            "X-Accel-Buffering": "no",
+        }
+    )
+
+@router.get("/stats")
+def event_stats(current_user: User = Depends(get_current_active_user)):
+    """事件推送连接统计（仅管理员）"""
+    if current_user.role != UserRole.ADMIN.value:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="没有足够的权限执行此操作"
+        )
+    return {
+        "connections": broker.connections,
+        "published": broker.published,
+        "dropped": broker.dropped,
+    }
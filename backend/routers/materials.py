@@ -5,11 +5,12 @@ from datetime import datetime
 import logging
 
 from database import get_db
-from models.user import User
+from models.user import User, UserRole
 from models.material import Material, MaterialCategory, MaterialSupplyType
 from schemas.material import MaterialCreate, MaterialUpdate, Material as MaterialSchema
 from utils.auth import get_current_active_user
-from utils.import_utils import process_import
+from utils.import_utils import bulk_insert, load_by_column, process_import
+from utils.repricing import publish_reprice_events, reprice_tasks
 
 # 创建日志记录器
 logger = logging.getLogger(__name__)
@@ -81,6 +82,7 @@ def read_material(
 def update_material(
     material_id: int,
     material: MaterialUpdate,
+    reprice_open_tasks: bool = Query(False, description="单价变化时同步重新计算未完成工单（仅管理员）"),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_active_user)
 ):
@@ -89,10 +91,26 @@ def update_material(
         raise HTTPException(status_code=404, detail="材料不存在")
 
     update_data = material.dict(exclude_unset=True)
+    reprice = reprice_open_tasks and update_data.get("unit_price") is not None
+    # 重新定价会修改所有未完成工单，与 POST /tasks/reprice 一样只允许管理员执行
+    if reprice and current_user.role != UserRole.ADMIN.value:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="没有足够的权限执行此操作"
+        )
+
     for key, value in update_data.items():
         setattr(db_material, key, value)
 
+    # 同步更新未完成工单中该项的单价和费用，与单价修改在同一事务中提交
+    if reprice:
+        db.flush()
+        repriced = reprice_tasks(db, material_prices={material_id: update_data["unit_price"]}, dry_run=False,
+                                 commit=False)
+
     db.commit()
+    if reprice:
+        publish_reprice_events(db, repriced["task_ids"])
     db.refresh(db_material)
     return db_material
 
@@ -143,8 +161,11 @@ def import_materials(
         # 定义必需字段
         required_fields = ["category", "code", "name", "unit", "unit_price"]
 
+        # 数据库中已存在的材料编号，在验证阶段查询
+        existing_codes = set()
+
         # 定义处理每一行数据的函数
-        def process_row(row: Dict[str, Any]) -> Material:
+        def process_row(row: Dict[str, Any]) -> Dict[str, Any]:
             # 转换数据类型
             material_data = {
                 "category": row.get("category", "通信材料"),
@@ -160,15 +181,10 @@ def import_materials(
             }
 
             # 检查材料编号是否已存在
-            existing_material = db.query(Material).filter(Material.code == material_data["code"]).first()
-            if existing_material:
+            if material_data["code"] in existing_codes:
                 raise ValueError(f"材料编号 '{material_data['code']}' 已存在")
 
-            # 创建材料对象
-            db_material = Material(**material_data)
-            db.add(db_material)
-
-            return db_material
+            return material_data
 
         # 定义验证函数
         def validate_data(rows: List[Dict[str, Any]]) -> None:
@@ -177,6 +193,9 @@ def import_materials(
             if len(codes) != len(set(codes)):
                 raise ValueError("CSV文件中存在重复的材料编号")
 
+            # 一次查出已存在的材料编号，避免逐行查询
+            existing_codes.update(load_by_column(db, Material.code, codes))
+
         # 处理导入
         imported_materials = process_import(
             file_content=file_content,
@@ -184,6 +203,7 @@ def import_materials(
             process_row_func=process_row,
             validate_func=validate_data
         )
+        bulk_insert(db, Material, imported_materials)
 
         # 提交事务
         db.commit()
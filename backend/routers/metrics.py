@@ -0,0 +1,26 @@
+from fastapi import APIRouter, Header, HTTPException, Query, status
+from fastapi.responses import PlainTextResponse
+from typing import Optional
+import os
+
+from utils.metrics import render_metrics
+
+router = APIRouter()
+
+# 设置后抓取指标需要携带该令牌，未设置时不需要认证（由网络策略限制访问）
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+
+@router.get("/metrics", response_class=PlainTextResponse)
+def read_metrics(
+    token: Optional[str] = Query(None),
+    authorization: Optional[str] = Header(None)
+):
+    """Prometheus 格式的请求和数据库性能指标"""
+    if METRICS_TOKEN:
+        provided = token
+        if authorization and authorization.lower().startswith("bearer "):
+            provided = authorization[7:]
+        if provided != METRICS_TOKEN:
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="无效的认证凭据")
+
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
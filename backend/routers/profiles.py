@@ -0,0 +1,59 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.responses import FileResponse
+from typing import Any, Dict, List
+
+from models.user import User, UserRole
+from utils.auth import get_current_active_user
+from utils.profiling import SORT_KEYS, list_profiles, load_profile, profile_file
+
+router = APIRouter(prefix="/profiles")
+
+@router.get("", response_model=List[Dict[str, Any]])
+def read_profiles(
+    limit: int = Query(50, ge=1, le=500),
+    current_user: User = Depends(get_current_active_user)
+):
+    """最近的性能分析记录（仅管理员）"""
+    if current_user.role != UserRole.ADMIN.value:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="没有足够的权限执行此操作"
+        )
+    return list_profiles(limit)
+
+@router.get("/{profile_id}", response_model=Dict[str, Any])
+def read_profile(
+    profile_id: str,
+    sort: str = Query("cumulative", description="排序方式：cumulative、tottime、calls"),
+    limit: int = Query(50, ge=1, le=1000),
+    current_user: User = Depends(get_current_active_user)
+):
+    """性能分析记录详情：耗时最多的函数（仅管理员）"""
+    if current_user.role != UserRole.ADMIN.value:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="没有足够的权限执行此操作"
+        )
+    if sort not in SORT_KEYS:
+        raise HTTPException(status_code=400, detail=f"排序方式只能是 {', '.join(SORT_KEYS)}")
+
+    profile = load_profile(profile_id, sort, limit)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="性能分析记录不存在")
+    return profile
+
+@router.get("/{profile_id}/download")
+def download_profile(
+    profile_id: str,
+    current_user: User = Depends(get_current_active_user)
+):
+    """下载 .prof 文件，可用 snakeviz 或 pstats 查看（仅管理员）"""
+    if current_user.role != UserRole.ADMIN.value:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="没有足够的权限执行此操作"
+        )
+    path = profile_file(profile_id)
+    if path is None:
+        raise HTTPException(status_code=404, detail="性能分析记录不存在")
+    return FileResponse(str(path), media_type="application/octet-stream", filename=path.name)
@@ -277,35 +277,38 @@ def get_team_statistics(
     # 查询所有团队
     teams = db.query(Team).filter(Team.is_active == True).all()
     
-    result = []
-    for team in teams:
-        # 团队完成的工单数
-        completed_tasks_count = db.query(func.count(Task.id)).filter(
-            Task.team_id == team.id,
+    # 按团队分组汇总，语句数不随团队数量增长
+    # 团队完成的工单数和总收入（工单总费用）
+    completed = {
+        team_id: (count, income)
+        for team_id, count, income in db.query(
+            Task.team_id, func.count(Task.id), func.sum(Task.total_cost)
+        ).filter(
             Task.completed_at >= start_date,
             Task.completed_at <= end_date,
             Task.status == "completed"
-        ).scalar() or 0
-        
-        # 团队总工单数
-        total_tasks_count = db.query(func.count(Task.id)).filter(
-            Task.team_id == team.id,
+        ).group_by(Task.team_id)
+    }
+    
+    # 团队总工单数
+    totals = dict(
+        db.query(Task.team_id, func.count(Task.id)).filter(
             Task.created_at >= start_date,
             Task.created_at <= end_date
-        ).scalar() or 0
-        
-        # 团队总收入（工单总费用）
-        total_income = db.query(func.sum(Task.total_cost)).filter(
-            Task.team_id == team.id,
-            Task.completed_at >= start_date,
-            Task.completed_at <= end_date,
-            Task.status == "completed"
-        ).scalar() or 0
-        
-        # 团队成员数
-        members_count = db.query(func.count(TeamMember.id)).filter(
-            TeamMember.team_id == team.id
-        ).scalar() or 0
+        ).group_by(Task.team_id).all()
+    )
+    
+    # 团队成员数
+    members = dict(
+        db.query(TeamMember.team_id, func.count(TeamMember.id)).group_by(TeamMember.team_id).all()
+    )
+    
+    result = []
+    for team in teams:
+        completed_tasks_count, total_income = completed.get(team.id, (0, 0))
+        total_income = total_income or 0
+        total_tasks_count = totals.get(team.id, 0)
+        members_count = members.get(team.id, 0)
         
         result.append({
             "id": team.id,
@@ -0,0 +1,30 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.orm import Session
+from typing import Optional
+
+from database import get_db
+from models.user import User
+from utils.auth import get_current_active_user
+from utils.change_feed import DEFAULT_CHANGE_LIMIT, get_changes, parse_since
+
+router = APIRouter(prefix="/sync")
+
+@router.get("/changes")
+def read_changes(
+    since: Optional[str] = Query(None, description="上次同步返回的 next 值，首次同步不传"),
+    limit: int = Query(DEFAULT_CHANGE_LIMIT, ge=1, le=5000, description="本次最多处理的变更数（首次同步时为最多返回的记录数）"),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """
+    增量同步工单、工单明细、材料和工作内容
+
+    返回 since 之后新增、修改、删除的记录，客户端保存 next 作为下次的 since；
+    has_more 为 true 时应立即继续拉取（首次同步的全部数据也按 limit 分页返回）
+    """
+    try:
+        position = parse_since(since)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="无效的同步序号")
+
+    return get_changes(db, position, limit)
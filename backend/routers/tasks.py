@@ -1,28 +1,63 @@
-from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File
+from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Query
+from fastapi.responses import StreamingResponse
+from sqlalchemy import insert
 from sqlalchemy.orm import Session
 from typing import List, Dict, Any, Optional
 from datetime import datetime
 import logging
 import json
 
-from database import get_db
-from models.user import User
+from database import get_db, SessionLocal
+from models.user import User, UserRole
 from models.task import Task, TaskStatus, TaskMaterial, TaskWorkItem
 from models.material import Material
 from models.work_item import WorkItem
 from models.project import Project
+from models.change_log import ChangeOperation
 from schemas.task import (
     TaskCreate, TaskUpdate, Task as TaskSchema,
-    TaskDetail, TaskComplete, TaskMaterialCreate, TaskWorkItemCreate
+    TaskDetail, TaskComplete, TaskMaterialCreate, TaskWorkItemCreate,
+    TaskRepriceRequest, TaskRepriceResult, TaskBatchRequest, TaskBatchResult
 )
 from utils.auth import get_current_active_user
-from utils.import_utils import process_import
+from utils.import_utils import bulk_insert, load_by_column, process_import
+from utils.export_utils import iter_csv, iter_xlsx
+from utils.task_export import SETTLEMENT_HEADER, build_settlement_query, iter_settlement_rows
+from utils.repricing import reprice_tasks
+from utils.task_batch import execute_batch
+from utils.change_feed import record_changes_where
+from utils.events import (
+    EVENT_TASK_ASSIGNED, EVENT_TASK_UPDATED, EVENT_TASK_DELETED,
+    broker, collect_task_recipients, task_event_data
+)
 
 # 创建日志记录器
 logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/tasks")
 
+def _load_by_ids(db: Session, model, ids) -> Dict[int, Any]:
+    """
+    按ID批量查询材料或工作内容，避免逐条明细查询
+
+    Args:
+        db: 数据库会话
+        model: Material 或 WorkItem
+        ids: ID列表（可包含空值或字符串形式的数字）
+
+    Returns:
+        ID -> 记录
+    """
+    wanted = set()
+    for value in ids:
+        try:
+            wanted.add(int(value))
+        except (TypeError, ValueError):
+            continue
+    if not wanted:
+        return {}
+    return {row.id: row for row in db.query(model).filter(model.id.in_(wanted))}
+
 @router.post("/", response_model=TaskSchema)
 def create_task(
     task: TaskCreate,
@@ -53,6 +88,7 @@ def create_task(
             # 处理工作内容
             if work_items_str:
                 work_items = json.loads(work_items_str)
+                catalog_work_items = _load_by_ids(db, WorkItem, [item.get('work_item_id') for item in work_items])
                 for work_item in work_items:
                     if not work_item.get('work_item_id') or not work_item.get('quantity'):
                         continue
@@ -61,7 +97,7 @@ def create_task(
                     quantity = float(work_item['quantity'])
 
                     # 获取工作内容信息
-                    db_work_item = db.query(WorkItem).filter(WorkItem.id == work_item_id).first()
+                    db_work_item = catalog_work_items.get(int(work_item_id))
                     if db_work_item:
                         # 计算总价
                         total_price = db_work_item.unit_price * quantity
@@ -79,6 +115,7 @@ def create_task(
             # 处理材料
             if materials_str:
                 materials = json.loads(materials_str)
+                catalog_materials = _load_by_ids(db, Material, [item.get('material_id') for item in materials])
                 for material in materials:
                     if not material.get('material_id') or not material.get('quantity'):
                         continue
@@ -88,7 +125,7 @@ def create_task(
                     is_company_provided = material.get('is_company_provided', False)
 
                     # 获取材料信息
-                    db_material = db.query(Material).filter(Material.id == material_id).first()
+                    db_material = catalog_materials.get(int(material_id))
                     if db_material:
                         # 计算总价
                         total_price = db_material.unit_price * quantity
@@ -141,6 +178,83 @@ def read_my_tasks(
         query = query.filter(Task.status == status)
     return query.offset(skip).limit(limit).all()
 
+@router.get("/export")
+def export_tasks(
+    format: str = Query("csv", pattern="^(csv|xlsx)$", description="导出格式"),
+    status: Optional[str] = Query(None, description="工单状态"),
+    project_id: Optional[int] = Query(None, description="项目ID"),
+    team_id: Optional[int] = Query(None, description="施工队伍ID"),
+    start_date: Optional[datetime] = Query(None, description="完成时间起"),
+    end_date: Optional[datetime] = Query(None, description="完成时间止"),
+    current_user: User = Depends(get_current_active_user)
+):
+    """流式导出工单结算明细"""
+    stmt = build_settlement_query(
+        status=status,
+        project_id=project_id,
+        team_id=team_id,
+        start_date=start_date,
+        end_date=end_date
+    )
+
+    def generate():
+        # 导出期间使用独立的会话，响应发送完毕后再关闭
+        db = SessionLocal()
+        try:
+            rows = iter_settlement_rows(db, stmt)
+            if format == "xlsx":
+                yield from iter_xlsx(SETTLEMENT_HEADER, rows, sheet_name="结算明细")
+            else:
+                yield from iter_csv(SETTLEMENT_HEADER, rows)
+        finally:
+            db.close()
+
+    filename = f"settlement_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{format}"
+    media_type = (
+        "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+        if format == "xlsx" else "text/csv"
+    )
+    return StreamingResponse(
+        generate(),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+@router.post("/reprice", response_model=TaskRepriceResult)
+def reprice_open_tasks(
+    reprice: TaskRepriceRequest,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """按新的工作内容、材料单价重新计算未完成工单的明细和费用"""
+    if current_user.role != UserRole.ADMIN.value:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="没有足够的权限执行此操作"
+        )
+
+    return reprice_tasks(
+        db,
+        work_item_prices={item.id: item.unit_price for item in reprice.work_items},
+        material_prices={item.id: item.unit_price for item in reprice.materials},
+        dry_run=reprice.dry_run
+    )
+
+@router.post("/batch", response_model=TaskBatchResult)
+def batch_tasks(
+    batch: TaskBatchRequest,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """在一个事务中批量指派、修改状态或删除工单"""
+    if not batch.operations:
+        raise HTTPException(status_code=400, detail="没有需要执行的操作")
+
+    try:
+        return execute_batch(db, batch.operations, current_user)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"批量操作工单失败: {str(e)}")
+
 @router.get("/{task_id}", response_model=TaskDetail)
 def read_task(
     task_id: int,
@@ -170,6 +284,10 @@ def update_task(
     work_items_str = update_data.pop('work_items', None)
     materials_str = update_data.pop('materials', None)
 
+    # 记录原负责人和施工队伍，变更后也要通知原负责人
+    previous_assignee = db_task.assigned_to_id
+    previous_team = db_task.team_id
+
     # 如果状态变为已接单，设置接单时间和接单人
     if "status" in update_data and update_data["status"] == TaskStatus.ASSIGNED.value:
         if not db_task.assigned_to_id:
@@ -193,6 +311,8 @@ def update_task(
             import json
 
             # 清除现有的工作内容和材料
+            record_changes_where(db, TaskWorkItem, TaskWorkItem.task_id == task_id, ChangeOperation.DELETE)
+            record_changes_where(db, TaskMaterial, TaskMaterial.task_id == task_id, ChangeOperation.DELETE)
             db.query(TaskWorkItem).filter(TaskWorkItem.task_id == task_id).delete()
             db.query(TaskMaterial).filter(TaskMaterial.task_id == task_id).delete()
 
@@ -203,6 +323,7 @@ def update_task(
             # 处理工作内容
             if work_items_str:
                 work_items = json.loads(work_items_str)
+                catalog_work_items = _load_by_ids(db, WorkItem, [item.get('work_item_id') for item in work_items])
                 for work_item in work_items:
                     if not work_item.get('work_item_id') or not work_item.get('quantity'):
                         continue
@@ -211,7 +332,7 @@ def update_task(
                     quantity = float(work_item['quantity'])
 
                     # 获取工作内容信息
-                    db_work_item = db.query(WorkItem).filter(WorkItem.id == work_item_id).first()
+                    db_work_item = catalog_work_items.get(int(work_item_id))
                     if db_work_item:
                         # 计算总价
                         total_price = db_work_item.unit_price * quantity
@@ -230,6 +351,7 @@ def update_task(
             # 处理材料
             if materials_str:
                 materials = json.loads(materials_str)
+                catalog_materials = _load_by_ids(db, Material, [item.get('material_id') for item in materials])
                 for material in materials:
                     if not material.get('material_id') or not material.get('quantity'):
                         continue
@@ -239,7 +361,7 @@ def update_task(
                     is_company_provided = material.get('is_company_provided', False)
 
                     # 获取材料信息
-                    db_material = db.query(Material).filter(Material.id == material_id).first()
+                    db_material = catalog_materials.get(int(material_id))
                     if db_material:
                         # 计算总价
                         total_price = db_material.unit_price * quantity
@@ -276,6 +398,12 @@ def update_task(
             print(traceback.format_exc())
             # 不回滚，保留已更新的任务
 
+    # 推送工单变化给相关用户
+    reassigned = db_task.assigned_to_id != previous_assignee or db_task.team_id != previous_team
+    recipients = collect_task_recipients(db, [task_id])[task_id]
+    recipients.add(previous_assignee)
+    broker.publish(EVENT_TASK_ASSIGNED if reassigned else EVENT_TASK_UPDATED, task_event_data(db_task), recipients)
+
     return db_task
 
 @router.post("/{task_id}/complete", response_model=TaskDetail)
@@ -293,17 +421,24 @@ def complete_task(
         raise HTTPException(status_code=400, detail="工单已完成")
 
     # 清除现有的材料和工作内容
+    record_changes_where(db, TaskMaterial, TaskMaterial.task_id == task_id, ChangeOperation.DELETE)
+    record_changes_where(db, TaskWorkItem, TaskWorkItem.task_id == task_id, ChangeOperation.DELETE)
     db.query(TaskMaterial).filter(TaskMaterial.task_id == task_id).delete()
     db.query(TaskWorkItem).filter(TaskWorkItem.task_id == task_id).delete()
 
     total_cost = 0.0
 
+    # 一次查出用到的材料和工作内容，语句数不随明细条数增长
+    materials = _load_by_ids(db, Material, [item.material_id for item in task_complete.materials])
+    work_items = _load_by_ids(db, WorkItem, [item.work_item_id for item in task_complete.work_items])
+
     # 添加材料
     company_material_cost = 0.0
     self_material_cost = 0.0
+    material_rows = []
 
     for material_item in task_complete.materials:
-        db_material = db.query(Material).filter(Material.id == material_item.material_id).first()
+        db_material = materials.get(material_item.material_id)
         if not db_material:
             raise HTTPException(status_code=404, detail=f"材料ID {material_item.material_id} 不存在")
 
@@ -316,33 +451,40 @@ def complete_task(
         else:
             self_material_cost += material_cost
 
-        db_task_material = TaskMaterial(
-            task_id=task_id,
-            material_id=material_item.material_id,
-            quantity=material_item.quantity,
-            is_company_provided=material_item.is_company_provided,
-            unit_price=db_material.unit_price,
-            total_price=material_cost
-        )
-        db.add(db_task_material)
+        material_rows.append({
+            "task_id": task_id,
+            "material_id": material_item.material_id,
+            "quantity": material_item.quantity,
+            "is_company_provided": material_item.is_company_provided,
+            "unit_price": db_material.unit_price,
+            "total_price": material_cost
+        })
 
     # 添加工作内容
+    work_item_rows = []
     for work_item in task_complete.work_items:
-        db_work_item = db.query(WorkItem).filter(WorkItem.id == work_item.work_item_id).first()
+        db_work_item = work_items.get(work_item.work_item_id)
         if not db_work_item:
             raise HTTPException(status_code=404, detail=f"工作内容ID {work_item.work_item_id} 不存在")
 
         work_cost = db_work_item.unit_price * work_item.quantity
         total_cost += work_cost
 
-        db_task_work_item = TaskWorkItem(
-            task_id=task_id,
-            work_item_id=work_item.work_item_id,
-            quantity=work_item.quantity,
-            unit_price=db_work_item.unit_price,
-            total_price=work_cost
-        )
-        db.add(db_task_work_item)
+        work_item_rows.append({
+            "task_id": task_id,
+            "work_item_id": work_item.work_item_id,
+            "quantity": work_item.quantity,
+            "unit_price": db_work_item.unit_price,
+            "total_price": work_cost
+        })
+
+    # 批量插入明细（executemany），变更记录用一条 INSERT ... SELECT 补上
+    if material_rows:
+        db.execute(insert(TaskMaterial), material_rows)
+        record_changes_where(db, TaskMaterial, TaskMaterial.task_id == task_id)
+    if work_item_rows:
+        db.execute(insert(TaskWorkItem), work_item_rows)
+        record_changes_where(db, TaskWorkItem, TaskWorkItem.task_id == task_id)
 
     # 更新工单状态和费用
     db_task.status = TaskStatus.COMPLETED.value
@@ -355,6 +497,8 @@ def complete_task(
 
     db.commit()
     db.refresh(db_task)
+
+    broker.publish(EVENT_TASK_UPDATED, task_event_data(db_task), collect_task_recipients(db, [task_id])[task_id])
     return db_task
 
 @router.delete("/{task_id}", status_code=status.HTTP_204_NO_CONTENT)
@@ -367,12 +511,19 @@ def delete_task(
     if db_task is None:
         raise HTTPException(status_code=404, detail="工单不存在")
 
+    recipients = collect_task_recipients(db, [task_id])[task_id]
+    event_data = task_event_data(db_task)
+
     # 删除关联的材料和工作内容
+    record_changes_where(db, TaskMaterial, TaskMaterial.task_id == task_id, ChangeOperation.DELETE)
+    record_changes_where(db, TaskWorkItem, TaskWorkItem.task_id == task_id, ChangeOperation.DELETE)
     db.query(TaskMaterial).filter(TaskMaterial.task_id == task_id).delete()
     db.query(TaskWorkItem).filter(TaskWorkItem.task_id == task_id).delete()
 
     db.delete(db_task)
     db.commit()
+
+    broker.publish(EVENT_TASK_DELETED, event_data, recipients)
     return None
 
 @router.options("/import")
@@ -401,8 +552,11 @@ def import_tasks(
         # 定义必需字段
         required_fields = ["title"]
 
+        # 已存在的项目，在验证阶段一次查出
+        projects = {}
+
         # 定义处理每一行数据的函数
-        def process_row(row: Dict[str, Any]) -> Task:
+        def process_row(row: Dict[str, Any]) -> Dict[str, Any]:
             # 转换数据类型
             task_data = {
                 "title": row.get("title", ""),
@@ -422,23 +576,31 @@ def import_tasks(
             if "project_id" in row and row["project_id"]:
                 project_id = int(row["project_id"])
                 # 检查项目是否存在
-                project = db.query(Project).filter(Project.id == project_id).first()
-                if not project:
+                if project_id not in projects:
                     raise ValueError(f"项目ID {project_id} 不存在")
                 task_data["project_id"] = project_id
 
-            # 创建工单对象
-            db_task = Task(**task_data)
-            db.add(db_task)
+            return task_data
 
-            return db_task
+        # 定义验证函数
+        def validate_data(rows: List[Dict[str, Any]]) -> None:
+            project_ids = set()
+            for row in rows:
+                if row.get("project_id"):
+                    try:
+                        project_ids.add(int(row["project_id"]))
+                    except ValueError:
+                        raise ValueError(f"无效的项目ID: {row['project_id']}")
+            projects.update(load_by_column(db, Project.id, project_ids))
 
         # 处理导入
         imported_tasks = process_import(
             file_content=file_content,
             required_fields=required_fields,
-            process_row_func=process_row
+            process_row_func=process_row,
+            validate_func=validate_data
         )
+        bulk_insert(db, Task, imported_tasks)
 
         # 提交事务
         db.commit()
@@ -491,41 +653,49 @@ def import_task_work_items(
         # 定义必需字段
         required_fields = ["project_number", "quantity"]
 
+        # 引用的工作内容，在验证阶段一次查出
+        work_items = {}
+
         # 定义处理每一行数据的函数
-        def process_row(row: Dict[str, Any]) -> TaskWorkItem:
+        def process_row(row: Dict[str, Any]) -> Dict[str, Any]:
             # 转换数据类型
             project_number = row.get("project_number", "").strip()
             quantity = float(row.get("quantity", 0) or 0)
 
             # 检查工作内容是否存在
-            db_work_item = db.query(WorkItem).filter(WorkItem.project_number == project_number).first()
+            db_work_item = work_items.get(project_number)
             if not db_work_item:
                 raise ValueError(f"工作内容编号 {project_number} 不存在")
 
             # 计算总价
             total_price = db_work_item.unit_price * quantity
 
-            # 创建工单工作内容关联
-            db_task_work_item = TaskWorkItem(
-                task_id=task_id,
-                work_item_id=db_work_item.id,
-                quantity=quantity,
-                unit_price=db_work_item.unit_price,
-                total_price=total_price
-            )
-            db.add(db_task_work_item)
+            # 工单工作内容关联
+            return {
+                "task_id": task_id,
+                "work_item_id": db_work_item.id,
+                "quantity": quantity,
+                "unit_price": db_work_item.unit_price,
+                "total_price": total_price
+            }
 
-            return db_task_work_item
+        # 定义验证函数
+        def validate_data(rows: List[Dict[str, Any]]) -> None:
+            work_items.update(load_by_column(
+                db, WorkItem.project_number, (row.get("project_number", "").strip() for row in rows)
+            ))
 
         # 处理导入
         imported_work_items = process_import(
             file_content=file_content,
             required_fields=required_fields,
-            process_row_func=process_row
+            process_row_func=process_row,
+            validate_func=validate_data
         )
+        bulk_insert(db, TaskWorkItem, imported_work_items)
 
         # 更新工单的施工费
-        labor_cost = sum(item.total_price for item in imported_work_items)
+        labor_cost = sum(item["total_price"] for item in imported_work_items)
         db_task.labor_cost = labor_cost
         db_task.total_cost = labor_cost + db_task.material_cost
 
@@ -580,8 +750,11 @@ def import_task_materials(
         # 定义必需字段
         required_fields = ["code", "quantity"]
 
+        # 引用的材料，在验证阶段一次查出
+        materials = {}
+
         # 定义处理每一行数据的函数
-        def process_row(row: Dict[str, Any]) -> TaskMaterial:
+        def process_row(row: Dict[str, Any]) -> Dict[str, Any]:
             # 转换数据类型
             code = row.get("code", "").strip()
             quantity = float(row.get("quantity", 0) or 0)
@@ -591,36 +764,43 @@ def import_task_materials(
             is_company_provided = is_company_provided_str in ["true", "1", "yes", "y", "是", "甲供"]
 
             # 检查材料是否存在
-            db_material = db.query(Material).filter(Material.code == code).first()
+            db_material = materials.get(code)
             if not db_material:
                 raise ValueError(f"材料编号 {code} 不存在")
 
             # 计算总价
             total_price = db_material.unit_price * quantity
 
-            # 创建工单材料关联
-            db_task_material = TaskMaterial(
-                task_id=task_id,
-                material_id=db_material.id,
-                quantity=quantity,
-                is_company_provided=is_company_provided,
-                unit_price=db_material.unit_price,
-                total_price=total_price
-            )
-            db.add(db_task_material)
+            # 工单材料关联
+            return {
+                "task_id": task_id,
+                "material_id": db_material.id,
+                "quantity": quantity,
+                "is_company_provided": is_company_provided,
+                "unit_price": db_material.unit_price,
+                "total_price": total_price
+            }
 
-            return db_task_material
+        # 定义验证函数
+        def validate_data(rows: List[Dict[str, Any]]) -> None:
+            materials.update(load_by_column(db, Material.code, (row.get("code", "").strip() for row in rows)))
 
         # 处理导入
         imported_materials = process_import(
             file_content=file_content,
             required_fields=required_fields,
-            process_row_func=process_row
+            process_row_func=process_row,
+            validate_func=validate_data
         )
+        bulk_insert(db, TaskMaterial, imported_materials)
 
         # 更新工单的材料费
-        company_material_cost = sum(item.total_price for item in imported_materials if item.is_company_provided)
-        self_material_cost = sum(item.total_price for item in imported_materials if not item.is_company_provided)
+        company_material_cost = sum(
+            item["total_price"] for item in imported_materials if item["is_company_provided"]
+        )
+        self_material_cost = sum(
+            item["total_price"] for item in imported_materials if not item["is_company_provided"]
+        )
         material_cost = company_material_cost + self_material_cost
 
         db_task.company_material_cost = company_material_cost
@@ -10,6 +10,7 @@ from datetime import datetime
 from database import get_db
 from models.user import User
 from utils.auth import get_current_active_user
+from utils.image_utils import schedule_variants, variant_urls
 
 router = APIRouter(prefix="/upload")
 
@@ -41,12 +42,16 @@ async def upload_file(
         
         # 生成可访问的URL
         file_url = f"/uploads/{today}/{unique_filename}"
+
+        # 图片在后台生成缩略图和网页尺寸图
+        schedule_variants(file_path)
         
         return {
             "filename": file.filename,
             "url": file_url,
             "size": os.path.getsize(file_path),
-            "content_type": file.content_type
+            "content_type": file.content_type,
+            "variants": variant_urls(file_url, file_path)
         }
     except Exception as e:
         raise HTTPException(
@@ -82,12 +87,16 @@ async def upload_multiple_files(
             
             # 生成可访问的URL
             file_url = f"/uploads/{today}/{unique_filename}"
+
+            # 图片在后台生成缩略图和网页尺寸图
+            schedule_variants(file_path)
             
             result.append({
                 "filename": file.filename,
                 "url": file_url,
                 "size": os.path.getsize(file_path),
-                "content_type": file.content_type
+                "content_type": file.content_type,
+                "variants": variant_urls(file_url, file_path)
             })
         except Exception as e:
             # 记录错误但继续处理其他文件
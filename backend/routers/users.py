@@ -9,7 +9,7 @@ from database import get_db
 from models.user import User, UserRole
 from schemas.user import User as UserSchema, UserUpdate
 from utils.auth import get_current_active_user, get_current_user
-from utils.import_utils import process_import
+from utils.import_utils import bulk_insert, load_by_column, process_import
 
 # 创建日志记录器
 logger = logging.getLogger(__name__)
@@ -207,15 +207,18 @@ def import_users(
         # 定义必需字段
         required_fields = ["username", "password", "email", "role"]
 
+        # 数据库中已存在的用户名和邮箱，在验证阶段查询
+        existing_usernames = set()
+        existing_emails = set()
+
         # 定义处理每一行数据的函数
-        def process_row(row: Dict[str, Any]) -> User:
+        def process_row(row: Dict[str, Any]) -> Dict[str, Any]:
             # 检查用户名是否已存在
             username = row.get("username", "").strip()
             if not username:
                 raise ValueError("用户名不能为空")
 
-            existing_user = db.query(User).filter(User.username == username).first()
-            if existing_user:
+            if username in existing_usernames:
                 raise ValueError(f"用户名 '{username}' 已存在")
 
             # 检查邮箱是否已存在
@@ -223,8 +226,7 @@ def import_users(
             if not email:
                 raise ValueError("邮箱不能为空")
 
-            existing_email = db.query(User).filter(User.email == email).first()
-            if existing_email:
+            if email in existing_emails:
                 raise ValueError(f"邮箱 '{email}' 已被使用")
 
             # 检查角色是否有效
@@ -241,22 +243,16 @@ def import_users(
             hashed_password = pwd_context.hash(password)
 
             # 创建用户对象
-            user_data = {
+            return {
                 "username": username,
                 "email": email,
                 "hashed_password": hashed_password,
                 "role": role,
                 "full_name": row.get("full_name", ""),
                 "phone": row.get("phone", ""),
-                "is_active": True,
-                "created_at": datetime.now()
+                "is_active": True
             }
 
-            db_user = User(**user_data)
-            db.add(db_user)
-
-            return db_user
-
         # 定义验证函数
         def validate_data(rows: List[Dict[str, Any]]) -> None:
             # 检查用户名是否唯一
@@ -269,6 +265,10 @@ def import_users(
             if len(emails) != len(set(emails)):
                 raise ValueError("CSV文件中存在重复的邮箱")
 
+            # 一次查出已存在的用户名和邮箱，避免逐行查询
+            existing_usernames.update(load_by_column(db, User.username, usernames))
+            existing_emails.update(load_by_column(db, User.email, emails))
+
         # 处理导入
         imported_users = process_import(
             file_content=file_content,
@@ -276,6 +276,7 @@ def import_users(
             process_row_func=process_row,
             validate_func=validate_data
         )
+        bulk_insert(db, User, imported_users)
 
         # 提交事务
         db.commit()
@@ -5,11 +5,12 @@ from datetime import datetime
 import logging
 
 from database import get_db
-from models.user import User
+from models.user import User, UserRole
 from models.work_item import WorkItem, WorkItemCategory
 from schemas.work_item import WorkItemCreate, WorkItemUpdate, WorkItem as WorkItemSchema
 from utils.auth import get_current_active_user
-from utils.import_utils import process_import
+from utils.import_utils import bulk_insert, load_by_column, process_import
+from utils.repricing import publish_reprice_events, reprice_tasks
 
 # 创建日志记录器
 logger = logging.getLogger(__name__)
@@ -162,6 +163,7 @@ def read_work_item(
 def update_work_item(
     work_item_id: int,
     work_item: WorkItemUpdate,
+    reprice_open_tasks: bool = Query(False, description="单价变化时同步重新计算未完成工单（仅管理员）"),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_active_user)
 ):
@@ -170,10 +172,26 @@ def update_work_item(
         raise HTTPException(status_code=404, detail="工作内容不存在")
 
     update_data = work_item.dict(exclude_unset=True)
+    reprice = reprice_open_tasks and update_data.get("unit_price") is not None
+    # 重新定价会修改所有未完成工单，与 POST /tasks/reprice 一样只允许管理员执行
+    if reprice and current_user.role != UserRole.ADMIN.value:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="没有足够的权限执行此操作"
+        )
+
     for key, value in update_data.items():
         setattr(db_work_item, key, value)
 
+    # 同步更新未完成工单中该项的单价和费用，与单价修改在同一事务中提交
+    if reprice:
+        db.flush()
+        repriced = reprice_tasks(db, work_item_prices={work_item_id: update_data["unit_price"]}, dry_run=False,
+                                 commit=False)
+
     db.commit()
+    if reprice:
+        publish_reprice_events(db, repriced["task_ids"])
     db.refresh(db_work_item)
     return db_work_item
 
@@ -229,8 +247,11 @@ def import_work_items(
         required_fields = ["category", "project_number", "name", "unit", "unit_price"]
         logger.debug(f"必需字段: {required_fields}")
 
+        # 数据库中已存在的项目编号，在验证阶段查询
+        existing_numbers = set()
+
         # 定义处理每一行数据的函数
-        def process_row(row: Dict[str, Any]) -> WorkItem:
+        def process_row(row: Dict[str, Any]) -> Dict[str, Any]:
             # 记录正在处理的行
             logger.debug(f"处理行数据: {row}")
 
@@ -257,22 +278,12 @@ def import_work_items(
                     raise ValueError(error_msg)
 
             # 检查项目编号是否已存在
-            existing_item = db.query(WorkItem).filter(WorkItem.project_number == work_item_data["project_number"]).first()
-            if existing_item:
+            if work_item_data["project_number"] in existing_numbers:
                 error_msg = f"项目编号 '{work_item_data['project_number']}' 已存在"
                 logger.error(error_msg)
                 raise ValueError(error_msg)
 
-            # 创建工作内容对象
-            try:
-                db_work_item = WorkItem(**work_item_data)
-                db.add(db_work_item)
-                logger.debug(f"成功创建工作内容对象: {work_item_data['project_number']}")
-                return db_work_item
-            except Exception as e:
-                error_msg = f"创建工作内容对象失败: {str(e)}"
-                logger.error(error_msg)
-                raise ValueError(error_msg)
+            return work_item_data
 
         # 定义验证函数
         def validate_data(rows: List[Dict[str, Any]]) -> None:
@@ -291,6 +302,9 @@ def import_work_items(
                 logger.error(error_msg)
                 raise ValueError(error_msg)
 
+            # 一次查出已存在的项目编号，避免逐行查询
+            existing_numbers.update(load_by_column(db, WorkItem.project_number, project_numbers))
+
             logger.info("数据验证通过")
 
         # 处理导入
@@ -301,6 +315,7 @@ def import_work_items(
             process_row_func=process_row,
             validate_func=validate_data
         )
+        bulk_insert(db, WorkItem, imported_items)
 
         # 提交事务
         db.commit()
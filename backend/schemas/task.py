@@ -94,3 +94,53 @@ class TaskDetail(Task):
 class TaskComplete(BaseModel):
     materials: List[TaskMaterialCreate] = []
     work_items: List[TaskWorkItemCreate] = []
+
+class PriceChange(BaseModel):
+    id: int  # 工作内容ID或材料ID
+    unit_price: float  # 新单价
+
+class TaskRepriceRequest(BaseModel):
+    work_items: List[PriceChange] = []
+    materials: List[PriceChange] = []
+    dry_run: bool = True  # 默认只预览差异，不修改数据
+
+class TaskCostDiff(BaseModel):
+    task_id: int
+    old_labor_cost: float
+    new_labor_cost: float
+    old_company_material_cost: float
+    new_company_material_cost: float
+    old_self_material_cost: float
+    new_self_material_cost: float
+    old_total_cost: float
+    new_total_cost: float
+
+class TaskRepriceResult(BaseModel):
+    dry_run: bool
+    affected_work_item_lines: int
+    affected_material_lines: int
+    affected_tasks: int
+    total_cost_delta: float
+    tasks: List[TaskCostDiff] = []
+
+class TaskBatchOperation(BaseModel):
+    action: str  # assign（指派）、status（修改状态）、delete（删除）
+    task_ids: List[int]
+    team_id: Optional[int] = None  # 指派的施工队伍
+    assigned_to_id: Optional[int] = None  # 指派的负责人
+    status: Optional[str] = None  # 修改后的状态
+
+class TaskBatchRequest(BaseModel):
+    operations: List[TaskBatchOperation]
+
+class TaskBatchItemResult(BaseModel):
+    operation: int  # 操作在请求中的序号
+    action: str
+    task_id: int
+    success: bool
+    detail: Optional[str] = None
+
+class TaskBatchResult(BaseModel):
+    succeeded: int
+    failed: int
+    results: List[TaskBatchItemResult] = []
@@ -0,0 +1,183 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+测试公共夹具
+
+应用使用临时目录中的SQLite数据库（在导入应用之前通过 DATABASE_URL 指定），
+会话开始时写入一组数据：每个班组多名成员、每个已完成工单有多条明细，
+数据量足以让逐条查询（N+1）超出语句数预算。
+"""
+
+import os
+import sys
+import tempfile
+from datetime import datetime, timedelta
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND_DIR))
+
+_TMP_DIR = tempfile.mkdtemp(prefix="repair_tests_")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_TMP_DIR, 'test.db')}"
+os.environ["SLOW_QUERY_THRESHOLD_MS"] = "0"
+os.environ["PROFILE_DIR"] = os.path.join(_TMP_DIR, "profiles")
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+import main  # noqa: E402
+import routers.upload  # noqa: E402
+from database import SessionLocal, engine  # noqa: E402
+from models import (  # noqa: E402
+    Material, Project, ProjectTeam, Task, TaskMaterial, TaskWorker, TaskWorkItem, Team, TeamMember, User, WorkItem
+)
+from utils.auth import create_access_token  # noqa: E402
+from tests.query_budget import query_budget as _query_budget  # noqa: E402
+
+# 上传的测试文件写到临时目录
+routers.upload.UPLOAD_DIR = os.path.join(_TMP_DIR, "uploads")
+
+TEAMS = 5
+MEMBERS_PER_TEAM = 3
+PROJECTS = 4
+CATALOG_SIZE = 20
+TASKS_PER_STATUS = 8
+LINES_PER_TASK = 10
+
+
+def add_task(db, project_id, team_id, creator_id, assignee_id=None, status="pending", lines=0):
+    """创建一个工单及其明细，返回工单ID"""
+    now = datetime.now()
+    task = Task(
+        project_id=project_id,
+        title=f"测试工单-{status}",
+        status=status,
+        created_by_id=creator_id,
+        assigned_to_id=assignee_id,
+        team_id=team_id,
+        assigned_at=now if assignee_id else None,
+        completed_at=now if status == "completed" else None,
+    )
+    db.add(task)
+    db.flush()
+    if assignee_id:
+        db.add(TaskWorker(task_id=task.id, user_id=assignee_id, is_primary=True))
+    labor_cost = material_cost = 0.0
+    for index in range(lines):
+        db.add(TaskWorkItem(task_id=task.id, work_item_id=index % CATALOG_SIZE + 1, quantity=2,
+                            unit_price=10.0, total_price=20.0))
+        db.add(TaskMaterial(task_id=task.id, material_id=index % CATALOG_SIZE + 1, quantity=3,
+                            is_company_provided=index % 2 == 0, unit_price=5.0, total_price=15.0))
+        labor_cost += 20.0
+        material_cost += 15.0
+    task.labor_cost = labor_cost
+    task.material_cost = material_cost
+    task.total_cost = labor_cost + material_cost
+    db.commit()
+    return task.id
+
+
+@pytest.fixture(scope="session")
+def data():
+    """会话级测试数据，返回各类记录的ID"""
+    db = SessionLocal()
+    try:
+        admin = User(username="admin", email="admin@example.com", hashed_password="x", full_name="管理员",
+                     role="admin", is_active=True)
+        manager = User(username="manager", email="manager@example.com", hashed_password="x", full_name="经理",
+                       role="manager", is_active=True)
+        db.add_all([admin, manager])
+        db.flush()
+
+        teams, workers = [], []
+        for team_index in range(TEAMS):
+            team = Team(name=f"施工队{team_index + 1}", is_active=True)
+            db.add(team)
+            db.flush()
+            teams.append(team.id)
+            for member_index in range(MEMBERS_PER_TEAM):
+                worker = User(username=f"worker{team_index}_{member_index}",
+                              email=f"worker{team_index}_{member_index}@example.com", hashed_password="x",
+                              full_name="施工人员", role="worker", is_active=True)
+                db.add(worker)
+                db.flush()
+                workers.append(worker.id)
+                db.add(TeamMember(team_id=team.id, user_id=worker.id, is_leader=member_index == 0))
+
+        projects = []
+        for project_index in range(PROJECTS):
+            project = Project(title=f"项目{project_index + 1}", location="测试地点", contact_name="张三",
+                              contact_phone="13800000000", status="in_progress", created_by_id=admin.id)
+            db.add(project)
+            db.flush()
+            projects.append(project.id)
+            db.add(ProjectTeam(project_id=project.id, team_id=teams[project_index % TEAMS]))
+
+        for index in range(CATALOG_SIZE):
+            db.add(WorkItem(category="通信线路", project_number=f"TEST-{index:03d}", name=f"工作内容{index}",
+                            unit="米", unit_price=10.0, skilled_labor_days=0.1, unskilled_labor_days=0.2))
+            db.add(Material(category="其他", code=f"M-{index:03d}", name=f"材料{index}", unit="个", unit_price=5.0))
+        db.commit()
+
+        worker_id = workers[0]
+        tasks = {}
+        for status in ("pending", "assigned", "in_progress", "completed"):
+            tasks[status] = [
+                add_task(db, projects[index % PROJECTS], teams[0], admin.id,
+                         None if status == "pending" else worker_id, status,
+                         LINES_PER_TASK if status in ("in_progress", "completed") else 0)
+                for index in range(TASKS_PER_STATUS)
+            ]
+        # 其他班组也有已完成的工单，班组统计需要逐个班组汇总
+        for team_id in teams[1:]:
+            add_task(db, projects[0], team_id, admin.id, workers[teams.index(team_id) * MEMBERS_PER_TEAM],
+                     "completed", 2)
+
+        return SimpleNamespace(
+            admin_id=admin.id, manager_id=manager.id, worker_id=worker_id, workers=workers,
+            teams=teams, projects=projects, tasks=tasks,
+        )
+    finally:
+        db.close()
+
+
+@pytest.fixture(scope="session")
+def client(data):
+    with TestClient(main.app) as test_client:
+        yield test_client
+
+
+def _headers(username):
+    return {"Authorization": f"Bearer {create_access_token({'sub': username})}"}
+
+
+@pytest.fixture(scope="session")
+def admin_headers(data):
+    return _headers("admin")
+
+
+@pytest.fixture(scope="session")
+def worker_headers(data):
+    return _headers("worker0_0")
+
+
+@pytest.fixture
+def db():
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+@pytest.fixture
+def query_budget():
+    """
+    SQL语句数预算：with query_budget(5, "GET /api/tasks/1"): ...
+    """
+    def budget(max_queries, label=""):
+        return _query_budget(engine, max_queries, label)
+    return budget
@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+SQL语句数预算
+
+在引擎上挂接 before_cursor_execute 钩子，统计一次API调用执行的全部SQL语句
+（包括认证依赖中查询用户的语句）。超过预算时断言失败，并列出执行过的语句，
+便于定位新增的 N+1 查询。
+
+用法（query_budget 夹具见 conftest.py）:
+    with query_budget(5, "GET /api/tasks/{task_id}"):
+        client.get(f"/api/tasks/{task_id}", headers=headers)
+"""
+
+import contextlib
+import threading
+from typing import List, Tuple
+
+from sqlalchemy import event
+
+# 失败信息中每条语句最多显示的长度
+MAX_STATEMENT_LENGTH = 300
+
+
+class QueryRecorder:
+    """记录引擎上执行的SQL语句（TestClient 在其他线程中运行应用，按时间段统计）"""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.statements: List[Tuple[str, object]] = []
+        self._lock = threading.Lock()
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        with self._lock:
+            self.statements.append((statement, parameters))
+
+    def __enter__(self):
+        event.listen(self.engine, "before_cursor_execute", self._before_cursor_execute)
+        return self
+
+    def __exit__(self, *exc_info):
+        event.remove(self.engine, "before_cursor_execute", self._before_cursor_execute)
+
+    @property
+    def count(self) -> int:
+        return len(self.statements)
+
+    def report(self) -> str:
+        lines = []
+        for index, (statement, parameters) in enumerate(self.statements, 1):
+            text = " ".join(statement.split())
+            if len(text) > MAX_STATEMENT_LENGTH:
+                text = text[:MAX_STATEMENT_LENGTH] + "..."
+            lines.append(f"  {index}. {text}  {parameters!r:.120}")
+        return "\n".join(lines)
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+@contextlib.contextmanager
+def query_budget(engine, max_queries: int, label: str = ""):
+    """
+    断言代码块中执行的SQL语句不超过 max_queries 条
+
+    Args:
+        engine: 数据库引擎
+        max_queries: 语句数上限
+        label: 失败信息中显示的名称（如请求方法和路径）
+    """
+    recorder = QueryRecorder(engine)
+    with recorder:
+        yield recorder
+    if recorder.count > max_queries:
+        raise QueryBudgetExceeded(
+            f"{label or '代码块'} 执行了 {recorder.count} 条SQL语句，预算为 {max_queries} 条:\n{recorder.report()}"
+        )
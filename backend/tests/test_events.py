@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+实时事件推送：断线重连补发、事件过期和服务重启后的 reset
+"""
+
+import asyncio
+
+from utils.events import EVENT_RESET, EventBroker
+
+
+def _collect(broker, user_id, last_event_id=None, publish=(), count=1):
+    """
+    打开一个事件流，读完补发部分后发布 publish 中的事件，返回之后收到的 count 条消息
+
+    Args:
+        broker: 事件代理
+        user_id: 订阅的用户
+        last_event_id: 重连时带上的事件ID
+        publish: [(事件类型, 接收用户列表)]
+        count: 要读取的消息数（不含开头的 retry）
+    """
+    async def run():
+        stream = broker.stream(user_id, last_event_id=last_event_id, heartbeat=0.05)
+        messages = []
+        try:
+            assert (await stream.__anext__()).startswith("retry:")
+            if not publish:
+                for _ in range(count):
+                    messages.append(await stream.__anext__())
+                return messages
+            # 补发的事件在发布之前读出（心跳说明补发已结束）
+            while True:
+                message = await stream.__anext__()
+                if message.startswith(":"):
+                    break
+                messages.append(message)
+            for event_type, user_ids in publish:
+                broker.publish(event_type, {"task_id": 1}, user_ids)
+            while len(messages) < count:
+                message = await stream.__anext__()
+                if not message.startswith(":"):
+                    messages.append(message)
+            return messages
+        finally:
+            await stream.aclose()
+
+    return asyncio.run(run())
+
+
+def _ids(messages):
+    return [message.split("\n", 1)[0][len("id: "):] for message in messages]
+
+
+def _types(messages):
+    return [message.split("\n")[1][len("event: "):] for message in messages]
+
+
+def test_event_ids_carry_epoch():
+    broker = EventBroker(epoch="boot1")
+    event = broker.publish("task.updated", {"task_id": 1}, [1])
+    assert event.event_id == "boot1-1"
+    assert event.encode().startswith("id: boot1-1\n")
+    assert broker.parse_event_id("boot1-7") == 7
+    assert broker.parse_event_id("boot0-7") is None
+    assert broker.parse_event_id("7") is None
+
+
+def test_replay_after_reconnect():
+    broker = EventBroker(epoch="boot1")
+    first = broker.publish("task.assigned", {"task_id": 1}, [1])
+    broker.publish("task.updated", {"task_id": 2}, [2])
+    broker.publish("task.updated", {"task_id": 3}, [1])
+
+    messages = _collect(broker, 1, last_event_id=first.event_id, publish=[("task.deleted", [1])], count=2)
+    assert _ids(messages) == ["boot1-3", "boot1-4"]
+    assert _types(messages) == ["task.updated", "task.deleted"]
+
+
+def test_stale_id_from_previous_process_resets():
+    # 重启后的代理序号从1开始，旧进程的ID即使数值更大也不能挡住新事件
+    broker = EventBroker(epoch="boot2")
+    messages = _collect(broker, 1, last_event_id="boot1-500", publish=[("task.assigned", [1])], count=2)
+    assert _types(messages) == [EVENT_RESET, "task.assigned"]
+    assert _ids(messages)[1] == "boot2-1"
+
+
+def test_id_newer_than_issued_resets():
+    broker = EventBroker(epoch="boot1")
+    broker.publish("task.updated", {"task_id": 1}, [1])
+    messages = _collect(broker, 1, last_event_id="boot1-500", publish=[("task.updated", [1])], count=2)
+    assert _types(messages) == [EVENT_RESET, "task.updated"]
+    assert _ids(messages) == ["boot1-1", "boot1-2"]
+
+
+def test_expired_buffer_resets():
+    broker = EventBroker(buffer_size=2, epoch="boot1")
+    first = broker.publish("task.updated", {"task_id": 1}, [1])
+    for _ in range(3):
+        broker.publish("task.updated", {"task_id": 1}, [1])
+    messages = _collect(broker, 1, last_event_id=first.event_id)
+    assert _types(messages) == [EVENT_RESET]
+    assert _ids(messages) == ["boot1-4"]
@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+工单结算明细导出
+"""
+
+import csv
+import io
+import zipfile
+from datetime import datetime
+from xml.etree import ElementTree
+
+import pytest
+
+from models import Material, Task, TaskMaterial, TaskWorkItem, Team, WorkItem
+from utils.export_utils import _xlsx_row, iter_xlsx
+from utils.task_export import SETTLEMENT_HEADER
+
+_SHEET_NS = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+
+
+@pytest.fixture
+def settlement_team(db, data):
+    """
+    一个新施工队伍的两个已完成工单，返回 (队伍ID, 预期的导出行)
+
+    第一个工单有一条工作内容、一条甲供材料和一条自购材料，第二个工单没有明细、费用为手工录入。
+    """
+    team = Team(name="导出测试队", is_active=True)
+    db.add(team)
+    db.flush()
+    completed_at = datetime(2026, 1, 2, 3, 4, 5)
+    with_lines = Task(project_id=data.projects[0], title="有明细的工单", status="completed", team_id=team.id,
+                      created_by_id=data.admin_id, completed_at=completed_at, labor_cost=20.0,
+                      company_material_cost=15.0, self_material_cost=20.0, material_cost=35.0, total_cost=55.0)
+    bare = Task(project_id=data.projects[1], title="手工录入费用的工单", status="completed", team_id=team.id,
+                created_by_id=data.admin_id, completed_at=completed_at, labor_cost=500.0,
+                company_material_cost=0.0, self_material_cost=30.0, material_cost=30.0, total_cost=530.0)
+    db.add_all([with_lines, bare])
+    db.flush()
+    work_item = db.query(WorkItem).filter(WorkItem.project_number == "TEST-000").one()
+    company, own = db.query(Material).filter(Material.code.in_(["M-001", "M-002"])).order_by(Material.code).all()
+    db.add_all([
+        TaskWorkItem(task_id=with_lines.id, work_item_id=work_item.id, quantity=2, unit_price=10.0, total_price=20.0),
+        TaskMaterial(task_id=with_lines.id, material_id=company.id, quantity=3, is_company_provided=True,
+                     unit_price=5.0, total_price=15.0),
+        TaskMaterial(task_id=with_lines.id, material_id=own.id, quantity=4, is_company_provided=False,
+                     unit_price=5.0, total_price=20.0),
+    ])
+    db.commit()
+
+    task = [str(with_lines.id), "有明细的工单", "completed", "项目1", "导出测试队", "2026-01-02 03:04:05"]
+    costs = ["20.0", "15.0", "20.0", "55.0"]
+    expected = [
+        task + ["工作内容", "TEST-000", "工作内容0", "米", "2.0", "10.0", "20.0"] + costs,
+        task + ["甲供材料", "M-001", "材料1", "个", "3.0", "5.0", "15.0"] + costs,
+        task + ["自购材料", "M-002", "材料2", "个", "4.0", "5.0", "20.0"] + costs,
+        [str(bare.id), "手工录入费用的工单", "completed", "项目2", "导出测试队", "2026-01-02 03:04:05",
+         "", "", "", "", "", "", "", "500.0", "0.0", "30.0", "530.0"],
+        # 合计行只汇总明细金额
+        [""] * 6 + ["合计", "", "施工费", "", "", "", "20.0"] + [""] * 4,
+        [""] * 6 + ["合计", "", "甲供材料费", "", "", "", "15.0"] + [""] * 4,
+        [""] * 6 + ["合计", "", "自购材料费", "", "", "", "20.0"] + [""] * 4,
+    ]
+    return team.id, expected
+
+
+def _xlsx_rows(content):
+    """读出XLSX工作表中各行的单元格文本，空单元格为空字符串"""
+    with zipfile.ZipFile(io.BytesIO(content)) as zf:
+        assert zf.testzip() is None
+        root = ElementTree.fromstring(zf.read("xl/worksheets/sheet1.xml"))
+    rows = []
+    for row in root.iter(f"{_SHEET_NS}row"):
+        rows.append(["".join(cell.itertext()) for cell in row.findall(f"{_SHEET_NS}c")])
+    return rows
+
+
+def test_export_csv(client, data, admin_headers):
+    response = client.get(f"/api/tasks/export?status=completed&project_id={data.projects[0]}",
+                          headers=admin_headers)
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/csv")
+    rows = list(csv.reader(io.StringIO(response.content.decode("utf-8-sig"))))
+    assert len(rows) > 1
+    assert all(len(row) == len(rows[0]) for row in rows)
+
+
+def test_export_xlsx(client, admin_headers):
+    response = client.get("/api/tasks/export?format=xlsx&status=completed", headers=admin_headers)
+    assert response.status_code == 200
+    with zipfile.ZipFile(io.BytesIO(response.content)) as zf:
+        assert zf.testzip() is None
+        sheet = zf.read("xl/worksheets/sheet1.xml").decode("utf-8")
+    assert sheet.count("<row>") > 1
+    assert sheet.endswith("</sheetData></worksheet>")
+
+
+def test_export_csv_rows(client, admin_headers, settlement_team):
+    team_id, expected = settlement_team
+    response = client.get(f"/api/tasks/export?team_id={team_id}", headers=admin_headers)
+    assert response.status_code == 200
+    rows = list(csv.reader(io.StringIO(response.content.decode("utf-8-sig"))))
+    assert rows == [SETTLEMENT_HEADER] + expected
+
+
+def test_export_xlsx_rows(client, admin_headers, settlement_team):
+    team_id, expected = settlement_team
+    response = client.get(f"/api/tasks/export?format=xlsx&team_id={team_id}", headers=admin_headers)
+    assert response.status_code == 200
+    assert _xlsx_rows(response.content) == [SETTLEMENT_HEADER] + expected
+
+
+def test_export_rejects_unknown_format(client, admin_headers):
+    response = client.get("/api/tasks/export?format=pdf", headers=admin_headers)
+    assert response.status_code == 422
+
+
+def test_xlsx_non_finite_numbers_are_empty():
+    row = _xlsx_row([1, 2.5, float("nan"), float("inf"), float("-inf")])
+    assert "nan" not in row and "inf" not in row
+    assert row == '<row><c t="n"><v>1</v></c><c t="n"><v>2.5</v></c><c/><c/><c/></row>'
+    assert b"nan" not in b"".join(iter_xlsx(["a"], [[float("nan")]]))
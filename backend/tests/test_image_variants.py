@@ -0,0 +1,38 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+图片衍生图：只从原图生成，衍生图本身不能再作为生成的来源
+"""
+
+import os
+
+import pytest
+
+from utils import image_utils
+
+pytestmark = pytest.mark.skipif(image_utils.Image is None, reason="未安装Pillow")
+
+
+@pytest.fixture
+def original(tmp_path):
+    path = tmp_path / "photo.png"
+    image_utils.Image.new("RGB", (2000, 1000), (200, 10, 10)).save(path)
+    return str(path)
+
+
+def test_ensure_variant_from_original(original):
+    thumb = image_utils.ensure_variant(original, "thumb")
+    assert thumb == image_utils.variant_path(original, "thumb")
+    with image_utils.Image.open(thumb) as img:
+        assert max(img.size) == image_utils.IMAGE_SIZES["thumb"]
+
+
+def test_variant_is_not_a_source(original):
+    thumb = image_utils.ensure_variant(original, "thumb")
+    assert image_utils.is_variant(thumb)
+    assert not image_utils.is_variant(original)
+
+    assert image_utils.ensure_variant(thumb, "web") is None
+    assert not os.path.exists(image_utils.variant_path(thumb, "web"))
+    assert image_utils.variant_urls("/uploads/x/photo_thumb.jpg", thumb) == {}
@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+CSV导入：写入的字段、引用和重复检查、工单费用汇总和变更日志
+"""
+
+import pytest
+
+from database import engine
+from models import ChangeLog, Material, Task, TaskMaterial, TaskWorkItem, User, WorkItem
+from routers.users import pwd_context
+from tests.conftest import add_task
+from utils.import_utils import bulk_insert
+
+
+def _csv_file(name, header, rows):
+    lines = [",".join(header)] + [",".join(str(value) for value in row) for row in rows]
+    return {"file": (name, "\n".join(lines).encode("utf-8"), "text/csv")}
+
+
+def _logged_ids(db, entity):
+    return {entry.entity_id for entry in db.query(ChangeLog).filter(ChangeLog.entity == entity)}
+
+
+def test_import_tasks(client, data, db, admin_headers):
+    header = ["title", "description", "project_id", "labor_cost", "material_cost"]
+    rows = [("导入行为测试1", "第一行", data.projects[1], 100, 20.5), ("导入行为测试2", "", "", "", "")]
+    response = client.post("/api/tasks/import", files=_csv_file("tasks.csv", header, rows), headers=admin_headers)
+    assert response.status_code == 201, response.text
+    assert response.json()["message"] == "成功导入 2 条工单记录"
+
+    tasks = db.query(Task).filter(Task.title.like("导入行为测试%")).order_by(Task.title).all()
+    assert [(task.title, task.description, task.project_id, task.labor_cost, task.material_cost)
+            for task in tasks] == [("导入行为测试1", "第一行", data.projects[1], 100.0, 20.5),
+                                   ("导入行为测试2", "", None, 0.0, 0.0)]
+    assert all(task.status == "pending" and task.created_by_id == data.admin_id for task in tasks)
+    # 批量写入的记录同样进入变更日志
+    assert {task.id for task in tasks} <= _logged_ids(db, "tasks")
+
+
+@pytest.mark.parametrize("project_id,detail", [(99999, "项目ID 99999 不存在"), ("abc", "无效的项目ID: abc")])
+def test_import_tasks_rejects_bad_project(client, data, db, admin_headers, project_id, detail):
+    rows = [("导入拒绝测试", data.projects[0]), ("导入拒绝测试", project_id)]
+    response = client.post("/api/tasks/import", files=_csv_file("tasks.csv", ["title", "project_id"], rows),
+                           headers=admin_headers)
+    assert response.status_code == 400
+    assert detail in response.json()["detail"]
+    # 整批不写入
+    assert db.query(Task).filter(Task.title == "导入拒绝测试").count() == 0
+
+
+def test_import_task_lines(client, data, db, admin_headers):
+    task_id = add_task(db, data.projects[0], data.teams[0], data.admin_id, data.worker_id, "in_progress")
+    response = client.post(f"/api/tasks/{task_id}/work-items/import",
+                           files=_csv_file("lines.csv", ["project_number", "quantity"],
+                                           [("TEST-000", 2), ("TEST-001", 1.5)]),
+                           headers=admin_headers)
+    assert response.status_code == 201, response.text
+    response = client.post(f"/api/tasks/{task_id}/materials/import",
+                           files=_csv_file("lines.csv", ["code", "quantity", "is_company_provided"],
+                                           [("M-000", 3, "是"), ("M-001", 4, "否")]),
+                           headers=admin_headers)
+    assert response.status_code == 201, response.text
+
+    work_lines = db.query(TaskWorkItem).filter(TaskWorkItem.task_id == task_id).order_by(TaskWorkItem.id).all()
+    assert [(line.quantity, line.unit_price, line.total_price) for line in work_lines] == [(2, 10.0, 20.0),
+                                                                                          (1.5, 10.0, 15.0)]
+    material_lines = db.query(TaskMaterial).filter(TaskMaterial.task_id == task_id).order_by(TaskMaterial.id).all()
+    assert [(line.quantity, line.is_company_provided, line.total_price) for line in material_lines] == [
+        (3, True, 15.0), (4, False, 20.0)]
+    assert {line.id for line in work_lines} <= _logged_ids(db, "task_work_items")
+    assert {line.id for line in material_lines} <= _logged_ids(db, "task_materials")
+
+    task = db.get(Task, task_id)
+    assert (task.labor_cost, task.company_material_cost, task.self_material_cost) == (35.0, 15.0, 20.0)
+    assert (task.material_cost, task.total_cost) == (35.0, 70.0)
+
+
+def test_import_task_lines_rejects_unknown_code(client, data, db, admin_headers):
+    task_id = add_task(db, data.projects[0], data.teams[0], data.admin_id, data.worker_id, "in_progress")
+    response = client.post(f"/api/tasks/{task_id}/materials/import",
+                           files=_csv_file("lines.csv", ["code", "quantity"], [("M-000", 1), ("NO-SUCH", 1)]),
+                           headers=admin_headers)
+    assert response.status_code == 400
+    assert "材料编号 NO-SUCH 不存在" in response.json()["detail"]
+    assert db.query(TaskMaterial).filter(TaskMaterial.task_id == task_id).count() == 0
+
+
+def test_import_materials(client, db, admin_headers):
+    header = ["category", "code", "name", "unit", "unit_price"]
+    rows = [("其他", "IMPB-M1", "导入材料甲", "个", 2.5), ("其他", "IMPB-M2", "导入材料乙", "米", 4)]
+    response = client.post("/api/materials/import", files=_csv_file("materials.csv", header, rows),
+                           headers=admin_headers)
+    assert response.status_code == 201, response.text
+    materials = db.query(Material).filter(Material.code.like("IMPB-M%")).order_by(Material.code).all()
+    assert [(material.code, material.name, material.unit, material.unit_price, material.is_active)
+            for material in materials] == [("IMPB-M1", "导入材料甲", "个", 2.5, True),
+                                           ("IMPB-M2", "导入材料乙", "米", 4.0, True)]
+    assert {material.id for material in materials} <= _logged_ids(db, "materials")
+
+    # 与已有编号重复、文件内重复都整批拒绝
+    for rows, detail in [([("其他", "IMPB-M3", "新", "个", 1), ("其他", "IMPB-M1", "重复", "个", 1)],
+                          "材料编号 'IMPB-M1' 已存在"),
+                         ([("其他", "IMPB-M4", "新", "个", 1), ("其他", "IMPB-M4", "重复", "个", 1)],
+                          "CSV文件中存在重复的材料编号")]:
+        response = client.post("/api/materials/import", files=_csv_file("materials.csv", header, rows),
+                               headers=admin_headers)
+        assert response.status_code == 400
+        assert detail in response.json()["detail"]
+    assert db.query(Material).filter(Material.code.in_(["IMPB-M3", "IMPB-M4"])).count() == 0
+
+
+def test_import_work_items(client, db, admin_headers):
+    header = ["category", "project_number", "name", "unit", "unit_price", "skilled_labor_days"]
+    rows = [("通信线路", "IMPB-W1", "导入工作内容", "米", 6, 0.5)]
+    response = client.post("/api/work-items/import", files=_csv_file("work_items.csv", header, rows),
+                           headers=admin_headers)
+    assert response.status_code == 201, response.text
+    work_item = db.query(WorkItem).filter(WorkItem.project_number == "IMPB-W1").one()
+    assert (work_item.name, work_item.unit_price, work_item.skilled_labor_days) == ("导入工作内容", 6.0, 0.5)
+
+    response = client.post("/api/work-items/import", files=_csv_file("work_items.csv", header, rows),
+                           headers=admin_headers)
+    assert response.status_code == 400
+    assert "项目编号 'IMPB-W1' 已存在" in response.json()["detail"]
+
+
+def test_import_users(client, db, admin_headers):
+    header = ["username", "password", "email", "role", "full_name"]
+    rows = [("impb_user", "secret1", "impb_user@example.com", "worker", "导入用户")]
+    response = client.post("/api/users/import", files=_csv_file("users.csv", header, rows), headers=admin_headers)
+    assert response.status_code == 201, response.text
+    user = db.query(User).filter(User.username == "impb_user").one()
+    assert (user.email, user.role, user.full_name, user.is_active) == ("impb_user@example.com", "worker",
+                                                                       "导入用户", True)
+    assert pwd_context.verify("secret1", user.hashed_password)
+
+    for rows, detail in [([("impb_other", "x", "impb_user@example.com", "worker", "")], "邮箱 'impb_user@example.com' 已被使用"),
+                         ([("impb_user", "x", "impb_new@example.com", "worker", "")], "用户名 'impb_user' 已存在"),
+                         ([("impb_role", "x", "impb_role@example.com", "boss", "")], "角色 'boss' 无效")]:
+        response = client.post("/api/users/import", files=_csv_file("users.csv", header, rows),
+                               headers=admin_headers)
+        assert response.status_code == 400
+        assert detail in response.json()["detail"]
+
+
+@pytest.mark.parametrize("executemany_returning", [True, False])
+def test_bulk_insert(db, monkeypatch, executemany_returning):
+    # 不支持 INSERT ... RETURNING 多行写入的数据库（如 SQLite 3.35 以前）逐行写入，结果相同
+    monkeypatch.setattr(engine.dialect, "insert_executemany_returning", executemany_returning)
+    prefix = f"BULK-{executemany_returning}"
+    rows = [{"category": "其他", "code": f"{prefix}-{index}", "name": "批量写入", "unit": "个", "unit_price": index + 1}
+            for index in range(3)]
+    ids = bulk_insert(db, Material, rows)
+    db.commit()
+    assert [db.get(Material, material_id).code for material_id in ids] == [row["code"] for row in rows]
+    assert set(ids) <= _logged_ids(db, "materials")
+    assert bulk_insert(db, Material, []) == []
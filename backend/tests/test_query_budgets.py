@@ -0,0 +1,383 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+各API的SQL语句数预算
+
+预算包含认证依赖中查询当前用户的1条语句。接口改动后语句数增加时测试失败，
+失败信息会列出执行过的全部语句；确认增加是合理的再调整这里的预算。
+
+明细类接口和导入接口用不同的明细条数、行数各测一次，预算相同，保证语句数不随明细条数、行数增长。
+"""
+
+import pytest
+
+from models import Task
+from tests.conftest import CATALOG_SIZE, add_task
+from tests.query_budget import QueryBudgetExceeded
+
+# 只读接口: (路径, 预算)，路径中的占位符由测试数据填充
+GET_BUDGETS = [
+    ("/", 0),
+    ("/api/health", 0),
+    ("/api/metrics", 0),
+    ("/api/auth/me", 1),
+    ("/api/health-check/", 0),
+    ("/api/health-check/auth", 1),
+    ("/api/events/stats", 1),
+    ("/api/projects/", 2),
+    ("/api/projects/{project}", 3),
+    ("/api/tasks/", 2),
+    ("/api/tasks/?status=completed&project_id={project}", 2),
+    ("/api/tasks/my-tasks", 2),
+    ("/api/tasks/{task}", 4),
+    ("/api/tasks/export", 2),
+    ("/api/tasks/export?format=xlsx", 2),
+    ("/api/materials/", 2),
+    ("/api/materials/categories", 0),
+    ("/api/materials/supply-types", 0),
+    ("/api/materials/1", 2),
+    ("/api/work-items/", 2),
+    ("/api/work-items/categories", 0),
+    ("/api/work-items/1", 2),
+    ("/api/teams/", 2),
+    ("/api/teams/{team}", 6),
+    ("/api/users/", 2),
+    ("/api/users/{worker}", 2),
+    ("/api/statistics/projects", 5),
+    ("/api/statistics/tasks", 6),
+    ("/api/statistics/materials", 6),
+    ("/api/statistics/work-items", 4),
+    ("/api/statistics/teams", 5),
+    ("/api/sync/changes", 7),
+    ("/api/sync/changes?since=0", 9),
+    ("/api/profiles", 1),
+]
+
+
+def _csv_file(name, header, rows):
+    lines = [",".join(header)] + [",".join(str(value) for value in row) for row in rows]
+    return {"file": (name, "\n".join(lines).encode("utf-8"), "text/csv")}
+
+
+@pytest.mark.parametrize("path,max_queries", GET_BUDGETS)
+def test_get_budget(client, data, admin_headers, query_budget, path, max_queries):
+    path = path.format(
+        project=data.projects[0], task=data.tasks["completed"][0], team=data.teams[0], worker=data.worker_id
+    )
+    with query_budget(max_queries, f"GET {path}"):
+        response = client.get(path, headers=admin_headers)
+    assert response.status_code == 200, response.text
+
+
+def test_my_tasks_worker(client, worker_headers, query_budget):
+    with query_budget(2, "GET /api/tasks/my-tasks"):
+        response = client.get("/api/tasks/my-tasks", headers=worker_headers)
+    assert response.status_code == 200
+    assert response.json()
+
+
+# ---------- 工单 ----------
+
+@pytest.mark.parametrize("lines", [1, 30])
+def test_task_detail_independent_of_lines(client, data, db, admin_headers, query_budget, lines):
+    task_id = add_task(db, data.projects[0], data.teams[0], data.admin_id, data.worker_id, "completed", lines)
+    with query_budget(4, f"GET /api/tasks/{task_id}（{lines} 条明细）"):
+        response = client.get(f"/api/tasks/{task_id}", headers=admin_headers)
+    assert response.status_code == 200
+    assert len(response.json()["materials"]) == lines
+
+
+@pytest.mark.parametrize("lines", [1, 20])
+def test_complete_task_independent_of_lines(client, data, db, admin_headers, query_budget, lines):
+    task_id = add_task(db, data.projects[0], data.teams[0], data.admin_id, data.worker_id, "in_progress", 5)
+    body = {
+        "materials": [
+            {"material_id": index % CATALOG_SIZE + 1, "quantity": 2, "is_company_provided": index % 2 == 0}
+            for index in range(lines)
+        ],
+        "work_items": [{"work_item_id": index % CATALOG_SIZE + 1, "quantity": 3} for index in range(lines)],
+    }
+    with query_budget(20, f"POST /api/tasks/{task_id}/complete（{lines} 条明细）"):
+        response = client.post(f"/api/tasks/{task_id}/complete", json=body, headers=admin_headers)
+    assert response.status_code == 200, response.text
+    task = response.json()
+    assert task["status"] == "completed"
+    assert len(task["materials"]) == len(task["work_items"]) == lines
+    assert task["total_cost"] == pytest.approx(lines * (2 * 5.0 + 3 * 10.0))
+
+
+def test_complete_task_unknown_material(client, data, db, admin_headers, query_budget):
+    task_id = add_task(db, data.projects[0], data.teams[0], data.admin_id, data.worker_id, "in_progress")
+    body = {"materials": [{"material_id": 99999, "quantity": 1}], "work_items": []}
+    with query_budget(7, "POST /api/tasks/{task_id}/complete（材料不存在）"):
+        response = client.post(f"/api/tasks/{task_id}/complete", json=body, headers=admin_headers)
+    assert response.status_code == 404
+    assert response.json()["detail"] == "材料ID 99999 不存在"
+
+
+def test_create_task(client, data, admin_headers, query_budget):
+    body = {
+        "title": "预算测试工单",
+        "project_id": data.projects[0],
+        "team_id": data.teams[0],
+    }
+    with query_budget(4, "POST /api/tasks/"):
+        response = client.post("/api/tasks/", json=body, headers=admin_headers)
+    assert response.status_code == 200, response.text
+
+
+def test_update_task(client, data, db, admin_headers, query_budget):
+    task_id = add_task(db, data.projects[0], data.teams[0], data.admin_id, data.worker_id, "assigned", 3)
+    body = {
+        "title": "修改后的工单",
+        "team_id": data.teams[1],
+        "work_items": '[{"work_item_id": 3, "quantity": 1}]',
+        "materials": '[{"material_id": "2", "quantity": 2}]',
+    }
+    with query_budget(19, f"PUT /api/tasks/{task_id}"):
+        response = client.put(f"/api/tasks/{task_id}", json=body, headers=admin_headers)
+    assert response.status_code == 200, response.text
+    assert response.json()["total_cost"] == pytest.approx(10.0 + 2 * 5.0)
+
+
+def test_delete_task(client, data, db, admin_headers, query_budget):
+    task_id = add_task(db, data.projects[0], data.teams[0], data.admin_id, data.worker_id, "assigned", 5)
+    with query_budget(15, f"DELETE /api/tasks/{task_id}"):
+        response = client.delete(f"/api/tasks/{task_id}", headers=admin_headers)
+    assert response.status_code == 204
+
+
+def test_batch_tasks(client, data, db, admin_headers, query_budget):
+    task_ids = [add_task(db, data.projects[1], data.teams[0], data.admin_id) for _ in range(10)]
+    body = {"operations": [
+        {"action": "assign", "task_ids": task_ids[:5], "team_id": data.teams[1], "assigned_to_id": data.workers[3]},
+        {"action": "status", "task_ids": task_ids[5:], "status": "in_progress"},
+    ]}
+    with query_budget(18, "POST /api/tasks/batch"):
+        response = client.post("/api/tasks/batch", json=body, headers=admin_headers)
+    assert response.status_code == 200, response.text
+    assert response.json()["succeeded"] == 10
+
+
+@pytest.mark.parametrize("dry_run,max_queries", [(True, 11), (False, 21)])
+def test_reprice_tasks(client, admin_headers, query_budget, dry_run, max_queries):
+    body = {"work_items": [{"id": 1, "unit_price": 10.0}], "materials": [{"id": 1, "unit_price": 5.0}],
+            "dry_run": dry_run}
+    with query_budget(max_queries, "POST /api/tasks/reprice"):
+        response = client.post("/api/tasks/reprice", json=body, headers=admin_headers)
+    assert response.status_code == 200, response.text
+
+
+@pytest.mark.parametrize("count", [1, 30])
+def test_import_tasks(client, data, db, admin_headers, query_budget, count):
+    rows = [(f"导入工单{count}-{index}", data.projects[index % len(data.projects)]) for index in range(count)]
+    with query_budget(4, f"POST /api/tasks/import（{count} 行）"):
+        response = client.post("/api/tasks/import", files=_csv_file("tasks.csv", ["title", "project_id"], rows),
+                               headers=admin_headers)
+    assert response.status_code == 201, response.text
+    assert db.query(Task).filter(Task.title.like(f"导入工单{count}-%")).count() == count
+
+
+@pytest.mark.parametrize("count", [1, 30])
+def test_import_task_lines(client, data, db, admin_headers, query_budget, count):
+    task_id = add_task(db, data.projects[0], data.teams[0], data.admin_id, data.worker_id, "in_progress")
+    work_rows = [(f"TEST-{index % CATALOG_SIZE:03d}", 2) for index in range(count)]
+    with query_budget(7, f"POST /api/tasks/{task_id}/work-items/import（{count} 行）"):
+        response = client.post(f"/api/tasks/{task_id}/work-items/import",
+                               files=_csv_file("lines.csv", ["project_number", "quantity"], work_rows),
+                               headers=admin_headers)
+    assert response.status_code == 201, response.text
+
+    material_rows = [(f"M-{index % CATALOG_SIZE:03d}", 3, "是") for index in range(count)]
+    with query_budget(7, f"POST /api/tasks/{task_id}/materials/import（{count} 行）"):
+        response = client.post(f"/api/tasks/{task_id}/materials/import",
+                               files=_csv_file("lines.csv", ["code", "quantity", "is_company_provided"], material_rows),
+                               headers=admin_headers)
+    assert response.status_code == 201, response.text
+
+    task = client.get(f"/api/tasks/{task_id}", headers=admin_headers).json()
+    assert len(task["work_items"]) == len(task["materials"]) == count
+    assert task["labor_cost"] == pytest.approx(count * 2 * 10.0)
+    assert task["company_material_cost"] == pytest.approx(count * 3 * 5.0)
+    assert task["total_cost"] == pytest.approx(count * (2 * 10.0 + 3 * 5.0))
+
+
+# ---------- 项目 ----------
+
+def test_project_lifecycle(client, admin_headers, query_budget):
+    body = {"title": "预算测试项目", "location": "测试地点", "contact_name": "李四", "contact_phone": "13900000000"}
+    with query_budget(3, "POST /api/projects/"):
+        response = client.post("/api/projects/", json=body, headers=admin_headers)
+    assert response.status_code == 200, response.text
+    project_id = response.json()["id"]
+
+    with query_budget(4, f"PUT /api/projects/{project_id}"):
+        response = client.put(f"/api/projects/{project_id}", json={"status": "in_progress"}, headers=admin_headers)
+    assert response.status_code == 200, response.text
+
+    with query_budget(5, f"DELETE /api/projects/{project_id}"):
+        response = client.delete(f"/api/projects/{project_id}", headers=admin_headers)
+    assert response.status_code == 204
+
+
+# ---------- 材料和工作内容 ----------
+
+def test_material_lifecycle(client, admin_headers, query_budget):
+    body = {"code": "BUDGET-M", "name": "预算测试材料", "unit": "个", "unit_price": 3.5}
+    with query_budget(4, "POST /api/materials/"):
+        response = client.post("/api/materials/", json=body, headers=admin_headers)
+    assert response.status_code == 200, response.text
+    material_id = response.json()["id"]
+
+    with query_budget(5, f"PUT /api/materials/{material_id}"):
+        response = client.put(f"/api/materials/{material_id}", json={"unit_price": 4.0}, headers=admin_headers)
+    assert response.status_code == 200, response.text
+
+    with query_budget(5, f"DELETE /api/materials/{material_id}"):
+        response = client.delete(f"/api/materials/{material_id}", headers=admin_headers)
+    assert response.status_code == 204
+
+
+@pytest.mark.parametrize("count", [1, 30])
+def test_import_materials(client, admin_headers, query_budget, count):
+    rows = [("其他", f"IMP-M{count}-{index:03d}", f"导入材料{index}", "个", 2.5) for index in range(count)]
+    header = ["category", "code", "name", "unit", "unit_price"]
+    with query_budget(4, f"POST /api/materials/import（{count} 行）"):
+        response = client.post("/api/materials/import", files=_csv_file("materials.csv", header, rows),
+                               headers=admin_headers)
+    assert response.status_code == 201, response.text
+
+
+def test_work_item_lifecycle(client, admin_headers, query_budget):
+    body = {"project_number": "BUDGET-W", "name": "预算测试工作内容", "unit": "米", "unit_price": 8.0}
+    with query_budget(5, "POST /api/work-items/"):
+        response = client.post("/api/work-items/", json=body, headers=admin_headers)
+    assert response.status_code == 200, response.text
+    work_item_id = response.json()["id"]
+
+    with query_budget(5, f"PUT /api/work-items/{work_item_id}"):
+        response = client.put(f"/api/work-items/{work_item_id}", json={"unit_price": 9.0}, headers=admin_headers)
+    assert response.status_code == 200, response.text
+
+    with query_budget(5, f"DELETE /api/work-items/{work_item_id}"):
+        response = client.delete(f"/api/work-items/{work_item_id}", headers=admin_headers)
+    assert response.status_code == 204
+
+
+@pytest.mark.parametrize("count", [1, 30])
+def test_import_work_items(client, admin_headers, query_budget, count):
+    rows = [("通信线路", f"IMP-W{count}-{index:03d}", f"导入工作内容{index}", "米", 6.0) for index in range(count)]
+    header = ["category", "project_number", "name", "unit", "unit_price"]
+    with query_budget(4, f"POST /api/work-items/import（{count} 行）"):
+        response = client.post("/api/work-items/import", files=_csv_file("work_items.csv", header, rows),
+                               headers=admin_headers)
+    assert response.status_code == 201, response.text
+    response = client.get(f"/api/work-items/?project_number=IMP-W{count}-000", headers=admin_headers)
+    assert len(response.json()) == 1
+
+
+# ---------- 施工队伍 ----------
+
+def test_team_lifecycle(client, data, admin_headers, query_budget):
+    with query_budget(6, "POST /api/teams/"):
+        response = client.post("/api/teams/", json={"name": "预算测试队伍"}, headers=admin_headers)
+    assert response.status_code == 200, response.text
+    team_id = response.json()["id"]
+
+    with query_budget(5, f"PUT /api/teams/{team_id}"):
+        response = client.put(f"/api/teams/{team_id}", json={"description": "修改"}, headers=admin_headers)
+    assert response.status_code == 200, response.text
+
+    member = {"user_id": data.workers[-1], "is_leader": False}
+    with query_budget(10, f"POST /api/teams/{team_id}/members"):
+        response = client.post(f"/api/teams/{team_id}/members", json=member, headers=admin_headers)
+    assert response.status_code == 200, response.text
+
+    with query_budget(5, f"DELETE /api/teams/{team_id}/members/{{user_id}}"):
+        response = client.delete(f"/api/teams/{team_id}/members/{data.workers[-1]}", headers=admin_headers)
+    assert response.status_code == 204
+
+    with query_budget(8, f"DELETE /api/teams/{team_id}"):
+        response = client.delete(f"/api/teams/{team_id}", headers=admin_headers)
+    assert response.status_code == 204
+
+
+# ---------- 用户和认证 ----------
+
+def test_register_and_login(client, query_budget):
+    body = {"username": "budget_user", "email": "budget_user@example.com", "password": "secret",
+            "full_name": "预算测试", "role": "worker"}
+    with query_budget(4, "POST /api/auth/register"):
+        response = client.post("/api/auth/register", json=body)
+    assert response.status_code == 200, response.text
+
+    with query_budget(1, "POST /api/auth/token"):
+        response = client.post("/api/auth/token", data={"username": "budget_user", "password": "secret"})
+    assert response.status_code == 200, response.text
+
+
+def test_user_update_and_delete(client, admin_headers, query_budget):
+    response = client.post("/api/auth/register", json={
+        "username": "budget_temp", "email": "budget_temp@example.com", "password": "secret", "role": "worker"
+    })
+    user_id = response.json()["id"]
+
+    with query_budget(4, f"PUT /api/users/{user_id}"):
+        response = client.put(f"/api/users/{user_id}", json={"full_name": "改名"}, headers=admin_headers)
+    assert response.status_code == 200, response.text
+
+    with query_budget(8, f"DELETE /api/users/{user_id}"):
+        response = client.delete(f"/api/users/{user_id}", headers=admin_headers)
+    assert response.status_code == 204
+
+
+@pytest.mark.parametrize("count", [1, 10])
+def test_import_users(client, admin_headers, query_budget, count):
+    rows = [(f"imported{count}_{index}", "secret", f"imported{count}_{index}@example.com", "worker")
+            for index in range(count)]
+    header = ["username", "password", "email", "role"]
+    with query_budget(4, f"POST /api/users/import（{count} 行）"):
+        response = client.post("/api/users/import", files=_csv_file("users.csv", header, rows),
+                               headers=admin_headers)
+    assert response.status_code == 201, response.text
+
+
+# ---------- 上传和性能分析 ----------
+
+def test_upload(client, admin_headers, query_budget):
+    with query_budget(1, "POST /api/upload/"):
+        response = client.post("/api/upload/", files={"file": ("note.txt", b"budget", "text/plain")},
+                               headers=admin_headers)
+    assert response.status_code == 201, response.text
+
+    files = [("files", ("a.txt", b"a", "text/plain")), ("files", ("b.txt", b"b", "text/plain"))]
+    with query_budget(1, "POST /api/upload/multiple"):
+        response = client.post("/api/upload/multiple", files=files, headers=admin_headers)
+    assert response.status_code == 201, response.text
+
+
+def test_profile_detail(client, admin_headers, query_budget):
+    response = client.get("/api/auth/me", headers={**admin_headers, "X-Profile": "1"})
+    profile_id = response.headers["x-profile-id"]
+
+    with query_budget(1, "GET /api/profiles/{profile_id}"):
+        response = client.get(f"/api/profiles/{profile_id}", headers=admin_headers)
+    assert response.status_code == 200, response.text
+
+    with query_budget(1, "GET /api/profiles/{profile_id}/download"):
+        response = client.get(f"/api/profiles/{profile_id}/download", headers=admin_headers)
+    assert response.status_code == 200
+
+
+# ---------- 预算工具本身 ----------
+
+def test_budget_failure_lists_statements(client, data, admin_headers, query_budget):
+    with pytest.raises(QueryBudgetExceeded) as excinfo:
+        with query_budget(1, "GET /api/teams/{team_id}"):
+            client.get(f"/api/teams/{data.teams[0]}", headers=admin_headers)
+    message = str(excinfo.value)
+    assert "GET /api/teams/{team_id} 执行了" in message
+    assert "预算为 1 条" in message
+    assert "1. SELECT users." in message
+    assert "FROM teams" in message
@@ -0,0 +1,187 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+工单重新定价：POST /tasks/reprice 和修改目录单价时的同步重新定价
+"""
+
+import itertools
+
+import pytest
+
+import routers.materials
+from database import SessionLocal
+from models import Material, Task, TaskMaterial, TaskWorkItem, WorkItem
+from tests.conftest import add_task
+from utils.events import EVENT_TASK_UPDATED, broker
+
+_codes = itertools.count(1)
+
+
+@pytest.fixture
+def priced_tasks(db, data):
+    """一个新的工作内容和材料，以及分别处于进行中和已完成状态、各有一条该项明细的两个工单"""
+    code = next(_codes)
+    work_item = WorkItem(category="通信线路", project_number=f"RP-W{code:03d}", name="重新定价工作内容", unit="米",
+                         unit_price=10.0)
+    material = Material(category="其他", code=f"RP-M{code:03d}", name="重新定价材料", unit="个", unit_price=5.0)
+    db.add_all([work_item, material])
+    db.commit()
+
+    task_ids = {}
+    for status in ("in_progress", "completed"):
+        task_id = add_task(db, data.projects[0], data.teams[0], data.admin_id, data.worker_id, status)
+        db.add(TaskWorkItem(task_id=task_id, work_item_id=work_item.id, quantity=2, unit_price=10.0, total_price=20.0))
+        db.add(TaskMaterial(task_id=task_id, material_id=material.id, quantity=3, is_company_provided=True,
+                            unit_price=5.0, total_price=15.0))
+        task = db.get(Task, task_id)
+        task.labor_cost, task.company_material_cost, task.self_material_cost = 20.0, 15.0, 0.0
+        task.material_cost, task.total_cost = 15.0, 35.0
+        db.commit()
+        task_ids[status] = task_id
+    return work_item.id, material.id, task_ids
+
+
+def _task_total(task_id):
+    session = SessionLocal()
+    try:
+        return session.get(Task, task_id).total_cost
+    finally:
+        session.close()
+
+
+@pytest.fixture
+def published(monkeypatch):
+    """记录推送的事件: [(事件类型, 工单ID)]"""
+    events = []
+    monkeypatch.setattr(broker, "publish", lambda event_type, data, user_ids=None: events.append(
+        (event_type, data["task_id"])))
+    return events
+
+
+def _task_costs(task_id):
+    session = SessionLocal()
+    try:
+        task = session.get(Task, task_id)
+        return (task.labor_cost, task.company_material_cost, task.self_material_cost, task.material_cost,
+                task.total_cost)
+    finally:
+        session.close()
+
+
+def _material_price(material_id):
+    session = SessionLocal()
+    try:
+        return session.get(Material, material_id).unit_price
+    finally:
+        session.close()
+
+
+def test_reprice_dry_run_and_apply(client, admin_headers, priced_tasks):
+    work_item_id, material_id, task_ids = priced_tasks
+    body = {"work_items": [{"id": work_item_id, "unit_price": 12.0}],
+            "materials": [{"id": material_id, "unit_price": 6.0}], "dry_run": True}
+
+    response = client.post("/api/tasks/reprice", json=body, headers=admin_headers)
+    assert response.status_code == 200, response.text
+    result = response.json()
+    assert result["affected_tasks"] == 1
+    assert result["affected_work_item_lines"] == result["affected_material_lines"] == 1
+    assert result["total_cost_delta"] == pytest.approx(2 * 2.0 + 3 * 1.0)
+    assert _task_total(task_ids["in_progress"]) == pytest.approx(35.0)
+
+    response = client.post("/api/tasks/reprice", json={**body, "dry_run": False}, headers=admin_headers)
+    assert response.status_code == 200, response.text
+    assert _task_total(task_ids["in_progress"]) == pytest.approx(2 * 12.0 + 3 * 6.0)
+    # 已完成的工单不重新定价
+    assert _task_total(task_ids["completed"]) == pytest.approx(35.0)
+
+
+def test_reprice_requires_admin(client, worker_headers, priced_tasks):
+    work_item_id, _, _ = priced_tasks
+    body = {"work_items": [{"id": work_item_id, "unit_price": 12.0}], "materials": [], "dry_run": True}
+    response = client.post("/api/tasks/reprice", json=body, headers=worker_headers)
+    assert response.status_code == 403
+
+
+def test_update_price_reprices_open_tasks(client, admin_headers, priced_tasks):
+    work_item_id, material_id, task_ids = priced_tasks
+    response = client.put(f"/api/work-items/{work_item_id}?reprice_open_tasks=true", json={"unit_price": 11.0},
+                          headers=admin_headers)
+    assert response.status_code == 200, response.text
+    assert response.json()["unit_price"] == 11.0
+    assert _task_total(task_ids["in_progress"]) == pytest.approx(2 * 11.0 + 15.0)
+    assert _task_total(task_ids["completed"]) == pytest.approx(35.0)
+
+    # 不带 reprice_open_tasks 时只修改目录单价
+    response = client.put(f"/api/materials/{material_id}", json={"unit_price": 7.0}, headers=admin_headers)
+    assert response.status_code == 200, response.text
+    assert _task_total(task_ids["in_progress"]) == pytest.approx(2 * 11.0 + 15.0)
+
+
+@pytest.mark.parametrize("path", ["/api/work-items/{work_item_id}", "/api/materials/{material_id}"])
+def test_update_price_reprice_requires_admin(client, worker_headers, priced_tasks, path):
+    work_item_id, material_id, task_ids = priced_tasks
+    url = path.format(work_item_id=work_item_id, material_id=material_id)
+    response = client.put(f"{url}?reprice_open_tasks=true", json={"unit_price": 99.0}, headers=worker_headers)
+    assert response.status_code == 403
+    # 单价和工单都没有被修改
+    assert client.get(url, headers=worker_headers).json()["unit_price"] != 99.0
+    assert _task_total(task_ids["in_progress"]) == pytest.approx(35.0)
+
+
+def test_update_price_rolls_back_when_reprice_fails(client, admin_headers, priced_tasks, monkeypatch):
+    _, material_id, task_ids = priced_tasks
+
+    reprice_tasks = routers.materials.reprice_tasks
+
+    def failing_reprice(db, *args, **kwargs):
+        reprice_tasks(db, *args, **kwargs)
+        raise RuntimeError("重新定价失败")
+
+    monkeypatch.setattr(routers.materials, "reprice_tasks", failing_reprice)
+    with pytest.raises(RuntimeError):
+        client.put(f"/api/materials/{material_id}?reprice_open_tasks=true", json={"unit_price": 8.0},
+                   headers=admin_headers)
+
+    # 单价和工单费用都保持原样
+    assert _material_price(material_id) == pytest.approx(5.0)
+    assert _task_total(task_ids["in_progress"]) == pytest.approx(35.0)
+
+
+def test_reprice_keeps_manual_costs(client, db, data, admin_headers, priced_tasks):
+    _, material_id, _ = priced_tasks
+    # 施工费手工录入、没有工作内容明细，只有一条甲供材料明细
+    task_id = add_task(db, data.projects[0], data.teams[0], data.admin_id, data.worker_id, "in_progress")
+    db.add(TaskMaterial(task_id=task_id, material_id=material_id, quantity=3, is_company_provided=True,
+                        unit_price=5.0, total_price=15.0))
+    task = db.get(Task, task_id)
+    task.labor_cost, task.company_material_cost, task.self_material_cost = 500.0, 15.0, 0.0
+    task.material_cost, task.total_cost = 15.0, 515.0
+    db.commit()
+
+    body = {"work_items": [], "materials": [{"id": material_id, "unit_price": 6.0}], "dry_run": True}
+    response = client.post("/api/tasks/reprice", json=body, headers=admin_headers)
+    diff = next(row for row in response.json()["tasks"] if row["task_id"] == task_id)
+    assert (diff["new_labor_cost"], diff["new_company_material_cost"], diff["new_total_cost"]) == (500.0, 18.0, 518.0)
+
+    response = client.post("/api/tasks/reprice", json={**body, "dry_run": False}, headers=admin_headers)
+    assert response.status_code == 200, response.text
+    # 只加上明细金额的变化（3 × (6 − 5)），手工录入的施工费保留
+    assert _task_costs(task_id) == pytest.approx((500.0, 18.0, 0.0, 18.0, 518.0))
+
+
+def test_reprice_publishes_task_events(client, admin_headers, priced_tasks, published):
+    work_item_id, material_id, task_ids = priced_tasks
+    body = {"work_items": [{"id": work_item_id, "unit_price": 12.0}], "materials": [], "dry_run": True}
+    client.post("/api/tasks/reprice", json=body, headers=admin_headers)
+    assert published == []
+
+    client.post("/api/tasks/reprice", json={**body, "dry_run": False}, headers=admin_headers)
+    assert published == [(EVENT_TASK_UPDATED, task_ids["in_progress"])]
+
+    published.clear()
+    response = client.put(f"/api/materials/{material_id}?reprice_open_tasks=true", json={"unit_price": 9.0},
+                          headers=admin_headers)
+    assert response.status_code == 200, response.text
+    assert published == [(EVENT_TASK_UPDATED, task_ids["in_progress"])]
@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+上传文件静态服务：Range请求、If-Range、X-Accel-Redirect 和衍生图生成失败时的缓存头
+"""
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from utils import static_files
+from utils.static_files import UploadStaticFiles, parse_range
+
+CONTENT = bytes(range(256)) * 4  # 1024 字节
+
+
+@pytest.fixture
+def uploads(tmp_path):
+    (tmp_path / "tasks").mkdir()
+    (tmp_path / "tasks" / "plan.pdf").write_bytes(CONTENT)
+    # 扩展名是图片但内容无效，衍生图无法生成
+    (tmp_path / "tasks" / "broken.jpg").write_bytes(b"not an image")
+    app = FastAPI()
+    app.mount("/uploads", UploadStaticFiles(directory=str(tmp_path)), name="uploads")
+    with TestClient(app) as client:
+        yield client
+
+
+@pytest.mark.parametrize("header,expected", [
+    ("bytes=0-99", (0, 99)),
+    ("bytes=1000-", (1000, 1023)),
+    ("bytes=1000-5000", (1000, 1023)),
+    ("bytes=-24", (1000, 1023)),
+    ("bytes=-5000", (0, 1023)),
+    ("bytes=0-9,20-29", None),
+    ("items=0-9", None),
+    ("bytes=-", None),
+])
+def test_parse_range(header, expected):
+    assert parse_range(header, len(CONTENT)) == expected
+
+
+@pytest.mark.parametrize("header", ["bytes=1024-", "bytes=50-10", "bytes=-0"])
+def test_parse_range_unsatisfiable(header):
+    with pytest.raises(ValueError):
+        parse_range(header, len(CONTENT))
+
+
+def test_full_response_is_immutable(uploads):
+    response = uploads.get("/uploads/tasks/plan.pdf")
+    assert response.status_code == 200
+    assert response.content == CONTENT
+    assert response.headers["accept-ranges"] == "bytes"
+    assert "immutable" in response.headers["cache-control"]
+
+
+@pytest.mark.parametrize("header,start,end", [("bytes=100-199", 100, 199), ("bytes=-24", 1000, 1023)])
+def test_range_request(uploads, header, start, end):
+    response = uploads.get("/uploads/tasks/plan.pdf", headers={"Range": header})
+    assert response.status_code == 206
+    assert response.headers["content-range"] == f"bytes {start}-{end}/{len(CONTENT)}"
+    assert response.headers["content-length"] == str(end - start + 1)
+    assert response.content == CONTENT[start:end + 1]
+
+
+def test_unsatisfiable_range(uploads):
+    response = uploads.get("/uploads/tasks/plan.pdf", headers={"Range": "bytes=5000-"})
+    assert response.status_code == 416
+    assert response.headers["content-range"] == f"bytes */{len(CONTENT)}"
+
+
+def test_if_range(uploads):
+    etag = uploads.get("/uploads/tasks/plan.pdf").headers["etag"]
+    response = uploads.get("/uploads/tasks/plan.pdf", headers={"Range": "bytes=0-9", "If-Range": etag})
+    assert response.status_code == 206
+    assert response.content == CONTENT[:10]
+
+    # 文件已变化（ETag不一致）时返回整个文件
+    response = uploads.get("/uploads/tasks/plan.pdf", headers={"Range": "bytes=0-9", "If-Range": '"stale"'})
+    assert response.status_code == 200
+    assert response.content == CONTENT
+
+
+def test_accel_redirect(uploads, monkeypatch):
+    monkeypatch.setattr(static_files, "UPLOADS_ACCEL_REDIRECT", "/internal-uploads/")
+    response = uploads.get("/uploads/tasks/plan.pdf", headers={"Range": "bytes=0-9"})
+    # 由nginx发送内容和处理Range
+    assert response.status_code == 200
+    assert response.headers["x-accel-redirect"] == "/internal-uploads/tasks/plan.pdf"
+    assert response.content == b""
+    assert "content-range" not in response.headers
+
+
+def test_failed_variant_falls_back_without_caching(uploads, monkeypatch):
+    monkeypatch.setattr(static_files, "UPLOADS_ACCEL_REDIRECT", "/internal-uploads/")
+    response = uploads.get("/uploads/tasks/broken.jpg?size=thumb")
+    assert response.status_code == 200
+    assert response.content == b"not an image"
+    assert response.headers["cache-control"] == "no-cache"
+    assert "x-accel-redirect" not in response.headers
+
+    # 不带 size 的原图仍然长期缓存
+    response = uploads.get("/uploads/tasks/broken.jpg")
+    assert "immutable" in response.headers["cache-control"]
@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+增量同步：全量数据分页返回，翻页期间的修改在之后的增量同步中返回
+"""
+
+from sqlalchemy import func
+
+from models import ChangeLog, Material, Task, TaskMaterial, TaskWorkItem, WorkItem
+from tests.conftest import add_task
+from utils.change_feed import current_sequence
+
+MODELS = {"tasks": Task, "task_materials": TaskMaterial, "task_work_items": TaskWorkItem,
+          "materials": Material, "work_items": WorkItem}
+
+
+def _sync(client, headers, since=None, limit=None):
+    params = {}
+    if since is not None:
+        params["since"] = since
+    if limit is not None:
+        params["limit"] = limit
+    response = client.get("/api/sync/changes", params=params, headers=headers)
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def test_snapshot_is_paged(client, db, admin_headers):
+    pages = [_sync(client, admin_headers, limit=50)]
+    while pages[-1]["has_more"]:
+        pages.append(_sync(client, admin_headers, since=pages[-1]["next"], limit=50))
+
+    assert len(pages) > 2
+    assert [page["reset"] for page in pages] == [True] + [False] * (len(pages) - 1)
+    seen = {entity: [] for entity in MODELS}
+    for page in pages:
+        assert sum(len(change["upserted"]) for change in page["changes"].values()) <= 50
+        for entity, change in page["changes"].items():
+            seen[entity].extend(record["id"] for record in change["upserted"])
+
+    for entity, model in MODELS.items():
+        assert seen[entity] == sorted(set(seen[entity])), entity
+        assert len(seen[entity]) == db.query(func.count(model.id)).scalar(), entity
+    # 全部返回后切换为增量同步
+    assert pages[-1]["next"] == str(current_sequence(db))
+
+
+def test_changes_during_snapshot_are_synced_afterwards(client, db, data, admin_headers):
+    page = _sync(client, admin_headers, limit=20)
+    assert page["has_more"]
+    task_id = add_task(db, data.projects[0], data.teams[0], data.admin_id)
+    material = db.get(Material, db.query(func.min(Material.id)).scalar())
+    material.name = "翻页期间修改"
+    material_id = material.id
+    db.commit()
+
+    while page["has_more"]:
+        page = _sync(client, admin_headers, since=page["next"], limit=500)
+    incremental = _sync(client, admin_headers, since=page["next"])
+    assert not incremental["reset"]
+    assert task_id in [record["id"] for record in incremental["changes"]["tasks"]["upserted"]]
+    assert material_id in [record["id"] for record in incremental["changes"]["materials"]["upserted"]]
+
+
+def test_stale_snapshot_cursor_restarts(client, db, admin_headers):
+    page = _sync(client, admin_headers, since=f"{current_sequence(db) + 100}.tasks.5", limit=10)
+    assert page["reset"]
+    assert page["has_more"]
+    assert page["changes"]["tasks"]["upserted"][0]["id"] == db.query(func.min(Task.id)).scalar()
+
+
+def test_invalid_since(client, admin_headers):
+    for since in ("abc", "1.users.3", "1.tasks", "1.tasks.x"):
+        response = client.get("/api/sync/changes", params={"since": since}, headers=admin_headers)
+        assert response.status_code == 400, since
+
+
+def test_pruned_cursor_restarts(client, db, data, admin_headers):
+    since = current_sequence(db)
+    add_task(db, data.projects[0], data.teams[0], data.admin_id)
+    add_task(db, data.projects[0], data.teams[0], data.admin_id)
+    assert not _sync(client, admin_headers, since=str(since))["reset"]
+
+    # 模拟 db_manager.py --prune-changes：删除客户端序号之后的一部分变更日志
+    db.query(ChangeLog).filter(ChangeLog.id <= since + 1).delete()
+    db.commit()
+    assert _sync(client, admin_headers, since=str(since))["reset"]
+    assert _sync(client, admin_headers, since=f"{since}.tasks.5")["reset"]
+    # 序号在保留范围内的客户端不受影响
+    page = _sync(client, admin_headers, since=str(since + 1))
+    assert not page["reset"]
+    assert page["next"] == str(current_sequence(db))
@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+工单批量操作：逐个工单的校验结果、数据库中的修改和推送的事件
+"""
+
+import pytest
+
+from database import SessionLocal
+from models import Task, TaskMaterial, TaskWorker
+from tests.conftest import add_task
+from utils.events import EVENT_TASK_ASSIGNED, EVENT_TASK_DELETED, EVENT_TASK_UPDATED, broker
+
+
+@pytest.fixture
+def published(monkeypatch):
+    """记录批量操作推送的事件: [(事件类型, 工单ID, 接收用户)]"""
+    events = []
+
+    def publish(event_type, data, user_ids=None):
+        events.append((event_type, data["task_id"], set(user_ids or ())))
+
+    monkeypatch.setattr(broker, "publish", publish)
+    return events
+
+
+def _batch(client, headers, operations):
+    response = client.post("/api/tasks/batch", json={"operations": operations}, headers=headers)
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def test_batch_assign_status_delete(client, data, db, admin_headers, published):
+    pending = [add_task(db, data.projects[0], data.teams[0], data.admin_id) for _ in range(3)]
+    doomed = add_task(db, data.projects[0], data.teams[0], data.admin_id, data.worker_id, "in_progress", 2)
+    assignee = data.workers[3]
+
+    result = _batch(client, admin_headers, [
+        {"action": "assign", "task_ids": pending + [99999], "team_id": data.teams[1], "assigned_to_id": assignee},
+        {"action": "status", "task_ids": pending[:1], "status": "in_progress"},
+        {"action": "delete", "task_ids": [doomed]},
+    ])
+    assert result["succeeded"] == 5
+    assert result["failed"] == 1
+    failed = [item for item in result["results"] if not item["success"]]
+    assert failed == [{"operation": 0, "action": "assign", "task_id": 99999, "success": False,
+                       "detail": "工单不存在"}]
+
+    session = SessionLocal()
+    try:
+        tasks = {task.id: task for task in session.query(Task).filter(Task.id.in_(pending + [doomed]))}
+        assert doomed not in tasks
+        assert session.query(TaskMaterial).filter(TaskMaterial.task_id == doomed).count() == 0
+        assert [tasks[task_id].status for task_id in pending] == ["in_progress", "assigned", "assigned"]
+        for task_id in pending:
+            assert tasks[task_id].team_id == data.teams[1]
+            assert tasks[task_id].assigned_to_id == assignee
+            workers = session.query(TaskWorker).filter(TaskWorker.task_id == task_id).all()
+            assert [(worker.user_id, worker.is_primary) for worker in workers] == [(assignee, True)]
+    finally:
+        session.close()
+
+    # 每个工单只推送一次：先指派后改状态的仍按指派推送，新的负责人也会收到
+    events = {task_id: (event_type, user_ids) for event_type, task_id, user_ids in published}
+    assert len(published) == len(events) == 4
+    assert all(events[task_id][0] == EVENT_TASK_ASSIGNED for task_id in pending)
+    assert all(assignee in events[task_id][1] for task_id in pending)
+    assert events[doomed][0] == EVENT_TASK_DELETED
+    assert data.worker_id in events[doomed][1]
+
+
+def test_batch_rejects_invalid_tasks_and_parameters(client, data, db, admin_headers, published):
+    completed = add_task(db, data.projects[0], data.teams[0], data.admin_id, data.worker_id, "completed")
+    assigned = add_task(db, data.projects[0], data.teams[0], data.admin_id, data.worker_id, "assigned")
+
+    result = _batch(client, admin_headers, [
+        {"action": "assign", "task_ids": [completed, assigned, assigned], "team_id": data.teams[2]},
+        {"action": "assign", "task_ids": [assigned]},
+        {"action": "status", "task_ids": [assigned], "status": "unknown"},
+        {"action": "archive", "task_ids": [assigned]},
+        {"action": "status", "task_ids": [assigned], "status": "in_progress"},
+    ])
+    details = [(item["operation"], item["task_id"], item["detail"]) for item in result["results"]]
+    assert details == [
+        (0, completed, "已完成或已取消的工单不能指派"),
+        (0, assigned, None),
+        (0, assigned, "工单重复"),
+        (1, assigned, "指派操作需要提供施工队伍或负责人"),
+        (2, assigned, "无效的工单状态: unknown"),
+        (3, assigned, "不支持的操作: archive"),
+        (4, assigned, None),
+    ]
+    assert result["succeeded"] == 2
+
+    session = SessionLocal()
+    try:
+        assert session.get(Task, completed).team_id == data.teams[0]
+        task = session.get(Task, assigned)
+        assert (task.team_id, task.status) == (data.teams[2], "in_progress")
+    finally:
+        session.close()
+    assert [(event_type, task_id) for event_type, task_id, _ in published] == [(EVENT_TASK_ASSIGNED, assigned)]
+
+
+def test_batch_status_only_publishes_update(client, data, db, admin_headers, published):
+    task_id = add_task(db, data.projects[0], data.teams[0], data.admin_id, data.worker_id, "assigned")
+    result = _batch(client, admin_headers, [{"action": "status", "task_ids": [task_id], "status": "completed"}])
+    assert result["succeeded"] == 1
+    assert [(event_type, event_task) for event_type, event_task, _ in published] == [(EVENT_TASK_UPDATED, task_id)]
+
+    session = SessionLocal()
+    try:
+        assert session.get(Task, task_id).completed_at is not None
+    finally:
+        session.close()
+
+
+def test_batch_requires_operations(client, admin_headers):
+    response = client.post("/api/tasks/batch", json={"operations": []}, headers=admin_headers)
+    assert response.status_code == 400
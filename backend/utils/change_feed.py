@@ -0,0 +1,263 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+增量同步变更日志
+
+工单、工单明细、材料、工作内容的每次新增、修改、删除都在 change_log 表中
+记录一行，与业务数据同一个事务提交。移动端保存上次同步的序号，
+之后只需拉取该序号之后变化的记录。
+
+- 通过ORM新增、修改、删除的对象由 after_flush 监听器自动记录
+- query().delete()、集合 UPDATE/DELETE 等不经过ORM会话的语句，
+  需要在执行前调用 record_changes / record_changes_where
+- 首次同步（或序号失效）时按表、按主键分页返回全部数据，同步序号为
+  "<快照序号>.<表名>.<已返回的最大ID>"，全部返回后切换为快照序号开始的增量同步
+- 变更日志用 db_manager.py --prune-changes DAYS 定期清理，始终保留最新一行；
+  客户端的序号早于保留的最早一行时，缺失的变更已无法补上，按序号失效处理（全量同步）
+"""
+
+import logging
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Tuple, Union
+
+from sqlalchemy import event, func, insert, literal, select
+from sqlalchemy.orm import Session, sessionmaker
+
+from models.change_log import ChangeLog, ChangeOperation
+from models.material import Material
+from models.task import Task, TaskMaterial, TaskWorkItem
+from models.work_item import WorkItem
+
+logger = logging.getLogger(__name__)
+
+# 参与同步的模型
+TRACKED_MODELS = (Task, TaskMaterial, TaskWorkItem, Material, WorkItem)
+_MODELS_BY_ENTITY = {model.__tablename__: model for model in TRACKED_MODELS}
+
+# 每次同步最多处理的变更日志行数（全量同步时为最多返回的记录数）
+DEFAULT_CHANGE_LIMIT = 500
+
+
+class SnapshotCursor(NamedTuple):
+    """全量同步的分页位置"""
+    until: int  # 快照开始时的变更序号，全部返回后从这里开始增量同步
+    entity: str  # 正在返回的表
+    last_id: int  # 该表已返回的最大ID
+
+
+def _after_flush(session: Session, flush_context):
+    """把本次flush中新增、修改、删除的同步对象写入变更日志"""
+    changes = {}
+    for obj in session.new:
+        if isinstance(obj, TRACKED_MODELS):
+            changes[(obj.__tablename__, obj.id)] = ChangeOperation.UPSERT
+    for obj in session.dirty:
+        if isinstance(obj, TRACKED_MODELS) and session.is_modified(obj, include_collections=False):
+            changes[(obj.__tablename__, obj.id)] = ChangeOperation.UPSERT
+    for obj in session.deleted:
+        if isinstance(obj, TRACKED_MODELS):
+            changes[(obj.__tablename__, obj.id)] = ChangeOperation.DELETE
+
+    if changes:
+        session.connection().execute(
+            insert(ChangeLog),
+            [
+                {"entity": entity, "entity_id": entity_id, "operation": operation}
+                for (entity, entity_id), operation in changes.items()
+            ]
+        )
+
+
+def register_change_tracking(session_factory: sessionmaker):
+    """为会话工厂注册变更日志监听器"""
+    if not event.contains(session_factory, "after_flush", _after_flush):
+        event.listen(session_factory, "after_flush", _after_flush)
+
+
+def record_changes(db: Session, model, ids: Iterable[int], operation: str = ChangeOperation.UPSERT):
+    """
+    记录指定ID的变更（用于集合语句）
+
+    Args:
+        db: 数据库会话
+        model: 同步模型类
+        ids: 记录ID
+        operation: upsert 或 delete
+    """
+    rows = [{"entity": model.__tablename__, "entity_id": entity_id, "operation": operation} for entity_id in ids]
+    if rows:
+        db.execute(insert(ChangeLog), rows)
+
+
+def record_changes_where(db: Session, model, whereclause, operation: str = ChangeOperation.UPSERT):
+    """
+    按条件记录变更，用 INSERT ... SELECT 一条语句完成
+
+    删除时需要在 DELETE 语句之前调用。
+
+    Args:
+        db: 数据库会话
+        model: 同步模型类
+        whereclause: 筛选条件
+        operation: upsert 或 delete
+    """
+    db.execute(
+        insert(ChangeLog).from_select(
+            ["entity", "entity_id", "operation"],
+            select(literal(model.__tablename__), model.id, literal(operation)).where(whereclause)
+        )
+    )
+
+
+def current_sequence(db: Session) -> int:
+    """当前最大变更序号"""
+    return db.execute(select(func.max(ChangeLog.id))).scalar() or 0
+
+
+def _sequence_range(db: Session) -> Tuple[int, int]:
+    """
+    变更日志保留的序号范围
+
+    Returns:
+        (可以继续增量同步的最小序号, 当前最大变更序号)；早于最小序号的变更已被清理
+    """
+    oldest, latest = db.execute(select(func.min(ChangeLog.id), func.max(ChangeLog.id))).one()
+    return (oldest or 1) - 1, latest or 0
+
+
+def _serialize(obj) -> Dict[str, Any]:
+    return {column.name: getattr(obj, column.name) for column in obj.__table__.columns}
+
+
+def _load(db: Session, model, ids: List[int]) -> List[Dict[str, Any]]:
+    records = []
+    for start in range(0, len(ids), 500):
+        chunk = ids[start:start + 500]
+        records.extend(_serialize(obj) for obj in db.query(model).filter(model.id.in_(chunk)).order_by(model.id))
+    return records
+
+
+def parse_since(since: Optional[str]) -> Union[None, int, SnapshotCursor]:
+    """
+    解析客户端带回的同步序号
+
+    Args:
+        since: 上次同步返回的 next 值
+
+    Returns:
+        None（首次同步）、增量同步的变更序号或全量同步的 SnapshotCursor
+
+    Raises:
+        ValueError: 序号格式无效
+    """
+    if since is None:
+        return None
+    if "." not in since:
+        return int(since)
+    until, entity, last_id = since.split(".")
+    if entity not in _MODELS_BY_ENTITY:
+        raise ValueError(f"无效的同步序号: {since}")
+    return SnapshotCursor(int(until), entity, int(last_id))
+
+
+def _snapshot(db: Session, cursor: SnapshotCursor, limit: int) -> Dict[str, Any]:
+    """
+    首次同步或序号失效（如数据库重建、变更日志已清理）时分页返回全部数据
+
+    每页最多 limit 条记录，按表的固定顺序、表内按ID（键集分页）返回。
+    翻页期间发生的变化都记录在快照序号之后的变更日志中，全部返回后的增量同步会补上。
+    """
+    entities = list(_MODELS_BY_ENTITY)
+    changes = {}
+    remaining = limit
+    next_cursor = None
+    last_id = cursor.last_id
+    for entity in entities[entities.index(cursor.entity):]:
+        model = _MODELS_BY_ENTITY[entity]
+        # 多取一条，判断这张表是否还有下一页
+        objs = db.query(model).filter(model.id > last_id).order_by(model.id).limit(remaining + 1).all()
+        records = [_serialize(obj) for obj in objs[:remaining]]
+        if records:
+            changes[entity] = {"upserted": records, "deleted": []}
+            last_id = records[-1]["id"]
+        if len(objs) > remaining:
+            next_cursor = SnapshotCursor(cursor.until, entity, last_id)
+            break
+        remaining -= len(records)
+        last_id = 0
+
+    first_page = cursor.entity == entities[0] and cursor.last_id == 0
+    return {
+        "since": "0" if first_page else ".".join(map(str, cursor)),
+        "next": ".".join(map(str, next_cursor)) if next_cursor else str(cursor.until),
+        "has_more": next_cursor is not None,
+        # 只有第一页需要客户端清空本地副本
+        "reset": first_page,
+        "changes": changes,
+    }
+
+
+def get_changes(db: Session, since: Union[None, int, SnapshotCursor],
+                limit: int = DEFAULT_CHANGE_LIMIT) -> Dict[str, Any]:
+    """
+    获取指定序号之后的变更
+
+    同一条记录多次变化只返回最终状态；记录在本批次之后被删除时按删除返回。
+
+    Args:
+        db: 数据库会话
+        since: parse_since 解析出的同步位置，为空时分页返回全部数据
+        limit: 本次最多处理的变更日志行数（全量同步时为最多返回的记录数）
+
+    Returns:
+        包含下次同步序号、是否还有更多变更和按表分组的变更内容的字典
+    """
+    expired, latest = _sequence_range(db)
+    if isinstance(since, SnapshotCursor):
+        if expired <= since.until <= latest:
+            return _snapshot(db, since, limit)
+        since = None
+    if since is None or since > latest or since < expired:
+        return _snapshot(db, SnapshotCursor(latest, next(iter(_MODELS_BY_ENTITY)), 0), limit)
+
+    # 本批次的结束序号
+    until = db.execute(
+        select(ChangeLog.id).where(ChangeLog.id > since).order_by(ChangeLog.id).offset(limit - 1).limit(1)
+    ).scalar() or latest
+
+    last_change = (
+        select(func.max(ChangeLog.id).label("id"))
+        .where(ChangeLog.id > since, ChangeLog.id <= until)
+        .group_by(ChangeLog.entity, ChangeLog.entity_id)
+        .subquery()
+    )
+    rows = db.execute(
+        select(ChangeLog.entity, ChangeLog.entity_id, ChangeLog.operation)
+        .join(last_change, last_change.c.id == ChangeLog.id)
+    ).all()
+
+    upserted_ids: Dict[str, List[int]] = {}
+    deleted_ids: Dict[str, List[int]] = {}
+    for entity, entity_id, operation in rows:
+        if entity not in _MODELS_BY_ENTITY:
+            continue
+        target = deleted_ids if operation == ChangeOperation.DELETE else upserted_ids
+        target.setdefault(entity, []).append(entity_id)
+
+    changes = {}
+    for entity, model in _MODELS_BY_ENTITY.items():
+        ids = sorted(upserted_ids.get(entity, []))
+        records = _load(db, model, ids) if ids else []
+        # 之后又被删除的记录按删除返回
+        found = {record["id"] for record in records}
+        deleted = sorted(set(deleted_ids.get(entity, [])) | (set(ids) - found))
+        if records or deleted:
+            changes[entity] = {"upserted": records, "deleted": deleted}
+
+    return {
+        "since": str(since),
+        "next": str(until),
+        "has_more": until < latest,
+        "reset": False,
+        "changes": changes,
+    }
@@ -0,0 +1,317 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+实时事件推送
+
+进程内的事件代理：工单指派、状态变化等事件发布到代理，
+再分发给订阅了这些用户的 Server-Sent Events 连接。
+
+- 每个连接一个有界 asyncio.Queue，空闲连接只占用一个队列和一个协程
+- 最近的事件保存在环形缓冲区中，客户端断线重连时带上 Last-Event-ID 即可补发
+- 事件ID为 "<启动标识>-<序号>"，进程重启后序号从1开始，带着上一个进程的ID重连的客户端收到 reset 事件
+- 同步路由运行在线程池中，发布通过 call_soon_threadsafe 投递到事件循环
+- 代理只在当前进程内有效，多worker部署时每个worker各自维护订阅
+"""
+
+import asyncio
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional, Set
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from models.task import Task
+from models.task_worker import TaskWorker
+from models.team import TeamMember
+
+logger = logging.getLogger(__name__)
+
+# 心跳间隔（秒），需小于反向代理的读超时
+HEARTBEAT_INTERVAL = float(os.getenv("EVENTS_HEARTBEAT_SECONDS", "15"))
+# 环形缓冲区保存的事件数
+BUFFER_SIZE = int(os.getenv("EVENTS_BUFFER_SIZE", "1000"))
+# 每个连接最多积压的事件数，超过后断开连接，由客户端重连补发
+QUEUE_SIZE = 100
+# 客户端重连等待时间（毫秒）
+RETRY_MS = 3000
+
+EVENT_TASK_ASSIGNED = "task.assigned"
+EVENT_TASK_UPDATED = "task.updated"
+EVENT_TASK_DELETED = "task.deleted"
+# 缓冲区已不包含客户端最后收到的事件，客户端需要重新拉取工单列表
+EVENT_RESET = "reset"
+
+
+class Event:
+    __slots__ = ("id", "epoch", "type", "data", "user_ids", "created_at")
+
+    def __init__(self, event_id: int, event_type: str, data: Dict[str, Any], user_ids: Optional[Set[int]],
+                 epoch: str = ""):
+        self.id = event_id  # 进程内的序号
+        self.epoch = epoch
+        self.type = event_type
+        self.data = data
+        self.user_ids = user_ids  # None 表示广播给所有连接
+        self.created_at = time.time()
+
+    def visible_to(self, user_id: int, is_admin: bool) -> bool:
+        return is_admin or self.user_ids is None or user_id in self.user_ids
+
+    @property
+    def event_id(self) -> str:
+        """发送给客户端的事件ID"""
+        return f"{self.epoch}-{self.id}"
+
+    def encode(self) -> str:
+        return f"id: {self.event_id}\nevent: {self.type}\ndata: {json.dumps(self.data, ensure_ascii=False, default=str)}\n\n"
+
+
+class Subscriber:
+    __slots__ = ("user_id", "is_admin", "queue", "closed")
+
+    def __init__(self, user_id: int, is_admin: bool):
+        self.user_id = user_id
+        self.is_admin = is_admin
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+        self.closed = False
+
+
+class EventBroker:
+    """进程内事件代理"""
+
+    def __init__(self, buffer_size: int = BUFFER_SIZE, epoch: Optional[str] = None):
+        # 启动标识：区分不同进程（或重启前后）发出的事件ID
+        self.epoch = epoch or format(time.time_ns() // 1000, "x")
+        self._ids = itertools.count(1)
+        self._last_id = 0
+        self._buffer: deque = deque(maxlen=buffer_size)
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._by_user: Dict[int, Set[Subscriber]] = {}
+        self._admins: Set[Subscriber] = set()
+        self.published = 0
+        self.dropped = 0
+
+    @property
+    def connections(self) -> int:
+        return sum(len(subscribers) for subscribers in self._by_user.values())
+
+    def publish(self, event_type: str, data: Dict[str, Any], user_ids: Optional[Iterable[int]] = None) -> Event:
+        """
+        发布事件，可在任意线程调用
+
+        Args:
+            event_type: 事件类型
+            data: 事件内容（可JSON序列化）
+            user_ids: 接收事件的用户ID，None 表示所有连接；管理员始终接收
+
+        Returns:
+            发布的事件
+        """
+        targets = None if user_ids is None else {user_id for user_id in user_ids if user_id is not None}
+        with self._lock:
+            event = Event(next(self._ids), event_type, data, targets, self.epoch)
+            self._last_id = event.id
+            self._buffer.append(event)
+            loop = self._loop
+        self.published += 1
+
+        if loop is not None and not loop.is_closed():
+            try:
+                running = asyncio.get_running_loop()
+            except RuntimeError:
+                running = None
+            if running is loop:
+                self._deliver(event)
+            else:
+                loop.call_soon_threadsafe(self._deliver, event)
+        return event
+
+    def _deliver(self, event: Event):
+        """在事件循环线程中把事件放入订阅者队列"""
+        if event.user_ids is None:
+            targets = [subscriber for subscribers in self._by_user.values() for subscriber in subscribers]
+        else:
+            targets = list(self._admins)
+            for user_id in event.user_ids:
+                targets.extend(subscriber for subscriber in self._by_user.get(user_id, ()) if not subscriber.is_admin)
+
+        for subscriber in targets:
+            if subscriber.closed:
+                continue
+            try:
+                subscriber.queue.put_nowait(event)
+            except asyncio.QueueFull:
+                # 客户端读得太慢：断开连接，重连后从缓冲区补发
+                self.dropped += 1
+                subscriber.closed = True
+                while not subscriber.queue.empty():
+                    subscriber.queue.get_nowait()
+                subscriber.queue.put_nowait(None)
+
+    def subscribe(self, user_id: int, is_admin: bool = False) -> Subscriber:
+        self._loop = asyncio.get_running_loop()
+        subscriber = Subscriber(user_id, is_admin)
+        self._by_user.setdefault(user_id, set()).add(subscriber)
+        if is_admin:
+            self._admins.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        subscriber.closed = True
+        subscribers = self._by_user.get(subscriber.user_id)
+        if subscribers is not None:
+            subscribers.discard(subscriber)
+            if not subscribers:
+                del self._by_user[subscriber.user_id]
+        self._admins.discard(subscriber)
+
+    def parse_event_id(self, last_event_id: str) -> Optional[int]:
+        """
+        解析客户端带回的事件ID
+
+        Returns:
+            本进程发出的事件的序号；其他进程（重启之前）发出的或格式错误时返回 None
+        """
+        epoch, _, seq = last_event_id.strip().rpartition("-")
+        if epoch != self.epoch or not seq.isdigit():
+            return None
+        return int(seq)
+
+    def replay(self, last_event_id: str, user_id: int, is_admin: bool) -> Optional[List[Event]]:
+        """
+        返回 last_event_id 之后该用户可见的事件
+
+        缓冲区已经丢弃了部分所需事件，或 last_event_id 不是本进程发出的时返回 None
+        """
+        last_seq = self.parse_event_id(last_event_id)
+        with self._lock:
+            events = list(self._buffer)
+            newest = self._last_id
+        if last_seq is None or last_seq > newest:
+            return None
+        if not events or last_seq == newest:
+            return []
+        if last_seq < events[0].id - 1:
+            return None
+        return [event for event in events if event.id > last_seq and event.visible_to(user_id, is_admin)]
+
+    async def stream(self, user_id: int, is_admin: bool = False,
+                     last_event_id: Optional[str] = None,
+                     heartbeat: float = HEARTBEAT_INTERVAL) -> AsyncIterator[str]:
+        """
+        生成SSE数据流
+
+        先订阅再补发，保证补发与实时事件之间不丢事件；
+        长时间没有事件时发送注释行作为心跳。
+        """
+        subscriber = self.subscribe(user_id, is_admin)
+        try:
+            yield f"retry: {RETRY_MS}\n\n"
+
+            # 实时事件中序号不大于 sent_id 的已经补发过
+            sent_id = 0
+            if last_event_id is not None:
+                missed = self.replay(last_event_id, user_id, is_admin)
+                if missed is None:
+                    # 从最新事件开始继续接收，之前的变化由客户端重新拉取
+                    with self._lock:
+                        sent_id = self._last_id
+                    yield Event(sent_id, EVENT_RESET, {"reason": "事件已过期，请重新获取工单"}, None,
+                                self.epoch).encode()
+                else:
+                    sent_id = self.parse_event_id(last_event_id)
+                    for event in missed:
+                        yield event.encode()
+                        sent_id = event.id
+
+            while True:
+                try:
+                    event = await asyncio.wait_for(subscriber.queue.get(), timeout=heartbeat)
+                except asyncio.TimeoutError:
+                    yield ": ping\n\n"
+                    continue
+                if event is None:
+                    break
+                if event.id > sent_id:
+                    yield event.encode()
+                    sent_id = event.id
+        finally:
+            self.unsubscribe(subscriber)
+
+
+broker = EventBroker()
+
+
+def collect_task_recipients(db: Session, task_ids: Iterable[int]) -> Dict[int, Set[int]]:
+    """
+    查询工单相关的用户：创建人、负责人、施工人员和施工队伍成员
+
+    Args:
+        db: 数据库会话
+        task_ids: 工单ID
+
+    Returns:
+        工单ID -> 用户ID集合
+    """
+    task_ids = list(task_ids)
+    recipients: Dict[int, Set[int]] = {task_id: set() for task_id in task_ids}
+    for start in range(0, len(task_ids), 500):
+        chunk = task_ids[start:start + 500]
+        for task_id, created_by_id, assigned_to_id in db.execute(
+            select(Task.id, Task.created_by_id, Task.assigned_to_id).where(Task.id.in_(chunk))
+        ):
+            recipients[task_id].update(user_id for user_id in (created_by_id, assigned_to_id) if user_id)
+        for task_id, user_id in db.execute(
+            select(TaskWorker.task_id, TaskWorker.user_id).where(TaskWorker.task_id.in_(chunk))
+        ):
+            if user_id:
+                recipients[task_id].add(user_id)
+        for task_id, user_id in db.execute(
+            select(Task.id, TeamMember.user_id)
+            .join(TeamMember, TeamMember.team_id == Task.team_id)
+            .where(Task.id.in_(chunk))
+        ):
+            if user_id:
+                recipients[task_id].add(user_id)
+    return recipients
+
+
+def task_event_data(task: Any) -> Dict[str, Any]:
+    """工单事件的内容，客户端据此决定是否重新获取工单详情"""
+    return {
+        "task_id": task.id,
+        "title": task.title,
+        "status": task.status,
+        "team_id": task.team_id,
+        "assigned_to_id": task.assigned_to_id,
+    }
+
+
+def load_task_event_data(db: Session, task_ids: Iterable[int]) -> Dict[int, Dict[str, Any]]:
+    """
+    查询工单事件内容
+
+    Args:
+        db: 数据库会话
+        task_ids: 工单ID
+
+    Returns:
+        工单ID -> 事件内容，不存在的工单不在结果中
+    """
+    task_ids = list(task_ids)
+    data = {}
+    for start in range(0, len(task_ids), 500):
+        chunk = task_ids[start:start + 500]
+        for task in db.execute(
+            select(Task.id, Task.title, Task.status, Task.team_id, Task.assigned_to_id).where(Task.id.in_(chunk))
+        ):
+            data[task.id] = task_event_data(task)
+    return data
@@ -0,0 +1,177 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+图片衍生图工具
+
+上传图片后在后台线程池中生成缩略图和网页尺寸图，保存在原图旁边：
+    /uploads/20240101/<uuid>.jpg        原图
+    /uploads/20240101/<uuid>_thumb.jpg  缩略图
+    /uploads/20240101/<uuid>_web.jpg    网页尺寸图
+访问时通过 ?size=thumb / ?size=web 获取对应尺寸，衍生图不存在时按需生成。
+衍生图只从原图生成，文件名以 _thumb / _web 结尾的图片不会再生成衍生图。
+"""
+
+import logging
+import os
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # 未安装Pillow时直接返回原图
+    Image = None
+    ImageOps = None
+
+logger = logging.getLogger(__name__)
+
+# 衍生图尺寸：名称 -> 最长边像素
+IMAGE_SIZES: Dict[str, int] = {
+    "thumb": 240,
+    "web": 1280,
+}
+
+# 支持生成衍生图的图片扩展名
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".webp", ".bmp", ".gif"}
+
+# JPEG压缩质量
+IMAGE_QUALITY = int(os.getenv("IMAGE_QUALITY", "82"))
+
+# 后台生成衍生图的线程数
+IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def is_image(path: str) -> bool:
+    """判断文件是否为支持生成衍生图的图片"""
+    return os.path.splitext(path)[1].lower() in IMAGE_EXTENSIONS
+
+
+def is_variant(path: str) -> bool:
+    """判断文件是否为衍生图（文件名以 _thumb / _web 结尾）"""
+    stem = os.path.splitext(os.path.basename(path))[0]
+    return any(stem.endswith(f"_{size}") for size in IMAGE_SIZES)
+
+
+def variant_path(original_path: str, size: str) -> str:
+    """
+    获取衍生图路径
+
+    Args:
+        original_path: 原图路径
+        size: 衍生图尺寸名称
+
+    Returns:
+        与原图同目录的衍生图路径
+    """
+    stem = os.path.splitext(original_path)[0]
+    return f"{stem}_{size}.jpg"
+
+
+def variant_urls(file_url: str, original_path: str) -> Dict[str, str]:
+    """获取上传文件各尺寸衍生图的访问URL，非图片返回空字典"""
+    if Image is None or not is_image(original_path) or is_variant(original_path):
+        return {}
+    return {size: f"{file_url}?size={size}" for size in IMAGE_SIZES}
+
+
+def generate_variant(original_path: str, size: str) -> Optional[str]:
+    """
+    生成单个衍生图
+
+    先写入临时文件再原子替换，多个请求同时生成同一衍生图时不会读到半个文件。
+
+    Args:
+        original_path: 原图路径
+        size: 衍生图尺寸名称
+
+    Returns:
+        衍生图路径，生成失败返回None
+    """
+    if Image is None or size not in IMAGE_SIZES or is_variant(original_path):
+        return None
+
+    max_edge = IMAGE_SIZES[size]
+    target_path = variant_path(original_path, size)
+    tmp_path = f"{target_path}.{uuid.uuid4().hex}.tmp"
+
+    try:
+        with Image.open(original_path) as img:
+            # 按EXIF方向旋转，避免手机照片缩略图方向错误
+            img = ImageOps.exif_transpose(img)
+            img.thumbnail((max_edge, max_edge))
+
+            # JPEG不支持透明通道，透明部分填充白色
+            if img.mode in ("RGBA", "LA", "P"):
+                img = img.convert("RGBA")
+                background = Image.new("RGB", img.size, (255, 255, 255))
+                background.paste(img, mask=img.getchannel("A"))
+                img = background
+            elif img.mode != "RGB":
+                img = img.convert("RGB")
+
+            img.save(tmp_path, "JPEG", quality=IMAGE_QUALITY, optimize=True, progressive=True)
+
+        os.replace(tmp_path, target_path)
+        return target_path
+    except Exception as e:
+        logger.warning(f"生成衍生图失败: {original_path} ({size}), 错误: {str(e)}")
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return None
+
+
+def ensure_variant(original_path: str, size: str) -> Optional[str]:
+    """
+    获取衍生图，不存在或已过期时立即生成
+
+    Args:
+        original_path: 原图路径
+        size: 衍生图尺寸名称
+
+    Returns:
+        衍生图路径，无法生成或原图本身是衍生图时返回None（调用方应返回原图）
+    """
+    if size not in IMAGE_SIZES or not is_image(original_path) or is_variant(original_path):
+        return None
+
+    target_path = variant_path(original_path, size)
+    try:
+        if os.stat(target_path).st_mtime >= os.stat(original_path).st_mtime:
+            return target_path
+    except FileNotFoundError:
+        pass
+
+    return generate_variant(original_path, size)
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=IMAGE_WORKERS, thread_name_prefix="image-variant")
+    return _executor
+
+
+def schedule_variants(original_path: str) -> bool:
+    """
+    提交后台任务生成所有尺寸的衍生图
+
+    Args:
+        original_path: 原图路径
+
+    Returns:
+        是否已提交生成任务
+    """
+    if Image is None or not is_image(original_path) or is_variant(original_path):
+        return False
+
+    executor = _get_executor()
+    for size in IMAGE_SIZES:
+        executor.submit(ensure_variant, original_path, size)
+    return True
@@ -3,15 +3,27 @@
 
 """
 导入工具函数
+
+导入接口的SQL语句数不随行数增长：引用的记录在验证阶段用 load_by_column 按块一次查出，
+处理每一行时不查询数据库；新记录最后由 bulk_insert 用多行 INSERT 一次写入
+（需要 INSERT ... RETURNING，即 SQLite 3.35 及以上，较旧的 SQLite 逐行写入）。
 """
 
 import csv
 import io
 import logging
-from typing import List, Dict, Any, Callable, Optional
+from typing import List, Dict, Any, Callable, Iterable, Optional
+
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+
+from utils.change_feed import TRACKED_MODELS, record_changes
 
 logger = logging.getLogger(__name__)
 
+# IN 查询每块的值数量
+LOOKUP_CHUNK_SIZE = 500
+
 def parse_csv(file_content: bytes) -> List[Dict[str, Any]]:
     """
     解析CSV文件内容为字典列表
@@ -106,3 +118,52 @@ def process_import(
             raise ValueError(f"处理数据失败: {str(e)}")
     
     return results
+
+
+def load_by_column(db: Session, column, values: Iterable[Any]) -> Dict[Any, Any]:
+    """
+    按某一列的值批量查询记录
+
+    Args:
+        db: 数据库会话
+        column: 模型的列，例如 Material.code
+        values: 要查询的值（忽略空值和重复值）
+
+    Returns:
+        列值 -> 记录，不存在的值不在结果中
+    """
+    model = column.class_
+    wanted = list({value for value in values if value not in (None, "")})
+    records = {}
+    for start in range(0, len(wanted), LOOKUP_CHUNK_SIZE):
+        chunk = wanted[start:start + LOOKUP_CHUNK_SIZE]
+        for record in db.query(model).filter(column.in_(chunk)):
+            records[getattr(record, column.key)] = record
+    return records
+
+
+def bulk_insert(db: Session, model, rows: List[Dict[str, Any]]) -> List[int]:
+    """
+    用多行 INSERT 写入导入的记录，参与同步的模型同时记录变更日志
+
+    多行写入并取回ID需要数据库支持 INSERT ... RETURNING（SQLite 3.35 及以上、PostgreSQL 等），
+    不支持时逐行写入。
+
+    Args:
+        db: 数据库会话
+        model: 模型类
+        rows: 每条记录的字段字典
+
+    Returns:
+        新记录的ID
+    """
+    if not rows:
+        return []
+    if db.get_bind().dialect.insert_executemany_returning:
+        ids = list(db.scalars(insert(model).returning(model.id), rows))
+    else:
+        connection = db.connection()
+        ids = [connection.execute(insert(model.__table__), row).inserted_primary_key[0] for row in rows]
+    if model in TRACKED_MODELS:
+        record_changes(db, model, ids)
+    return ids
@@ -0,0 +1,255 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+请求性能指标
+
+- MetricsMiddleware（纯ASGI中间件）统计每个路由的请求数、耗时分布、
+  响应大小分布和正在处理的请求数
+- SQLAlchemy 的 before/after_cursor_execute 钩子把SQL语句数和数据库耗时
+  记到当前请求上（通过 contextvars 传递，线程池中的同步路由同样有效）
+- 每个响应带 Server-Timing 头：db（数据库耗时和语句数）、app（处理耗时）
+- render_metrics() 输出 Prometheus 文本格式，由 /api/metrics 提供
+"""
+
+import bisect
+import threading
+import time
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# 请求耗时分桶（秒）
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# 响应大小分桶（字节）
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+# 没有匹配到路由的请求统一归类，避免标签数量无限增长
+UNMATCHED_ROUTE = "<unmatched>"
+
+
+class RequestStats:
+    """单个请求的统计"""
+    __slots__ = ("scope", "start", "db_statements", "db_time")
+
+    def __init__(self, scope):
+        self.scope = scope
+        self.start = time.perf_counter()
+        self.db_statements = 0
+        self.db_time = 0.0
+
+    @property
+    def route(self) -> str:
+        """路由模板，路由匹配之前为 <unmatched>"""
+        return _route_label(self.scope)
+
+
+_current_request: ContextVar[Optional[RequestStats]] = ContextVar("metrics_current_request", default=None)
+
+
+def current_request_stats() -> Optional[RequestStats]:
+    """当前请求的统计，不在请求中时返回 None"""
+    return _current_request.get()
+
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "total", "count")
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self.buckets, value)
+        if index < len(self.counts):
+            self.counts[index] += 1
+        self.total += value
+        self.count += 1
+
+
+class MetricsRegistry:
+    """进程内指标存储"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.requests: Dict[Tuple[str, str, str], int] = {}
+        self.latency: Dict[Tuple[str, str], Histogram] = {}
+        self.response_size: Dict[Tuple[str, str], Histogram] = {}
+        self.db_statements: Dict[Tuple[str, str], int] = {}
+        self.db_time: Dict[Tuple[str, str], float] = {}
+        self.db_statements_outside_requests = 0
+        self.db_time_outside_requests = 0.0
+
+    def request_started(self):
+        with self._lock:
+            self.in_flight += 1
+
+    def request_finished(self, method: str, route: str, status: int, duration: float,
+                         size: int, stats: RequestStats):
+        key = (method, route)
+        with self._lock:
+            self.in_flight -= 1
+            request_key = (method, route, str(status))
+            self.requests[request_key] = self.requests.get(request_key, 0) + 1
+            self.latency.setdefault(key, Histogram(LATENCY_BUCKETS)).observe(duration)
+            self.response_size.setdefault(key, Histogram(SIZE_BUCKETS)).observe(size)
+            self.db_statements[key] = self.db_statements.get(key, 0) + stats.db_statements
+            self.db_time[key] = self.db_time.get(key, 0.0) + stats.db_time
+
+    def query_finished(self, duration: float):
+        """请求之外（启动、后台任务）执行的SQL"""
+        with self._lock:
+            self.db_statements_outside_requests += 1
+            self.db_time_outside_requests += duration
+
+
+registry = MetricsRegistry()
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _labels(**labels) -> str:
+    return "{" + ",".join(f'{name}="{_escape(str(value))}"' for name, value in labels.items()) + "}"
+
+
+def _render_histogram(lines: List[str], name: str, help_text: str, histograms: Dict[Tuple[str, str], Histogram]):
+    lines.append(f"# HELP {name} {help_text}")
+    lines.append(f"# TYPE {name} histogram")
+    for (method, route), histogram in sorted(histograms.items()):
+        cumulative = 0
+        for bucket, count in zip(histogram.buckets, histogram.counts):
+            cumulative += count
+            lines.append(f"{name}_bucket{_labels(method=method, route=route, le=repr(float(bucket)))} {cumulative}")
+        lines.append(f"{name}_bucket{_labels(method=method, route=route, le='+Inf')} {histogram.count}")
+        lines.append(f"{name}_sum{_labels(method=method, route=route)} {histogram.total}")
+        lines.append(f"{name}_count{_labels(method=method, route=route)} {histogram.count}")
+
+
+def render_metrics() -> str:
+    """输出 Prometheus 文本格式（version 0.0.4）"""
+    with registry._lock:
+        requests = dict(registry.requests)
+        latency = {key: _copy_histogram(value) for key, value in registry.latency.items()}
+        response_size = {key: _copy_histogram(value) for key, value in registry.response_size.items()}
+        db_statements = dict(registry.db_statements)
+        db_time = dict(registry.db_time)
+        in_flight = registry.in_flight
+        outside_statements = registry.db_statements_outside_requests
+        outside_time = registry.db_time_outside_requests
+
+    lines = [
+        "# HELP http_requests_in_flight 正在处理的请求数",
+        "# TYPE http_requests_in_flight gauge",
+        f"http_requests_in_flight {in_flight}",
+        "# HELP http_requests_total 请求总数",
+        "# TYPE http_requests_total counter",
+    ]
+    for (method, route, status), count in sorted(requests.items()):
+        lines.append(f"http_requests_total{_labels(method=method, route=route, status=status)} {count}")
+
+    _render_histogram(lines, "http_request_duration_seconds", "请求处理耗时", latency)
+    _render_histogram(lines, "http_response_size_bytes", "响应体大小", response_size)
+
+    lines.append("# HELP http_request_db_statements_total 请求中执行的SQL语句数")
+    lines.append("# TYPE http_request_db_statements_total counter")
+    for (method, route), count in sorted(db_statements.items()):
+        lines.append(f"http_request_db_statements_total{_labels(method=method, route=route)} {count}")
+    lines.append("# HELP http_request_db_seconds_total 请求中SQL语句的执行耗时")
+    lines.append("# TYPE http_request_db_seconds_total counter")
+    for (method, route), seconds in sorted(db_time.items()):
+        lines.append(f"http_request_db_seconds_total{_labels(method=method, route=route)} {seconds}")
+
+    lines.append("# HELP db_statements_outside_requests_total 请求之外执行的SQL语句数")
+    lines.append("# TYPE db_statements_outside_requests_total counter")
+    lines.append(f"db_statements_outside_requests_total {outside_statements}")
+    lines.append("# HELP db_seconds_outside_requests_total 请求之外SQL语句的执行耗时")
+    lines.append("# TYPE db_seconds_outside_requests_total counter")
+    lines.append(f"db_seconds_outside_requests_total {outside_time}")
+    return "\n".join(lines) + "\n"
+
+
+def _copy_histogram(histogram: Histogram) -> Histogram:
+    copy = Histogram(histogram.buckets)
+    copy.counts = list(histogram.counts)
+    copy.total = histogram.total
+    copy.count = histogram.count
+    return copy
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("metrics_query_start", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get("metrics_query_start")
+    if not starts:
+        return
+    duration = time.perf_counter() - starts.pop()
+    stats = _current_request.get()
+    if stats is None:
+        registry.query_finished(duration)
+    else:
+        stats.db_statements += 1
+        stats.db_time += duration
+
+
+def _route_label(scope) -> str:
+    route = scope.get("route")
+    if route is not None and getattr(route, "path", None):
+        return route.path
+    # 挂载的子应用（如 /uploads）没有 route，使用挂载路径
+    if "endpoint" in scope and scope.get("root_path"):
+        return scope["root_path"]
+    return UNMATCHED_ROUTE
+
+
+class MetricsMiddleware:
+    """记录请求指标并添加 Server-Timing 响应头"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats(scope)
+        token = _current_request.set(stats)
+        status_code = 500
+        size = 0
+
+        async def send_wrapper(message):
+            nonlocal status_code, size
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                elapsed = (time.perf_counter() - stats.start) * 1000
+                timing = (
+                    f'db;dur={stats.db_time * 1000:.2f};desc="{stats.db_statements} queries", '
+                    f'app;dur={elapsed:.2f}'
+                )
+                message["headers"] = list(message.get("headers", [])) + [(b"server-timing", timing.encode("latin-1"))]
+            elif message["type"] == "http.response.body":
+                size += len(message.get("body", b""))
+            elif message["type"] == "http.response.zerocopysend":
+                size += message.get("count") or 0
+            await send(message)
+
+        registry.request_started()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current_request.reset(token)
+            registry.request_finished(
+                scope["method"], _route_label(scope), status_code,
+                time.perf_counter() - stats.start, size, stats
+            )
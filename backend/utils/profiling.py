@@ -0,0 +1,278 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+按请求开启的性能分析
+
+管理员在请求上带 `X-Profile: 1` 请求头或 `profile=1` 查询参数时，该请求在
+cProfile 下执行，结果（.prof 文件和包含路由、耗时等信息的 .json 文件）保存到
+PROFILE_DIR 目录，响应头 X-Profile-Id 返回记录ID，可通过 /api/profiles 查看。
+
+- 同步路由在线程池中执行，install_profiling() 包装每个同步路由函数，
+  在执行它的线程中单独记录，最后与事件循环线程的记录合并
+- 事件循环线程的记录包含同一时间其他请求在事件循环中执行的代码
+- 依赖项（认证、数据库会话）不在记录范围内
+- 未带标记的请求只多一次请求头检查；非管理员带标记时按普通请求处理
+"""
+
+import asyncio
+import cProfile
+import functools
+import json
+import logging
+import os
+import pstats
+import re
+import threading
+import time
+import uuid
+from contextvars import ContextVar
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+from urllib.parse import parse_qs
+
+from fastapi.routing import APIRoute
+from jose import JWTError, jwt
+from starlette.concurrency import run_in_threadpool
+
+from database import SessionLocal
+from models.user import User, UserRole
+from utils.auth import SECRET_KEY, ALGORITHM
+
+logger = logging.getLogger(__name__)
+
+# 性能分析记录保存目录
+PROFILE_DIR = Path(os.getenv("PROFILE_DIR", str(Path(__file__).resolve().parent.parent / "profiles")))
+# 最多保留的记录数
+PROFILE_MAX_FILES = int(os.getenv("PROFILE_MAX_FILES", "200"))
+
+PROFILE_HEADER = b"x-profile"
+PROFILE_QUERY_PARAM = "profile"
+_TRUE_VALUES = ("1", "true", "yes")
+_PROFILE_ID_PATTERN = re.compile(r"^[0-9A-Za-z_-]+$")
+
+SORT_KEYS = ("cumulative", "tottime", "calls")
+
+
+class ProfileSession:
+    """一个被分析请求的全部 cProfile 记录"""
+
+    def __init__(self, profile_id: str, username: str):
+        self.id = profile_id
+        self.username = username
+        self.profilers: List[cProfile.Profile] = []
+        self._lock = threading.Lock()
+
+    def add(self, profiler: cProfile.Profile):
+        with self._lock:
+            self.profilers.append(profiler)
+
+    def save(self, scope, status_code: int, duration: float):
+        """合并各线程的记录并写入文件"""
+        stats = None
+        for profiler in self.profilers:
+            profiler.create_stats()
+            if not profiler.stats:
+                continue
+            if stats is None:
+                stats = pstats.Stats(profiler)
+            else:
+                stats.add(profiler)
+        if stats is None:
+            return
+
+        PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+        stats.dump_stats(str(PROFILE_DIR / f"{self.id}.prof"))
+        route = scope.get("route")
+        metadata = {
+            "id": self.id,
+            "created_at": datetime.now().isoformat(sep=" ", timespec="seconds"),
+            "method": scope["method"],
+            "path": scope["path"],
+            "query": scope.get("query_string", b"").decode("latin-1"),
+            "route": getattr(route, "path", None),
+            "status": status_code,
+            "duration_ms": round(duration * 1000, 2),
+            "user": self.username,
+            "threads": len(self.profilers),
+        }
+        with open(PROFILE_DIR / f"{self.id}.json", "w", encoding="utf-8") as f:
+            json.dump(metadata, f, ensure_ascii=False)
+        _prune()
+
+
+_active_profile: ContextVar[Optional[ProfileSession]] = ContextVar("active_profile", default=None)
+# cProfile 在同一线程只能有一个处于启用状态
+_loop_profiler_lock = threading.Lock()
+
+
+def _prune():
+    files = sorted(PROFILE_DIR.glob("*.prof"))
+    for path in files[:max(len(files) - PROFILE_MAX_FILES, 0)]:
+        path.unlink(missing_ok=True)
+        path.with_suffix(".json").unlink(missing_ok=True)
+
+
+def _profile_requested(scope) -> bool:
+    for name, value in scope["headers"]:
+        if name == PROFILE_HEADER:
+            return value.decode("latin-1").strip().lower() in _TRUE_VALUES
+    query = scope.get("query_string", b"")
+    if PROFILE_QUERY_PARAM.encode() not in query:
+        return False
+    values = parse_qs(query.decode("latin-1")).get(PROFILE_QUERY_PARAM, [])
+    return any(value.lower() in _TRUE_VALUES for value in values)
+
+
+def _admin_username(scope) -> Optional[str]:
+    """请求携带管理员令牌时返回用户名"""
+    authorization = ""
+    for name, value in scope["headers"]:
+        if name == b"authorization":
+            authorization = value.decode("latin-1")
+            break
+    if not authorization.lower().startswith("bearer "):
+        return None
+    try:
+        username = jwt.decode(authorization[7:], SECRET_KEY, algorithms=[ALGORITHM]).get("sub")
+    except JWTError:
+        return None
+    if username is None:
+        return None
+
+    db = SessionLocal()
+    try:
+        user = db.query(User).filter(User.username == username).first()
+        if user is None or not user.is_active or user.role != UserRole.ADMIN.value:
+            return None
+        return user.username
+    finally:
+        db.close()
+
+
+def _profiled(func):
+    """在线程池中执行的同步路由函数：有活动的分析会话时在本线程记录"""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        session = _active_profile.get()
+        if session is None:
+            return func(*args, **kwargs)
+        profiler = cProfile.Profile()
+        session.add(profiler)
+        return profiler.runcall(func, *args, **kwargs)
+    return wrapper
+
+
+def install_profiling(app):
+    """包装应用中所有同步路由函数，需在注册全部路由之后调用"""
+    for route in app.routes:
+        if isinstance(route, APIRoute) and not asyncio.iscoroutinefunction(route.dependant.call) \
+                and not getattr(route.dependant.call, "__wrapped__", None):
+            route.dependant.call = _profiled(route.dependant.call)
+
+
+class ProfilingMiddleware:
+    """管理员带分析标记的请求在 cProfile 下执行"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not _profile_requested(scope):
+            await self.app(scope, receive, send)
+            return
+
+        username = await run_in_threadpool(_admin_username, scope)
+        if username is None:
+            await self.app(scope, receive, send)
+            return
+
+        session = ProfileSession(f"{datetime.now():%Y%m%d-%H%M%S-%f}-{uuid.uuid4().hex[:6]}", username)
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                message["headers"] = list(message.get("headers", [])) + [(b"x-profile-id", session.id.encode())]
+            await send(message)
+
+        loop_profiler = None
+        if _loop_profiler_lock.acquire(blocking=False):
+            loop_profiler = cProfile.Profile()
+            session.add(loop_profiler)
+        token = _active_profile.set(session)
+        start = time.perf_counter()
+        try:
+            if loop_profiler is not None:
+                loop_profiler.enable()
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            if loop_profiler is not None:
+                loop_profiler.disable()
+                _loop_profiler_lock.release()
+            _active_profile.reset(token)
+            duration = time.perf_counter() - start
+            try:
+                await run_in_threadpool(session.save, scope, status_code, duration)
+            except Exception as e:
+                logger.error(f"保存性能分析记录失败: {e}")
+
+
+def list_profiles(limit: int = 50) -> List[Dict[str, Any]]:
+    """最近的性能分析记录，按时间倒序"""
+    if not PROFILE_DIR.exists():
+        return []
+    profiles = []
+    for path in sorted(PROFILE_DIR.glob("*.json"), reverse=True)[:limit]:
+        try:
+            with open(path, encoding="utf-8") as f:
+                profiles.append(json.load(f))
+        except (OSError, ValueError):
+            continue
+    return profiles
+
+
+def profile_file(profile_id: str) -> Optional[Path]:
+    """记录对应的 .prof 文件，不存在时返回 None"""
+    if not _PROFILE_ID_PATTERN.match(profile_id):
+        return None
+    path = PROFILE_DIR / f"{profile_id}.prof"
+    return path if path.exists() else None
+
+
+def load_profile(profile_id: str, sort: str = "cumulative", limit: int = 50) -> Optional[Dict[str, Any]]:
+    """
+    读取一条性能分析记录
+
+    Args:
+        profile_id: 记录ID
+        sort: 排序方式（cumulative、tottime、calls）
+        limit: 返回的函数数量
+
+    Returns:
+        记录信息和耗时最多的函数列表，不存在时返回 None
+    """
+    path = profile_file(profile_id)
+    if path is None:
+        return None
+    with open(path.with_suffix(".json"), encoding="utf-8") as f:
+        metadata = json.load(f)
+
+    stats = pstats.Stats(str(path))
+    stats.sort_stats(sort)
+    functions = []
+    for func in stats.fcn_list[:limit]:
+        primitive_calls, calls, total_time, cumulative_time, _ = stats.stats[func]
+        filename, line, name = func
+        functions.append({
+            "function": name if filename == "~" else f"{filename}:{line}({name})",
+            "calls": calls,
+            "primitive_calls": primitive_calls,
+            "total_ms": round(total_time * 1000, 3),
+            "cumulative_ms": round(cumulative_time * 1000, 3),
+        })
+    metadata["total_calls"] = stats.total_calls
+    metadata["functions"] = functions
+    return metadata
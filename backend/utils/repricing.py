@@ -0,0 +1,250 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+工单重新定价
+
+工作内容或材料单价调整后，批量更新未完成工单中对应明细的单价、金额，
+并把明细金额的变化（数量 × 新单价 − 原金额）加到这些工单的施工费、材料费、
+甲供材料费、自购材料费和总费用上。工单费用可能包含手工录入或导入的部分，
+因此只按变化量调整，不用明细重新汇总覆盖。
+
+全部计算用集合SQL完成（SQLAlchemy Core，不依赖特定数据库）：新单价用 CASE 表达式按ID映射，
+费用变化按工单分组汇总，工单费用用关联子查询一次更新，不在Python中逐行加载明细。
+提交后向受影响工单的相关用户推送 task.updated 事件。
+"""
+
+import logging
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import and_, case, func, literal, or_, select, union_all, update
+from sqlalchemy.orm import Session
+
+from models.change_log import ChangeOperation
+from models.task import Task, TaskMaterial, TaskStatus, TaskWorkItem
+from utils.change_feed import record_changes, record_changes_where
+from utils.events import EVENT_TASK_UPDATED, broker, collect_task_recipients, load_task_event_data
+
+logger = logging.getLogger(__name__)
+
+# 不再调整价格的工单状态
+CLOSED_TASK_STATUSES = (TaskStatus.COMPLETED.value, TaskStatus.CANCELLED.value)
+
+# 差异明细最多返回的工单数
+MAX_DIFF_ROWS = 1000
+
+# 单条语句 IN 列表的最大长度，避免超出SQLite变量数限制
+IN_CHUNK_SIZE = 500
+
+
+class _LinePricing:
+    """一类明细（工作内容或材料）的新单价和费用变化表达式"""
+
+    def __init__(self, model, item_column, prices: Dict[int, float]):
+        self.model = model
+        self.item_column = item_column
+        self.item_ids = list(prices)
+        self.new_price = case(prices, value=item_column)
+        # 数量为空时金额不变
+        self.delta = (func.coalesce(model.quantity * self.new_price, model.total_price, 0)
+                      - func.coalesce(model.total_price, 0))
+
+    def changed(self):
+        """单价确实发生变化的明细"""
+        return and_(
+            self.item_column.in_(self.item_ids),
+            or_(self.model.unit_price.is_(None), self.model.unit_price != self.new_price),
+        )
+
+    def changed_in_open_tasks(self):
+        open_tasks = select(Task.id).where(or_(Task.status.is_(None), Task.status.not_in(CLOSED_TASK_STATUSES)))
+        return and_(self.changed(), self.model.task_id.in_(open_tasks))
+
+
+def _delta_rows(work: Optional[_LinePricing], material: Optional[_LinePricing]):
+    """每条变化的明细一行：工单ID和施工费、甲供材料费、自购材料费的变化"""
+    parts = []
+    if work:
+        parts.append(
+            select(
+                TaskWorkItem.task_id.label("task_id"),
+                work.delta.label("labor_delta"),
+                literal(0.0).label("company_delta"),
+                literal(0.0).label("self_delta"),
+            ).where(work.changed_in_open_tasks())
+        )
+    if material:
+        company = TaskMaterial.is_company_provided == True  # noqa: E712
+        parts.append(
+            select(
+                TaskMaterial.task_id.label("task_id"),
+                literal(0.0).label("labor_delta"),
+                case((company, material.delta), else_=0.0).label("company_delta"),
+                case((company, 0.0), else_=material.delta).label("self_delta"),
+            ).where(material.changed_in_open_tasks())
+        )
+    return union_all(*parts).subquery() if len(parts) > 1 else parts[0].subquery()
+
+
+def _cost_diff(work: Optional[_LinePricing], material: Optional[_LinePricing]):
+    """受影响工单的新旧费用对比（不修改数据）"""
+    lines = _delta_rows(work, material)
+    deltas = select(
+        lines.c.task_id,
+        func.sum(lines.c.labor_delta).label("labor_delta"),
+        func.sum(lines.c.company_delta).label("company_delta"),
+        func.sum(lines.c.self_delta).label("self_delta"),
+    ).group_by(lines.c.task_id).subquery()
+
+    labor = func.coalesce(Task.labor_cost, 0)
+    company = func.coalesce(Task.company_material_cost, 0)
+    own = func.coalesce(Task.self_material_cost, 0)
+    total = func.coalesce(Task.total_cost, 0)
+    return select(
+        Task.id.label("task_id"),
+        labor.label("old_labor_cost"),
+        (labor + deltas.c.labor_delta).label("new_labor_cost"),
+        company.label("old_company_material_cost"),
+        (company + deltas.c.company_delta).label("new_company_material_cost"),
+        own.label("old_self_material_cost"),
+        (own + deltas.c.self_delta).label("new_self_material_cost"),
+        total.label("old_total_cost"),
+        (total + deltas.c.labor_delta + deltas.c.company_delta + deltas.c.self_delta).label("new_total_cost"),
+    ).join(deltas, deltas.c.task_id == Task.id).subquery()
+
+
+def _task_delta(pricing: Optional[_LinePricing], company: Optional[bool] = None):
+    """工单（UPDATE tasks 的当前行）某项费用的变化，关联子查询"""
+    if pricing is None:
+        return literal(0.0)
+    conditions = [pricing.changed(), pricing.model.task_id == Task.id]
+    if company is True:
+        conditions.append(TaskMaterial.is_company_provided == True)  # noqa: E712
+    elif company is False:
+        conditions.append(or_(TaskMaterial.is_company_provided.is_(None), TaskMaterial.is_company_provided == False))  # noqa: E712
+    return select(func.coalesce(func.sum(pricing.delta), 0)).where(*conditions).scalar_subquery()
+
+
+def _apply(db: Session, work: Optional[_LinePricing], material: Optional[_LinePricing], task_ids: List[int]):
+    """更新工单费用和明细单价，并记录变更日志"""
+    labor_delta = _task_delta(work)
+    company_delta = _task_delta(material, company=True)
+    self_delta = _task_delta(material, company=False)
+
+    for start in range(0, len(task_ids), IN_CHUNK_SIZE):
+        chunk = task_ids[start:start + IN_CHUNK_SIZE]
+        # 先按变化量更新工单费用，再更新明细，子查询读到的是明细的原金额
+        db.execute(
+            update(Task).where(Task.id.in_(chunk)).values(
+                labor_cost=func.coalesce(Task.labor_cost, 0) + labor_delta,
+                company_material_cost=func.coalesce(Task.company_material_cost, 0) + company_delta,
+                self_material_cost=func.coalesce(Task.self_material_cost, 0) + self_delta,
+                material_cost=func.coalesce(Task.material_cost, 0) + company_delta + self_delta,
+                total_cost=func.coalesce(Task.total_cost, 0) + labor_delta + company_delta + self_delta,
+                updated_at=func.now(),
+            ).execution_options(synchronize_session=False)
+        )
+        for pricing in (work, material):
+            if pricing is None:
+                continue
+            lines = and_(pricing.item_column.in_(pricing.item_ids), pricing.model.task_id.in_(chunk))
+            record_changes_where(db, pricing.model, and_(lines, pricing.changed()), ChangeOperation.UPSERT)
+            db.execute(
+                update(pricing.model).where(lines).values(
+                    unit_price=pricing.new_price,
+                    total_price=pricing.model.quantity * pricing.new_price,
+                ).execution_options(synchronize_session=False)
+            )
+    record_changes(db, Task, task_ids)
+
+
+def publish_reprice_events(db: Session, task_ids: List[int]):
+    """
+    重新定价提交后，向受影响工单的相关用户推送 task.updated 事件
+
+    Args:
+        db: 数据库会话
+        task_ids: 重新定价的工单ID
+    """
+    if not task_ids:
+        return
+    snapshot = load_task_event_data(db, task_ids)
+    for task_id, user_ids in collect_task_recipients(db, task_ids).items():
+        if task_id in snapshot:
+            broker.publish(EVENT_TASK_UPDATED, snapshot[task_id], user_ids)
+
+
+def reprice_tasks(
+    db: Session,
+    work_item_prices: Optional[Dict[int, float]] = None,
+    material_prices: Optional[Dict[int, float]] = None,
+    dry_run: bool = True,
+    max_diff_rows: int = MAX_DIFF_ROWS,
+    commit: bool = True
+) -> Dict[str, Any]:
+    """
+    按新的目录单价重新计算未完成工单的明细和费用
+
+    Args:
+        db: 数据库会话
+        work_item_prices: 工作内容ID -> 新单价
+        material_prices: 材料ID -> 新单价
+        dry_run: 为True时只计算差异，不修改数据
+        max_diff_rows: 返回的工单差异明细上限（按费用变化绝对值降序）
+        commit: 为False时不提交也不推送事件，由调用方与其他修改（例如目录单价）在同一事务中提交，
+            提交后用结果中的 task_ids 调用 publish_reprice_events
+
+    Returns:
+        包含受影响明细数、工单数、费用变化合计和工单差异明细的字典；
+        实际修改时还包含重新定价的工单ID（task_ids）
+    """
+    work = _LinePricing(TaskWorkItem, TaskWorkItem.work_item_id, work_item_prices) if work_item_prices else None
+    material = _LinePricing(TaskMaterial, TaskMaterial.material_id, material_prices) if material_prices else None
+
+    result = {
+        "dry_run": dry_run,
+        "affected_work_item_lines": 0,
+        "affected_material_lines": 0,
+        "affected_tasks": 0,
+        "total_cost_delta": 0.0,
+        "tasks": [],
+        "task_ids": [],
+    }
+    if work is None and material is None:
+        return result
+
+    # 受影响的明细数量
+    for key, pricing in (("affected_work_item_lines", work), ("affected_material_lines", material)):
+        if pricing is not None:
+            result[key] = db.execute(
+                select(func.count()).select_from(pricing.model).where(pricing.changed_in_open_tasks())
+            ).scalar()
+
+    # 新旧费用对比
+    diff = _cost_diff(work, material)
+    change = diff.c.new_total_cost - diff.c.old_total_cost
+    summary = db.execute(select(func.count(), func.coalesce(func.sum(change), 0)).select_from(diff)).one()
+    diff_rows = db.execute(
+        select(diff).order_by(func.abs(change).desc(), diff.c.task_id).limit(max_diff_rows)
+    ).mappings().all()
+    result.update({
+        "affected_tasks": summary[0],
+        "total_cost_delta": round(summary[1], 2),
+        "tasks": [dict(row) for row in diff_rows],
+    })
+    if dry_run:
+        return result
+
+    task_ids = list(db.scalars(select(diff.c.task_id).order_by(diff.c.task_id)))
+    _apply(db, work, material, task_ids)
+    result["task_ids"] = task_ids
+    if commit:
+        db.commit()
+        publish_reprice_events(db, task_ids)
+
+    logger.info(
+        f"重新定价完成: {result['affected_tasks']} 个工单, "
+        f"{result['affected_work_item_lines']} 条工作内容明细, {result['affected_material_lines']} 条材料明细, "
+        f"费用变化 {result['total_cost_delta']}"
+    )
+    return result
@@ -0,0 +1,181 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+慢查询记录
+
+在数据库引擎上挂接 before/after_cursor_execute 钩子，执行时间超过阈值的SQL
+连同绑定参数、来源路由、耗时和影响行数写入单独的SQLite文件
+（默认 backend/slow_queries.db），不占用业务数据库的写锁。
+
+- 写入由后台线程完成，请求线程只把记录放入队列
+- 表中超过 SLOW_QUERY_MAX_ROWS 行时删除最早的记录
+- 行数取自 cursor.rowcount：UPDATE/DELETE/INSERT 为影响行数，
+  SQLite 的 SELECT 在执行时还不知道结果行数，记为空
+- 涉及密码字段的语句不记录参数
+
+使用 `python db_manager.py --slow-queries` 查看按总耗时排序的慢查询。
+"""
+
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Optional
+
+from sqlalchemy import event
+
+from utils.metrics import current_request_stats
+
+logger = logging.getLogger(__name__)
+
+# 记录阈值（毫秒），小于等于0时不记录
+SLOW_QUERY_THRESHOLD_MS = float(os.getenv("SLOW_QUERY_THRESHOLD_MS", "200"))
+# 慢查询数据库路径
+SLOW_QUERY_DB = os.getenv("SLOW_QUERY_DB", str(Path(__file__).resolve().parent.parent / "slow_queries.db"))
+# 最多保留的记录数
+SLOW_QUERY_MAX_ROWS = int(os.getenv("SLOW_QUERY_MAX_ROWS", "100000"))
+
+# 参数文本的最大长度
+MAX_PARAMETERS_LENGTH = 2000
+# 含有这些字段的语句不记录参数
+SENSITIVE_COLUMNS = ("hashed_password",)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS slow_queries (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    recorded_at TEXT NOT NULL,
+    elapsed_ms REAL NOT NULL,
+    statement TEXT NOT NULL,
+    parameters TEXT,
+    route TEXT,
+    method TEXT,
+    path TEXT,
+    row_count INTEGER,
+    executemany INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS ix_slow_queries_statement ON slow_queries (statement);
+CREATE INDEX IF NOT EXISTS ix_slow_queries_recorded_at ON slow_queries (recorded_at);
+"""
+
+
+def connect(db_path: str = SLOW_QUERY_DB) -> sqlite3.Connection:
+    """打开慢查询数据库并确保表存在"""
+    conn = sqlite3.connect(db_path)
+    conn.executescript(_SCHEMA)
+    return conn
+
+
+class SlowQueryRecorder:
+    """后台写入慢查询记录"""
+
+    def __init__(self, db_path: str = SLOW_QUERY_DB, threshold_ms: float = SLOW_QUERY_THRESHOLD_MS,
+                 max_rows: int = SLOW_QUERY_MAX_ROWS):
+        self.db_path = db_path
+        self.threshold = threshold_ms / 1000
+        self.max_rows = max_rows
+        self.dropped = 0
+        self._queue: queue.Queue = queue.Queue(maxsize=10000)
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def install(self, engine):
+        """在引擎上注册钩子"""
+        if self.threshold <= 0:
+            return
+        event.listen(engine, "before_cursor_execute", self._before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", self._after_cursor_execute)
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("slow_query_start", []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        starts = conn.info.get("slow_query_start")
+        if not starts:
+            return
+        elapsed = time.perf_counter() - starts.pop()
+        if elapsed < self.threshold:
+            return
+
+        stats = current_request_stats()
+        scope = stats.scope if stats is not None else {}
+        if any(column in statement for column in SENSITIVE_COLUMNS):
+            params_text = "<已隐藏>"
+        else:
+            params_text = repr(parameters)
+            if len(params_text) > MAX_PARAMETERS_LENGTH:
+                params_text = params_text[:MAX_PARAMETERS_LENGTH] + "..."
+        row_count = cursor.rowcount if cursor.rowcount is not None and cursor.rowcount >= 0 else None
+
+        self._ensure_writer()
+        try:
+            self._queue.put_nowait((
+                datetime.now().isoformat(sep=" ", timespec="milliseconds"),
+                round(elapsed * 1000, 3),
+                statement,
+                params_text,
+                stats.route if stats is not None else None,
+                scope.get("method"),
+                scope.get("path"),
+                row_count,
+                int(bool(executemany)),
+            ))
+        except queue.Full:
+            self.dropped += 1
+
+    def _ensure_writer(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._write_loop, name="slow-query-writer", daemon=True)
+                self._thread.start()
+
+    def _write_loop(self):
+        conn = connect(self.db_path)
+        written = 0
+        while True:
+            records = [self._queue.get()]
+            # 一次取走积压的记录，合并到一个事务
+            while len(records) < 500:
+                try:
+                    records.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                conn.executemany(
+                    "INSERT INTO slow_queries (recorded_at, elapsed_ms, statement, parameters, route, method, path, "
+                    "row_count, executemany) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    records
+                )
+                written += len(records)
+                if written >= 1000:
+                    written = 0
+                    conn.execute(
+                        "DELETE FROM slow_queries WHERE id <= (SELECT MAX(id) FROM slow_queries) - ?",
+                        (self.max_rows,)
+                    )
+                conn.commit()
+            except sqlite3.Error as e:
+                logger.error(f"写入慢查询记录失败: {e}")
+            for _ in records:
+                self._queue.task_done()
+
+    def flush(self, timeout: float = 5.0):
+        """等待队列中的记录写入完成"""
+        deadline = time.time() + timeout
+        while self._queue.unfinished_tasks and time.time() < deadline:
+            time.sleep(0.01)
+
+
+recorder = SlowQueryRecorder()
+
+
+def install_slow_query_recorder(engine):
+    """为引擎启用慢查询记录"""
+    recorder.install(engine)
+
@@ -0,0 +1,219 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+上传文件静态服务
+
+上传文件名是UUID，内容不会变化，因此响应带一年的immutable缓存头。
+支持HTTP Range请求（断点续传、PDF图纸和视频拖动播放），服务器支持
+http.response.zerocopysend 扩展时使用零拷贝sendfile发送文件内容。
+
+部署在nginx之后时，可设置环境变量 UPLOADS_ACCEL_REDIRECT（例如 /internal-uploads/），
+后端只返回 X-Accel-Redirect 响应头，由nginx直接发送文件内容。
+"""
+
+import os
+import re
+import stat
+from typing import Optional, Tuple
+from urllib.parse import parse_qs, quote
+
+import anyio
+from fastapi.staticfiles import StaticFiles
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import NotModifiedResponse
+from starlette.types import Receive, Scope, Send
+
+from utils.image_utils import IMAGE_SIZES, ensure_variant, is_image, is_variant
+
+# 上传文件缓存时间（秒）
+UPLOADS_CACHE_MAX_AGE = int(os.getenv("UPLOADS_CACHE_MAX_AGE", str(365 * 24 * 3600)))
+
+# 衍生图生成失败、以原图代替时的缓存头：同一个URL之后可能返回衍生图，不能被长期缓存
+FALLBACK_CACHE_CONTROL = "no-cache"
+
+# nginx内部location前缀，为空时由后端自己发送文件内容
+UPLOADS_ACCEL_REDIRECT = os.getenv("UPLOADS_ACCEL_REDIRECT", "")
+
+# 没有零拷贝扩展时每次读取的块大小
+UPLOADS_CHUNK_SIZE = 256 * 1024
+
+_RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def parse_range(range_header: str, file_size: int) -> Optional[Tuple[int, int]]:
+    """
+    解析单段Range请求头
+
+    Args:
+        range_header: Range请求头，例如 "bytes=0-1023"、"bytes=1024-"、"bytes=-500"
+        file_size: 文件大小
+
+    Returns:
+        (起始偏移, 结束偏移) 闭区间；多段或格式错误返回None（按整个文件返回）
+
+    Raises:
+        ValueError: 范围无法满足，应返回416
+    """
+    match = _RANGE_RE.match(range_header.strip())
+    if not match:
+        return None
+
+    start_str, end_str = match.groups()
+    if not start_str and not end_str:
+        return None
+
+    if not start_str:
+        # 后缀范围：最后N个字节
+        suffix_length = int(end_str)
+        if suffix_length == 0:
+            raise ValueError("无法满足的范围")
+        return max(file_size - suffix_length, 0), file_size - 1
+
+    start = int(start_str)
+    end = int(end_str) if end_str else file_size - 1
+    if start >= file_size or start > end:
+        raise ValueError("无法满足的范围")
+    return start, min(end, file_size - 1)
+
+
+class UploadFileResponse(FileResponse):
+    """支持Range、零拷贝发送和X-Accel-Redirect的文件响应"""
+
+    chunk_size = UPLOADS_CHUNK_SIZE
+
+    def __init__(self, *args, byte_range: Optional[Tuple[int, int]] = None,
+                 accel_redirect: Optional[str] = None, cache_control: Optional[str] = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.accel_redirect = accel_redirect
+        self.headers["accept-ranges"] = "bytes"
+        self.headers["cache-control"] = cache_control or f"public, max-age={UPLOADS_CACHE_MAX_AGE}, immutable"
+
+        file_size = self.stat_result.st_size
+        if byte_range is None:
+            self.offset, self.count = 0, file_size
+        else:
+            start, end = byte_range
+            self.offset, self.count = start, end - start + 1
+            self.status_code = 206
+            self.headers["content-range"] = f"bytes {start}-{end}/{file_size}"
+            self.headers["content-length"] = str(self.count)
+
+        if accel_redirect:
+            # nginx会自己处理Range，这里只返回头部
+            self.status_code = 200
+            self.headers["x-accel-redirect"] = accel_redirect
+            self.headers["content-length"] = "0"
+            for header in ("content-range", "accept-ranges"):
+                if header in self.headers:
+                    del self.headers[header]
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        await send({
+            "type": "http.response.start",
+            "status": self.status_code,
+            "headers": self.raw_headers,
+        })
+
+        if self.send_header_only or self.accel_redirect or self.count == 0:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+        elif "http.response.zerocopysend" in scope.get("extensions", {}):
+            with open(self.path, "rb") as file:
+                await send({
+                    "type": "http.response.zerocopysend",
+                    "file": file.fileno(),
+                    "offset": self.offset,
+                    "count": self.count,
+                    "more_body": False,
+                })
+        else:
+            async with await anyio.open_file(self.path, mode="rb") as file:
+                if self.offset:
+                    await file.seek(self.offset)
+                remaining = self.count
+                while remaining > 0:
+                    chunk = await file.read(min(self.chunk_size, remaining))
+                    if not chunk:
+                        break
+                    remaining -= len(chunk)
+                    await send({
+                        "type": "http.response.body",
+                        "body": chunk,
+                        "more_body": remaining > 0,
+                    })
+                if remaining > 0:
+                    await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+        if self.background is not None:
+            await self.background()
+
+
+class UploadStaticFiles(StaticFiles):
+    """
+    上传文件目录的静态文件服务
+
+    图片请求带 ?size=thumb / ?size=web 时返回对应尺寸的衍生图，
+    衍生图尚未生成时当场生成，生成失败则返回原图，此时响应不带 immutable 缓存头
+    （no-cache，且不经过 X-Accel-Redirect，nginx 内部location固定加 immutable），之后可以重新生成。
+    请求的文件本身是衍生图时忽略 size 参数，避免从衍生图再生成衍生图（_thumb_web.jpg ...）占满磁盘。
+    """
+
+    async def get_response(self, path: str, scope: Scope) -> Response:
+        size = self._requested_size(scope)
+        if size and scope["method"] in ("GET", "HEAD") and is_image(path) and not is_variant(path):
+            full_path, stat_result = await anyio.to_thread.run_sync(self.lookup_path, path)
+            if stat_result is not None:
+                target_path = await anyio.to_thread.run_sync(ensure_variant, full_path, size)
+                if target_path:
+                    return self.file_response(target_path, os.stat(target_path), scope)
+                if stat.S_ISREG(stat_result.st_mode):
+                    return self.file_response(full_path, stat_result, scope, cache_control=FALLBACK_CACHE_CONTROL)
+
+        return await super().get_response(path, scope)
+
+    def file_response(self, full_path, stat_result: os.stat_result, scope: Scope,
+                      status_code: int = 200, cache_control: Optional[str] = None) -> Response:
+        method = scope["method"]
+        request_headers = Headers(scope=scope)
+
+        accel_redirect = None
+        if UPLOADS_ACCEL_REDIRECT and not cache_control and stat.S_ISREG(stat_result.st_mode):
+            rel_path = os.path.relpath(full_path, os.path.realpath(str(self.directory)))
+            accel_redirect = UPLOADS_ACCEL_REDIRECT.rstrip("/") + "/" + quote(rel_path.replace(os.sep, "/"))
+
+        response = UploadFileResponse(
+            full_path, status_code=status_code, stat_result=stat_result,
+            method=method, accel_redirect=accel_redirect, cache_control=cache_control
+        )
+        if self.is_not_modified(response.headers, request_headers):
+            return NotModifiedResponse(response.headers)
+
+        range_header = request_headers.get("range")
+        if range_header and not accel_redirect and self._if_range_matches(response.headers, request_headers):
+            file_size = stat_result.st_size
+            try:
+                byte_range = parse_range(range_header, file_size)
+            except ValueError:
+                return Response(status_code=416, headers={"content-range": f"bytes */{file_size}"})
+            if byte_range is not None:
+                return UploadFileResponse(
+                    full_path, status_code=status_code, stat_result=stat_result,
+                    method=method, byte_range=byte_range, cache_control=cache_control
+                )
+
+        return response
+
+    @staticmethod
+    def _if_range_matches(response_headers: Headers, request_headers: Headers) -> bool:
+        """If-Range与当前文件的ETag或修改时间一致时才按范围返回"""
+        if_range = request_headers.get("if-range")
+        if not if_range:
+            return True
+        return if_range in (response_headers.get("etag"), response_headers.get("last-modified"))
+
+    @staticmethod
+    def _requested_size(scope: Scope):
+        query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+        size = query.get("size", [None])[0]
+        return size if size in IMAGE_SIZES else None
@@ -0,0 +1,258 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+工单批量操作
+
+一次请求中按顺序执行多组操作（指派、修改状态、删除），
+每组操作对所有合法工单只执行一条集合 UPDATE/DELETE 语句，
+全部操作在同一个事务中提交，返回每个工单的处理结果。
+"""
+
+import logging
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional, Sequence
+
+from sqlalchemy import case, delete, insert, or_, select, update
+from sqlalchemy.orm import Session
+
+from models.task import Task, TaskMaterial, TaskStatus, TaskWorkItem
+from models.task_worker import TaskWorker
+from models.team import Team
+from models.user import User
+from models.change_log import ChangeOperation
+from utils.change_feed import record_changes, record_changes_where
+from utils.events import (
+    EVENT_TASK_ASSIGNED, EVENT_TASK_DELETED, EVENT_TASK_UPDATED,
+    broker, collect_task_recipients, load_task_event_data
+)
+
+logger = logging.getLogger(__name__)
+
+ACTION_ASSIGN = "assign"
+ACTION_STATUS = "status"
+ACTION_DELETE = "delete"
+
+# 已关闭的工单不允许再指派
+CLOSED_TASK_STATUSES = (TaskStatus.COMPLETED.value, TaskStatus.CANCELLED.value)
+
+# 单条语句 IN 列表的最大长度，避免超出SQLite变量数限制
+IN_CHUNK_SIZE = 500
+
+
+def _chunks(ids: Sequence[int], size: int = IN_CHUNK_SIZE) -> Iterator[List[int]]:
+    for start in range(0, len(ids), size):
+        yield list(ids[start:start + size])
+
+
+def _load_statuses(db: Session, task_ids: Sequence[int]) -> Dict[int, str]:
+    """一次查询所有涉及工单的当前状态"""
+    statuses = {}
+    for chunk in _chunks(task_ids):
+        for task_id, task_status in db.execute(select(Task.id, Task.status).where(Task.id.in_(chunk))):
+            statuses[task_id] = task_status
+    return statuses
+
+
+def _publish_events(db: Session, results: List[Dict[str, Any]],
+                    recipients: Dict[int, set], snapshot: Dict[int, Dict[str, Any]]):
+    """提交后按工单推送事件，每个工单只推送一次"""
+    event_types = {}
+    for result in results:
+        if not result["success"]:
+            continue
+        if result["action"] == ACTION_DELETE:
+            event_types[result["task_id"]] = EVENT_TASK_DELETED
+        elif result["action"] == ACTION_ASSIGN or event_types.get(result["task_id"]) == EVENT_TASK_ASSIGNED:
+            event_types[result["task_id"]] = EVENT_TASK_ASSIGNED
+        else:
+            event_types[result["task_id"]] = EVENT_TASK_UPDATED
+    if not event_types:
+        return
+
+    # 仍然存在的工单重新查询，新的负责人和施工队伍成员也要通知
+    remaining = [task_id for task_id, event_type in event_types.items() if event_type != EVENT_TASK_DELETED]
+    snapshot.update(load_task_event_data(db, remaining))
+    for task_id, user_ids in collect_task_recipients(db, remaining).items():
+        recipients[task_id] |= user_ids
+
+    for task_id, event_type in event_types.items():
+        broker.publish(event_type, snapshot[task_id], recipients[task_id])
+
+
+def _exists(db: Session, model, object_id: int) -> bool:
+    return db.execute(select(model.id).where(model.id == object_id)).first() is not None
+
+
+def _assign(db: Session, task_ids: List[int], statuses: Dict[int, str],
+            team_id: Optional[int], assigned_to_id: Optional[int], now: datetime):
+    """指派施工队伍和负责人，待接单的工单同时变为已接单"""
+    values = {}
+    if team_id is not None:
+        values["team_id"] = team_id
+    if assigned_to_id is not None:
+        values["assigned_to_id"] = assigned_to_id
+    values["assigned_at"] = case((Task.status == TaskStatus.PENDING.value, now), else_=Task.assigned_at)
+    values["status"] = case(
+        (Task.status == TaskStatus.PENDING.value, TaskStatus.ASSIGNED.value),
+        else_=Task.status
+    )
+
+    for chunk in _chunks(task_ids):
+        db.execute(update(Task).where(Task.id.in_(chunk)).values(**values))
+        record_changes(db, Task, chunk)
+
+        if assigned_to_id is not None:
+            # 负责人作为主要施工人员：替换原主要负责人，避免同一人重复关联
+            db.execute(
+                delete(TaskWorker)
+                .where(TaskWorker.task_id.in_(chunk))
+                .where(or_(TaskWorker.is_primary == True, TaskWorker.user_id == assigned_to_id))
+            )
+            db.execute(
+                insert(TaskWorker),
+                [
+                    {"task_id": task_id, "user_id": assigned_to_id, "is_primary": True, "assigned_at": now}
+                    for task_id in chunk
+                ]
+            )
+
+    for task_id in task_ids:
+        if statuses[task_id] == TaskStatus.PENDING.value:
+            statuses[task_id] = TaskStatus.ASSIGNED.value
+
+
+def _change_status(db: Session, task_ids: List[int], statuses: Dict[int, str],
+                   new_status: str, current_user: User, now: datetime):
+    """修改状态，规则与单个工单更新接口一致"""
+    values = {"status": new_status}
+    if new_status == TaskStatus.ASSIGNED.value:
+        values["assigned_to_id"] = case((Task.assigned_to_id.is_(None), current_user.id), else_=Task.assigned_to_id)
+        values["assigned_at"] = now
+    elif new_status == TaskStatus.COMPLETED.value:
+        values["completed_at"] = now
+
+    for chunk in _chunks(task_ids):
+        db.execute(update(Task).where(Task.id.in_(chunk)).values(**values))
+        record_changes(db, Task, chunk)
+
+    for task_id in task_ids:
+        statuses[task_id] = new_status
+
+
+def _delete(db: Session, task_ids: List[int], statuses: Dict[int, str]):
+    """删除工单及其材料、工作内容和施工人员关联"""
+    for chunk in _chunks(task_ids):
+        record_changes_where(db, TaskMaterial, TaskMaterial.task_id.in_(chunk), ChangeOperation.DELETE)
+        record_changes_where(db, TaskWorkItem, TaskWorkItem.task_id.in_(chunk), ChangeOperation.DELETE)
+        record_changes(db, Task, chunk, ChangeOperation.DELETE)
+        db.execute(delete(TaskMaterial).where(TaskMaterial.task_id.in_(chunk)))
+        db.execute(delete(TaskWorkItem).where(TaskWorkItem.task_id.in_(chunk)))
+        db.execute(delete(TaskWorker).where(TaskWorker.task_id.in_(chunk)))
+        db.execute(delete(Task).where(Task.id.in_(chunk)))
+
+    for task_id in task_ids:
+        del statuses[task_id]
+
+
+def execute_batch(db: Session, operations: Sequence[Any], current_user: User) -> Dict[str, Any]:
+    """
+    按顺序执行批量操作
+
+    每个工单先在内存中校验（是否存在、状态是否允许），
+    校验失败的工单记录原因并跳过，其余工单用集合语句处理；
+    所有操作在同一个事务中提交，数据库出错时全部回滚。
+
+    Args:
+        db: 数据库会话
+        operations: TaskBatchOperation 列表
+        current_user: 当前用户
+
+    Returns:
+        包含每个工单处理结果和成功、失败数量的字典
+    """
+    all_ids = sorted({task_id for operation in operations for task_id in operation.task_ids})
+    statuses = _load_statuses(db, all_ids)
+    # 删除前记录工单内容和相关用户，用于推送事件
+    snapshot = load_task_event_data(db, list(statuses))
+    recipients = collect_task_recipients(db, list(statuses))
+    valid_statuses = {item.value for item in TaskStatus}
+    now = datetime.now()
+
+    results = []
+    applied = []
+
+    for index, operation in enumerate(operations):
+        def fail_all(detail):
+            for task_id in operation.task_ids:
+                results.append({
+                    "operation": index, "action": operation.action, "task_id": task_id,
+                    "success": False, "detail": detail
+                })
+
+        # 整组操作的参数校验
+        if operation.action == ACTION_ASSIGN:
+            if operation.team_id is None and operation.assigned_to_id is None:
+                fail_all("指派操作需要提供施工队伍或负责人")
+                continue
+            if operation.team_id is not None and not _exists(db, Team, operation.team_id):
+                fail_all(f"施工队伍ID {operation.team_id} 不存在")
+                continue
+            if operation.assigned_to_id is not None and not _exists(db, User, operation.assigned_to_id):
+                fail_all(f"用户ID {operation.assigned_to_id} 不存在")
+                continue
+        elif operation.action == ACTION_STATUS:
+            if operation.status not in valid_statuses:
+                fail_all(f"无效的工单状态: {operation.status}")
+                continue
+        elif operation.action != ACTION_DELETE:
+            fail_all(f"不支持的操作: {operation.action}")
+            continue
+
+        # 逐个工单校验
+        task_ids = []
+        seen = set()
+        for task_id in operation.task_ids:
+            detail = None
+            if task_id in seen:
+                detail = "工单重复"
+            elif task_id not in statuses:
+                detail = "工单不存在"
+            elif operation.action == ACTION_ASSIGN and statuses[task_id] in CLOSED_TASK_STATUSES:
+                detail = "已完成或已取消的工单不能指派"
+
+            seen.add(task_id)
+            if detail is None:
+                task_ids.append(task_id)
+            results.append({
+                "operation": index, "action": operation.action, "task_id": task_id,
+                "success": detail is None, "detail": detail
+            })
+
+        if not task_ids:
+            continue
+
+        if operation.action == ACTION_ASSIGN:
+            _assign(db, task_ids, statuses, operation.team_id, operation.assigned_to_id, now)
+        elif operation.action == ACTION_STATUS:
+            _change_status(db, task_ids, statuses, operation.status, current_user, now)
+        else:
+            _delete(db, task_ids, statuses)
+        applied.append((operation.action, len(task_ids)))
+
+    try:
+        db.commit()
+    except Exception:
+        db.rollback()
+        logger.exception("批量操作工单失败，已回滚")
+        raise
+
+    _publish_events(db, results, recipients, snapshot)
+
+    succeeded = sum(1 for result in results if result["success"])
+    logger.info(f"批量操作工单完成: {applied}, 成功 {succeeded} 个, 失败 {len(results) - succeeded} 个")
+    return {
+        "succeeded": succeeded,
+        "failed": len(results) - succeeded,
+        "results": results,
+    }
@@ -0,0 +1,170 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+工单结算导出
+
+每个工单的每条工作内容、材料明细输出一行，附带工单、项目、施工队伍和工单费用，
+末尾输出施工费、甲供材料费、自购材料费合计行。
+"""
+
+from datetime import datetime
+from typing import Any, Iterator, List, Optional
+
+from sqlalchemy import case, literal, null, select, union_all
+from sqlalchemy.orm import Session
+
+from models.material import Material
+from models.project import Project
+from models.task import Task, TaskMaterial, TaskWorkItem
+from models.team import Team
+from models.work_item import WorkItem
+
+# 服务端游标每次读取的行数
+EXPORT_YIELD_PER = 1000
+
+LINE_TYPE_WORK = "工作内容"
+LINE_TYPE_COMPANY_MATERIAL = "甲供材料"
+LINE_TYPE_SELF_MATERIAL = "自购材料"
+
+SETTLEMENT_HEADER = [
+    "工单ID", "工单主题", "工单状态", "项目", "施工队伍", "完成时间",
+    "明细类型", "编号", "名称", "单位", "数量", "单价", "金额",
+    "工单施工费", "工单甲供材料费", "工单自购材料费", "工单总费用",
+]
+
+
+def build_settlement_query(
+    status: Optional[str] = None,
+    project_id: Optional[int] = None,
+    team_id: Optional[int] = None,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+):
+    """
+    构建结算明细查询
+
+    工作内容明细、材料明细和没有任何明细的工单用 UNION ALL 合并，
+    按工单ID排序，保证同一工单的明细连续输出。
+    """
+    task_columns = [
+        Task.id.label("task_id"),
+        Task.title.label("task_title"),
+        Task.status.label("task_status"),
+        Project.title.label("project_title"),
+        Team.name.label("team_name"),
+        Task.completed_at.label("completed_at"),
+    ]
+    cost_columns = [
+        Task.labor_cost.label("labor_cost"),
+        Task.company_material_cost.label("company_material_cost"),
+        Task.self_material_cost.label("self_material_cost"),
+        Task.total_cost.label("total_cost"),
+    ]
+
+    def apply_filters(stmt):
+        stmt = stmt.outerjoin(Project, Task.project_id == Project.id).outerjoin(Team, Task.team_id == Team.id)
+        if status:
+            stmt = stmt.where(Task.status == status)
+        if project_id:
+            stmt = stmt.where(Task.project_id == project_id)
+        if team_id:
+            stmt = stmt.where(Task.team_id == team_id)
+        if start_date:
+            stmt = stmt.where(Task.completed_at >= start_date)
+        if end_date:
+            stmt = stmt.where(Task.completed_at <= end_date)
+        return stmt
+
+    work_lines = apply_filters(
+        select(
+            *task_columns,
+            literal(0).label("line_order"),
+            TaskWorkItem.id.label("line_id"),
+            literal(LINE_TYPE_WORK).label("line_type"),
+            WorkItem.project_number.label("code"),
+            WorkItem.name.label("name"),
+            WorkItem.unit.label("unit"),
+            TaskWorkItem.quantity.label("quantity"),
+            TaskWorkItem.unit_price.label("unit_price"),
+            TaskWorkItem.total_price.label("total_price"),
+            *cost_columns,
+        )
+        .select_from(TaskWorkItem)
+        .join(Task, TaskWorkItem.task_id == Task.id)
+        .outerjoin(WorkItem, TaskWorkItem.work_item_id == WorkItem.id)
+    )
+
+    material_lines = apply_filters(
+        select(
+            *task_columns,
+            literal(1).label("line_order"),
+            TaskMaterial.id.label("line_id"),
+            case(
+                (TaskMaterial.is_company_provided == True, LINE_TYPE_COMPANY_MATERIAL),
+                else_=LINE_TYPE_SELF_MATERIAL
+            ).label("line_type"),
+            Material.code.label("code"),
+            Material.name.label("name"),
+            Material.unit.label("unit"),
+            TaskMaterial.quantity.label("quantity"),
+            TaskMaterial.unit_price.label("unit_price"),
+            TaskMaterial.total_price.label("total_price"),
+            *cost_columns,
+        )
+        .select_from(TaskMaterial)
+        .join(Task, TaskMaterial.task_id == Task.id)
+        .outerjoin(Material, TaskMaterial.material_id == Material.id)
+    )
+
+    # 没有明细的工单也要出现在结算表中（费用可能是手工录入的）
+    bare_tasks = apply_filters(
+        select(
+            *task_columns,
+            literal(2).label("line_order"),
+            null().label("line_id"),
+            literal("").label("line_type"),
+            null().label("code"),
+            null().label("name"),
+            null().label("unit"),
+            null().label("quantity"),
+            null().label("unit_price"),
+            null().label("total_price"),
+            *cost_columns,
+        )
+        .select_from(Task)
+        .where(Task.id.not_in(select(TaskWorkItem.task_id).where(TaskWorkItem.task_id.is_not(None))))
+        .where(Task.id.not_in(select(TaskMaterial.task_id).where(TaskMaterial.task_id.is_not(None))))
+    )
+
+    combined = union_all(work_lines, material_lines, bare_tasks).subquery()
+    return select(combined).order_by(combined.c.task_id, combined.c.line_order, combined.c.line_id)
+
+
+def iter_settlement_rows(db: Session, stmt, yield_per: int = EXPORT_YIELD_PER) -> Iterator[List[Any]]:
+    """
+    逐行读取结算明细
+
+    使用服务端游标分批读取，内存中只保留当前批次；
+    末尾追加按明细类型汇总的合计行。
+    """
+    totals = {
+        LINE_TYPE_WORK: 0.0,
+        LINE_TYPE_COMPANY_MATERIAL: 0.0,
+        LINE_TYPE_SELF_MATERIAL: 0.0,
+    }
+
+    result = db.execute(stmt.execution_options(stream_results=True, yield_per=yield_per))
+    for row in result:
+        if row.line_type in totals and row.total_price:
+            totals[row.line_type] += row.total_price
+        yield [
+            row.task_id, row.task_title, row.task_status, row.project_title, row.team_name, row.completed_at,
+            row.line_type, row.code, row.name, row.unit, row.quantity, row.unit_price, row.total_price,
+            row.labor_cost, row.company_material_cost, row.self_material_cost, row.total_cost,
+        ]
+
+    empty = [None] * 6
+    yield empty + ["合计", None, "施工费", None, None, None, round(totals[LINE_TYPE_WORK], 2)] + [None] * 4
+    yield empty + ["合计", None, "甲供材料费", None, None, None, round(totals[LINE_TYPE_COMPANY_MATERIAL], 2)] + [None] * 4
+    yield empty + ["合计", None, "自购材料费", None, None, None, round(totals[LINE_TYPE_SELF_MATERIAL], 2)] + [None] * 4
@@ -4,80 +4,325 @@
 """
 批量添加工作内容测试脚本
 可以从CSV文件或命令行参数批量添加工作内容
+
+- 每个工作线程复用一个HTTP长连接，多个请求并发提交
+- 数据量较大时（默认不少于500条）按块上传到 /work-items/import 导入接口，
+  某一块被拒绝（如包含已存在的项目编号）时，改为逐条提交这一块以导入其余数据
+- 请求发出之前的连接失败、429/503 自动重试；GET 等幂等请求还会在连接中断、502/504 时重试
+- 添加请求已发出但没有收到结果（连接中断、502/504）时不直接重试，先按项目编号查询是否已经创建，
+  没有创建才再次提交，避免重复添加；单条失败不影响其他数据
+- 结束时输出成功、失败数量和每秒处理的行数
 """
 
 import json
 import sys
 import os
 import csv
+import io
+import time
+import uuid
+import socket
 import argparse
-from datetime import datetime
-import urllib.request
-import urllib.error
+import threading
+import http.client
 import urllib.parse
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 # API基础URL
 BASE_URL = "http://localhost:8000/api"  # 默认地址
 # 如果需要使用不同的地址，请取消下面的注释并修改
 # BASE_URL = "http://localhost:8458/api"  # 前端代理地址
 
+# 幂等请求需要重试的HTTP状态码
+RETRY_STATUSES = (429, 502, 503, 504)
+# 服务端没有处理请求的状态码，非幂等请求也可以重试
+SAFE_RETRY_STATUSES = (429, 503)
+# 502/504 时请求可能已经被处理，非幂等请求的结果未知
+UNCERTAIN_STATUSES = (502, 504)
+# 可以安全重复发送的请求方法
+IDEMPOTENT_METHODS = ("GET", "HEAD", "PUT", "DELETE", "OPTIONS")
+# 导入接口使用的CSV列
+IMPORT_FIELDS = ["category", "project_number", "name", "description", "unit",
+                 "skilled_labor_days", "unskilled_labor_days", "unit_price"]
+
+
+class ApiError(Exception):
+    """请求失败（已达到重试次数或服务端拒绝）"""
+
+    def __init__(self, message, status=None, uncertain=False):
+        super().__init__(message)
+        self.status = status
+        # 请求已经发出但没有收到结果，服务端可能已经处理
+        self.uncertain = uncertain
+
+
+class ApiClient:
+    """复用长连接的API客户端，每个线程一个连接"""
+
+    def __init__(self, base_url, retries=3, backoff=0.5, timeout=60):
+        parsed = urllib.parse.urlsplit(base_url)
+        self.scheme = parsed.scheme or "http"
+        self.host = parsed.hostname or "localhost"
+        self.port = parsed.port
+        self.prefix = parsed.path.rstrip("/")
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.token = None
+        self._local = threading.local()
+
+    def _connection(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection_class = http.client.HTTPSConnection if self.scheme == "https" else http.client.HTTPConnection
+            connection = connection_class(self.host, self.port, timeout=self.timeout)
+            self._local.connection = connection
+        return connection
+
+    def _reset_connection(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
+
+    def request(self, method, path, body=None, content_type=None, idempotent=None):
+        """
+        发送请求，临时错误自动重试
+
+        请求发出之前的连接失败和 429/503 总是重试；请求发出之后的网络错误和 502/504 只对幂等请求重试，
+        非幂等请求抛出 uncertain 的 ApiError，由调用方确认是否已经处理。
+
+        Args:
+            idempotent: 请求是否可以重复发送，默认按请求方法判断
+
+        Returns:
+            (状态码, 解析后的JSON或文本)
+
+        Raises:
+            ApiError: 重试次数用完，或非幂等请求的结果未知（uncertain 为 True）
+        """
+        if idempotent is None:
+            idempotent = method in IDEMPOTENT_METHODS
+        headers = {}
+        if content_type:
+            headers["Content-Type"] = content_type
+        if self.token:
+            headers["Authorization"] = f"Bearer {self.token}"
+
+        for attempt in range(self.retries + 1):
+            sent = False
+            try:
+                connection = self._connection()
+                connection.request(method, self.prefix + path, body=body, headers=headers)
+                sent = True
+                response = connection.getresponse()
+                data = response.read()
+                if response.getheader("Connection", "").lower() == "close":
+                    self._reset_connection()
+            except (OSError, http.client.HTTPException, socket.timeout) as e:
+                # 连接被服务端关闭或网络错误，重新建立连接后重试
+                self._reset_connection()
+                if sent and not idempotent:
+                    raise ApiError(f"网络错误（请求已发出，服务端可能已经处理）: {e}", uncertain=True)
+                if attempt == self.retries:
+                    raise ApiError(f"网络错误: {e}")
+                time.sleep(self.backoff * 2 ** attempt)
+                continue
+
+            retry_statuses = RETRY_STATUSES if idempotent else SAFE_RETRY_STATUSES
+            if response.status in retry_statuses and attempt < self.retries:
+                retry_after = response.getheader("Retry-After")
+                time.sleep(float(retry_after) if retry_after and retry_after.isdigit() else self.backoff * 2 ** attempt)
+                continue
+
+            text = data.decode("utf-8", errors="replace")
+            try:
+                payload = json.loads(text) if text else None
+            except ValueError:
+                payload = text
+            if not idempotent and response.status in UNCERTAIN_STATUSES:
+                raise ApiError(f"{error_detail(response.status, payload)}（服务端可能已经处理）",
+                               status=response.status, uncertain=True)
+            return response.status, payload
+
+        raise ApiError("重试次数已用完")
+
+
+def error_detail(status, payload):
+    if isinstance(payload, dict) and "detail" in payload:
+        return f"HTTP {status}: {payload['detail']}"
+    return f"HTTP {status}: {payload}"
+
+
 # 登录并获取访问令牌
-def get_access_token(username, password):
+def get_access_token(client, username, password):
     """登录并获取访问令牌"""
-    login_url = f"{BASE_URL}/auth/token"
     login_data = urllib.parse.urlencode({
         "username": username,
         "password": password
-    }).encode('utf-8')
-
+    })
     try:
-        req = urllib.request.Request(login_url, data=login_data, method='POST')
-        req.add_header('Content-Type', 'application/x-www-form-urlencoded')
-
-        with urllib.request.urlopen(req) as response:
-            response_data = response.read().decode('utf-8')
-            token_data = json.loads(response_data)
-            return token_data.get("access_token")
-    except urllib.error.HTTPError as e:
-        print(f"登录失败: HTTP错误 {e.code}")
-        print(f"响应内容: {e.read().decode('utf-8')}")
-        return None
-    except urllib.error.URLError as e:
-        print(f"登录失败: URL错误 {e.reason}")
-        return None
-    except Exception as e:
+        # 登录没有副作用，可以重复发送
+        status, payload = client.request("POST", "/auth/token", login_data, "application/x-www-form-urlencoded",
+                                         idempotent=True)
+    except ApiError as e:
         print(f"登录失败: {e}")
         return None
+    if status != 200:
+        print(f"登录失败: {error_detail(status, payload)}")
+        return None
+    return payload.get("access_token")
 
-# 添加工作内容
-def add_work_item(token, work_item_data):
-    """添加工作内容"""
-    url = f"{BASE_URL}/work-items/"
-    headers = {
-        "Authorization": f"Bearer {token}",
-        "Content-Type": "application/json"
-    }
 
+def find_work_item(client, project_number):
+    """
+    按项目编号查询工作内容
+
+    Returns:
+        (工作内容, 错误信息)，不存在时工作内容为 None
+    """
+    query = urllib.parse.urlencode({"project_number": project_number})
     try:
-        data = json.dumps(work_item_data).encode('utf-8')
-        req = urllib.request.Request(url, data=data, method='POST')
-
-        for key, value in headers.items():
-            req.add_header(key, value)
-
-        with urllib.request.urlopen(req) as response:
-            response_data = response.read().decode('utf-8')
-            return json.loads(response_data)
-    except urllib.error.HTTPError as e:
-        print(f"添加工作内容失败: HTTP错误 {e.code}")
-        print(f"响应内容: {e.read().decode('utf-8')}")
-        return None
-    except urllib.error.URLError as e:
-        print(f"添加工作内容失败: URL错误 {e.reason}")
-        return None
-    except Exception as e:
-        print(f"添加工作内容失败: {e}")
-        return None
+        status, payload = client.request("GET", f"/work-items/?{query}")
+    except ApiError as e:
+        return None, str(e)
+    if status >= 400:
+        return None, error_detail(status, payload)
+    return (payload[0] if payload else None), None
+
+
+# 添加工作内容
+def add_work_item(client, work_item_data, check_existing=False):
+    """
+    添加单个工作内容
+
+    请求已发出但结果未知时不直接重新提交：先按项目编号查询，已经创建则视为成功，否则再提交一次。
+
+    Args:
+        client: API客户端
+        work_item_data: 工作内容数据
+        check_existing: 提交前先按项目编号查询（之前结果未知的导入请求可能已经创建了它）
+
+    Returns:
+        (创建的工作内容, 错误信息)，成功时错误信息为 None
+    """
+    project_number = work_item_data.get("project_number")
+    body = json.dumps(work_item_data, ensure_ascii=False).encode("utf-8")
+    error = None
+    for _ in range(client.retries + 1):
+        if check_existing and project_number:
+            existing, lookup_error = find_work_item(client, project_number)
+            if lookup_error:
+                return None, f"{error}；查询是否已创建失败: {lookup_error}" if error else lookup_error
+            if existing:
+                return existing, None
+
+        try:
+            status, payload = client.request("POST", "/work-items/", body, "application/json")
+        except ApiError as e:
+            if not e.uncertain or not project_number:
+                return None, str(e)
+            error = str(e)
+            check_existing = True
+            continue
+        if status == 400 and error is not None:
+            # 之前结果未知的请求在查询之后才完成，项目编号已存在
+            existing, _ = find_work_item(client, project_number)
+            if existing:
+                return existing, None
+        if status >= 400:
+            return None, error_detail(status, payload)
+        return payload, None
+    return None, error
+
+
+def import_chunk(client, rows):
+    """
+    通过CSV导入接口提交一批工作内容（整批成功或整批失败）
+
+    Returns:
+        (错误信息, 是否可能已经导入)，成功时错误信息为 None
+    """
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=IMPORT_FIELDS, extrasaction="ignore")
+    writer.writeheader()
+    writer.writerows(rows)
+
+    boundary = uuid.uuid4().hex
+    body = (
+        f"--{boundary}\r\n"
+        f"Content-Disposition: form-data; name=\"file\"; filename=\"work_items.csv\"\r\n"
+        f"Content-Type: text/csv\r\n\r\n"
+    ).encode("utf-8") + buffer.getvalue().encode("utf-8") + f"\r\n--{boundary}--\r\n".encode("utf-8")
+    try:
+        status, payload = client.request("POST", "/work-items/import", body, f"multipart/form-data; boundary={boundary}")
+    except ApiError as e:
+        return str(e), e.uncertain
+    if status >= 400:
+        return error_detail(status, payload), False
+    return None, False
+
+
+class Progress:
+    """线程安全的进度统计"""
+
+    def __init__(self, total):
+        self.total = total
+        self.succeeded = 0
+        self.failed = 0
+        self.start = time.perf_counter()
+        self._last_report = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, succeeded=0, failed=0):
+        with self._lock:
+            self.succeeded += succeeded
+            self.failed += failed
+            now = time.perf_counter()
+            if now - self._last_report >= 1 or self.succeeded + self.failed == self.total:
+                self._last_report = now
+                done = self.succeeded + self.failed
+                print(f"进度: {done}/{self.total}，成功 {self.succeeded}，失败 {self.failed}，"
+                      f"{done / max(now - self.start, 1e-6):.0f} 行/秒", flush=True)
+
+    @property
+    def elapsed(self):
+        return time.perf_counter() - self.start
+
+
+def add_items_concurrently(client, items, results, progress, concurrency, verbose=False, check_existing=False):
+    """逐条并发提交，结果按原顺序写入 results"""
+    def worker(index):
+        result, error = add_work_item(client, items[index], check_existing)
+        results[index] = (result, error)
+        if error:
+            print(f"第 {index + 1} 条（{items[index].get('project_number')}）添加失败: {error}", flush=True)
+        elif verbose:
+            print(f"第 {index + 1} 条（{items[index].get('project_number')}）添加成功", flush=True)
+        progress.add(succeeded=0 if error else 1, failed=1 if error else 0)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for future in as_completed([executor.submit(worker, index) for index in range(len(items))]):
+            future.result()
+
+
+def import_items(client, items, results, progress, chunk_size, concurrency, verbose=False):
+    """按块使用导入接口，被拒绝的块改为逐条提交"""
+    for start in range(0, len(items), chunk_size):
+        chunk = items[start:start + chunk_size]
+        error, uncertain = import_chunk(client, chunk)
+        if error is None:
+            for index in range(start, start + len(chunk)):
+                results[index] = ({}, None)
+            progress.add(succeeded=len(chunk))
+            continue
+
+        print(f"第 {start + 1}-{start + len(chunk)} 条导入失败（{error}），改为逐条提交", flush=True)
+        chunk_results = [None] * len(chunk)
+        # 结果未知的块可能已经导入，逐条提交前先按项目编号查询
+        add_items_concurrently(client, chunk, chunk_results, progress, concurrency, verbose, check_existing=uncertain)
+        results[start:start + len(chunk)] = chunk_results
+
 
 # 从CSV文件加载工作内容
 def load_work_items_from_csv(csv_file):
@@ -85,16 +330,16 @@ def load_work_items_from_csv(csv_file):
     work_items = []
 
     try:
-        with open(csv_file, 'r', encoding='utf-8') as f:
+        with open(csv_file, 'r', encoding='utf-8-sig') as f:
             reader = csv.DictReader(f)
             for row in reader:
                 # 转换数值字段
                 if 'skilled_labor_days' in row:
-                    row['skilled_labor_days'] = float(row['skilled_labor_days'])
+                    row['skilled_labor_days'] = float(row['skilled_labor_days'] or 0)
                 if 'unskilled_labor_days' in row:
-                    row['unskilled_labor_days'] = float(row['unskilled_labor_days'])
+                    row['unskilled_labor_days'] = float(row['unskilled_labor_days'] or 0)
                 if 'unit_price' in row:
-                    row['unit_price'] = float(row['unit_price'])
+                    row['unit_price'] = float(row['unit_price'] or 0)
 
                 work_items.append(row)
 
@@ -111,10 +356,10 @@ def save_results_to_csv(results, output_file):
         return
 
     try:
-        fieldnames = results[0].keys()
+        fieldnames = list(results[0].keys())
 
         with open(output_file, 'w', encoding='utf-8', newline='') as f:
-            writer = csv.DictWriter(f, fieldnames=fieldnames)
+            writer = csv.DictWriter(f, fieldnames=fieldnames, extrasaction='ignore')
             writer.writeheader()
             for result in results:
                 writer.writerow(result)
@@ -132,6 +377,13 @@ def main():
     parser.add_argument('--output', help='输出结果的CSV文件路径')
     parser.add_argument('--single', action='store_true', help='添加单个工作内容')
     parser.add_argument('--api-url', help='API基础URL，例如 http://localhost:8000/api')
+    parser.add_argument('--concurrency', type=int, default=8, help='逐条提交时的并发请求数（默认8）')
+    parser.add_argument('--mode', choices=['auto', 'api', 'import'], default='auto',
+                        help='api: 逐条提交；import: 使用CSV导入接口；auto: 数据量达到 --import-threshold 时使用导入接口')
+    parser.add_argument('--import-threshold', type=int, default=500, help='auto模式下使用导入接口的最少行数（默认500）')
+    parser.add_argument('--chunk-size', type=int, default=2000, help='导入接口每次上传的行数（默认2000）')
+    parser.add_argument('--retries', type=int, default=3, help='临时错误的重试次数（默认3）')
+    parser.add_argument('--verbose', action='store_true', help='输出每一条的处理结果')
 
     args = parser.parse_args()
 
@@ -147,9 +399,11 @@ def main():
 
     print(f"使用用户名: {username}")
 
+    client = ApiClient(BASE_URL, retries=args.retries)
+
     # 获取访问令牌
     print("正在登录...")
-    token = get_access_token(username, password)
+    token = get_access_token(client, username, password)
 
     if not token:
         print("登录失败，无法获取访问令牌")
@@ -158,10 +412,9 @@ def main():
         print("例如: python batch_add_work_items.py --username admin --password yourpassword --single")
         sys.exit(1)
 
+    client.token = token
     print("登录成功，获取到访问令牌")
 
-    results = []
-
     if args.single:
         # 添加单个工作内容
         work_item_data = {
@@ -177,14 +430,14 @@ def main():
         print("正在添加工作内容...")
         print(f"工作内容数据: {json.dumps(work_item_data, ensure_ascii=False, indent=2)}")
 
-        result = add_work_item(token, work_item_data)
+        result, error = add_work_item(client, work_item_data)
 
         if result:
             print("工作内容添加成功!")
             print(f"结果: {json.dumps(result, ensure_ascii=False, indent=2)}")
-            results.append(result)
         else:
-            print("工作内容添加失败")
+            print(f"工作内容添加失败: {error}")
+        work_items, results = [work_item_data], [(result, error)]
 
     elif args.csv:
         # 从CSV文件批量添加
@@ -194,27 +447,30 @@ def main():
             print("没有找到工作内容数据")
             sys.exit(1)
 
-        print(f"从CSV文件加载了 {len(work_items)} 个工作内容")
+        use_import = args.mode == 'import' or (args.mode == 'auto' and len(work_items) >= args.import_threshold)
+        print(f"从CSV文件加载了 {len(work_items)} 个工作内容，"
+              f"{'使用导入接口，每块 %d 行' % args.chunk_size if use_import else '逐条提交，并发 %d' % args.concurrency}")
 
-        for i, item in enumerate(work_items):
-            print(f"正在添加第 {i+1}/{len(work_items)} 个工作内容...")
-            print(f"工作内容数据: {json.dumps(item, ensure_ascii=False, indent=2)}")
-
-            result = add_work_item(token, item)
+        results = [None] * len(work_items)
+        progress = Progress(len(work_items))
+        if use_import:
+            import_items(client, work_items, results, progress, args.chunk_size, args.concurrency, args.verbose)
+        else:
+            add_items_concurrently(client, work_items, results, progress, args.concurrency, args.verbose)
 
-            if result:
-                print("工作内容添加成功!")
-                results.append(result)
-            else:
-                print("工作内容添加失败")
+        print(f"完成: 成功 {progress.succeeded}，失败 {progress.failed}，耗时 {progress.elapsed:.1f}s，"
+              f"{len(work_items) / max(progress.elapsed, 1e-6):.0f} 行/秒")
 
     else:
         print("请指定 --csv 参数提供CSV文件，或使用 --single 添加单个工作内容")
         sys.exit(1)
 
-    # 保存结果
-    if args.output and results:
-        save_results_to_csv(results, args.output)
+    # 保存结果：每一行输入数据及其处理结果
+    if args.output:
+        save_results_to_csv([
+            dict(item, id=(result or {}).get('id', ''), result='成功' if error is None else '失败', error=error or '')
+            for item, (result, error) in zip(work_items, results)
+        ], args.output)
 
 if __name__ == "__main__":
     main()
@@ -20,6 +20,8 @@ from datetime import datetime
 ROOT_DIR = Path(__file__).resolve().parent
 BACKEND_DIR = ROOT_DIR / "backend"
 DB_PATH = BACKEND_DIR / "repair_management.db"
+# 慢查询记录（由后端 utils/slow_queries.py 写入）
+SLOW_QUERY_DB_PATH = Path(os.getenv("SLOW_QUERY_DB", str(BACKEND_DIR / "slow_queries.db")))
 
 # 配置日志
 logging.basicConfig(
@@ -595,6 +597,95 @@ def create_admin_user():
         if 'conn' in locals():
             conn.close()
 
+def show_slow_queries(top=20, since=None):
+    """按总耗时列出最慢的SQL语句"""
+    if not os.path.exists(SLOW_QUERY_DB_PATH):
+        logger.warning(f"慢查询记录不存在: {SLOW_QUERY_DB_PATH}")
+        return False
+
+    conn = sqlite3.connect(SLOW_QUERY_DB_PATH)
+    cursor = conn.cursor()
+
+    try:
+        where = "WHERE recorded_at >= ?" if since else ""
+        params = (since,) if since else ()
+        cursor.execute(f"""
+            SELECT statement, COUNT(*), SUM(elapsed_ms), AVG(elapsed_ms), MAX(elapsed_ms)
+            FROM slow_queries {where}
+            GROUP BY statement
+            ORDER BY SUM(elapsed_ms) DESC
+            LIMIT ?
+        """, params + (top,))
+        rows = cursor.fetchall()
+        if not rows:
+            logger.info("没有慢查询记录")
+            return True
+
+        statement_filter = f"{where} AND statement = ?" if where else "WHERE statement = ?"
+        print(f"\n按总耗时排序的前 {len(rows)} 条慢查询" + (f"（{since} 之后）" if since else "") + ":")
+        for index, (statement, calls, total_ms, avg_ms, max_ms) in enumerate(rows, 1):
+            print("\n" + "-" * 80)
+            print(f"#{index}  次数: {calls}  总耗时: {total_ms:.1f}ms  平均: {avg_ms:.1f}ms  最大: {max_ms:.1f}ms")
+
+            # 主要来源路由
+            cursor.execute(f"""
+                SELECT COALESCE(method || ' ' || route, '(请求之外)'), COUNT(*), SUM(elapsed_ms)
+                FROM slow_queries {statement_filter}
+                GROUP BY method, route
+                ORDER BY SUM(elapsed_ms) DESC
+                LIMIT 3
+            """, params + (statement,))
+            for route, route_calls, route_ms in cursor.fetchall():
+                print(f"    来源: {route}  次数: {route_calls}  耗时: {route_ms:.1f}ms")
+
+            # 最慢一次的参数
+            cursor.execute(f"""
+                SELECT parameters, row_count, recorded_at FROM slow_queries {statement_filter}
+                ORDER BY elapsed_ms DESC LIMIT 1
+            """, params + (statement,))
+            parameters, row_count, recorded_at = cursor.fetchone()
+            print(f"    最慢一次: {recorded_at}  行数: {row_count if row_count is not None else '-'}  参数: {parameters}")
+            print("    " + " ".join(statement.split())[:1000])
+        return True
+    except sqlite3.Error as e:
+        logger.error(f"读取慢查询记录失败: {e}")
+        return False
+    finally:
+        conn.close()
+
+def prune_change_log(days):
+    """
+    清理移动端同步用的变更日志（change_log）
+
+    删除早于指定天数的记录，始终保留最新一行以保持当前同步序号不变；
+    同步序号早于保留范围的客户端下次同步时会收到全量数据（reset 为 true）
+    """
+    if not check_database():
+        return False
+
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+
+    try:
+        cursor.execute(
+            """
+            DELETE FROM change_log
+            WHERE changed_at < datetime('now', ?)
+              AND id < (SELECT MAX(id) FROM change_log)
+            """,
+            (f"-{days} days",)
+        )
+        deleted = cursor.rowcount
+        conn.commit()
+        logger.info(f"已清理 {deleted} 条 {days} 天以前的变更日志")
+        return True
+    except sqlite3.Error as e:
+        conn.rollback()
+        logger.error(f"清理变更日志失败: {e}")
+        return False
+    finally:
+        conn.close()
+
 def main():
     """主函数"""
     parser = argparse.ArgumentParser(description='数据库管理工具')
@@ -605,11 +696,15 @@ def main():
     parser.add_argument('--backup', action='store_true', help='备份数据库')
     parser.add_argument('--create-admin', action='store_true', help='创建管理员用户')
     parser.add_argument('--table', help='指定要检查的表名')
+    parser.add_argument('--slow-queries', action='store_true', help='按总耗时列出慢查询')
+    parser.add_argument('--top', type=int, default=20, help='慢查询列出的语句数')
+    parser.add_argument('--since', help='只统计该时间之后的慢查询（YYYY-MM-DD[ HH:MM:SS]）')
+    parser.add_argument('--prune-changes', type=int, metavar='DAYS', help='清理DAYS天以前的同步变更日志')
 
     args = parser.parse_args()
 
-    # 如果没有指定任何参数，显示交互式菜单
-    if not any(vars(args).values()):
+    # 如果没有指定任何操作，显示交互式菜单
+    if not any(value not in (None, False) for key, value in vars(args).items() if key != 'top'):
         show_menu()
         return
 
@@ -642,6 +737,13 @@ def main():
         backup_database()
         rebuild_work_items_table()
 
+    if args.slow_queries:
+        show_slow_queries(args.top, args.since)
+
+    if args.prune_changes is not None:
+        backup_database()
+        prune_change_log(args.prune_changes)
+
 def show_menu():
     """显示交互式菜单"""
     while True:
@@ -654,10 +756,11 @@ def show_menu():
         print("4. 初始化数据库")
         print("5. 备份数据库")
         print("6. 创建管理员用户")
+        print("7. 查看慢查询")
         print("0. 退出")
         print("="*50)
 
-        choice = input("请选择操作 [0-6]: ")
+        choice = input("请选择操作 [0-7]: ")
 
         if choice == '0':
             print("退出程序")
@@ -681,6 +784,8 @@ def show_menu():
             backup_database()
         elif choice == '6':
             create_admin_user()
+        elif choice == '7':
+            show_slow_queries()
         else:
             print("无效的选择，请重试")
 
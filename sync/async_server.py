@@ -0,0 +1,799 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+文件同步工具 asyncio 服务端模块
+
+所有客户端连接在一个事件循环中处理，替代每个连接一个线程：
+- 同时处理的连接数由 MAX_CLIENTS 限制，超出的连接排队等待，超过 CLIENT_WAIT_TIMEOUT 回复服务端繁忙
+- 背压：每个连接的接收缓冲不超过 STREAM_BUFFER_SIZE，文件内容写入磁盘后才继续读取，发送时等待缓冲区排空；
+  数据库写入跟不上时，接收文件的连接在写入队列上等待
+- 文件读写、哈希计算在线程池中执行；数据库只由一个写入任务在专用线程中访问，
+  同一时间多个连接的文件记录合并为一个事务
+- 收到 SIGINT/SIGTERM 或调用 stop() 后停止接受新连接，断开空闲连接，等待进行中的请求完成
+  （最多 SHUTDOWN_TIMEOUT 秒），写完数据库后退出
+- 连接和传输统计（ServerMetrics）每 METRICS_INTERVAL 秒写入日志，也可以通过 stats 请求查询
+- 每 BACKUP_GC_INTERVAL 秒在文件读写线程池中执行一次备份维护（使用单独的数据库连接，不占用写入线程）
+
+协议与 SyncServer 相同，客户端无需修改。
+"""
+
+import asyncio
+import io
+import json
+import signal
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from config import (
+    DEFAULT_PORT, PROTOCOL_VERSION, ACK_BATCH_SIZE, DELTA_SPOOL_SIZE, TRANSFER_BUFFER_SIZE,
+    USE_SENDFILE, MAX_CLIENTS, CLIENT_WAIT_TIMEOUT, CLIENT_IDLE_TIMEOUT, LISTEN_BACKLOG, STREAM_BUFFER_SIZE,
+    IO_WORKERS, DB_QUEUE_SIZE, SHUTDOWN_TIMEOUT, METRICS_INTERVAL, BACKUP_GC_INTERVAL, MAX_MESSAGE_SIZE, logger
+)
+from compression import (
+    FRAME_HEADER, CompressionError, check_decompressed_length, check_frame_length, decompress_frame,
+    finish_decompressor
+)
+from database import FileDatabase
+from hashing import format_hash, hasher_for
+from server import SyncServer
+from utils import (
+    MESSAGE_LENGTH, RECORD_HEADER, END_OF_RECORDS, DELTA_RECORD, COMPRESSED_RECORD, COMPRESSED_MESSAGE,
+    configure_socket, pack_message, unpack_message
+)
+
+# 所有连接共用的文件清单最多缓存几种排除规则
+MANIFEST_CACHE_SIZE = 8
+
+
+class ServerMetrics:
+    """连接和传输统计，只在事件循环线程中更新"""
+
+    def __init__(self):
+        self.started = time.time()
+        self.connections_total = 0
+        self.connections_active = 0
+        self.connections_peak = 0
+        self.connections_waiting = 0
+        self.connections_rejected = 0
+        self.connections_failed = 0
+        self.requests = {}
+        self.files_received = 0
+        self.files_failed = 0
+        self.bytes_received = 0
+        self.bytes_sent = 0
+        self.db_batches = 0
+        self.db_records = 0
+        self.db_queue_peak = 0
+
+    def snapshot(self):
+        """当前统计，可以直接转为JSON"""
+        data = dict(vars(self))
+        data['requests'] = dict(self.requests)
+        data['uptime'] = time.time() - self.started
+        return data
+
+    def summary(self):
+        """写入日志的一行摘要"""
+        return (f"活动连接 {self.connections_active}（峰值 {self.connections_peak}），排队 {self.connections_waiting}，"
+                f"累计 {self.connections_total}，拒绝 {self.connections_rejected}，出错 {self.connections_failed}；"
+                f"接收文件 {self.files_received}，失败 {self.files_failed}；"
+                f"收 {self.bytes_received / 1024 / 1024:.1f} MB，发 {self.bytes_sent / 1024 / 1024:.1f} MB；"
+                f"数据库写入 {self.db_batches} 批 {self.db_records} 条")
+
+
+class ClientConnection:
+    """一个客户端连接：收发带长度前缀的消息和文件内容，统计字节数"""
+
+    def __init__(self, reader, writer, metrics):
+        """
+        Args:
+            reader: asyncio.StreamReader
+            writer: asyncio.StreamWriter
+            metrics: ServerMetrics
+        """
+        self.reader = reader
+        self.writer = writer
+        self.metrics = metrics
+        peer = writer.get_extra_info('peername') or ('unknown',)
+        self.ip = peer[0]
+        # 客户端在时间同步时声明支持压缩后，较大的消息压缩发送
+        self.compress_messages = False
+
+    async def receive_message(self):
+        """接收一条消息
+
+        Returns:
+            消息字符串，连接关闭时返回 None
+        """
+        try:
+            header = await self.reader.readexactly(MESSAGE_LENGTH.size)
+            length_field, = MESSAGE_LENGTH.unpack(header)
+            length = length_field & ~COMPRESSED_MESSAGE
+            if length > MAX_MESSAGE_SIZE:
+                logger.warning(f"客户端 {self.ip} 发送的消息过大: {length} 字节，断开连接")
+                return None
+            data = await self.reader.readexactly(length)
+        except asyncio.IncompleteReadError as e:
+            if e.partial:
+                logger.warning("接收数据时连接中断")
+            return None
+        self.metrics.bytes_received += MESSAGE_LENGTH.size + length
+        return unpack_message(length_field, data)
+
+    async def send_message(self, data):
+        """发送一条消息（4字节长度前缀 + 内容），等待发送缓冲区排空
+
+        Args:
+            data: 要发送的字符串
+        """
+        await self.send_bytes(pack_message(data, self.compress_messages))
+
+    async def send_bytes(self, data):
+        """发送二进制数据，等待发送缓冲区排空"""
+        self.writer.write(data)
+        self.metrics.bytes_sent += len(data)
+        await self.writer.drain()
+
+    async def send_file(self, f, count):
+        """从文件当前位置发送 count 字节
+
+        Returns:
+            实际发送的字节数
+        """
+        await self.writer.drain()
+        loop = asyncio.get_running_loop()
+        if USE_SENDFILE:
+            sent = await loop.sendfile(self.writer.transport, f, f.tell(), count)
+        else:
+            sent = 0
+            while sent < count:
+                chunk = await loop.run_in_executor(None, f.read, min(TRANSFER_BUFFER_SIZE, count - sent))
+                if not chunk:
+                    break
+                self.writer.write(chunk)
+                await self.writer.drain()
+                sent += len(chunk)
+        self.metrics.bytes_sent += sent
+        return sent
+
+    async def read_exactly(self, size):
+        """接收 size 字节
+
+        Raises:
+            ConnectionError: 连接中断
+        """
+        try:
+            data = await self.reader.readexactly(size)
+        except asyncio.IncompleteReadError as e:
+            self.metrics.bytes_received += len(e.partial)
+            raise ConnectionError("接收数据时连接中断") from None
+        self.metrics.bytes_received += size
+        return data
+
+    async def read_chunk(self, limit):
+        """接收不超过 limit 字节（接收缓冲中已有的数据）
+
+        Raises:
+            ConnectionError: 连接中断
+        """
+        data = await self.reader.read(limit)
+        if not data:
+            raise ConnectionError("接收文件内容时连接中断")
+        self.metrics.bytes_received += len(data)
+        return data
+
+    async def close(self):
+        self.writer.close()
+        try:
+            await self.writer.wait_closed()
+        except (OSError, asyncio.CancelledError):
+            pass
+
+
+class CompressedRecordReader:
+    """从压缩帧中读取一条记录解压后的内容，提供与 ClientConnection 相同的 read_exactly、read_chunk
+
+    解压在线程池中执行，见 compression.DecompressReader。
+    """
+
+    def __init__(self, conn, codec, run, size):
+        """
+        Args:
+            conn: 客户端连接
+            codec: 压缩算法对象
+            run: 在线程池中执行函数的方法
+            size: 记录头中的长度，解压后的数据超过该长度时报错
+        """
+        self.conn = conn
+        self.decompressor = codec.decompressor()
+        self.run = run
+        self.remaining = size
+        self.pending = memoryview(b'')
+        self.ended = False
+
+    async def fill(self):
+        """保证有待读取的解压数据，读到结束帧且数据已读完时返回 False"""
+        while not self.pending:
+            if not self.decompressor.needs_input:
+                # 上一帧还没有解压完
+                self.accept(await self.run(decompress_frame, self.decompressor, b'', TRANSFER_BUFFER_SIZE))
+                continue
+            if self.ended:
+                return False
+            length, = FRAME_HEADER.unpack(await self.conn.read_exactly(FRAME_HEADER.size))
+            if length == 0:
+                self.ended = True
+                self.accept(finish_decompressor(self.decompressor))
+                continue
+            check_frame_length(length)
+            data = await self.conn.read_exactly(length)
+            self.accept(await self.run(decompress_frame, self.decompressor, data, TRANSFER_BUFFER_SIZE))
+        return True
+
+    def accept(self, data):
+        self.remaining = check_decompressed_length(self.remaining, len(data))
+        self.pending = memoryview(data)
+
+    async def read_chunk(self, limit):
+        if not await self.fill():
+            raise CompressionError("解压后的数据比记录长度短")
+        chunk = bytes(self.pending[:limit])
+        self.pending = self.pending[len(chunk):]
+        return chunk
+
+    async def read_exactly(self, size):
+        parts = []
+        while size > 0:
+            chunk = await self.read_chunk(size)
+            parts.append(chunk)
+            size -= len(chunk)
+        return b''.join(parts)
+
+    async def finish(self):
+        """读到结束帧，解压后的数据比记录长度长时抛出异常"""
+        if await self.fill():
+            raise CompressionError("解压后的数据比记录长度长")
+
+
+def _write_chunk(f, hasher, chunk):
+    hasher.update(chunk)
+    f.write(chunk)
+
+
+class AsyncSyncServer(SyncServer):
+    """基于 asyncio 的同步服务端，一个进程可以同时处理数百个客户端"""
+
+    def __init__(self, port=DEFAULT_PORT, log_dir=None, sync_dir=None, data_dir=None, max_clients=MAX_CLIENTS):
+        """初始化服务端
+
+        Args:
+            port: 服务端监听端口，0 表示由系统分配（启动后更新为实际端口）
+            log_dir: 日志目录，默认为当前目录下的logs文件夹
+            sync_dir: 同步目录，默认为脚本所在目录的上一级目录
+            data_dir: 数据库和备份所在目录，默认为脚本所在目录
+            max_clients: 同时处理的客户端连接数
+        """
+        super().__init__(port=port, log_dir=log_dir, sync_dir=sync_dir, data_dir=data_dir)
+        # 扫描用的数据库连接，运行时数据库只在写入线程中访问
+        self.db.close()
+        self.max_clients = max_clients
+        self.metrics = ServerMetrics()
+        # 开始监听后设置，供其他线程等待服务端就绪
+        self.listening = threading.Event()
+        self.loop = None
+        self.stopping = None
+
+    def start(self, host='0.0.0.0'):
+        """启动服务端，阻塞直到 stop() 被调用或收到中断信号"""
+        try:
+            asyncio.run(self.serve(host))
+        except KeyboardInterrupt:
+            # 不支持 add_signal_handler 的系统（如Windows）
+            logger.info("接收到中断信号，服务端已停止")
+        except Exception as e:
+            logger.error(f"服务端发生错误: {str(e)}")
+        finally:
+            logger.info("服务端已关闭")
+
+    def stop(self):
+        """停止服务端（可以在其他线程中调用，服务端已停止时不做任何操作）"""
+        if self.loop is not None and not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(self.request_stop)
+
+    def request_stop(self):
+        if not self.stopping.is_set():
+            logger.info("服务端正在关闭，等待进行中的请求完成...")
+            self.stopping.set()
+
+    async def serve(self, host='0.0.0.0'):
+        """监听端口并处理连接，直到 stop() 被调用或收到中断信号
+
+        Args:
+            host: 监听地址
+        """
+        self.loop = asyncio.get_running_loop()
+        self.stopping = asyncio.Event()
+        self.slots = asyncio.Semaphore(self.max_clients)
+        # 连接任务 -> 是否正在处理请求
+        self.sessions = {}
+        self.db_queue = asyncio.Queue(DB_QUEUE_SIZE)
+        # 文件记录每提交一批加一，所有连接共用的文件清单据此判断是否需要重新构建
+        self.db_generation = 0
+        self.manifests = {}
+
+        self.io_executor = ThreadPoolExecutor(IO_WORKERS, thread_name_prefix="sync_io")
+        # 数据库连接只在这一个线程中使用
+        self.db_executor = ThreadPoolExecutor(1, thread_name_prefix="sync_db")
+        self.writer_db = await self.run_db(FileDatabase, self.db_path)
+        writer_task = asyncio.create_task(self.db_writer())
+        metrics_task = asyncio.create_task(self.log_metrics())
+        backup_task = asyncio.create_task(self.maintain_backups()) if BACKUP_GC_INTERVAL else None
+
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                self.loop.add_signal_handler(sig, self.request_stop)
+            except (NotImplementedError, RuntimeError):
+                # Windows 或非主线程
+                pass
+
+        server = None
+        try:
+            server = await asyncio.start_server(
+                self.handle_connection, host, self.port,
+                limit=STREAM_BUFFER_SIZE, backlog=LISTEN_BACKLOG, reuse_address=True
+            )
+            self.port = server.sockets[0].getsockname()[1]
+            logger.info(f"服务端已启动，监听地址: {host}:{self.port}，最多同时处理 {self.max_clients} 个连接")
+            self.listening.set()
+            await self.stopping.wait()
+        finally:
+            if server is not None:
+                server.close()
+            await self.close_sessions()
+            if server is not None:
+                await server.wait_closed()
+            await self.db_queue.join()
+            writer_task.cancel()
+            metrics_task.cancel()
+            if backup_task is not None:
+                backup_task.cancel()
+            await self.run_db(self.writer_db.close)
+            self.io_executor.shutdown()
+            self.db_executor.shutdown()
+            for sig in (signal.SIGINT, signal.SIGTERM):
+                try:
+                    self.loop.remove_signal_handler(sig)
+                except (NotImplementedError, RuntimeError):
+                    pass
+            logger.info(f"连接统计: {self.metrics.summary()}")
+
+    async def close_sessions(self):
+        """断开空闲和排队中的连接，等待进行中的请求完成，超时后强制断开"""
+        for task, busy in list(self.sessions.items()):
+            if not busy:
+                task.cancel()
+
+        busy = [task for task, busy in self.sessions.items() if busy]
+        if busy:
+            logger.info(f"等待 {len(busy)} 个进行中的请求完成")
+            _, pending = await asyncio.wait(busy, timeout=SHUTDOWN_TIMEOUT)
+            for task in pending:
+                logger.warning("请求未在关闭等待时间内完成，强制断开")
+                task.cancel()
+
+        if self.sessions:
+            await asyncio.wait(list(self.sessions))
+
+    def run_io(self, func, *args):
+        """在文件读写线程池中执行"""
+        return self.loop.run_in_executor(self.io_executor, func, *args)
+
+    def run_db(self, func, *args):
+        """在数据库线程中执行"""
+        return self.loop.run_in_executor(self.db_executor, func, *args)
+
+    async def log_metrics(self):
+        """定期把连接统计写入日志"""
+        while True:
+            await asyncio.sleep(METRICS_INTERVAL)
+            logger.info(f"连接统计: {self.metrics.summary()}")
+
+    async def maintain_backups(self):
+        """定期执行备份维护"""
+        while True:
+            await self.run_io(self.run_backup_maintenance)
+            await asyncio.sleep(BACKUP_GC_INTERVAL)
+
+    async def db_writer(self):
+        """数据库写入任务：取出队列中当前所有连接提交的记录，在一个事务中写入"""
+        while True:
+            batch = [await self.db_queue.get()]
+            while not self.db_queue.empty():
+                batch.append(self.db_queue.get_nowait())
+
+            errors = await self.commit(batch)
+            self.metrics.db_batches += 1
+            for (rows, backups, future), error in zip(batch, errors):
+                if error is None:
+                    self.metrics.db_records += len(rows) + len(backups)
+                    if rows:
+                        self.db_generation += 1
+                if not future.done():
+                    if error is None:
+                        future.set_result(None)
+                    else:
+                        future.set_exception(error)
+                self.db_queue.task_done()
+
+    async def commit(self, batch):
+        """在一个事务中写入一批记录，整批失败时逐个连接重试，只让出错的连接收到异常
+
+        Returns:
+            每项的异常，成功时为 None
+        """
+        rows = [row for item in batch for row in item[0]]
+        backups = [backup for item in batch for backup in item[1]]
+        try:
+            await self.run_db(self.writer_db.record_received_files, rows, backups)
+            return [None] * len(batch)
+        except Exception as e:
+            if len(batch) == 1:
+                return [e]
+            return [(await self.commit([item]))[0] for item in batch]
+
+    async def write_records(self, rows, backups):
+        """把文件记录和备份记录交给数据库写入任务，等待提交完成
+
+        Raises:
+            sqlite3.Error: 写入失败
+        """
+        future = self.loop.create_future()
+        await self.db_queue.put((list(rows), list(backups), future))
+        self.metrics.db_queue_peak = max(self.metrics.db_queue_peak, self.db_queue.qsize())
+        await future
+
+    async def handle_connection(self, reader, writer):
+        """处理单个客户端连接（asyncio.start_server 的回调）"""
+        conn = ClientConnection(reader, writer, self.metrics)
+        task = asyncio.current_task()
+        self.sessions[task] = False
+        self.metrics.connections_total += 1
+        sock = writer.get_extra_info('socket')
+        if sock is not None:
+            configure_socket(sock)
+        writer.transport.set_write_buffer_limits(high=STREAM_BUFFER_SIZE)
+
+        try:
+            self.metrics.connections_waiting += 1
+            try:
+                await asyncio.wait_for(self.slots.acquire(), CLIENT_WAIT_TIMEOUT)
+            except asyncio.TimeoutError:
+                self.metrics.connections_rejected += 1
+                logger.warning(f"客户端 {conn.ip} 等待超过 {CLIENT_WAIT_TIMEOUT} 秒，服务端繁忙，断开连接")
+                try:
+                    await conn.send_message(json.dumps({"status": "error", "message": "Server busy"}))
+                except OSError:
+                    pass
+                return
+            finally:
+                self.metrics.connections_waiting -= 1
+
+            logger.info(f"接受客户端连接: {conn.ip}")
+            self.metrics.connections_active += 1
+            self.metrics.connections_peak = max(self.metrics.connections_peak, self.metrics.connections_active)
+            try:
+                await self.handle_requests(conn, task)
+            finally:
+                self.metrics.connections_active -= 1
+                self.slots.release()
+        except asyncio.CancelledError:
+            # 服务端关闭时取消的连接；不再向上抛出，Python 3.11 的 start_server 会把取消记录为错误
+            logger.info(f"服务端关闭，断开客户端 {conn.ip}")
+        finally:
+            self.sessions.pop(task, None)
+            await conn.close()
+
+    async def handle_requests(self, conn, task):
+        """持续处理客户端请求，直到连接关闭、出错或服务端关闭"""
+        # 连接内多次请求共用的状态（如清单对比使用的 Merkle 树）
+        session = {}
+        try:
+            while not self.stopping.is_set():
+                try:
+                    request_data = await asyncio.wait_for(conn.receive_message(), CLIENT_IDLE_TIMEOUT)
+                except asyncio.TimeoutError:
+                    logger.info(f"客户端 {conn.ip} 超过 {CLIENT_IDLE_TIMEOUT} 秒没有请求，断开连接")
+                    break
+                if not request_data or request_data == "{}":
+                    logger.info(f"客户端 {conn.ip} 关闭连接")
+                    break
+
+                self.sessions[task] = True
+                try:
+                    if not await self.handle_request(conn, request_data, session):
+                        break
+                finally:
+                    self.sessions[task] = False
+        except Exception as e:
+            self.metrics.connections_failed += 1
+            logger.error(f"处理客户端 {conn.ip} 时发生错误: {str(e)}")
+            try:
+                await conn.send_message(json.dumps({"status": "error", "message": str(e)}))
+            except Exception:
+                pass
+        finally:
+            logger.info(f"客户端 {conn.ip} 连接已关闭")
+
+    async def handle_request(self, conn, request_data, session):
+        """处理一个请求
+
+        Returns:
+            是否继续处理该连接的请求
+        """
+        try:
+            request = json.loads(request_data)
+        except json.JSONDecodeError as e:
+            logger.error(f"解析JSON数据失败: {str(e)}")
+            await conn.send_message(json.dumps({"status": "error", "message": "Invalid JSON data"}))
+            return True
+
+        request_type = request.get('type')
+        self.metrics.requests[request_type] = self.metrics.requests.get(request_type, 0) + 1
+        logger.info(f"收到客户端 {conn.ip} 请求: {request_type}")
+
+        if request_type == 'time_sync':
+            conn.compress_messages = self.accepts_compression(request)
+            await conn.send_message(json.dumps(self.time_sync_reply(request)))
+        elif request_type == 'manifest':
+            await self.handle_manifest_async(conn, request, session)
+        elif request_type == 'db_download':
+            await self.handle_db_download_async(conn)
+        elif request_type == 'block_signatures':
+            await self.handle_block_signatures_async(conn, request)
+        elif request_type == 'file_sync':
+            await self.handle_file_sync_async(conn, request)
+        elif request_type == 'stats':
+            await conn.send_message(json.dumps({"status": "ok", "metrics": self.metrics.snapshot()}))
+        elif request_type == 'close':
+            logger.info(f"客户端 {conn.ip} 请求关闭连接")
+            return False
+        else:
+            logger.warning(f"未知的请求类型: {request_type}")
+            await conn.send_message(json.dumps({"status": "error", "message": "Unknown request type"}))
+        return True
+
+    async def handle_manifest_async(self, conn, request, session):
+        """处理清单对比请求，见 SyncServer.handle_manifest
+
+        同一连接内复用第一次请求时的清单；所有连接共用按排除规则缓存的清单，文件记录提交后重新构建。
+        """
+        rules = request.get('exclude') or {}
+        key = json.dumps(rules, sort_keys=True)
+        try:
+            if session.get('manifest_key') != key:
+                session['manifest'] = await self.shared_manifest(rules, key)
+                session['manifest_key'] = key
+        except Exception as e:
+            logger.error(f"构建文件清单失败: {str(e)}")
+            await conn.send_message(json.dumps({"status": "error", "message": str(e)}))
+            return
+
+        reply = await self.run_io(lambda: json.dumps(self.manifest_reply(session['manifest'], request)))
+        await conn.send_message(reply)
+
+    async def shared_manifest(self, rules, key):
+        """所有连接共用的文件清单，同时请求的连接等待同一次构建"""
+        cached = self.manifests.get(key)
+        if cached is None or cached[0] != self.db_generation:
+            future = asyncio.ensure_future(self.run_db(self.load_manifest, self.writer_db, rules))
+            cached = (self.db_generation, future)
+            self.manifests.pop(key, None)
+            self.manifests[key] = cached
+            while len(self.manifests) > MANIFEST_CACHE_SIZE:
+                self.manifests.pop(next(iter(self.manifests)))
+        try:
+            return await asyncio.shield(cached[1])
+        except Exception:
+            if self.manifests.get(key) is cached:
+                del self.manifests[key]
+            raise
+
+    async def handle_db_download_async(self, conn):
+        """处理数据库下载请求（旧版本客户端），见 SyncServer.handle_db_download"""
+        db_path = self.db_path
+        logger.info(f"收到数据库下载请求，数据库路径: {db_path}")
+        if not db_path.exists():
+            logger.error(f"数据库文件不存在: {db_path}")
+            await conn.send_message(json.dumps({"status": "error", "message": "Database file not found"}))
+            return
+
+        file_size = db_path.stat().st_size
+        await conn.send_message(json.dumps({"status": "ok", "size": file_size}))
+
+        response_data = await conn.receive_message()
+        try:
+            response = json.loads(response_data) if response_data else {}
+        except json.JSONDecodeError as e:
+            logger.error(f"解析客户端准备就绪信息失败: {str(e)}")
+            return
+        if response.get("status") != "ready":
+            logger.error(f"客户端未准备就绪: {response}")
+            return
+
+        with open(db_path, 'rb') as f:
+            sent_size = await conn.send_file(f, file_size)
+        logger.info(f"数据库文件发送完成，总共发送: {sent_size} 字节")
+
+    async def handle_block_signatures_async(self, conn, request):
+        """返回服务端已有文件的块签名，见 SyncServer.handle_block_signatures"""
+        entries, signatures = await self.run_io(self.collect_signatures, request.get('files', []))
+        await conn.send_message(json.dumps({"status": "ok", "files": entries}))
+        for signature in signatures:
+            await conn.send_bytes(signature)
+        logger.info(f"已发送 {len(entries)} 个文件的块签名")
+
+    async def handle_file_sync_async(self, conn, request):
+        """处理文件同步请求，协议版本协商见 SyncServer.handle_file_sync"""
+        files_to_sync = request.get('files', [])
+        file_count = len(files_to_sync)
+        protocol_version = min(int(request.get('protocol_version') or 1), PROTOCOL_VERSION)
+        codec = self.transfer_codec(request, protocol_version)
+
+        logger.info(f"客户端 {conn.ip} 请求同步 {file_count} 个文件，协议版本: {protocol_version}，"
+                    f"压缩: {codec.name if codec else '无'}")
+        await conn.send_message(json.dumps({
+            "status": "ready",
+            "protocol_version": protocol_version,
+            "ack_batch": ACK_BATCH_SIZE,
+            "compression": codec.name if codec else None
+        }))
+
+        if protocol_version >= 2:
+            received_files = await self.receive_files_pipelined_async(conn, files_to_sync, codec)
+        else:
+            received_files = await self.receive_files_async(conn, files_to_sync)
+
+        await conn.send_message(json.dumps({
+            "status": "sync_complete",
+            "received_files": received_files
+        }))
+        logger.info(f"客户端 {conn.ip} 同步完成，共接收 {received_files}/{file_count} 个文件")
+
+    async def receive_files_async(self, conn, files_to_sync):
+        """逐个文件握手接收（协议版本1），每个文件的记录提交后再确认
+
+        Returns:
+            成功接收的文件数量
+        """
+        received_files = 0
+        file_count = len(files_to_sync)
+        for file_info in files_to_sync:
+            rows = []
+            backups = []
+            await conn.send_message(json.dumps({"status": "ready_for_file"}))
+            status = await self.receive_record_async(conn, file_info, file_info.get('size'), rows, backups)
+            if rows or backups:
+                await self.write_records(rows, backups)
+            await conn.send_message(json.dumps({"status": status}))
+            if status == "file_received":
+                received_files += 1
+                logger.info(f"已接收文件 ({received_files}/{file_count}): {file_info.get('path')}")
+        return received_files
+
+    async def receive_files_pipelined_async(self, conn, files_to_sync, codec=None):
+        """流水线接收（协议版本2、3），每 ACK_BATCH_SIZE 个文件提交数据库后确认一次
+
+        Args:
+            conn: 客户端连接
+            files_to_sync: 请求中的文件列表
+            codec: 协商的压缩算法对象，None 表示不压缩
+
+        Returns:
+            成功接收的文件数量
+        """
+        received_files = 0
+        file_count = len(files_to_sync)
+        results = []
+        rows = []
+        backups = []
+
+        async def flush():
+            if rows or backups:
+                await self.write_records(rows, backups)
+                rows.clear()
+                backups.clear()
+            if results:
+                await conn.send_message(json.dumps({"status": "ack", "results": results}))
+                results.clear()
+
+        while True:
+            index, file_size = RECORD_HEADER.unpack(await conn.read_exactly(RECORD_HEADER.size))
+            if index == END_OF_RECORDS:
+                break
+
+            is_delta = index & DELTA_RECORD
+            is_compressed = index & COMPRESSED_RECORD
+            index &= ~(DELTA_RECORD | COMPRESSED_RECORD)
+            file_info = files_to_sync[index] if index < file_count else {}
+            source = conn
+            if is_compressed:
+                if codec is None:
+                    raise ConnectionError("收到未协商压缩算法的压缩记录")
+                source = CompressedRecordReader(conn, codec, self.run_io, file_size)
+            status = await self.receive_record_async(source, file_info, file_size, rows, backups, is_delta)
+            if is_compressed:
+                await source.finish()
+            results.append([index, status])
+            if status == "file_received":
+                received_files += 1
+                logger.debug(f"已接收文件 ({received_files}/{file_count}): {file_info.get('path')}")
+
+            if len(results) >= ACK_BATCH_SIZE:
+                await flush()
+                logger.info(f"已接收 {received_files}/{file_count} 个文件")
+
+        await flush()
+        return received_files
+
+    async def receive_record_async(self, conn, file_info, size, rows, backups, is_delta=False):
+        """接收一条记录的内容
+
+        不超过 STREAM_BUFFER_SIZE 的文件一次读入内存后在线程池中写入；较大的文件边接收边写入，
+        写完一块才读取下一块；增量数据先读入内存（超过 DELTA_SPOOL_SIZE 时写入临时文件），再在线程池中重建。
+
+        Args:
+            conn: 客户端连接，或读取压缩记录的 CompressedRecordReader
+            file_info: 请求中该文件的信息，序号无效时为空字典
+            size: 记录中的内容长度（压缩记录为解压后的长度）
+            rows: 待写入数据库的文件记录，成功时追加
+            backups: 待写入数据库的备份记录
+            is_delta: 是否为增量记录
+
+        Returns:
+            file_received、hash_mismatch 或 error
+        """
+        if is_delta:
+            spool = io.BytesIO() if size <= DELTA_SPOOL_SIZE else tempfile.TemporaryFile()
+            with spool:
+                await self.receive_into(conn, size, lambda chunk: self.run_io(spool.write, chunk))
+                spool.seek(0)
+                status = await self.run_io(self.receive_delta_record, spool, file_info, size, rows, backups)
+        elif size <= STREAM_BUFFER_SIZE:
+            data = await conn.read_exactly(size)
+            status = await self.run_io(self.receive_file_record, io.BytesIO(data), file_info, size, rows, backups)
+        else:
+            status = await self.receive_large_file(conn, file_info, size, rows, backups)
+
+        if status == "file_received":
+            self.metrics.files_received += 1
+        else:
+            self.metrics.files_failed += 1
+        return status
+
+    async def receive_large_file(self, conn, file_info, file_size, rows, backups):
+        """边接收边写入一个较大的文件，见 SyncServer.receive_file_record"""
+        target = await self.run_io(self.open_target, file_info.get('path'), backups)
+        algorithm, hasher = hasher_for(file_info.get('hash'))
+        try:
+            if target is None:
+                await self.receive_into(conn, file_size, None)
+                return "error"
+            await self.receive_into(conn, file_size, lambda chunk: self.run_io(_write_chunk, target, hasher, chunk))
+        finally:
+            if target is not None:
+                await self.run_io(target.close)
+        return await self.run_io(self.complete_received_file, file_info, file_size,
+                                 format_hash(algorithm, hasher.hexdigest()), rows)
+
+    @staticmethod
+    async def receive_into(conn, size, consume):
+        """接收 size 字节，每块交给 consume（返回可等待对象，为 None 时丢弃），处理完再接收下一块"""
+        remaining = size
+        while remaining > 0:
+            chunk = await conn.read_chunk(min(remaining, TRANSFER_BUFFER_SIZE))
+            remaining -= len(chunk)
+            if consume is not None:
+                await consume(chunk)
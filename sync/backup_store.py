@@ -0,0 +1,316 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+文件同步工具备份存储模块
+
+服务端覆盖文件前的备份按内容寻址保存：
+- 对象路径为 backups/objects/<哈希前两位>/<哈希>，内容相同的备份只保存一份，不同目录下的同名文件也不会互相覆盖；
+  BACKUP_COMPRESSION 时值得压缩的内容保存为 zlib 流，文件名加 .z（已压缩格式和抽样压缩率不够的内容保存原样）
+- backup_files 表的 object_key 列引用对象（"blake2b:<哈希>"），backup_path 为对象相对于数据目录的路径
+- maintain_backups 把旧格式的备份（backups/<文件名>_<时间戳>）导入对象存储，按保留策略删除备份记录，
+  再删除不再被引用的对象
+"""
+
+import os
+import re
+import tempfile
+import time
+from pathlib import Path
+
+from compression import CompressionPolicy, ZlibCodec
+from config import (
+    BACKUP_COMPRESSION, BACKUP_COMPRESSION_LEVEL, BACKUP_KEEP_VERSIONS, BACKUP_KEEP_DAYS, BACKUP_MIN_VERSIONS,
+    BACKUP_GC_GRACE, TRANSFER_BUFFER_SIZE, logger
+)
+from hashing import format_hash, hash_file, new_hasher
+from utils import copy_file
+
+# 对象按该算法的哈希值寻址
+OBJECT_HASH_ALGORITHM = 'blake2b'
+# 压缩保存的对象的文件名后缀
+COMPRESSED_SUFFIX = '.z'
+# 对象中的十六进制哈希值
+_DIGEST = re.compile(r'[0-9a-f]{3,}')
+
+
+class BackupStore:
+    """内容寻址的备份存储"""
+
+    def __init__(self, backup_dir, data_dir=None, compress=BACKUP_COMPRESSION):
+        """
+        Args:
+            backup_dir: 备份目录，对象保存在其中的 objects 子目录
+            data_dir: 数据目录，备份记录中的路径相对于该目录，默认为备份目录的上一级
+            compress: 是否压缩保存
+        """
+        self.backup_dir = Path(backup_dir)
+        self.data_dir = Path(data_dir) if data_dir else self.backup_dir.parent
+        self.objects_dir = self.backup_dir / "objects"
+        # 写入中的对象先放在这里，写完再移动到最终位置
+        self.tmp_dir = self.objects_dir / "tmp"
+        self.tmp_dir.mkdir(parents=True, exist_ok=True)
+        self.codec = ZlibCodec(BACKUP_COMPRESSION_LEVEL) if compress else None
+
+    def object_paths(self, key):
+        """对象原样保存和压缩保存时的路径
+
+        Args:
+            key: 对象（"blake2b:<哈希>"）
+
+        Returns:
+            (原样保存的路径, 压缩保存的路径)
+
+        Raises:
+            ValueError: 对象格式无效
+        """
+        algorithm, _, digest = key.partition(':')
+        if algorithm != OBJECT_HASH_ALGORITHM or not _DIGEST.fullmatch(digest):
+            raise ValueError(f"无效的备份对象: {key}")
+        path = self.objects_dir / digest[:2] / digest
+        return path, path.with_name(digest + COMPRESSED_SUFFIX)
+
+    def find(self, key):
+        """对象的文件路径，不存在时返回 None"""
+        for path in self.object_paths(key):
+            if path.exists():
+                return path
+        return None
+
+    def relative_path(self, path):
+        """对象路径相对于数据目录的形式，记录在 backup_files.backup_path 中"""
+        try:
+            return str(Path(path).relative_to(self.data_dir))
+        except ValueError:
+            return str(path)
+
+    def put(self, source):
+        """把文件存入备份存储，已有相同内容时不再写入
+
+        先计算哈希判断对象是否已存在；不存在时复制（或压缩）到临时文件，同时再计算一次哈希，
+        以复制时的内容为准（文件在两次读取之间被修改时不会保存成错误的对象）。
+
+        Args:
+            source: 文件路径
+
+        Returns:
+            (对象, 对象文件路径, 是否新写入)
+        """
+        source = Path(source)
+        key = hash_file(source, OBJECT_HASH_ALGORITHM)
+        existing = self.find(key)
+        if existing is not None:
+            # 刷新修改时间，垃圾回收的宽限期从最近一次引用算起
+            os.utime(existing)
+            return key, existing, False
+
+        fd, tmp_name = tempfile.mkstemp(dir=self.tmp_dir)
+        try:
+            with os.fdopen(fd, 'wb') as out, open(source, 'rb') as src:
+                key, compressed = self._copy(source, src, out)
+            existing = self.find(key)
+            if existing is not None:
+                os.unlink(tmp_name)
+                os.utime(existing)
+                return key, existing, False
+            raw_path, packed_path = self.object_paths(key)
+            path = packed_path if compressed else raw_path
+            path.parent.mkdir(exist_ok=True)
+            os.replace(tmp_name, path)
+        except BaseException:
+            try:
+                os.unlink(tmp_name)
+            except FileNotFoundError:
+                pass
+            raise
+        return key, path, True
+
+    def _copy(self, source, src, out):
+        """复制文件内容，值得压缩时压缩
+
+        Returns:
+            (按复制的内容计算的对象, 是否压缩保存)
+        """
+        hasher = new_hasher(OBJECT_HASH_ALGORITHM)
+        size = os.fstat(src.fileno()).st_size
+        compressor = None
+        if self.codec is not None:
+            policy = CompressionPolicy(self.codec)
+            if policy.should_try(source.name, size) and policy.read_sample(src):
+                compressor = self.codec.compressor()
+
+        while True:
+            chunk = src.read(TRANSFER_BUFFER_SIZE)
+            if not chunk:
+                break
+            hasher.update(chunk)
+            out.write(compressor.compress(chunk) if compressor else chunk)
+        if compressor:
+            out.write(compressor.flush())
+        return format_hash(OBJECT_HASH_ALGORITHM, hasher.hexdigest()), compressor is not None
+
+    def restore(self, key, dest):
+        """把对象的原内容写入 dest
+
+        Args:
+            key: 对象
+            dest: 目标文件路径
+
+        Raises:
+            FileNotFoundError: 对象不存在
+        """
+        path = self.find(key)
+        if path is None:
+            raise FileNotFoundError(f"备份对象不存在: {key}")
+        if path.suffix != COMPRESSED_SUFFIX:
+            copy_file(path, dest)
+            return
+        decompressor = ZlibCodec().decompressor()
+        with open(path, 'rb') as src, open(dest, 'wb') as out:
+            while True:
+                chunk = src.read(TRANSFER_BUFFER_SIZE)
+                if not chunk:
+                    break
+                out.write(decompressor.decompress(chunk))
+            out.write(decompressor.flush())
+
+    def iter_objects(self):
+        """遍历所有对象
+
+        Yields:
+            (对象, 文件路径, os.stat_result)
+        """
+        try:
+            prefixes = os.scandir(self.objects_dir)
+        except FileNotFoundError:
+            return
+        with prefixes:
+            for prefix in prefixes:
+                if len(prefix.name) != 2 or not prefix.is_dir():
+                    continue
+                with os.scandir(prefix.path) as entries:
+                    for entry in entries:
+                        if not entry.is_file():
+                            continue
+                        digest = entry.name[:-len(COMPRESSED_SUFFIX)] \
+                            if entry.name.endswith(COMPRESSED_SUFFIX) else entry.name
+                        yield format_hash(OBJECT_HASH_ALGORITHM, digest), Path(entry.path), entry.stat()
+
+    def collect_garbage(self, referenced, grace=BACKUP_GC_GRACE, now=None):
+        """删除没有被引用、且超过宽限期没有写入或复用的对象，以及遗留的临时文件
+
+        Args:
+            referenced: 备份记录引用的对象集合
+            grace: 宽限期（秒）
+            now: 当前时间戳，默认为 time.time()
+
+        Returns:
+            (删除的对象数, 释放的字节数)
+        """
+        deadline = (time.time() if now is None else now) - grace
+        removed = 0
+        freed = 0
+        for key, path, stat in list(self.iter_objects()):
+            if key in referenced or stat.st_mtime > deadline:
+                continue
+            try:
+                # 遍历期间可能刚被复用（put 会刷新修改时间），删除前再检查一次
+                if path.stat().st_mtime > deadline:
+                    continue
+                path.unlink()
+            except FileNotFoundError:
+                continue
+            removed += 1
+            freed += stat.st_size
+
+        with os.scandir(self.tmp_dir) as entries:
+            for entry in entries:
+                try:
+                    if entry.is_file() and entry.stat().st_mtime <= deadline:
+                        os.unlink(entry.path)
+                except OSError:
+                    pass
+        return removed, freed
+
+    def usage(self):
+        """对象数量和占用的字节数"""
+        count = 0
+        size = 0
+        for _, _, stat in self.iter_objects():
+            count += 1
+            size += stat.st_size
+        return count, size
+
+    def import_legacy(self, db):
+        """把旧格式的备份文件存入对象存储，更新备份记录后删除原文件
+
+        Args:
+            db: 数据库连接
+
+        Returns:
+            导入的备份文件数量
+        """
+        by_path = {}
+        for backup_id, backup_path in db.get_legacy_backups():
+            by_path.setdefault(backup_path, []).append(backup_id)
+
+        backup_root = self.backup_dir.resolve()
+        imported = []
+        updates = []
+        for backup_path, ids in by_path.items():
+            path = self.data_dir / backup_path
+            try:
+                # 只处理备份目录中的文件
+                path.resolve().relative_to(backup_root)
+                if not path.is_file():
+                    continue
+                key, object_path, _ = self.put(path)
+            except (OSError, ValueError) as e:
+                logger.warning(f"导入旧备份文件失败: {backup_path}, 错误: {str(e)}")
+                continue
+            imported.append(path)
+            updates.extend((self.relative_path(object_path), key, backup_id) for backup_id in ids)
+
+        if updates:
+            db.set_backup_objects(updates)
+        for path in imported:
+            try:
+                path.unlink()
+            except OSError as e:
+                logger.warning(f"删除已导入的旧备份文件失败: {path}, 错误: {str(e)}")
+        return len(imported)
+
+
+def maintain_backups(db, store, keep_versions=BACKUP_KEEP_VERSIONS, keep_days=BACKUP_KEEP_DAYS,
+                     min_versions=BACKUP_MIN_VERSIONS, grace=BACKUP_GC_GRACE, now=None):
+    """导入旧格式备份，执行保留策略，删除不再被引用的对象
+
+    Args:
+        db: 数据库连接
+        store: BackupStore
+        keep_versions: 每个文件最多保留的版本数，None 表示不限
+        keep_days: 保留天数，None 表示不限
+        min_versions: 超过保留天数时至少保留的版本数
+        grace: 未引用对象的宽限期（秒）
+        now: 当前时间戳，默认为 time.time()
+
+    Returns:
+        统计信息字典
+    """
+    started = time.time()
+    imported = store.import_legacy(db)
+    pruned = db.prune_backups(keep_versions, keep_days, min_versions, now)
+    removed, freed = store.collect_garbage(db.get_backup_object_keys(), grace, now)
+    objects, size = store.usage()
+    stats = {
+        "imported": imported,
+        "pruned": len(pruned),
+        "removed_objects": removed,
+        "freed_bytes": freed,
+        "objects": objects,
+        "bytes": size,
+    }
+    logger.info(f"备份维护完成（{time.time() - started:.2f}秒）：导入旧备份 {imported} 个，删除过期记录 {len(pruned)} 条，"
+                f"删除对象 {removed} 个（{freed / 1024 / 1024:.1f} MB），"
+                f"现有对象 {objects} 个（{size / 1024 / 1024:.1f} MB）")
+    return stats
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+备份存储测试
+
+模拟服务端反复接收同一批文件：每个目录下有同名的 config.json、index.html、report.sql（可压缩文本）
+和 photo.png（随机内容），每一轮每个文件换成它的若干个版本之一（内容在版本之间来回切换，
+config.json 在所有目录中相同），覆盖前备份原文件。对比：
+- 原来的方式：复制到 backups/<文件名>_<时间戳>，同名文件在同一秒内备份会互相覆盖
+- BackupStore：按内容寻址，相同内容只保存一份，可压缩的内容压缩保存
+最后按保留策略（每个文件保留 --keep 个版本）删除记录并清理未引用的对象。
+
+使用方法:
+    cd sync
+    python benchmarks/backup_benchmark.py
+    python benchmarks/backup_benchmark.py --dirs 100 --rounds 50 --variants 8 --keep 10
+"""
+
+import argparse
+import logging
+import random
+import shutil
+import tempfile
+import time
+from pathlib import Path
+
+import common  # noqa: F401  设置导入路径
+from backup_store import BackupStore, maintain_backups  # noqa: E402
+from database import FileDatabase  # noqa: E402
+
+# 文件名 -> (大小, 是否可压缩, 是否所有目录共用同一组版本)
+FILES = {
+    "config.json": (4 << 10, True, True),
+    "index.html": (32 << 10, True, False),
+    "report.sql": (256 << 10, True, False),
+    "photo.png": (128 << 10, False, False),
+}
+
+
+def make_variants(rng, size, compressible, count):
+    words = [b"task", b"material", b"work_item", b"project", b"INSERT", b"SELECT", b"2025-05-21", b"ok"]
+    variants = []
+    for _ in range(count):
+        if compressible:
+            data = b" ".join(rng.choice(words) for _ in range(size // 6))[:size]
+        else:
+            data = rng.randbytes(size)
+        variants.append(data)
+    return variants
+
+
+def old_backup(backup_dir, data_dir, full_dest_path):
+    """原来的 make_backup：按文件名和秒级时间戳复制"""
+    backup_path = backup_dir / f"{full_dest_path.name}_{int(time.time())}"
+    shutil.copy2(full_dest_path, backup_path)
+    return str(backup_path.relative_to(data_dir))
+
+
+def disk_usage(root):
+    files = [path for path in Path(root).rglob("*") if path.is_file()]
+    return len(files), sum(path.stat().st_size for path in files)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="备份存储测试")
+    parser.add_argument("--dirs", type=int, default=50, help="目录数量")
+    parser.add_argument("--rounds", type=int, default=20, help="同步轮数")
+    parser.add_argument("--variants", type=int, default=4, help="每个文件的版本数")
+    parser.add_argument("--keep", type=int, default=5, help="每个文件保留的备份版本数")
+    args = parser.parse_args()
+    common.logger.setLevel(logging.WARNING)
+
+    rng = random.Random(1)
+    pools = {}
+    for name, (size, compressible, shared) in FILES.items():
+        groups = 1 if shared else args.dirs
+        pools[name] = [make_variants(rng, size, compressible, args.variants) for _ in range(groups)]
+
+    tmp = Path(tempfile.mkdtemp(prefix="sync_backup_bench_"))
+    try:
+        results = {}
+        for mode in ("old", "store"):
+            data_dir = tmp / mode
+            tree = data_dir / "tree"
+            backup_dir = data_dir / "backups"
+            backup_dir.mkdir(parents=True)
+            store = BackupStore(backup_dir, data_dir) if mode == "store" else None
+            db = FileDatabase(data_dir / "file_sync.db")
+
+            order = random.Random(2)
+            elapsed = 0.0
+            backups = 0
+            raw = 0
+            for round_index in range(args.rounds + 1):
+                rows = []
+                for d in range(args.dirs):
+                    for name, (_, _, shared) in FILES.items():
+                        path = tree / f"dir{d:04d}" / name
+                        if round_index > 0:
+                            started = time.perf_counter()
+                            if store is None:
+                                backup_path, key = old_backup(backup_dir, data_dir, path), None
+                            else:
+                                key, object_path, _ = store.put(path)
+                                backup_path = store.relative_path(object_path)
+                            elapsed += time.perf_counter() - started
+                            stat = path.stat()
+                            rows.append((f"dir{d:04d}/{name}", backup_path, stat.st_size, stat.st_mtime, key, key))
+                            backups += 1
+                            raw += stat.st_size
+                        path.parent.mkdir(parents=True, exist_ok=True)
+                        path.write_bytes(order.choice(pools[name][0 if shared else d]))
+                db.record_received_files([], rows)
+
+            files, size = disk_usage(backup_dir)
+            lost = backups - len({row['backup_path'] for row in db.get_backup_files_by_time_range(0, time.time() + 1)}) \
+                if store is None else 0
+            after = None
+            if store is not None:
+                maintain_backups(db, store, keep_versions=args.keep, keep_days=None, grace=0)
+                after = disk_usage(backup_dir)
+            db.close()
+            results[mode] = (elapsed, backups, raw, files, size, lost, after)
+
+        print(f"{args.dirs} 个目录 x {len(FILES)} 个文件，{args.rounds} 轮，每个文件 {args.variants} 个版本")
+        print(f"{'方式':<12} {'耗时(s)':>8} {'备份次数':>8} {'原始(MB)':>9} {'文件数':>7} {'占用(MB)':>9} {'被覆盖':>7}")
+        for mode, label in (("old", "原来的方式"), ("store", "BackupStore")):
+            elapsed, backups, raw, files, size, lost, _ = results[mode]
+            print(f"{label:<12} {elapsed:>8.2f} {backups:>8} {raw / 1024 / 1024:>9.1f} {files:>7} "
+                  f"{size / 1024 / 1024:>9.1f} {lost:>7}")
+        files, size = results["store"][6]
+        print(f"保留 {args.keep} 个版本并清理后: {files} 个文件，{size / 1024 / 1024:.1f} MB")
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
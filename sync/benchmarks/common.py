@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+同步工具性能测试的公共部分
+
+- LatencyProxy: 本机TCP代理，双向各延迟 RTT/2，模拟远程链路（可选限速），统计双向字节数
+- make_tree: 生成测试文件树
+- SyncPair: 在临时目录中创建服务端和客户端，通过代理连接（也可以直接连接）
+"""
+
+import heapq
+import logging
+import os
+import random
+import shutil
+import socket
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+SYNC_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(SYNC_DIR))
+
+from config import logger  # noqa: E402
+from server import SyncServer  # noqa: E402
+from async_server import AsyncSyncServer  # noqa: E402
+from client import SyncClient  # noqa: E402
+from utils import configure_socket, send_data  # noqa: E402
+
+
+class LatencyProxy:
+    """转发到目标端口的TCP代理，每个方向的数据延迟 RTT/2 后送达"""
+
+    def __init__(self, target_port, rtt_ms=0.0, bandwidth=None):
+        """
+        Args:
+            target_port: 本机目标端口
+            rtt_ms: 模拟的往返时延（毫秒）
+            bandwidth: 每个方向的带宽上限（字节/秒），None 表示不限速
+        """
+        self.target_port = target_port
+        self.delay = rtt_ms / 2000.0
+        self.bandwidth = bandwidth
+        # 客户端到服务端（up）、服务端到客户端（down）转发的字节数
+        self.bytes = {"up": 0, "down": 0}
+        self.listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.listener.bind(('127.0.0.1', 0))
+        self.listener.listen(16)
+        self.port = self.listener.getsockname()[1]
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def _accept(self):
+        while True:
+            try:
+                downstream, _ = self.listener.accept()
+            except OSError:
+                return
+            upstream = socket.create_connection(('127.0.0.1', self.target_port))
+            for sock in (downstream, upstream):
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self._pipe(downstream, upstream, "up")
+            self._pipe(upstream, downstream, "down")
+
+    def _pipe(self, source, dest, direction):
+        pending = []
+        condition = threading.Condition()
+
+        def reader():
+            # 限速时按带宽计算每段数据最早的送达时间
+            available_at = 0.0
+            while True:
+                try:
+                    data = source.recv(256 * 1024)
+                except OSError:
+                    data = b''
+                self.bytes[direction] += len(data)
+                now = time.monotonic()
+                if self.bandwidth:
+                    available_at = max(available_at, now) + len(data) / self.bandwidth
+                    deliver_at = available_at + self.delay
+                else:
+                    deliver_at = now + self.delay
+                with condition:
+                    if data:
+                        heapq.heappush(pending, (deliver_at, id(data), data))
+                    else:
+                        heapq.heappush(pending, (deliver_at, 0, b''))
+                    condition.notify()
+                if not data:
+                    return
+
+        def writer():
+            while True:
+                with condition:
+                    while not pending:
+                        condition.wait()
+                    deliver_at, _, data = pending[0]
+                    wait = deliver_at - time.monotonic()
+                    if wait > 0:
+                        condition.wait(wait)
+                        continue
+                    heapq.heappop(pending)
+                if not data:
+                    try:
+                        dest.shutdown(socket.SHUT_WR)
+                    except OSError:
+                        pass
+                    return
+                try:
+                    dest.sendall(data)
+                except OSError:
+                    return
+
+        threading.Thread(target=reader, daemon=True).start()
+        threading.Thread(target=writer, daemon=True).start()
+
+    def close(self):
+        self.listener.close()
+
+
+def make_tree(root, files, size, seed=1, compressible=False, suffix=".txt"):
+    """生成测试文件树，每个子目录最多100个文件
+
+    Args:
+        root: 根目录
+        files: 文件数量
+        size: 每个文件的大小（字节）
+        seed: 随机种子
+        compressible: 是否生成可压缩的文本内容
+        suffix: 文件扩展名
+
+    Returns:
+        文件总字节数
+    """
+    rng = random.Random(seed)
+    root = Path(root)
+    total = 0
+    words = [b"task", b"material", b"work_item", b"project", b"INSERT", b"SELECT", b"2025-05-21", b"ok"]
+    for index in range(files):
+        directory = root / f"dir{index // 100:04d}"
+        directory.mkdir(parents=True, exist_ok=True)
+        if compressible:
+            parts = []
+            length = 0
+            while length < size:
+                word = rng.choice(words)
+                parts.append(word)
+                length += len(word) + 1
+            data = b" ".join(parts)[:size]
+        else:
+            data = rng.randbytes(size)
+        (directory / f"file{index:06d}{suffix}").write_bytes(data)
+        total += len(data)
+    return total
+
+
+class SyncPair:
+    """临时目录中的一对服务端和客户端
+
+    服务端不调用 start()，而是由这里监听一个随机端口，把连接交给 handle_client；
+    create_server(asyncio_server=True) 时在后台线程中运行 AsyncSyncServer。
+    客户端经过 LatencyProxy 连接；proxy=False 时直接连接服务端（测试本机吞吐量）。
+    """
+
+    def __init__(self, rtt_ms=0.0, bandwidth=None, log_level=logging.WARNING, proxy=True):
+        self.tmp = Path(tempfile.mkdtemp(prefix="sync_bench_"))
+        self.server_root = self.tmp / "server"
+        self.client_root = self.tmp / "client"
+        for directory in (self.server_root, self.client_root, self.tmp / "server_data", self.tmp / "client_data"):
+            directory.mkdir()
+        self.rtt_ms = rtt_ms
+        self.bandwidth = bandwidth
+        self.use_proxy = proxy
+        logger.setLevel(log_level)
+
+    def create_server(self, asyncio_server=False):
+        server_class = AsyncSyncServer if asyncio_server else SyncServer
+        self.server = server_class(port=0, log_dir=self.tmp / "logs", sync_dir=self.server_root,
+                                   data_dir=self.tmp / "server_data")
+        if asyncio_server:
+            self.server_thread = threading.Thread(target=self.server.start, args=('127.0.0.1',), daemon=True)
+            self.server_thread.start()
+            self.server.listening.wait()
+            self.port = self.server.port
+        else:
+            self.listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self.listener.bind(('127.0.0.1', 0))
+            self.listener.listen(64)
+            threading.Thread(target=self._serve, daemon=True).start()
+            self.port = self.listener.getsockname()[1]
+        if self.use_proxy:
+            self.proxy = LatencyProxy(self.port, self.rtt_ms, self.bandwidth)
+            self.port = self.proxy.port
+        return self.server
+
+    def _serve(self):
+        while True:
+            try:
+                conn, address = self.listener.accept()
+            except OSError:
+                return
+            threading.Thread(target=self.server.handle_client, args=(conn, address), daemon=True).start()
+
+    def create_client(self):
+        self.client = SyncClient('127.0.0.1', self.port, exclude_config=SYNC_DIR / "exclude.conf",
+                                 sync_dir=self.client_root, data_dir=self.tmp / "client_data")
+        return self.client
+
+    def connect(self):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        configure_socket(sock)
+        sock.connect(('127.0.0.1', self.port))
+        return sock
+
+    @staticmethod
+    def disconnect(sock):
+        send_data(sock, '{"type": "close"}')
+        sock.close()
+
+    def close(self):
+        if getattr(self, "server_thread", None):
+            self.server.stop()
+            self.server_thread.join()
+        for name in ("client", "server"):
+            side = getattr(self, name, None)
+            if side is not None:
+                side.db.close()
+        if getattr(self, "proxy", None):
+            self.proxy.close()
+        if getattr(self, "listener", None):
+            self.listener.close()
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+
+def count_files(root):
+    return sum(len(filenames) for _, _, filenames in os.walk(root))
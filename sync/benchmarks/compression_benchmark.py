@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+传输压缩测试
+
+经过限速的延迟代理同步一批混合文件（默认共32MB）：
+- 可压缩的文本（模拟源代码、日志、SQL导出）：16KB 小文件和 2MB 大文件，约占 70%
+- 已压缩格式（.gz，随机内容）：按扩展名跳过，约占 15%
+- 不可压缩的数据（.bin，随机内容）：抽样压缩后跳过，约占 15%
+
+对比不压缩和各压缩算法、级别在不同带宽下 sync_files 阶段的耗时和上行字节数。
+带宽足够高时压缩本身（单线程）会成为瓶颈，这时客户端可以用 --no-compression 关闭压缩。
+
+使用方法:
+    cd sync
+    python benchmarks/compression_benchmark.py
+    python benchmarks/compression_benchmark.py --total-mb 64 --bandwidth 1 10 0 --codecs zlib:1 zlib:6
+"""
+
+import argparse
+import shutil
+import tempfile
+import time
+from pathlib import Path
+
+from common import SyncPair, count_files, make_tree
+from compression import available_codecs  # noqa: E402
+
+
+def make_mixed_tree(root, total_mb):
+    """可压缩文本约 70%（一半为16KB小文件，一半为2MB大文件），.gz 和 .bin 随机内容各约 15%"""
+    total = total_mb * 1024 * 1024
+    size = 0
+    size += make_tree(root / "src", int(total * 0.35) // (16 << 10), 16 << 10, seed=1, compressible=True)
+    size += make_tree(root / "dumps", max(1, int(total * 0.35) // (2 << 20)), 2 << 20, seed=2, compressible=True,
+                      suffix=".sql")
+    size += make_tree(root / "archives", max(1, int(total * 0.15) // (1 << 20)), 1 << 20, seed=3, suffix=".gz")
+    size += make_tree(root / "data", max(1, int(total * 0.15) // (1 << 20)), 1 << 20, seed=4, suffix=".bin")
+    return size
+
+
+def run_once(tree, codec, bandwidth, rtt_ms, asyncio_server):
+    """同步一次
+
+    Args:
+        codec: (算法, 级别)，None 表示不压缩
+
+    Returns:
+        (耗时秒数, 上行字节数, 服务端收到的文件数)
+    """
+    pair = SyncPair(rtt_ms=rtt_ms, bandwidth=bandwidth)
+    try:
+        pair.client_root = tree
+        pair.create_server(asyncio_server)
+        client = pair.create_client()
+        client.delta_transfer = False
+        if codec is None:
+            client.compression_algorithms = []
+        else:
+            client.compression_algorithms = [codec[0]]
+            client.compression_level = codec[1]
+
+        sock = pair.connect()
+        client.sync_time(sock)
+        files_to_sync = client.compare_manifest(sock)
+        sent_before = pair.proxy.bytes["up"]
+        started = time.perf_counter()
+        client.sync_files(sock, files_to_sync)
+        elapsed = time.perf_counter() - started
+        sent = pair.proxy.bytes["up"] - sent_before
+        pair.disconnect(sock)
+        return elapsed, sent, count_files(pair.server_root)
+    finally:
+        pair.close()
+
+
+def parse_codec(text):
+    """"zlib:6" -> ("zlib", 6)，"zstd" -> ("zstd", None)"""
+    name, _, level = text.partition(":")
+    return name, int(level) if level else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="传输压缩测试")
+    parser.add_argument("--total-mb", type=int, default=32, help="文件总大小（MB）")
+    parser.add_argument("--bandwidth", type=float, nargs="+", default=[1, 10, 100],
+                        help="模拟的带宽（MB/秒），0 表示不限速")
+    parser.add_argument("--rtt", type=float, default=20.0, help="模拟的往返时延（毫秒）")
+    parser.add_argument("--codecs", nargs="+", help="测试的压缩算法和级别，如 zlib:1 zlib:6 zstd:3，默认为本机支持的算法")
+    parser.add_argument("--asyncio", action="store_true", help="使用 AsyncSyncServer")
+    args = parser.parse_args()
+
+    codecs = [parse_codec(text) for text in args.codecs] if args.codecs else \
+        [("zlib", 1), ("zlib", 6)] + [(name, None) for name in available_codecs() if name != "zlib"]
+    unavailable = [name for name, _ in codecs if name not in available_codecs()]
+    if unavailable:
+        parser.error(f"本机不支持的压缩算法: {', '.join(unavailable)}")
+
+    tmp = Path(tempfile.mkdtemp(prefix="sync_compression_bench_"))
+    try:
+        tree = tmp / "tree"
+        total = make_mixed_tree(tree, args.total_mb)
+        files = count_files(tree)
+        print(f"{files} 个文件，共 {total / 1024 / 1024:.0f} MB，RTT {args.rtt:.0f}ms")
+        print(f"{'带宽(MB/s)':>10} {'压缩':<10} {'耗时(s)':>8} {'上行(MB)':>9} {'压缩比':>7} {'有效MB/秒':>10}")
+        for bandwidth in args.bandwidth:
+            label = f"{bandwidth:g}" if bandwidth else "不限"
+            for codec in [None] + codecs:
+                name = "不压缩" if codec is None else f"{codec[0]}:{codec[1] if codec[1] is not None else '默认'}"
+                elapsed, sent, received = run_once(tree, codec, bandwidth * 1024 * 1024 or None, args.rtt,
+                                                   args.asyncio)
+                if received != files:
+                    print(f"警告: 服务端只收到 {received}/{files} 个文件")
+                print(f"{label:>10} {name:<10} {elapsed:>8.2f} {sent / 1024 / 1024:>9.1f} {sent / total:>7.0%} "
+                      f"{total / elapsed / 1024 / 1024:>10.1f}")
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+服务端并发连接测试
+
+在子进程中启动服务端（每个连接一个线程的 SyncServer，或 AsyncSyncServer），
+N 个客户端同时连接、保持连接，全部连上后同时进行一次完整同步（时间同步、清单对比、流水线发送），
+每个客户端同步自己的一组小文件。统计：
+- 连接耗时：所有客户端同时发起连接，到全部连上的时间（旧服务端的监听队列只有5）
+- 同步耗时：全部客户端完成同步的时间，以及单个客户端耗时的中位数和 P95
+- 服务端进程的线程数峰值和内存（RSS）峰值，服务端收到的文件数和数据库中的文件记录数
+  （每个连接各自打开数据库时，并发写入可能出现 database is locked，文件已写入但没有记录）
+
+使用方法:
+    cd sync
+    python benchmarks/concurrency_benchmark.py
+    python benchmarks/concurrency_benchmark.py --clients 500 --files 10 --modes asyncio
+"""
+
+import argparse
+import logging
+import multiprocessing
+import shutil
+import socket
+import sqlite3
+import statistics
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from common import SYNC_DIR, count_files, make_tree
+from async_server import AsyncSyncServer  # noqa: E402
+from client import SyncClient  # noqa: E402
+from config import logger  # noqa: E402
+from server import SyncServer  # noqa: E402
+from utils import configure_socket, send_data  # noqa: E402
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+def free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def run_server(mode, port, root, peak_threads, peak_rss_kb):
+    """服务端子进程：启动服务端，并每10ms记录线程数和内存峰值"""
+    logger.setLevel(logging.WARNING)
+
+    def sample():
+        while True:
+            peak_threads.value = max(peak_threads.value, threading.active_count())
+            if resource is not None:
+                peak_rss_kb.value = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            time.sleep(0.01)
+
+    threading.Thread(target=sample, daemon=True).start()
+    server_class = AsyncSyncServer if mode == "asyncio" else SyncServer
+    server = server_class(port=port, log_dir=root / "logs", sync_dir=root / "sync", data_dir=root / "data")
+    server.start()
+
+
+def wait_listening(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError("服务端没有启动")
+
+
+def run_client(client_root, data_dir, port, connected, results, index):
+    """一个客户端：连接，等待所有客户端连上，然后同步"""
+    client = SyncClient('127.0.0.1', port, exclude_config=SYNC_DIR / "exclude.conf",
+                        sync_dir=client_root, data_dir=data_dir)
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    configure_socket(sock)
+    waited = False
+    try:
+        started = time.perf_counter()
+        sock.connect(('127.0.0.1', port))
+        connect_time = time.perf_counter() - started
+        waited = True
+        connected.wait()
+
+        started = time.perf_counter()
+        client.sync_time(sock)
+        client.sync_files(sock, client.compare_manifest(sock) or [])
+        send_data(sock, '{"type": "close"}')
+        results[index] = (connect_time, time.perf_counter() - started)
+    except Exception as e:
+        logger.error(f"客户端 {index} 同步失败: {str(e)}")
+        if not waited:
+            connected.wait()
+    finally:
+        sock.close()
+        client.db.close()
+
+
+def run_once(mode, tmp, client_roots, files):
+    """测试一种服务端，返回统计结果"""
+    root = tmp / mode
+    for name in ("sync", "data", "logs"):
+        (root / name).mkdir(parents=True)
+    port = free_port()
+    peak_threads = multiprocessing.Value('i', 0)
+    peak_rss_kb = multiprocessing.Value('l', 0)
+    process = multiprocessing.Process(target=run_server, args=(mode, port, root, peak_threads, peak_rss_kb))
+    process.start()
+    try:
+        wait_listening(port)
+
+        clients = len(client_roots)
+        results = [None] * clients
+        # 所有客户端连上（或失败）后同时开始同步
+        connected = threading.Barrier(clients + 1)
+        threads = []
+        for index, client_root in enumerate(client_roots):
+            data_dir = tmp / "client_data" / mode / str(index)
+            data_dir.mkdir(parents=True)
+            thread = threading.Thread(target=run_client,
+                                      args=(client_root, data_dir, port, connected, results, index))
+            thread.start()
+            threads.append(thread)
+        connected.wait()
+        sync_started = time.perf_counter()
+        for thread in threads:
+            thread.join()
+        sync_elapsed = time.perf_counter() - sync_started
+    finally:
+        process.terminate()
+        process.join()
+
+    with sqlite3.connect(root / "data" / "file_sync.db") as conn:
+        recorded = conn.execute('SELECT COUNT(*) FROM files').fetchone()[0]
+    done = [result for result in results if result is not None]
+    connect_times = sorted(result[0] for result in done) or [0]
+    sync_times = sorted(result[1] for result in done) or [0]
+    return {
+        "ok": len(done),
+        "connect_max": connect_times[-1],
+        "elapsed": sync_elapsed,
+        "p50": statistics.median(sync_times),
+        "p95": sync_times[min(len(sync_times) - 1, int(len(sync_times) * 0.95))],
+        "threads": peak_threads.value,
+        "rss_mb": peak_rss_kb.value / 1024,
+        "received": count_files(root / "sync"),
+        "recorded": recorded,
+        "expected": clients * files,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="服务端并发连接测试")
+    parser.add_argument("--clients", type=int, default=200, help="同时连接的客户端数量")
+    parser.add_argument("--files", type=int, default=20, help="每个客户端同步的文件数量")
+    parser.add_argument("--size", type=int, default=4096, help="每个文件的大小（字节）")
+    parser.add_argument("--modes", nargs="+", default=["threaded", "asyncio"], choices=["threaded", "asyncio"],
+                        help="测试的服务端实现")
+    args = parser.parse_args()
+    logger.setLevel(logging.WARNING)
+
+    tmp = Path(tempfile.mkdtemp(prefix="sync_concurrency_bench_"))
+    try:
+        # 每个客户端的文件放在各自的子目录中，同步到服务端后互不覆盖
+        client_roots = []
+        for index in range(args.clients):
+            client_root = tmp / "clients" / str(index)
+            make_tree(client_root / f"client{index:04d}", args.files, args.size, seed=index)
+            client_roots.append(client_root)
+
+        print(f"{args.clients} 个客户端，每个同步 {args.files} 个 {args.size} 字节的文件")
+        print(f"{'服务端':<9} {'成功':>5} {'最慢连接(s)':>11} {'同步(s)':>8} {'文件/秒':>8} {'P50(s)':>7} {'P95(s)':>7} "
+              f"{'线程峰值':>8} {'RSS(MB)':>8} {'收到文件':>9} {'数据库记录':>9}")
+        for mode in args.modes:
+            r = run_once(mode, tmp, client_roots, args.files)
+            print(f"{mode:<9} {r['ok']:>5} {r['connect_max']:>11.2f} {r['elapsed']:>8.2f} "
+                  f"{r['received'] / r['elapsed']:>8.0f} {r['p50']:>7.2f} {r['p95']:>7.2f} "
+                  f"{r['threads']:>8} {r['rss_mb']:>8.1f} {r['received']:>5}/{r['expected']} {r['recorded']:>9}")
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
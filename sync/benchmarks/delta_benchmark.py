@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+增量传输性能测试
+
+服务端已有一个大文件，客户端的副本分散修改了一部分内容（原地覆盖、插入和删除各占一部分），
+分别用完整传输和增量传输同步，比较双向传输的字节数和耗时。
+
+使用方法:
+    cd sync
+    python benchmarks/delta_benchmark.py
+    python benchmarks/delta_benchmark.py --size-mb 200 --edit-percent 1 --edits 200 --rtt 20
+"""
+
+import argparse
+import os
+import random
+import time
+
+from common import SyncPair
+
+
+def make_files(pair, size, edit_percent, edits, seed):
+    """生成服务端原文件和客户端修改后的文件"""
+    rng = random.Random(seed)
+    original = rng.randbytes(size)
+    modified = bytearray(original)
+    edit_size = max(1, int(size * edit_percent / 100 / edits))
+    for _ in range(edits):
+        position = rng.randrange(len(modified) - edit_size)
+        kind = rng.random()
+        if kind < 0.6:
+            modified[position:position + edit_size] = rng.randbytes(edit_size)
+        elif kind < 0.8:
+            modified[position:position] = rng.randbytes(edit_size)
+        else:
+            del modified[position:position + edit_size]
+    (pair.server_root / "dump.sql").write_bytes(original)
+    (pair.client_root / "dump.sql").write_bytes(modified)
+    # 服务端文件改为一小时前修改，否则大小相近时 compare_files 认为文件未变化
+    old_time = time.time() - 3600
+    os.utime(pair.server_root / "dump.sql", (old_time, old_time))
+    return len(modified)
+
+
+def run_once(delta, args):
+    pair = SyncPair(rtt_ms=args.rtt)
+    try:
+        new_size = make_files(pair, args.size_mb * 1024 * 1024, args.edit_percent, args.edits, args.seed)
+        server = pair.create_server()
+        client = pair.create_client()
+        client.delta_transfer = delta
+        files_to_sync = client.compare_files(server.db_path)
+
+        sock = pair.connect()
+        started = time.perf_counter()
+        client.sync_files(sock, files_to_sync)
+        elapsed = time.perf_counter() - started
+        pair.disconnect(sock)
+
+        synced = (pair.server_root / "dump.sql").read_bytes() == (pair.client_root / "dump.sql").read_bytes()
+        return new_size, dict(pair.proxy.bytes), elapsed, synced
+    finally:
+        pair.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="增量传输性能测试")
+    parser.add_argument("--size-mb", type=int, default=200, help="文件大小（MB）")
+    parser.add_argument("--edit-percent", type=float, default=1.0, help="修改的数据占文件大小的百分比")
+    parser.add_argument("--edits", type=int, default=100, help="修改的位置数")
+    parser.add_argument("--rtt", type=float, default=0, help="模拟的往返时延（毫秒）")
+    parser.add_argument("--seed", type=int, default=1, help="随机种子")
+    args = parser.parse_args()
+
+    print(f"{'方式':<6} {'文件(MB)':>9} {'上行(MB)':>9} {'下行(MB)':>9} {'耗时(s)':>8} {'一致':>4}")
+    for delta in (False, True):
+        new_size, transferred, elapsed, synced = run_once(delta, args)
+        print(f"{'增量' if delta else '完整':<6} {new_size / 1048576:>9.1f} {transferred['up'] / 1048576:>9.2f} "
+              f"{transferred['down'] / 1048576:>9.2f} {elapsed:>8.2f} {'是' if synced else '否':>4}")
+
+
+if __name__ == "__main__":
+    main()
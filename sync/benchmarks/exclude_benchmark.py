@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+排除规则匹配性能测试
+
+随机生成一批相对路径（默认100万个）和一份较大的排除规则，对比原来逐条检查列表的实现和
+ExcludeMatcher 的每秒路径数，并检查两者在不含通配符的规则下结果一致。
+原实现较慢，只用前 --baseline-paths 个路径计时。
+
+使用方法:
+    cd sync
+    python benchmarks/exclude_benchmark.py
+    python benchmarks/exclude_benchmark.py --paths 100000 --path-rules 10000 --globs 200
+"""
+
+import argparse
+import random
+import time
+from pathlib import Path
+
+import common  # noqa: F401  设置导入路径
+from exclude import ExcludeMatcher  # noqa: E402
+
+
+def linear_exclude(path, extensions, directories, paths):
+    """原来的 SyncClient.should_exclude_file（去掉日志）"""
+    str_path = str(path)
+    for excluded_path in paths:
+        if str_path == excluded_path or str_path.startswith(excluded_path + '/'):
+            return True
+    if Path(path).suffix.lower() in extensions:
+        return True
+    for part in Path(path).parts:
+        if part in directories:
+            return True
+    return False
+
+
+def make_rules(rng, names, path_rules, dir_rules, ext_rules, globs):
+    extensions = ['.db', '.log', '.pyc'] + [f'.x{i}' for i in range(ext_rules)]
+    directories = ['__pycache__', '.git', 'node_modules'] + [f'skip{i}' for i in range(dir_rules)]
+    paths = ['/'.join(rng.choice(names) for _ in range(rng.randint(2, 4))) for _ in range(path_rules)]
+    patterns = [f'*.tmp{i}' for i in range(globs // 2)] + [f'build{i}/*' for i in range(globs - globs // 2)]
+    return extensions, directories, paths, patterns
+
+
+def make_paths(rng, names, count):
+    suffixes = ['.py', '.txt', '.db', '.log', '.tsx', '.json', '.pyc', '', '.x3', '.tmp1']
+    specials = ['__pycache__', '.git', 'node_modules', 'skip5', 'build1']
+    paths = []
+    for _ in range(count):
+        parts = [rng.choice(specials) if rng.random() < 0.02 else rng.choice(names)
+                 for _ in range(rng.randint(0, 5))]
+        parts.append(f'file{rng.randrange(1000)}{rng.choice(suffixes)}')
+        paths.append('/'.join(parts))
+    return paths
+
+
+def timed(name, func, paths):
+    started = time.perf_counter()
+    excluded = sum(1 for path in paths if func(path))
+    elapsed = time.perf_counter() - started
+    print(f"{name:<30} {elapsed:>8.2f} {len(paths) / elapsed:>12.0f} {excluded:>9}")
+    return excluded
+
+
+def main():
+    parser = argparse.ArgumentParser(description="排除规则匹配性能测试")
+    parser.add_argument("--paths", type=int, default=1000000, help="路径数量")
+    parser.add_argument("--baseline-paths", type=int, default=50000, help="原实现计时使用的路径数量")
+    parser.add_argument("--path-rules", type=int, default=2000, help="path: 规则数量")
+    parser.add_argument("--dir-rules", type=int, default=200, help="dir: 规则数量")
+    parser.add_argument("--ext-rules", type=int, default=100, help="ext: 规则数量")
+    parser.add_argument("--globs", type=int, default=50, help="glob: 规则数量")
+    parser.add_argument("--seed", type=int, default=1, help="随机种子")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    names = [f'd{i}' for i in range(50)] + ['src', 'backend', 'frontend', 'sync', 'tests']
+    extensions, directories, paths, patterns = make_rules(
+        rng, names, args.path_rules, args.dir_rules, args.ext_rules, args.globs)
+    sample = make_paths(rng, names, args.paths)
+
+    print(f"{len(sample)} 个路径，规则: {len(extensions)} 个扩展名, {len(directories)} 个目录名, "
+          f"{len(paths)} 个路径, {len(patterns)} 个通配符")
+    print(f"{'方式':<30} {'耗时(s)':>8} {'路径/秒':>12} {'排除数':>9}")
+
+    baseline = sample[:args.baseline_paths]
+    timed("原实现（逐条检查）", lambda p: linear_exclude(p, extensions, directories, paths), baseline)
+    matcher = ExcludeMatcher(extensions, directories, paths)
+    timed("ExcludeMatcher", matcher.match_file, sample)
+    mismatched = [p for p in baseline if matcher.match_file(p) != linear_exclude(p, extensions, directories, paths)]
+    if mismatched:
+        print(f"警告: 与原实现结果不一致，例如 {mismatched[:5]}")
+
+    matcher = ExcludeMatcher(extensions, directories, paths, patterns)
+    timed("ExcludeMatcher（含通配符）", matcher.match_file, sample)
+
+
+if __name__ == "__main__":
+    main()
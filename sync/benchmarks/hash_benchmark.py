@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+文件哈希性能测试
+
+生成一个文件树（默认5万个文件），对比：
+- 原来的实现：逐个文件、4KB 分块、MD5
+- HashEngine：线程池并行，MD5 和 BLAKE2b，首次计算（无缓存）
+- HashEngine：第二次运行，文件未变化，全部命中缓存
+
+文件刚生成，都在页缓存中，结果反映的是CPU开销而不是磁盘读取速度。
+
+使用方法:
+    cd sync
+    python benchmarks/hash_benchmark.py
+    python benchmarks/hash_benchmark.py --files 10000 --size 65536 --workers 1 4 8
+"""
+
+import argparse
+import hashlib
+import os
+import shutil
+import tempfile
+import time
+from pathlib import Path
+
+from common import make_tree
+from database import FileDatabase  # noqa: E402
+from hashing import HashEngine  # noqa: E402
+
+
+def old_hash(path):
+    hash_md5 = hashlib.md5()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(4096), b""):
+            hash_md5.update(chunk)
+    return hash_md5.hexdigest()
+
+
+def list_files(root):
+    paths = []
+    for directory, _, filenames in os.walk(root):
+        for filename in filenames:
+            paths.append(os.path.relpath(os.path.join(directory, filename), root))
+    return paths
+
+
+def report(name, elapsed, files, total):
+    print(f"{name:<28} {elapsed:>8.2f} {files / elapsed:>10.0f} {total / elapsed / 1024 / 1024:>8.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="文件哈希性能测试")
+    parser.add_argument("--files", type=int, default=50000, help="文件数量")
+    parser.add_argument("--size", type=int, default=8192, help="每个文件的大小（字节）")
+    parser.add_argument("--workers", type=int, nargs="+", default=[os.cpu_count() or 1], help="线程数")
+    args = parser.parse_args()
+
+    tmp = Path(tempfile.mkdtemp(prefix="sync_hash_bench_"))
+    try:
+        root = tmp / "tree"
+        total = make_tree(root, args.files, args.size)
+        paths = list_files(root)
+        print(f"{len(paths)} 个文件，共 {total / 1024 / 1024:.0f} MB，CPU核数 {os.cpu_count()}")
+        print(f"{'方式':<28} {'耗时(s)':>8} {'文件/秒':>10} {'MB/秒':>8}")
+
+        started = time.perf_counter()
+        for rel_path in paths:
+            old_hash(root / rel_path)
+        report("原实现 md5 4KB 串行", time.perf_counter() - started, len(paths), total)
+
+        for algorithm in ("md5", "blake2b"):
+            for workers in args.workers:
+                db_path = tmp / f"cache_{algorithm}_{workers}.db"
+                db = FileDatabase(db_path)
+                try:
+                    engine = HashEngine(db, algorithm, workers)
+                    started = time.perf_counter()
+                    engine.hash_files(root, paths)
+                    report(f"{algorithm} {workers}线程 无缓存", time.perf_counter() - started, len(paths), total)
+
+                    started = time.perf_counter()
+                    engine.hash_files(root, paths)
+                    assert engine.misses == 0
+                    report(f"{algorithm} {workers}线程 缓存命中", time.perf_counter() - started, len(paths), total)
+                finally:
+                    db.close()
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+文件清单对比性能测试
+
+先把客户端的文件树完整同步到服务端，然后分别用两种方式找出需要同步的文件：
+- 下载服务端数据库（db_download）后在本地对比
+- 目录 Merkle 树清单对比（manifest）
+
+测试两种场景：没有文件变化；一个目录中有若干文件被修改。统计耗时和经过代理的上下行字节数。
+本机不限速时两种方式的耗时都以构建清单、读取数据库为主，用 --bandwidth 模拟实际链路。
+
+使用方法:
+    cd sync
+    python benchmarks/manifest_benchmark.py
+    python benchmarks/manifest_benchmark.py --files 100000 --changed 20 --rtt 50 --bandwidth 2
+"""
+
+import argparse
+import time
+
+from common import SyncPair, make_tree
+
+
+def measure(pair, client, method):
+    """对比一次，返回 (耗时秒数, 上行字节数, 下行字节数, 需要同步的文件数)"""
+    sock = pair.connect()
+    try:
+        client.sync_time(sock)
+        up, down = pair.proxy.bytes["up"], pair.proxy.bytes["down"]
+        started = time.perf_counter()
+        if method == "manifest":
+            files_to_sync = client.compare_manifest(sock)
+        else:
+            files_to_sync = client.compare_files(client.download_server_db(sock))
+        elapsed = time.perf_counter() - started
+        return elapsed, pair.proxy.bytes["up"] - up, pair.proxy.bytes["down"] - down, len(files_to_sync)
+    finally:
+        pair.disconnect(sock)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="文件清单对比性能测试")
+    parser.add_argument("--files", type=int, default=20000, help="文件数量")
+    parser.add_argument("--size", type=int, default=256, help="每个文件的大小（字节）")
+    parser.add_argument("--changed", type=int, default=10, help="第二个场景中修改的文件数量（同一目录）")
+    parser.add_argument("--rtt", type=float, default=20, help="模拟的往返时延（毫秒）")
+    parser.add_argument("--bandwidth", type=float, default=None, help="每个方向的带宽上限（MB/秒），默认不限速")
+    args = parser.parse_args()
+
+    bandwidth = args.bandwidth * 1024 * 1024 if args.bandwidth else None
+    pair = SyncPair(rtt_ms=args.rtt, bandwidth=bandwidth)
+    try:
+        make_tree(pair.client_root, args.files, args.size)
+        server = pair.create_server()
+        client = pair.create_client()
+
+        # 初始完整同步
+        sock = pair.connect()
+        client.sync_time(sock)
+        client.sync_files(sock, client.compare_manifest(sock))
+        pair.disconnect(sock)
+
+        print(f"{args.files} 个文件，RTT {args.rtt:g}ms，带宽 {f'{args.bandwidth:g}MB/s' if args.bandwidth else '不限'}")
+        print(f"{'场景':<10} {'方式':<12} {'耗时(s)':>8} {'上行KB':>9} {'下行KB':>9} {'需同步':>7}")
+
+        def run(scenario):
+            for method in ("db_download", "manifest"):
+                elapsed, up, down, count = measure(pair, client, method)
+                print(f"{scenario:<10} {method:<12} {elapsed:>8.3f} {up / 1024:>9.1f} {down / 1024:>9.1f} {count:>7}")
+
+        run("无变化")
+
+        for path in sorted((pair.client_root / "dir0000").iterdir())[:args.changed]:
+            path.write_bytes(path.read_bytes() + b"changed" * 4)
+        client.scan_parent_directory()
+        run(f"修改{args.changed}个")
+    finally:
+        pair.close()
+
+
+if __name__ == "__main__":
+    main()
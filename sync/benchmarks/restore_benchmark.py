@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+文件恢复测试
+
+生成一个文件树（默认2万个文件），每个文件有若干个备份版本（存入 BackupStore，不压缩，备份时间相隔1小时），
+然后按包含所有版本的时间范围恢复（每个文件恢复为最新的备份版本），对比：
+- 原来的实现：按时间范围取出所有备份记录，在 Python 中保留每个文件最新的一条，逐个 shutil.copy2，逐条写数据库
+- FileRestorer：get_backup_catalog 一次窗口查询，线程池并行复制（copy_file_range），一个事务写数据库
+另外给出只恢复一个目录、试运行和再次恢复（文件已是该版本，全部跳过）的耗时。
+
+使用方法:
+    cd sync
+    python benchmarks/restore_benchmark.py
+    python benchmarks/restore_benchmark.py --files 100000 --versions 5 --workers 1 8 16
+"""
+
+import argparse
+import logging
+import os
+import shutil
+import tempfile
+import time
+from pathlib import Path
+
+import common
+from common import make_tree
+from restorer import FileRestorer  # noqa: E402
+
+
+def populate(restorer, tree, versions):
+    """为 tree 中的每个文件写入 versions 个备份版本
+
+    Returns:
+        (第一个版本的备份时间, 文件数)
+    """
+    paths = sorted(str(path.relative_to(tree)) for path in tree.rglob("*") if path.is_file())
+    base = time.time() - versions * 3600
+    rows = []
+    for version in range(versions):
+        for rel_path in paths:
+            full_path = tree / rel_path
+            with open(full_path, "r+b") as f:
+                f.write(f"{version:08d}".encode())
+            stat = full_path.stat()
+            key, object_path, _ = restorer.backup_store.put(full_path)
+            rows.append((rel_path, restorer.backup_store.relative_path(object_path), stat.st_size, stat.st_mtime,
+                         base + version * 3600, key, key))
+    restorer.db.cursor.executemany('''
+    INSERT INTO backup_files (original_path, backup_path, size, modified_time, backup_time, hash, object_key)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', rows)
+    restorer.db.conn.commit()
+    return base, len(paths)
+
+
+def old_restore(restorer, start_time, end_time):
+    """原来的 restore_files_by_time_range"""
+    backup_files = restorer.db.get_backup_files_by_time_range(start_time, end_time)
+    latest_backups = {}
+    for backup in backup_files:
+        original_path = backup['original_path']
+        if original_path not in latest_backups or backup['backup_time'] > latest_backups[original_path]['backup_time']:
+            latest_backups[original_path] = backup
+    restored_count = 0
+    for original_path, backup in latest_backups.items():
+        full_dest_path = restorer.sync_dir / original_path
+        backup_path = restorer.data_dir / backup['backup_path']
+        if not backup_path.exists():
+            continue
+        full_dest_path.parent.mkdir(parents=True, exist_ok=True)
+        shutil.copy2(backup_path, full_dest_path)
+        os.utime(full_dest_path, (time.time(), backup['modified_time']))
+        restorer.db.cursor.execute('''
+        INSERT OR REPLACE INTO files (path, size, modified_time, hash, last_sync_time)
+        VALUES (?, ?, ?, ?, ?)
+        ''', (original_path, backup['size'], backup['modified_time'], backup['hash'], time.time()))
+        restored_count += 1
+    restorer.db.conn.commit()
+    return restored_count
+
+
+def touch_all(tree):
+    """修改所有文件的修改时间，使下一次恢复不能跳过"""
+    now = time.time()
+    for path in tree.rglob("*"):
+        if path.is_file():
+            os.utime(path, (now, now))
+
+
+def timed(func, *args, **kwargs):
+    started = time.perf_counter()
+    result = func(*args, **kwargs)
+    return time.perf_counter() - started, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="文件恢复测试")
+    parser.add_argument("--files", type=int, default=20000, help="文件数量")
+    parser.add_argument("--size", type=int, default=8192, help="每个文件的大小（字节）")
+    parser.add_argument("--versions", type=int, default=5, help="每个文件的备份版本数")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 8], help="并行恢复的线程数")
+    args = parser.parse_args()
+    common.logger.setLevel(logging.WARNING)
+
+    tmp = Path(tempfile.mkdtemp(prefix="sync_restore_bench_"))
+    try:
+        tree = tmp / "tree"
+        make_tree(tree, args.files, args.size, seed=1)
+        (tmp / "data").mkdir()
+        restorer = FileRestorer(sync_dir=tree, data_dir=tmp / "data")
+        restorer.backup_store.codec = None
+        base, files = populate(restorer, tree, args.versions)
+        # 包含所有版本的时间范围，每个文件恢复为其中最新的版本
+        start, end = base - 1, time.time()
+        print(f"{files} 个文件，每个 {args.versions} 个备份版本")
+        print(f"{'方式':<34} {'耗时(s)':>8} {'文件数':>8} {'文件/秒':>9}")
+
+        def report(name, elapsed, count):
+            print(f"{name:<34} {elapsed:>8.2f} {count:>8} {count / elapsed if elapsed else 0:>9.0f}")
+
+        elapsed, backups = timed(restorer.db.get_backup_files_by_time_range, start, end)
+        report("原来：按时间范围查询全部记录", elapsed, len(backups))
+        elapsed, catalog = timed(restorer.db.get_backup_catalog, start, end)
+        report("get_backup_catalog", elapsed, len(catalog))
+
+        touch_all(tree)
+        report("原来的实现（逐个 copy2）", *timed(old_restore, restorer, start, end))
+        for workers in args.workers:
+            touch_all(tree)
+            elapsed, _ = timed(restorer.restore_backups, restorer.db.get_backup_catalog(start, end), workers=workers)
+            report(f"FileRestorer（{workers} 线程）", elapsed, files)
+
+        report("FileRestorer 再次恢复（全部跳过）", *timed(restorer.restore_files_by_time_range, start, end))
+        report("FileRestorer 试运行", *timed(restorer.restore_files_by_time_range, start, end, dry_run=True))
+        touch_all(tree)
+        report("FileRestorer 只恢复 dir0000", *timed(restorer.restore_files_by_time_range, start, end,
+                                                     path_prefix="dir0000"))
+        restorer.close()
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+文件传输吞吐量测试
+
+在本机（不经过延迟代理）同步一批大小混合的文件（默认共1GB：大文件、1MB文件、16KB小文件各占一部分），
+对比不同传输配置下 sync_files 阶段的吞吐量和CPU时间（服务端和客户端在同一进程中）：
+- 原来的方式：4KB 缓冲区循环读写，不用 sendfile，系统默认 socket 选项
+- 当前配置：socket.sendfile 发送，1MB 缓冲区 recv_into，TCP_NODELAY，4MB socket 缓冲区
+
+协议1在原来的方式下每个小文件都要等待 Nagle 算法和延迟确认（约40ms），1GB 时需要约10分钟。
+
+使用方法:
+    cd sync
+    python benchmarks/transfer_benchmark.py
+    python benchmarks/transfer_benchmark.py --total-mb 256 --protocol 1 2
+"""
+
+import argparse
+import shutil
+import tempfile
+import time
+from pathlib import Path
+
+from common import SyncPair, count_files, make_tree
+import server as server_module  # noqa: E402
+import utils  # noqa: E402
+
+CONFIGS = {
+    "原来的方式": {"USE_SENDFILE": False, "TRANSFER_BUFFER_SIZE": 4096, "TCP_NODELAY": False, "SOCKET_BUFFER_SIZE": None},
+    "当前配置": {},
+}
+
+
+def apply_config(overrides):
+    """修改传输配置（utils 和 server 模块中导入的常量）"""
+    saved = {}
+    for name, value in overrides.items():
+        for module in (utils, server_module):
+            if hasattr(module, name):
+                saved[(module, name)] = getattr(module, name)
+                setattr(module, name, value)
+    return saved
+
+
+def make_mixed_tree(root, total_mb):
+    """大文件（64MB）、1MB文件、16KB文件分别约占 60%、30%、10%"""
+    total = total_mb * 1024 * 1024
+    size = 0
+    size += make_tree(root / "large", max(1, int(total * 0.6) // (64 << 20)), 64 << 20, seed=1)
+    size += make_tree(root / "medium", int(total * 0.3) // (1 << 20), 1 << 20, seed=2)
+    size += make_tree(root / "small", int(total * 0.1) // (16 << 10), 16 << 10, seed=3)
+    return size
+
+
+def run_once(tree, protocol, overrides):
+    """同步一次，返回 (耗时秒数, CPU秒数, 服务端收到的文件数)"""
+    saved = apply_config(overrides)
+    pair = SyncPair(proxy=False)
+    try:
+        pair.client_root = tree
+        pair.create_server()
+        client = pair.create_client()
+        client.protocol_version = protocol
+        client.delta_transfer = False
+        files_to_sync = client.compare_files(pair.server.db_path)
+
+        sock = pair.connect()
+        started = time.perf_counter()
+        cpu_started = time.process_time()
+        client.sync_files(sock, files_to_sync)
+        elapsed = time.perf_counter() - started
+        cpu = time.process_time() - cpu_started
+        pair.disconnect(sock)
+        return elapsed, cpu, count_files(pair.server_root)
+    finally:
+        pair.close()
+        for (module, name), value in saved.items():
+            setattr(module, name, value)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="文件传输吞吐量测试")
+    parser.add_argument("--total-mb", type=int, default=1024, help="文件总大小（MB）")
+    parser.add_argument("--protocol", type=int, nargs="+", default=[2], help="测试的协议版本")
+    args = parser.parse_args()
+
+    tmp = Path(tempfile.mkdtemp(prefix="sync_transfer_bench_"))
+    try:
+        tree = tmp / "tree"
+        total = make_mixed_tree(tree, args.total_mb)
+        files = count_files(tree)
+        print(f"{files} 个文件，共 {total / 1024 / 1024:.0f} MB")
+        print(f"{'配置':<12} {'协议':>4} {'耗时(s)':>8} {'MB/秒':>8} {'CPU(s)':>8}")
+        for protocol in args.protocol:
+            for name, overrides in CONFIGS.items():
+                elapsed, cpu, received = run_once(tree, protocol, overrides)
+                if received != files:
+                    print(f"警告: 服务端只收到 {received}/{files} 个文件")
+                print(f"{name:<12} {protocol:>4} {elapsed:>8.2f} {total / elapsed / 1024 / 1024:>8.0f} {cpu:>8.2f}")
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
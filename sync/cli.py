@@ -12,6 +12,7 @@ from datetime import datetime
 
 from config import DEFAULT_PORT, logger
 from server import SyncServer
+from async_server import AsyncSyncServer
 from client import SyncClient
 from restorer import FileRestorer
 
@@ -40,7 +41,7 @@ def start_server_interactive():
     if not log_dir:
         log_dir = None
 
-    server = SyncServer(port=port, log_dir=log_dir)
+    server = AsyncSyncServer(port=port, log_dir=log_dir)
     server.start()
 
 def start_client_interactive():
@@ -65,6 +66,7 @@ def restore_files_interactive():
     print("=" * 30)
     print("请选择恢复方式:")
     print("1. 按时间范围恢复")
+    print("2. 恢复到某个时间点")
     print("0. 返回")
 
     choice = input("请选择: ")
@@ -83,6 +85,21 @@ def restore_files_interactive():
             restorer.close()
         except ValueError:
             print("时间格式错误，请使用 YYYY-MM-DD HH:MM:SS 格式")
+    elif choice == "2":
+        # 恢复到某个时间点
+        as_of_str = input("请输入时间点 (格式: YYYY-MM-DD HH:MM:SS): ")
+        path_prefix = input("只恢复该目录下的文件（直接回车恢复所有文件）: ").strip() or None
+
+        try:
+            as_of = datetime.strptime(as_of_str, "%Y-%m-%d %H:%M:%S").timestamp()
+
+            restorer = FileRestorer()
+            restorer.restore_to_time(as_of, path_prefix=path_prefix, dry_run=True)
+            if input("确认恢复以上文件? (y/n): ").strip().lower() == "y":
+                restorer.restore_to_time(as_of, path_prefix=path_prefix)
+            restorer.close()
+        except ValueError:
+            print("时间格式错误，请使用 YYYY-MM-DD HH:MM:SS 格式")
     elif choice == "0":
         return
     else:
@@ -97,8 +114,14 @@ def parse_args():
     parser.add_argument("--server-ip", help="服务端IP地址")
     parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="服务端端口")
     parser.add_argument("--log-dir", help="日志目录")
+    parser.add_argument("--threaded", action="store_true", help="服务端使用每个连接一个线程的旧实现")
+    parser.add_argument("--no-compression", action="store_true", help="客户端传输时不压缩（如高速局域网）")
+    parser.add_argument("--gc-backups", action="store_true", help="执行备份保留策略并清理未引用的备份对象")
     parser.add_argument("--start-time", help="恢复文件的开始时间 (格式: YYYY-MM-DD HH:MM:SS)")
     parser.add_argument("--end-time", help="恢复文件的结束时间 (格式: YYYY-MM-DD HH:MM:SS)")
+    parser.add_argument("--as-of", help="把文件恢复为该时间点的内容，替代开始和结束时间 (格式: YYYY-MM-DD HH:MM:SS)")
+    parser.add_argument("--path", help="只恢复该目录（相对于同步目录）下的文件")
+    parser.add_argument("--dry-run", action="store_true", help="只列出将要恢复的文件，不写入")
 
     return parser.parse_args()
 
@@ -108,7 +131,8 @@ def run_cli():
 
     # 通过命令行参数启动
     if args.server:
-        server = SyncServer(port=args.port, log_dir=args.log_dir)
+        server_class = SyncServer if args.threaded else AsyncSyncServer
+        server = server_class(port=args.port, log_dir=args.log_dir)
         server.start()
     elif args.client:
         if not args.server_ip:
@@ -116,21 +140,37 @@ def run_cli():
             return
 
         client = SyncClient(server_ip=args.server_ip, port=args.port)
+        if args.no_compression:
+            client.compression_algorithms = []
         client.start()
     elif args.restore:
-        if not args.start_time or not args.end_time:
-            print("恢复文件需要指定开始时间和结束时间")
+        if not args.as_of and (not args.start_time or not args.end_time):
+            print("恢复文件需要指定开始时间和结束时间，或者用 --as-of 指定时间点")
             return
 
         try:
-            start_time = datetime.strptime(args.start_time, "%Y-%m-%d %H:%M:%S").timestamp()
-            end_time = datetime.strptime(args.end_time, "%Y-%m-%d %H:%M:%S").timestamp()
-
             restorer = FileRestorer()
-            restorer.restore_files_by_time_range(start_time, end_time)
-            restorer.close()
+            try:
+                if args.as_of:
+                    as_of = datetime.strptime(args.as_of, "%Y-%m-%d %H:%M:%S").timestamp()
+                    restorer.restore_to_time(as_of, path_prefix=args.path, dry_run=args.dry_run)
+                else:
+                    start_time = datetime.strptime(args.start_time, "%Y-%m-%d %H:%M:%S").timestamp()
+                    end_time = datetime.strptime(args.end_time, "%Y-%m-%d %H:%M:%S").timestamp()
+                    restorer.restore_files_by_time_range(start_time, end_time, path_prefix=args.path,
+                                                         dry_run=args.dry_run)
+            finally:
+                restorer.close()
         except ValueError:
             print("时间格式错误，请使用 YYYY-MM-DD HH:MM:SS 格式")
+    elif args.gc_backups:
+        restorer = FileRestorer()
+        try:
+            stats = restorer.maintain_backups()
+            print(f"删除过期备份记录 {stats['pruned']} 条，释放 {stats['freed_bytes'] / 1024 / 1024:.1f} MB，"
+                  f"现有备份对象 {stats['objects']} 个（{stats['bytes'] / 1024 / 1024:.1f} MB）")
+        finally:
+            restorer.close()
     else:
         # 交互式菜单
         while True:
@@ -12,38 +12,70 @@ import socket
 import json
 import sqlite3
 import os
+import tempfile
+import threading
 from pathlib import Path
 
+from compression import (
+    CompressionPolicy, END_OF_FRAMES, available_codecs, choose_codec, get_codec, pack_frame, send_compressed
+)
 from config import (
-    DEFAULT_PORT, DEFAULT_BUFFER_SIZE, DEFAULT_TIME_THRESHOLD, DEFAULT_SIZE_THRESHOLD, 
-    logger, load_exclude_config, EXCLUDED_EXTENSIONS, EXCLUDED_DIRECTORIES, EXCLUDED_PATHS
+    DEFAULT_PORT, DEFAULT_TIME_THRESHOLD, DEFAULT_SIZE_THRESHOLD, 
+    PROTOCOL_VERSION, SMALL_FILE_SIZE, DELTA_MIN_SIZE, DELTA_SPOOL_SIZE,
+    logger, EXCLUDED_EXTENSIONS, EXCLUDED_DIRECTORIES, EXCLUDED_PATHS
 )
 from database import FileDatabase
-from utils import calculate_file_hash, send_data, receive_data, parse_json_response
+from delta import compute_delta
+from exclude import ExcludeMatcher
+from manifest import Manifest, child_path
+from hashing import DEFAULT_HASH_ALGORITHM, HashEngine, choose_hash_algorithm
+from utils import (
+    configure_socket, send_data, receive_data, receive_exact, parse_json_response, send_record_header, send_file,
+    receive_to_file,
+    END_OF_RECORDS, DELTA_RECORD, COMPRESSED_RECORD
+)
 
 class SyncClient:
     """同步客户端"""
 
-    def __init__(self, server_ip, port=DEFAULT_PORT, exclude_config='exclude.conf'):
+    def __init__(self, server_ip, port=DEFAULT_PORT, exclude_config='exclude.conf', sync_dir=None, data_dir=None):
         """初始化客户端
 
         Args:
             server_ip: 服务端IP地址
             port: 服务端端口
             exclude_config: 排除配置文件路径
+            sync_dir: 同步目录，默认为脚本所在目录的上一级目录
+            data_dir: 数据库所在目录，默认为脚本所在目录
         """
         self.server_ip = server_ip
         self.port = port
 
         # 获取当前脚本所在目录
         self.script_dir = Path(__file__).resolve().parent
-
-        # 加载排除规则
-        self.excluded_extensions, self.excluded_directories, self.excluded_paths = load_exclude_config(exclude_config)
-        logger.info(f"已加载排除规则: {len(self.excluded_extensions)} 个扩展名, {len(self.excluded_directories)} 个目录, {len(self.excluded_paths)} 个路径")
+        self.sync_dir = Path(sync_dir) if sync_dir else self.script_dir.parent
+        self.data_dir = Path(data_dir) if data_dir else self.script_dir
+
+        # 文件传输协议版本，服务端不支持时自动降级为1
+        self.protocol_version = PROTOCOL_VERSION
+        # 服务端已有的较大文件只发送变化的部分（需要协议版本3）
+        self.delta_transfer = True
+        # 文件哈希算法，时间同步时按服务端支持的算法选择
+        self.hash_algorithm = DEFAULT_HASH_ALGORITHM
+        # 启用的传输压缩算法（按优先顺序，空列表表示不压缩）和压缩级别（None 表示按配置）
+        self.compression_algorithms = available_codecs()
+        self.compression_level = None
+        # 时间同步时选择的压缩算法，服务端是否接受压缩的消息
+        self.compression = None
+        self.compress_messages = False
+
+        # 加载并编译排除规则，目录扫描和文件对比共用
+        self.exclude = ExcludeMatcher.from_config(exclude_config)
+        logger.info(f"已加载排除规则: {len(self.exclude.extensions)} 个扩展名, {len(self.exclude.directories)} 个目录, "
+                    f"共 {self.exclude.rule_count} 条规则")
 
         # 初始化数据库
-        self.db = FileDatabase(self.script_dir / "file_sync_client.db")
+        self.db = FileDatabase(self.data_dir / "file_sync_client.db")
 
         # 时间差值
         self.time_diff = 0
@@ -55,9 +87,8 @@ class SyncClient:
 
     def scan_parent_directory(self):
         """扫描上一级目录"""
-        parent_dir = self.script_dir.parent
-        logger.info(f"开始扫描上一级目录: {parent_dir}")
-        file_count = self.db.scan_directory(parent_dir)
+        logger.info(f"开始扫描上一级目录: {self.sync_dir}")
+        file_count = self.db.scan_directory(self.sync_dir, self.exclude.match_file, self.exclude.match_directory)
         logger.info(f"扫描完成，共发现 {file_count} 个文件")
 
     def start(self):
@@ -78,23 +109,27 @@ class SyncClient:
                     
                     # 创建新的socket连接
                     client_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+                    configure_socket(client_socket)
                     client_socket.connect((self.server_ip, self.port))
                     logger.info(f"已连接到服务端: {self.server_ip}:{self.port}")
 
                     # 同步时间
                     self.sync_time(client_socket)
 
-                    # 下载服务端数据库
-                    server_db_path = self.download_server_db(client_socket)
+                    # 对比文件清单，找出需要同步的文件
+                    files_to_sync = self.compare_manifest(client_socket)
+
+                    if files_to_sync is None:
+                        # 旧服务端不支持清单对比，下载服务端数据库
+                        server_db_path = self.download_server_db(client_socket)
 
-                    if not server_db_path:
-                        retry_count += 1
-                        logger.warning(f"下载服务端数据库失败，尝试重试 ({retry_count}/{max_retries})...")
-                        time.sleep(2)  # 等待2秒后重试
-                        continue
+                        if not server_db_path:
+                            retry_count += 1
+                            logger.warning(f"下载服务端数据库失败，尝试重试 ({retry_count}/{max_retries})...")
+                            time.sleep(2)  # 等待2秒后重试
+                            continue
 
-                    # 对比文件清单，找出需要同步的文件
-                    files_to_sync = self.compare_files(server_db_path)
+                        files_to_sync = self.compare_files(server_db_path)
 
                     # 同步文件
                     self.sync_files(client_socket, files_to_sync)
@@ -159,7 +194,8 @@ class SyncClient:
         # 发送时间同步请求
         request = {
             "type": "time_sync",
-            "client_time": time.time()
+            "client_time": time.time(),
+            "compression": self.compression_algorithms
         }
         send_data(client_socket, json.dumps(request))
 
@@ -180,7 +216,13 @@ class SyncClient:
             return 0
 
         self.time_diff = response.get("time_diff", 0)
-        logger.info(f"时间同步完成，时间差: {self.time_diff:.2f}秒")
+        # 旧服务端不返回支持的哈希算法，使用MD5
+        self.hash_algorithm = choose_hash_algorithm(response.get("hash_algorithms"))
+        # 旧服务端不返回支持的压缩算法，不压缩
+        self.compression = choose_codec(self.compression_algorithms, response.get("compression"))
+        self.compress_messages = self.compression is not None
+        logger.info(f"时间同步完成，时间差: {self.time_diff:.2f}秒，哈希算法: {self.hash_algorithm}，"
+                    f"压缩算法: {self.compression or '无'}")
         return self.time_diff
 
     def download_server_db(self, client_socket):
@@ -227,7 +269,7 @@ class SyncClient:
 
             # 接收数据库文件
             logger.info("开始接收数据库文件...")
-            server_db_path = self.script_dir / "server_file_sync.db"
+            server_db_path = self.data_dir / "server_file_sync.db"
             
             # 设置socket超时
             original_timeout = client_socket.gettimeout()
@@ -235,31 +277,13 @@ class SyncClient:
             
             try:
                 with open(server_db_path, 'wb') as f:
-                    received_size = 0
-                    last_log_time = time.time()
-                    
-                    while received_size < file_size:
-                        try:
-                            chunk = client_socket.recv(min(DEFAULT_BUFFER_SIZE, file_size - received_size))
-                            if not chunk:
-                                logger.warning("接收数据库文件时连接关闭")
-                                break
-                                
-                            f.write(chunk)
-                            received_size += len(chunk)
-                            
-                            # 每秒记录一次进度
-                            current_time = time.time()
-                            if current_time - last_log_time >= 1:
-                                logger.info(f"已接收 {received_size}/{file_size} 字节 ({received_size/file_size*100:.1f}%)")
-                                last_log_time = current_time
-                                
-                        except socket.timeout:
-                            logger.warning("接收数据库文件时超时")
-                            break
-                        except Exception as e:
-                            logger.error(f"接收数据库文件时发生错误: {str(e)}")
-                            break
+                    try:
+                        receive_to_file(client_socket, file_size, f)
+                    except socket.timeout:
+                        logger.warning("接收数据库文件时超时")
+                    except Exception as e:
+                        logger.error(f"接收数据库文件时发生错误: {str(e)}")
+                    received_size = f.tell()
             finally:
                 # 恢复原始超时设置
                 client_socket.settimeout(original_timeout)
@@ -287,27 +311,18 @@ class SyncClient:
         Returns:
             如果文件应该被排除，返回True，否则返回False
         """
-        # 检查特定路径
-        str_path = str(path)
-        for excluded_path in self.excluded_paths:
-            if str_path == excluded_path or str_path.startswith(excluded_path + '/'):
-                logger.debug(f"排除文件(路径匹配): {path}")
-                return True
-        
-        # 检查文件扩展名
-        suffix = Path(path).suffix.lower()
-        if suffix in self.excluded_extensions:
-            logger.debug(f"排除文件(扩展名匹配): {path}")
-            return True
-        
-        # 检查目录名
-        parts = Path(path).parts
-        for part in parts:
-            if part in self.excluded_directories:
-                logger.debug(f"排除文件(目录匹配): {path}")
-                return True
-        
-        return False
+        return self.exclude.match_file(path)
+
+    def should_exclude_directory(self, path):
+        """检查目录是否应该被排除，排除的目录扫描时不再进入
+
+        Args:
+            path: 目录相对路径
+
+        Returns:
+            如果目录应该被排除，返回True，否则返回False
+        """
+        return self.exclude.match_directory(path)
 
     def compare_files(self, server_db_path):
         """对比文件清单，找出需要同步的文件
@@ -344,50 +359,136 @@ class SyncClient:
         for file_info in self.db.get_all_files():
             client_files[file_info['path']] = file_info
 
-        # 找出需要同步的文件
-        files_to_sync = []
-        parent_dir = self.script_dir.parent
+        # 遍历客户端文件，找出大小或修改时间不同的文件
+        candidates = []
         excluded_count = 0
-
-        # 遍历客户端文件
         for path, client_file in client_files.items():
             # 检查文件是否应该被排除
             if self.should_exclude_file(path):
                 excluded_count += 1
                 continue
-                
-            server_file = server_files.get(path)
 
-            # 如果服务端没有该文件，或者文件大小不同，或者修改时间差异超过阈值
-            if (not server_file or
-                abs(client_file['size'] - server_file['size']) > DEFAULT_SIZE_THRESHOLD or
-                abs(client_file['modified_time'] - server_file['modified_time']) > DEFAULT_TIME_THRESHOLD):
-
-                # 计算文件哈希
-                full_path = parent_dir / path
-                if full_path.exists():
-                    file_hash = calculate_file_hash(full_path)
-                    file_size = full_path.stat().st_size
-                    file_mtime = full_path.stat().st_mtime
-
-                    # 如果服务端有该文件，且哈希值相同，则不需要同步
-                    if server_file and server_file['hash'] == file_hash:
-                        continue
-
-                    files_to_sync.append({
-                        'path': path,
-                        'size': file_size,
-                        'modified_time': file_mtime,
-                        'hash': file_hash
-                    })
+            if self.needs_compare(client_file, server_files.get(path)):
+                candidates.append(path)
+
+        files_to_sync = self.select_changed_files(candidates, server_files)
 
         server_db.close()
         logger.info(f"文件对比完成，需要同步 {len(files_to_sync)} 个文件，排除 {excluded_count} 个文件")
         return files_to_sync
 
+    @staticmethod
+    def needs_compare(client_file, server_file):
+        """检查文件是否需要计算哈希进一步对比
+
+        服务端没有该文件，或者文件大小差异、修改时间差异超过阈值时返回True
+        """
+        return (not server_file or
+                abs(client_file['size'] - server_file['size']) > DEFAULT_SIZE_THRESHOLD or
+                abs(client_file['modified_time'] - server_file['modified_time']) > DEFAULT_TIME_THRESHOLD)
+
+    def select_changed_files(self, candidates, server_files):
+        """计算候选文件的哈希，找出与服务端不同的文件
+
+        Args:
+            candidates: 候选文件的相对路径列表
+            server_files: 相对路径 -> 服务端文件信息（含 hash）
+
+        Returns:
+            需要同步的文件列表
+        """
+        # 计算文件哈希（使用缓存，未缓存的文件并行计算）
+        hashes = HashEngine(self.db, self.hash_algorithm).hash_files(self.sync_dir, candidates)
+
+        files_to_sync = []
+        for path in candidates:
+            file_info = hashes.get(path)
+            if not file_info:
+                continue
+
+            # 如果服务端有该文件，且哈希值相同，则不需要同步
+            server_file = server_files.get(path)
+            if server_file and server_file['hash'] == file_info['hash']:
+                continue
+
+            files_to_sync.append({
+                'path': path,
+                'size': file_info['size'],
+                'modified_time': file_info['modified_time'],
+                'hash': file_info['hash']
+            })
+        return files_to_sync
+
+    def compare_manifest(self, client_socket):
+        """通过目录 Merkle 树与服务端对比文件清单，找出需要同步的文件
+
+        先发送根目录摘要，每轮把摘要不同的子目录合并为一个请求，只有变化的目录需要交换文件列表。
+
+        Args:
+            client_socket: 客户端socket
+
+        Returns:
+            需要同步的文件列表，服务端不支持清单对比时返回 None
+        """
+        # 扫描时已按排除规则过滤，数据库中只有需要对比的文件
+        manifest = Manifest((f['path'], f['size'], f['modified_time'], f['hash']) for f in self.db.get_all_files())
+
+        candidates = []
+        server_files = {}
+        pending = {'': manifest.digest('')}
+        rounds = 0
+        while pending:
+            request = {
+                "type": "manifest",
+                "exclude": self.exclude.rules,
+                "dirs": pending
+            }
+            send_data(client_socket, json.dumps(request), self.compress_messages)
+            response = parse_json_response(receive_data(client_socket))
+            if not response or response.get("status") != "ok":
+                if rounds == 0:
+                    logger.info("服务端不支持清单对比，改为下载服务端数据库")
+                    return None
+                raise ConnectionError(f"清单对比失败: {response}")
+            rounds += 1
+
+            next_pending = {}
+            for directory, listing in response.get("dirs", {}).items():
+                if listing is None:
+                    # 摘要相同
+                    continue
+                server_dir_files = listing.get("files", {})
+                for name, (path, size, modified_time, _) in manifest.files.get(directory, {}).items():
+                    server_entry = server_dir_files.get(name)
+                    server_file = None
+                    if server_entry:
+                        server_file = {'size': server_entry[0], 'modified_time': server_entry[1], 'hash': server_entry[2]}
+                        server_files[path] = server_file
+                    if self.needs_compare({'size': size, 'modified_time': modified_time}, server_file):
+                        candidates.append(path)
+
+                server_dirs = listing.get("dirs", {})
+                for name in manifest.subdirs.get(directory, ()):
+                    child = child_path(directory, name)
+                    if name not in server_dirs:
+                        # 服务端没有该目录，其中的文件都需要同步
+                        candidates.extend(leaf[0] for leaf in manifest.files_under(child))
+                    elif server_dirs[name] != manifest.digest(child):
+                        next_pending[child] = manifest.digest(child)
+            pending = next_pending
+
+        files_to_sync = self.select_changed_files(candidates, server_files)
+        logger.info(f"清单对比完成（{rounds} 轮请求），需要同步 {len(files_to_sync)} 个文件")
+        return files_to_sync
+
     def sync_files(self, client_socket, files_to_sync):
         """同步文件
 
+        请求中带上客户端支持的协议版本，按服务端回复的版本发送：
+        版本2流水线发送，版本1（旧服务端）逐个文件握手。
+        版本3时，服务端已有的较大文件先获取块签名，只发送增量数据。
+        时间同步时选择了压缩算法且服务端在回复中确认时，流水线发送的记录按 CompressionPolicy 压缩。
+
         Args:
             client_socket: 客户端socket
             files_to_sync: 需要同步的文件列表
@@ -396,12 +497,22 @@ class SyncClient:
             logger.info("没有文件需要同步")
             return
 
+        # 获取较大文件在服务端的块签名，旧服务端不支持时返回空字典
+        signatures = {}
+        if self.delta_transfer and self.protocol_version >= 3:
+            candidates = [file_info['path'] for file_info in files_to_sync if file_info['size'] >= DELTA_MIN_SIZE]
+            if candidates:
+                signatures = self.request_signatures(client_socket, candidates)
+
         # 发送文件同步请求
         request = {
             "type": "file_sync",
+            "protocol_version": self.protocol_version,
             "files": files_to_sync
         }
-        send_data(client_socket, json.dumps(request))
+        if self.compression:
+            request["compression"] = self.compression
+        send_data(client_socket, json.dumps(request), self.compress_messages)
 
         # 接收服务端准备就绪信息
         response_data = receive_data(client_socket)
@@ -419,15 +530,51 @@ class SyncClient:
             logger.error(f"服务端未准备就绪: {response}")
             return
 
-        # 发送文件
+        file_count = len(files_to_sync)
+        protocol_version = min(response.get("protocol_version", 1), self.protocol_version)
+        if protocol_version >= 2:
+            if protocol_version < 3:
+                signatures = {}
+            policy = None
+            if self.compression and response.get("compression") == self.compression:
+                policy = CompressionPolicy(get_codec(self.compression, self.compression_level))
+            response = self.send_files_pipelined(client_socket, files_to_sync, signatures, policy)
+            if policy is not None:
+                logger.info(policy.summary())
+        else:
+            self.send_files(client_socket, files_to_sync)
+
+            # 接收同步完成信息
+            response_data = receive_data(client_socket)
+            if not response_data:
+                logger.warning("同步完成状态未知: 未收到服务端响应")
+                return
+
+            try:
+                response = json.loads(response_data)
+            except json.JSONDecodeError as e:
+                logger.warning(f"同步完成状态未知: JSON解析错误 - {str(e)}")
+                return
+
+        if response.get("status") == "sync_complete":
+            received_files = response.get("received_files", 0)
+            logger.info(f"同步完成，服务端成功接收 {received_files}/{file_count} 个文件")
+        else:
+            logger.warning(f"同步未正常完成: {response}")
+
+    def send_files(self, client_socket, files_to_sync):
+        """逐个文件握手发送（协议版本1）
+
+        Args:
+            client_socket: 客户端socket
+            files_to_sync: 需要同步的文件列表
+        """
         sent_files = 0
         file_count = len(files_to_sync)
-        parent_dir = self.script_dir.parent
+        parent_dir = self.sync_dir
 
         for file_info in files_to_sync:
             rel_path = file_info['path']
-            file_size = file_info['size']
-            file_hash = file_info['hash']
 
             # 接收服务端准备接收文件的信息
             response_data = receive_data(client_socket)
@@ -448,11 +595,7 @@ class SyncClient:
             # 发送文件内容
             full_path = parent_dir / rel_path
             with open(full_path, 'rb') as f:
-                while True:
-                    chunk = f.read(DEFAULT_BUFFER_SIZE)
-                    if not chunk:
-                        break
-                    client_socket.sendall(chunk)
+                send_file(client_socket, f, os.fstat(f.fileno()).st_size)
 
             # 接收文件接收状态
             response_data = receive_data(client_socket)
@@ -472,20 +615,171 @@ class SyncClient:
             else:
                 logger.warning(f"文件发送失败: {rel_path}, 状态: {response.get('status')}")
 
-        # 接收同步完成信息
-        response_data = receive_data(client_socket)
-        if not response_data:
-            logger.warning("同步完成状态未知: 未收到服务端响应")
-            return
-            
+    def request_signatures(self, client_socket, paths):
+        """获取服务端已有文件的块签名
+
+        Args:
+            client_socket: 客户端socket
+            paths: 文件相对路径列表
+
+        Returns:
+            文件路径 -> (服务端文件大小, 块大小, 签名数据)
+        """
+        send_data(client_socket, json.dumps({"type": "block_signatures", "files": paths}), self.compress_messages)
+        response = parse_json_response(receive_data(client_socket))
+        if response.get("status") != "ok":
+            logger.info("服务端不支持增量传输，发送完整文件")
+            return {}
+
+        signatures = {}
+        for entry in response.get("files", []):
+            signature = receive_exact(client_socket, entry['length'])
+            if signature is None:
+                raise ConnectionError("接收块签名时连接中断")
+            signatures[entry['path']] = (entry['size'], entry['block_size'], signature)
+        logger.info(f"已获取 {len(signatures)} 个文件的块签名")
+        return signatures
+
+    def send_files_pipelined(self, client_socket, files_to_sync, signatures=None, policy=None):
+        """流水线发送（协议版本2）
+
+        主线程连续发送文件记录，后台线程读取服务端的批量确认，
+        避免服务端确认积压在socket缓冲区中导致双方互相等待。
+
+        Args:
+            client_socket: 客户端socket
+            files_to_sync: 需要同步的文件列表
+            signatures: 服务端块签名，有签名的文件发送增量数据
+            policy: CompressionPolicy，None 表示不压缩
+
+        Returns:
+            服务端的同步完成信息，读取失败时返回空字典
+        """
+        signatures = signatures or {}
+        file_count = len(files_to_sync)
+        completion = {}
+        acked = {"file_received": 0, "failed": 0}
+
+        def read_acks():
+            while True:
+                response = parse_json_response(receive_data(client_socket))
+                status = response.get("status")
+                if status == "ack":
+                    for index, file_status in response.get("results", []):
+                        if file_status == "file_received":
+                            acked["file_received"] += 1
+                        else:
+                            acked["failed"] += 1
+                            logger.warning(f"文件发送失败: {files_to_sync[index]['path']}, 状态: {file_status}")
+                    logger.info(f"服务端已确认 {acked['file_received']}/{file_count} 个文件")
+                else:
+                    completion.update(response)
+                    return
+
+        reader = threading.Thread(target=read_acks, daemon=True)
+        reader.start()
+
         try:
-            response = json.loads(response_data)
-        except json.JSONDecodeError as e:
-            logger.warning(f"同步完成状态未知: JSON解析错误 - {str(e)}")
+            for index, file_info in enumerate(files_to_sync):
+                signature = signatures.get(file_info['path'])
+                if signature and self.send_delta_record(client_socket, index, file_info, signature, policy):
+                    continue
+                self.send_file_record(client_socket, index, file_info, policy)
+            send_record_header(client_socket, END_OF_RECORDS, 0)
+        except Exception:
+            # 发送失败时关闭连接，让读取确认的线程退出
+            try:
+                client_socket.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            raise
+        finally:
+            reader.join()
+
+        return completion
+
+    def send_file_record(self, client_socket, index, file_info, policy=None):
+        """发送一条文件记录：记录头 + 文件内容
+
+        记录头中的长度以发送时的文件大小为准，文件在读取过程中变短时补零，
+        保证记录边界正确，服务端会因哈希不匹配而拒绝该文件。
+        按压缩策略值得压缩的文件发送压缩帧，记录头中的长度仍为原始长度。
+
+        Args:
+            client_socket: 客户端socket
+            index: 文件序号
+            file_info: 文件信息
+            policy: CompressionPolicy，None 表示不压缩
+        """
+        full_path = self.sync_dir / file_info['path']
+        try:
+            f = open(full_path, 'rb')
+        except OSError as e:
+            logger.error(f"无法读取文件: {file_info['path']}, 错误: {str(e)}")
             return
 
-        if response.get("status") == "sync_complete":
-            received_files = response.get("received_files", 0)
-            logger.info(f"同步完成，服务端成功接收 {received_files}/{file_count} 个文件")
-        else:
-            logger.warning(f"同步未正常完成: {response}")
+        with f:
+            file_size = os.fstat(f.fileno()).st_size
+            compress = policy is not None and policy.should_try(file_info['path'], file_size)
+            if file_size <= SMALL_FILE_SIZE:
+                data = f.read(file_size).ljust(file_size, b'\0')
+                packed = policy.compress_sample(data) if compress else None
+                if packed is not None:
+                    payload = pack_frame(packed) + END_OF_FRAMES
+                    send_record_header(client_socket, index | COMPRESSED_RECORD, file_size, payload)
+                    policy.record(file_size, len(payload))
+                else:
+                    send_record_header(client_socket, index, file_size, data)
+                return
+
+            if compress and policy.read_sample(f):
+                send_record_header(client_socket, index | COMPRESSED_RECORD, file_size)
+                policy.record(file_size, send_compressed(client_socket, f, file_size, policy.codec))
+                return
+
+            send_record_header(client_socket, index, file_size)
+            sent = send_file(client_socket, f, file_size)
+            # 文件在发送过程中变短时补齐，保证记录边界正确（服务端校验哈希时会发现不一致）
+            if sent < file_size:
+                client_socket.sendall(b'\0' * (file_size - sent))
+
+    def send_delta_record(self, client_socket, index, file_info, signature, policy=None):
+        """发送一条增量记录
+
+        增量数据先写入临时文件（较小时在内存中），不比完整文件小时不发送。
+        增量数据按压缩策略值得压缩时发送压缩帧。
+
+        Args:
+            client_socket: 客户端socket
+            index: 文件序号
+            file_info: 文件信息
+            signature: (服务端文件大小, 块大小, 签名数据)
+            policy: CompressionPolicy，None 表示不压缩
+
+        Returns:
+            是否已发送；返回False时应发送完整文件
+        """
+        basis_size, block_size, blocks = signature
+        full_path = self.sync_dir / file_info['path']
+        with tempfile.SpooledTemporaryFile(max_size=DELTA_SPOOL_SIZE) as delta:
+            try:
+                literal_bytes, copied_blocks = compute_delta(full_path, basis_size, block_size, blocks, delta)
+            except (OSError, ValueError) as e:
+                logger.warning(f"计算增量数据失败: {file_info['path']}, 错误: {str(e)}")
+                return False
+
+            delta_size = delta.tell()
+            if delta_size >= file_info['size']:
+                return False
+
+            delta.seek(0)
+            if (policy is not None and policy.should_try(file_info['path'], delta_size)
+                    and policy.read_sample(delta)):
+                send_record_header(client_socket, index | DELTA_RECORD | COMPRESSED_RECORD, delta_size)
+                policy.record(delta_size, send_compressed(client_socket, delta, delta_size, policy.codec))
+            else:
+                send_record_header(client_socket, index | DELTA_RECORD, delta_size)
+                send_file(client_socket, delta, delta_size)
+
+        logger.info(f"增量发送: {file_info['path']}，复用 {copied_blocks} 块，新数据 {literal_bytes} 字节")
+        return True
@@ -0,0 +1,472 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+文件同步工具传输压缩模块
+
+- 算法：zlib（标准库，总是可用），安装了 zstandard、lz4 包时还支持 zstd、lz4。
+  时间同步时双方交换支持的算法，客户端按 COMPRESSION_ALGORITHMS 的顺序选择，文件同步请求中再确认一次
+- 压缩的文件记录：记录头中的长度仍为原始长度，内容为若干帧（4字节压缩数据长度 + 压缩数据），
+  以长度为0的帧结束。整个文件是一个压缩流，发送方边读边压缩，接收方边解压边写入
+- CompressionPolicy 逐个文件决定是否压缩：已压缩格式的扩展名、太小的文件直接发送，
+  其他文件先压缩开头一段，压缩率不够时直接发送
+- 不小于 MESSAGE_COMPRESSION_MIN_SIZE 的JSON消息用 zlib 压缩，长度前缀的最高位表示已压缩
+- 解压时限制每次输出的长度：压缩记录解压后超过记录头中的长度、压缩消息解压后超过 MAX_MESSAGE_SIZE 时
+  立即报错，不会把对方构造的高压缩比数据整个解压到内存中
+"""
+
+import struct
+import zlib
+from pathlib import Path
+
+from config import (
+    COMPRESSION_ALGORITHMS, COMPRESSION_LEVELS, COMPRESSION_MIN_SIZE, COMPRESSION_SAMPLE_SIZE, COMPRESSION_MAX_RATIO,
+    COMPRESSION_SKIP_EXTENSIONS, MESSAGE_COMPRESSION_MIN_SIZE, MAX_MESSAGE_SIZE, TRANSFER_BUFFER_SIZE
+)
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import lz4.frame as lz4_frame
+except ImportError:
+    lz4_frame = None
+
+# 压缩帧头：压缩数据长度，0 表示结束
+FRAME_HEADER = struct.Struct('!I')
+END_OF_FRAMES = FRAME_HEADER.pack(0)
+# 单个压缩帧的长度上限，超过时认为数据流已损坏
+MAX_FRAME_SIZE = 64 * 1024 * 1024
+# JSON 消息的压缩级别
+MESSAGE_COMPRESSION_LEVEL = 6
+
+
+class CompressionError(ConnectionError):
+    """压缩数据无效，记录边界已无法确定"""
+
+
+class _ZlibDecompressor:
+    """给 zlib.decompressobj 加上 needs_input，与 LZ4FrameDecompressor 的接口一致
+
+    max_length 限制一次返回的数据量，没有处理的输入留在 unconsumed_tail 中，下次调用时先解压这部分。
+    """
+
+    def __init__(self):
+        self.decompressor = zlib.decompressobj()
+
+    @property
+    def needs_input(self):
+        return not self.decompressor.unconsumed_tail
+
+    def decompress(self, data, max_length=0):
+        tail = self.decompressor.unconsumed_tail
+        return self.decompressor.decompress(tail + data if tail else data, max_length)
+
+    def flush(self):
+        return self.decompressor.flush()
+
+
+class ZlibCodec:
+    """zlib 压缩"""
+
+    name = 'zlib'
+
+    def __init__(self, level=None):
+        self.level = COMPRESSION_LEVELS.get(self.name, 1) if level is None else level
+
+    def compressor(self):
+        return zlib.compressobj(self.level)
+
+    def decompressor(self):
+        return _ZlibDecompressor()
+
+    def compress(self, data):
+        return zlib.compress(data, self.level)
+
+
+class _ZstdDecompressor:
+    """用 zstandard 的 stream_writer 实现与 LZ4FrameDecompressor 相同的 decompress(data, max_length)、needs_input
+
+    zstandard 的 decompressobj 不能限制输出长度。stream_writer 按 write_size 分块写出解压数据，
+    这里逐块收集，收集的数据超过 MAX_FRAME_SIZE 时中止（正常的帧解压后远小于该值）。
+    """
+
+    def __init__(self):
+        self.buffer = bytearray()
+        self.writer = zstandard.ZstdDecompressor().stream_writer(self, write_size=TRANSFER_BUFFER_SIZE)
+
+    @property
+    def needs_input(self):
+        return not self.buffer
+
+    def write(self, data):
+        """stream_writer 写出解压数据"""
+        if len(self.buffer) + len(data) > MAX_FRAME_SIZE:
+            raise CompressionError("压缩帧解压后过大")
+        self.buffer += data
+        return len(data)
+
+    def decompress(self, data, max_length=0):
+        if data:
+            self.writer.write(data)
+        if max_length <= 0 or len(self.buffer) <= max_length:
+            output = bytes(self.buffer)
+            self.buffer.clear()
+        else:
+            output = bytes(self.buffer[:max_length])
+            del self.buffer[:max_length]
+        return output
+
+
+class ZstdCodec:
+    """zstd 压缩（zstandard 包）"""
+
+    name = 'zstd'
+
+    def __init__(self, level=None):
+        self.level = COMPRESSION_LEVELS.get(self.name, 3) if level is None else level
+
+    def compressor(self):
+        return zstandard.ZstdCompressor(level=self.level).compressobj()
+
+    def decompressor(self):
+        return _ZstdDecompressor()
+
+    def compress(self, data):
+        return zstandard.ZstdCompressor(level=self.level).compress(data)
+
+
+class _Lz4Compressor:
+    """把 LZ4FrameCompressor 包装成与 zlib.compressobj 相同的 compress/flush 接口"""
+
+    def __init__(self, level):
+        self.compressor = lz4_frame.LZ4FrameCompressor(compression_level=level)
+        self.header = self.compressor.begin()
+
+    def compress(self, data):
+        packed = self.header + self.compressor.compress(data)
+        self.header = b''
+        return packed
+
+    def flush(self):
+        return self.header + self.compressor.flush()
+
+
+class Lz4Codec:
+    """lz4 压缩（lz4 包）"""
+
+    name = 'lz4'
+
+    def __init__(self, level=None):
+        self.level = COMPRESSION_LEVELS.get(self.name, 0) if level is None else level
+
+    def compressor(self):
+        return _Lz4Compressor(self.level)
+
+    def decompressor(self):
+        return lz4_frame.LZ4FrameDecompressor()
+
+    def compress(self, data):
+        return lz4_frame.compress(data, compression_level=self.level)
+
+
+# 本机可用的算法
+CODECS = {'zlib': ZlibCodec}
+if zstandard is not None:
+    CODECS['zstd'] = ZstdCodec
+if lz4_frame is not None:
+    CODECS['lz4'] = Lz4Codec
+
+
+def available_codecs():
+    """本机支持的压缩算法，按 COMPRESSION_ALGORITHMS 的优先顺序"""
+    return [name for name in COMPRESSION_ALGORITHMS if name in CODECS]
+
+
+def choose_codec(local_codecs, remote_codecs):
+    """按本地优先顺序选择对方也支持的算法
+
+    Args:
+        local_codecs: 本地启用的算法
+        remote_codecs: 对方支持的算法，旧版本不返回时为 None
+
+    Returns:
+        算法名称，没有共同支持的算法时返回 None
+    """
+    for name in local_codecs:
+        if name in (remote_codecs or []) and name in CODECS:
+            return name
+    return None
+
+
+def get_codec(name, level=None):
+    """创建压缩算法对象
+
+    Args:
+        name: 算法名称
+        level: 压缩级别，None 表示使用 COMPRESSION_LEVELS 中的配置
+
+    Returns:
+        算法对象，name 为空或本机不支持时返回 None
+    """
+    codec_class = CODECS.get(name) if name else None
+    return codec_class(level) if codec_class else None
+
+
+def pack_frame(data):
+    """一个压缩帧：长度 + 数据"""
+    return FRAME_HEADER.pack(len(data)) + data
+
+
+def decompress_frame(decompressor, data, max_length):
+    """解压一帧数据，最多返回 max_length 字节
+
+    没有解压完的部分留在解压对象中（needs_input 为 False），之后用空数据继续调用取出。
+
+    Raises:
+        CompressionError: 数据无效
+    """
+    try:
+        return decompressor.decompress(data, max_length)
+    except CompressionError:
+        raise
+    except Exception as e:
+        raise CompressionError(f"压缩数据无效: {str(e)}") from None
+
+
+def finish_decompressor(decompressor):
+    """结束帧后取出解压对象中剩余的数据"""
+    flush = getattr(decompressor, 'flush', None)
+    if flush is None:
+        return b''
+    try:
+        return flush()
+    except Exception as e:
+        raise CompressionError(f"压缩数据无效: {str(e)}") from None
+
+
+def check_frame_length(length):
+    if length > MAX_FRAME_SIZE:
+        raise CompressionError(f"压缩帧过大: {length} 字节")
+
+
+def check_decompressed_length(remaining, length):
+    """记录还剩 remaining 字节时又解压出 length 字节
+
+    Returns:
+        之后还剩的字节数
+
+    Raises:
+        CompressionError: 解压后的数据比记录长度长
+    """
+    if length > remaining:
+        raise CompressionError("解压后的数据比记录长度长")
+    return remaining - length
+
+
+def send_compressed(sock, f, count, codec):
+    """从文件当前位置读取 count 字节，压缩后分帧发送，最后发送结束帧
+
+    文件比 count 短时补零，保证解压后的长度与记录头一致。
+
+    Args:
+        sock: socket对象
+        f: 以二进制读方式打开的文件对象
+        count: 原始字节数
+        codec: 压缩算法对象
+
+    Returns:
+        发送的字节数（含帧头）
+    """
+    compressor = codec.compressor()
+    sent = 0
+    remaining = count
+    while remaining > 0:
+        chunk = f.read(min(TRANSFER_BUFFER_SIZE, remaining))
+        if not chunk:
+            chunk = bytes(min(TRANSFER_BUFFER_SIZE, remaining))
+        remaining -= len(chunk)
+        packed = compressor.compress(chunk)
+        if packed:
+            sock.sendall(pack_frame(packed))
+            sent += FRAME_HEADER.size + len(packed)
+    packed = compressor.flush()
+    tail = (pack_frame(packed) if packed else b'') + END_OF_FRAMES
+    sock.sendall(tail)
+    return sent + len(tail)
+
+
+class DecompressReader:
+    """从压缩帧中读取解压后的数据
+
+    提供 read 和 readinto，可以替代缓冲读取对象传给 receive_to_file、apply_delta。
+    """
+
+    def __init__(self, stream, codec, size):
+        """
+        Args:
+            stream: socket.makefile('rb') 返回的缓冲读取对象
+            codec: 压缩算法对象
+            size: 记录头中的长度，解压后的数据超过该长度时报错
+        """
+        self.stream = stream
+        self.decompressor = codec.decompressor()
+        self.remaining = size
+        self.pending = memoryview(b'')
+        self.ended = False
+
+    def _fill(self):
+        """保证有待读取的解压数据
+
+        Returns:
+            是否还有数据，读到结束帧且数据已读完时返回 False
+
+        Raises:
+            CompressionError: 数据无效或解压后的数据比记录长度长
+        """
+        while not self.pending:
+            if not self.decompressor.needs_input:
+                # 上一帧还没有解压完
+                self._accept(decompress_frame(self.decompressor, b'', TRANSFER_BUFFER_SIZE))
+                continue
+            if self.ended:
+                return False
+            header = self.stream.read(FRAME_HEADER.size)
+            if len(header) < FRAME_HEADER.size:
+                raise ConnectionError("接收压缩数据时连接中断")
+            length, = FRAME_HEADER.unpack(header)
+            if length == 0:
+                self.ended = True
+                self._accept(finish_decompressor(self.decompressor))
+                continue
+            check_frame_length(length)
+            data = self.stream.read(length)
+            if len(data) < length:
+                raise ConnectionError("接收压缩数据时连接中断")
+            self._accept(decompress_frame(self.decompressor, data, TRANSFER_BUFFER_SIZE))
+        return True
+
+    def _accept(self, data):
+        self.remaining = check_decompressed_length(self.remaining, len(data))
+        self.pending = memoryview(data)
+
+    def readinto(self, buffer):
+        if not self._fill():
+            return 0
+        n = min(len(buffer), len(self.pending))
+        buffer[:n] = self.pending[:n]
+        self.pending = self.pending[n:]
+        return n
+
+    def read(self, size):
+        parts = []
+        while size > 0 and self._fill():
+            chunk = self.pending[:size]
+            parts.append(bytes(chunk))
+            self.pending = self.pending[len(chunk):]
+            size -= len(chunk)
+        return b''.join(parts)
+
+    def finish(self):
+        """读到结束帧
+
+        Raises:
+            CompressionError: 解压后的数据比记录头中的长度长
+        """
+        if self._fill():
+            raise CompressionError("解压后的数据比记录长度长")
+
+
+class CompressionPolicy:
+    """逐个文件决定是否压缩发送，并统计压缩效果
+
+    已压缩格式的扩展名、小于 COMPRESSION_MIN_SIZE 的文件不压缩；其他文件先压缩开头
+    COMPRESSION_SAMPLE_SIZE 字节（小文件即整个文件），压缩后超过原大小的 COMPRESSION_MAX_RATIO 时不压缩。
+    """
+
+    def __init__(self, codec):
+        """
+        Args:
+            codec: 压缩算法对象
+        """
+        self.codec = codec
+        self.skip_extensions = {ext.lower() for ext in COMPRESSION_SKIP_EXTENSIONS}
+        self.compressed_files = 0
+        self.skipped_files = 0
+        self.raw_bytes = 0
+        self.wire_bytes = 0
+
+    def should_try(self, path, size):
+        """按扩展名和大小判断是否尝试压缩"""
+        if size < COMPRESSION_MIN_SIZE or Path(path).suffix.lower() in self.skip_extensions:
+            self.skipped_files += 1
+            return False
+        return True
+
+    def compress_sample(self, sample):
+        """压缩一段样本
+
+        Args:
+            sample: 文件开头的数据（小文件为整个文件）
+
+        Returns:
+            压缩后的数据，压缩率不够时返回 None
+        """
+        packed = self.codec.compress(sample)
+        if len(packed) > len(sample) * COMPRESSION_MAX_RATIO:
+            self.skipped_files += 1
+            return None
+        return packed
+
+    def read_sample(self, f):
+        """读取文件开头的样本并判断是否值得压缩，读完后回到文件开头"""
+        sample = f.read(COMPRESSION_SAMPLE_SIZE)
+        f.seek(0)
+        return self.compress_sample(sample) is not None
+
+    def record(self, raw_size, wire_size):
+        """记录一个压缩发送的文件"""
+        self.compressed_files += 1
+        self.raw_bytes += raw_size
+        self.wire_bytes += wire_size
+
+    def summary(self):
+        ratio = self.wire_bytes / self.raw_bytes if self.raw_bytes else 1.0
+        return (f"压缩发送 {self.compressed_files} 个文件（{self.codec.name}），"
+                f"{self.raw_bytes / 1024 / 1024:.1f} MB -> {self.wire_bytes / 1024 / 1024:.1f} MB（{ratio:.0%}），"
+                f"{self.skipped_files} 个文件未压缩")
+
+
+def compress_message(data):
+    """压缩一条JSON消息
+
+    Args:
+        data: 编码后的消息
+
+    Returns:
+        压缩后的数据，消息较小或压缩后没有变小时返回 None
+    """
+    if len(data) < MESSAGE_COMPRESSION_MIN_SIZE:
+        return None
+    packed = zlib.compress(data, MESSAGE_COMPRESSION_LEVEL)
+    return packed if len(packed) < len(data) else None
+
+
+def decompress_message(data):
+    """解压一条JSON消息，解压后最多 MAX_MESSAGE_SIZE 字节
+
+    Raises:
+        CompressionError: 数据无效或解压后过大
+    """
+    decompressor = zlib.decompressobj()
+    try:
+        message = decompressor.decompress(data, MAX_MESSAGE_SIZE)
+    except zlib.error as e:
+        raise CompressionError(f"压缩消息无效: {str(e)}") from None
+    if not decompressor.eof:
+        if decompressor.unconsumed_tail or len(message) == MAX_MESSAGE_SIZE:
+            raise CompressionError(f"压缩消息解压后超过 {MAX_MESSAGE_SIZE} 字节")
+        raise CompressionError("压缩消息无效: 数据不完整")
+    return message
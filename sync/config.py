@@ -17,10 +17,66 @@ DEFAULT_ENCODING = 'utf-8'
 DEFAULT_TIME_THRESHOLD = 60  # 文件修改时间阈值（秒）
 DEFAULT_SIZE_THRESHOLD = 10  # 文件大小阈值（字节）
 
+# 文件传输协议版本：1 为逐个文件握手，2 为流水线传输（客户端连续发送文件记录，服务端批量确认），
+# 3 在2的基础上支持增量记录（只发送与服务端已有文件不同的部分）
+PROTOCOL_VERSION = 3
+ACK_BATCH_SIZE = 64  # 流水线传输时服务端每接收多少个文件确认一次
+SMALL_FILE_SIZE = 64 * 1024  # 不超过该大小的文件与记录头合并为一次发送
+DELTA_MIN_SIZE = 256 * 1024  # 服务端已有且不小于该大小的文件使用增量传输
+DELTA_SPOOL_SIZE = 16 * 1024 * 1024  # 增量数据超过该大小时暂存到临时文件
+
+# 网络传输
+TRANSFER_BUFFER_SIZE = 1024 * 1024  # 收发文件内容的缓冲区大小
+SOCKET_BUFFER_SIZE = 4 * 1024 * 1024  # socket 发送和接收缓冲区（SO_SNDBUF/SO_RCVBUF），None 表示系统默认值
+TCP_NODELAY = True  # 关闭 Nagle 算法，小消息立即发送
+USE_SENDFILE = True  # 用 socket.sendfile 发送文件内容（不支持的系统自动改为普通发送）
+MAX_MESSAGE_SIZE = 256 * 1024 * 1024  # JSON 消息（解压后）的最大长度，对方声明的长度超过该值时断开连接
+
+# 传输压缩（时间同步时协商，双方都支持的算法中按客户端的优先顺序选择）
+COMPRESSION_ALGORITHMS = ['zstd', 'lz4', 'zlib']  # zstd、lz4 需要安装 zstandard、lz4 包，空列表表示不压缩
+COMPRESSION_LEVELS = {'zstd': 3, 'lz4': 0, 'zlib': 1}  # 各算法的压缩级别（zlib 1级在10MB/s以上的链路上比6级快）
+COMPRESSION_MIN_SIZE = 512  # 小于该大小的文件不压缩
+COMPRESSION_SAMPLE_SIZE = 64 * 1024  # 较大的文件先抽样压缩开头的这部分，判断是否值得压缩
+COMPRESSION_MAX_RATIO = 0.9  # 抽样压缩后超过原大小的该比例时不压缩
+COMPRESSION_SKIP_EXTENSIONS = [  # 已压缩的格式，直接发送
+    '.gz', '.tgz', '.bz2', '.xz', '.zst', '.lz4', '.zip', '.7z', '.rar', '.jar', '.whl',
+    '.docx', '.xlsx', '.pptx', '.jpg', '.jpeg', '.png', '.gif', '.webp', '.mp3', '.mp4', '.mov', '.avi',
+]
+MESSAGE_COMPRESSION_MIN_SIZE = 4096  # 不小于该大小的JSON消息用 zlib 压缩后发送
+
+# 服务端（asyncio）
+MAX_CLIENTS = 256  # 同时处理的客户端连接数，超出的连接排队等待
+CLIENT_WAIT_TIMEOUT = 30  # 排队超过该时间（秒）仍没有空闲名额时回复服务端繁忙并断开
+CLIENT_IDLE_TIMEOUT = 600  # 客户端超过该时间（秒）没有发送请求时断开
+LISTEN_BACKLOG = 512  # 等待 accept 的连接队列长度
+STREAM_BUFFER_SIZE = 256 * 1024  # 每个连接的接收和发送缓冲上限，超过后暂停读取或等待发送完成（背压）
+IO_WORKERS = 16  # 文件读写和哈希计算的线程数
+DB_QUEUE_SIZE = 1024  # 等待写入数据库的批次上限，写入跟不上时接收文件的连接暂停
+SHUTDOWN_TIMEOUT = 30  # 关闭时等待进行中的请求完成的时间（秒）
+METRICS_INTERVAL = 60  # 连接统计写入日志的间隔（秒）
+
+# 服务端备份（按内容寻址，相同内容只保存一份）
+BACKUP_COMPRESSION = True  # 备份对象用 zlib 压缩（已压缩格式和抽样压缩率不够的文件保存原内容）
+BACKUP_COMPRESSION_LEVEL = 6  # 备份对象的压缩级别
+BACKUP_KEEP_VERSIONS = 20  # 每个文件最多保留的备份版本数，None 表示不限
+BACKUP_KEEP_DAYS = 90  # 备份保留的天数，None 表示不限
+BACKUP_MIN_VERSIONS = 1  # 超过保留天数时，每个文件仍至少保留的最近版本数
+BACKUP_GC_INTERVAL = 24 * 3600  # 服务端执行保留策略和清理未引用对象的间隔（秒），None 表示不自动执行
+BACKUP_GC_GRACE = 3600  # 未引用的对象超过该时间（秒）没有被写入或复用才删除，避免删除刚写入、记录还未提交的对象
+
+# 文件恢复
+RESTORE_WORKERS = 8  # 并行恢复文件的线程数
+USE_COPY_FILE_RANGE = True  # 用 os.copy_file_range 复制备份（在内核中复制，支持的文件系统上共享数据块），不支持时自动改为普通复制
+
+# 文件哈希算法，按优先顺序排列，客户端选择服务端也支持的第一个
+HASH_ALGORITHMS = ['blake2b', 'md5']
+HASH_WORKERS = None  # 计算哈希的线程数，None 表示CPU核数
+
 # 排除上传的文件和目录
 EXCLUDED_EXTENSIONS = ['.db', '.db-journal', '.log', '.pyc', '.pyo', '.pyd']  # 排除的文件扩展名
 EXCLUDED_DIRECTORIES = ['__pycache__', 'backups', 'logs', '.git']  # 排除的目录名
 EXCLUDED_PATHS = []  # 排除的特定路径（相对于根目录）
+EXCLUDED_PATTERNS = []  # 排除的通配符模式（不含/时匹配文件名或目录名，含/时匹配相对路径）
 
 # 读取排除配置文件
 def load_exclude_config(config_file='exclude.conf'):
@@ -30,12 +86,13 @@ def load_exclude_config(config_file='exclude.conf'):
         config_file: 配置文件路径
         
     Returns:
-        排除规则元组 (extensions, directories, paths)
+        排除规则元组 (extensions, directories, paths, patterns)
     """
     try:
         extensions = list(EXCLUDED_EXTENSIONS)
         directories = list(EXCLUDED_DIRECTORIES)
         paths = list(EXCLUDED_PATHS)
+        patterns = list(EXCLUDED_PATTERNS)
         
         config_path = Path(config_file)
         if config_path.exists():
@@ -61,13 +118,18 @@ def load_exclude_config(config_file='exclude.conf'):
                         path = line[5:].strip()
                         if path and path not in paths:
                             paths.append(path)
+                    elif line.startswith('glob:'):
+                        # 通配符模式
+                        pattern = line[5:].strip()
+                        if pattern and pattern not in patterns:
+                            patterns.append(pattern)
             
             logger.info(f"已从配置文件 {config_file} 加载排除规则")
         
-        return (extensions, directories, paths)
+        return (extensions, directories, paths, patterns)
     except Exception as e:
         logger.error(f"加载排除配置文件失败: {str(e)}")
-        return (EXCLUDED_EXTENSIONS, EXCLUDED_DIRECTORIES, EXCLUDED_PATHS)
+        return (EXCLUDED_EXTENSIONS, EXCLUDED_DIRECTORIES, EXCLUDED_PATHS, EXCLUDED_PATTERNS)
 
 # 配置日志
 def setup_logging():
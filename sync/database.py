@@ -14,6 +14,9 @@ import os
 
 from config import logger
 
+# 修改时间相差不超过该值（秒）视为未变化，避免浮点数和纳秒时间戳互相转换的误差
+MTIME_TOLERANCE = 0.001
+
 class FileDatabase:
     """文件数据库管理类"""
 
@@ -62,7 +65,46 @@ class FileDatabase:
                 size INTEGER NOT NULL,
                 modified_time REAL NOT NULL,
                 backup_time REAL NOT NULL,
-                hash TEXT
+                hash TEXT,
+                object_key TEXT
+            )
+            ''')
+            # 旧版本的备份记录直接指向 backups/<文件名>_<时间戳>，没有 object_key 列
+            self.cursor.execute('PRAGMA table_info(backup_files)')
+            if 'object_key' not in {row[1] for row in self.cursor.fetchall()}:
+                self.cursor.execute('ALTER TABLE backup_files ADD COLUMN object_key TEXT')
+            # 保留策略和恢复目录按文件和时间排序，按时间范围查询备份，垃圾回收按对象查找引用
+            self.cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_backup_files_path_time ON backup_files (original_path, backup_time)
+            ''')
+            self.cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_backup_files_time ON backup_files (backup_time)
+            ''')
+            self.cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_backup_files_object ON backup_files (object_key)
+            ''')
+
+            # 创建已删除文件表，记录扫描时发现已被删除的文件
+            self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS deleted_files (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                path TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                modified_time REAL NOT NULL,
+                hash TEXT,
+                deleted_time REAL NOT NULL
+            )
+            ''')
+
+            # 创建哈希缓存表，文件大小、修改时间和 inode 都不变时直接使用缓存的哈希值
+            self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS file_hashes (
+                path TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                inode INTEGER NOT NULL,
+                algorithm TEXT NOT NULL,
+                hash TEXT NOT NULL
             )
             ''')
 
@@ -80,11 +122,16 @@ class FileDatabase:
             self.conn.close()
             logger.info("数据库连接已关闭")
 
-    def scan_directory(self, directory):
-        """扫描目录并更新数据库
+    def scan_directory(self, directory, exclude_file=None, exclude_directory=None):
+        """扫描目录并增量更新数据库
+
+        用 os.scandir 遍历，被排除的目录不会进入；只写入新增和大小、修改时间有变化的文件
+        （变化的文件清空哈希值，未变化的文件保留），已删除的文件从 files 表移到 deleted_files 表。
 
         Args:
             directory: 要扫描的目录
+            exclude_file: 判断文件是否排除的函数，参数为相对路径
+            exclude_directory: 判断目录是否排除的函数，参数为相对路径，排除的目录不再遍历
 
         Returns:
             扫描到的文件数量
@@ -94,35 +141,99 @@ class FileDatabase:
             logger.error(f"目录不存在或不是一个有效的目录: {directory}")
             return 0
 
-        file_count = 0
         current_time = time.time()
 
         try:
-            for root, _, filenames in os.walk(directory):
-                for filename in filenames:
-                    file_path = Path(root) / filename
-                    rel_path = file_path.relative_to(directory)
-
-                    # 获取文件信息
-                    file_size = file_path.stat().st_size
-                    file_mtime = file_path.stat().st_mtime
-
-                    # 更新数据库
-                    self.cursor.execute('''
-                    INSERT OR REPLACE INTO files (path, size, modified_time, last_sync_time)
-                    VALUES (?, ?, ?, ?)
-                    ''', (str(rel_path), file_size, file_mtime, current_time))
-
-                    file_count += 1
+            self.cursor.execute('SELECT path, size, modified_time FROM files')
+            existing = {row[0]: (row[1], row[2]) for row in self.cursor.fetchall()}
+
+            added = []
+            changed = []
+            seen = set()
+            # 无法读取的目录，其中原有的记录不当作已删除
+            unreadable = []
+
+            stack = [('', str(directory))]
+            while stack:
+                rel_dir, abs_dir = stack.pop()
+                try:
+                    entries = os.scandir(abs_dir)
+                except OSError as e:
+                    logger.warning(f"无法读取目录: {abs_dir}, 错误: {str(e)}")
+                    unreadable.append(rel_dir)
+                    continue
+
+                with entries:
+                    for entry in entries:
+                        rel_path = os.path.join(rel_dir, entry.name) if rel_dir else entry.name
+                        try:
+                            if entry.is_dir():
+                                # 与 os.walk 一致，不进入指向目录的符号链接
+                                if not entry.is_symlink() and not (exclude_directory and exclude_directory(rel_path)):
+                                    stack.append((rel_path, entry.path))
+                                continue
+                            if not entry.is_file() or (exclude_file and exclude_file(rel_path)):
+                                continue
+                            stat = entry.stat()
+                        except OSError as e:
+                            logger.warning(f"无法读取文件信息: {rel_path}, 错误: {str(e)}")
+                            continue
+
+                        seen.add(rel_path)
+                        old = existing.get(rel_path)
+                        if old is None:
+                            added.append((rel_path, stat.st_size, stat.st_mtime, current_time))
+                        elif old[0] != stat.st_size or abs(old[1] - stat.st_mtime) > MTIME_TOLERANCE:
+                            changed.append((stat.st_size, stat.st_mtime, current_time, rel_path))
+
+            deleted = []
+            dropped = []
+            for rel_path in existing.keys() - seen:
+                if any(not prefix or rel_path.startswith(prefix + os.sep) for prefix in unreadable):
+                    continue
+                # 被排除的文件（规则修改前扫描进来的）直接移除，不记录为删除
+                if self._is_excluded(rel_path, exclude_file, exclude_directory):
+                    dropped.append((rel_path,))
+                else:
+                    deleted.append((rel_path,))
+
+            self.cursor.executemany('''
+            INSERT INTO files (path, size, modified_time, last_sync_time)
+            VALUES (?, ?, ?, ?)
+            ''', added)
+            self.cursor.executemany('''
+            UPDATE files SET size = ?, modified_time = ?, hash = NULL, last_sync_time = ?
+            WHERE path = ?
+            ''', changed)
+            self.cursor.executemany('''
+            INSERT INTO deleted_files (path, size, modified_time, hash, deleted_time)
+            SELECT path, size, modified_time, hash, ? FROM files WHERE path = ?
+            ''', [(current_time, row[0]) for row in deleted])
+            self.cursor.executemany('DELETE FROM files WHERE path = ?', deleted + dropped)
+            self.cursor.executemany('DELETE FROM file_hashes WHERE path = ?', deleted + dropped)
 
             self.conn.commit()
-            logger.info(f"扫描完成，共处理 {file_count} 个文件")
-            return file_count
+            logger.info(f"扫描完成，共 {len(seen)} 个文件，新增 {len(added)} 个，修改 {len(changed)} 个，"
+                        f"删除 {len(deleted)} 个")
+            return len(seen)
         except Exception as e:
             logger.error(f"扫描目录时发生错误: {str(e)}")
             self.conn.rollback()
             return 0
 
+    @staticmethod
+    def _is_excluded(rel_path, exclude_file=None, exclude_directory=None):
+        """文件本身或所在的任意一级目录被排除"""
+        if exclude_file and exclude_file(rel_path):
+            return True
+        if exclude_directory:
+            parent = os.path.dirname(rel_path)
+            while parent:
+                if exclude_directory(parent):
+                    return True
+                parent = os.path.dirname(parent)
+        return False
+
     def get_file_info(self, file_path):
         """获取文件信息
 
@@ -180,15 +291,54 @@ class FileDatabase:
             logger.error(f"获取所有文件信息失败: {str(e)}")
             return []
 
-    def backup_file(self, original_path, backup_path, size, modified_time, hash_value=None):
+    def get_cached_hashes(self, algorithm):
+        """获取缓存的哈希值
+
+        Args:
+            algorithm: 哈希算法
+
+        Returns:
+            路径 -> ((大小, 修改时间纳秒, inode), 哈希值)
+        """
+        try:
+            self.cursor.execute('''
+            SELECT path, size, mtime_ns, inode, hash
+            FROM file_hashes
+            WHERE algorithm = ?
+            ''', (algorithm,))
+            return {row[0]: ((row[1], row[2], row[3]), row[4]) for row in self.cursor.fetchall()}
+        except sqlite3.Error as e:
+            logger.error(f"读取哈希缓存失败: {str(e)}")
+            return {}
+
+    def store_hashes(self, rows):
+        """保存计算出的哈希值
+
+        Args:
+            rows: [(路径, 大小, 修改时间纳秒, inode, 算法, 哈希值), ...]
+        """
+        if not rows:
+            return
+        try:
+            self.cursor.executemany('''
+            INSERT OR REPLACE INTO file_hashes (path, size, mtime_ns, inode, algorithm, hash)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ''', rows)
+            self.conn.commit()
+        except sqlite3.Error as e:
+            logger.error(f"保存哈希缓存失败: {str(e)}")
+            self.conn.rollback()
+
+    def backup_file(self, original_path, backup_path, size, modified_time, hash_value=None, object_key=None):
         """备份文件记录
 
         Args:
             original_path: 原始文件路径
-            backup_path: 备份文件路径
+            backup_path: 备份文件路径（相对于数据目录）
             size: 文件大小
             modified_time: 文件修改时间
             hash_value: 文件哈希值
+            object_key: 备份存储中的对象（BackupStore），旧格式的备份为 None
 
         Returns:
             是否成功
@@ -196,9 +346,9 @@ class FileDatabase:
         try:
             backup_time = time.time()
             self.cursor.execute('''
-            INSERT INTO backup_files (original_path, backup_path, size, modified_time, backup_time, hash)
-            VALUES (?, ?, ?, ?, ?, ?)
-            ''', (str(original_path), str(backup_path), size, modified_time, backup_time, hash_value))
+            INSERT INTO backup_files (original_path, backup_path, size, modified_time, backup_time, hash, object_key)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', (str(original_path), str(backup_path), size, modified_time, backup_time, hash_value, object_key))
 
             self.conn.commit()
             return True
@@ -207,6 +357,33 @@ class FileDatabase:
             self.conn.rollback()
             return False
 
+    def record_received_files(self, rows, backups=()):
+        """在一个事务中写入接收到的文件和覆盖前的备份记录
+
+        Args:
+            rows: [(路径, 大小, 修改时间, 哈希值, 同步时间), ...]
+            backups: [(原始路径, 备份路径, 大小, 修改时间, 哈希值, 对象), ...]
+
+        Raises:
+            sqlite3.Error: 写入失败（已回滚）
+        """
+        try:
+            backup_time = time.time()
+            self.cursor.executemany('''
+            INSERT INTO backup_files (original_path, backup_path, size, modified_time, backup_time, hash, object_key)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', [(str(path), str(backup_path), size, modified_time, backup_time, hash_value, object_key)
+                  for path, backup_path, size, modified_time, hash_value, object_key in backups])
+            self.cursor.executemany('''
+            INSERT OR REPLACE INTO files (path, size, modified_time, hash, last_sync_time)
+            VALUES (?, ?, ?, ?, ?)
+            ''', rows)
+            self.conn.commit()
+        except sqlite3.Error as e:
+            logger.error(f"写入文件记录失败: {str(e)}")
+            self.conn.rollback()
+            raise
+
     def get_backup_files_by_time_range(self, start_time, end_time):
         """根据时间范围获取备份文件
 
@@ -219,7 +396,7 @@ class FileDatabase:
         """
         try:
             self.cursor.execute('''
-            SELECT original_path, backup_path, size, modified_time, backup_time, hash
+            SELECT original_path, backup_path, size, modified_time, backup_time, hash, object_key
             FROM backup_files
             WHERE backup_time BETWEEN ? AND ?
             ORDER BY backup_time DESC
@@ -233,9 +410,133 @@ class FileDatabase:
                     'size': row[2],
                     'modified_time': row[3],
                     'backup_time': row[4],
-                    'hash': row[5]
+                    'hash': row[5],
+                    'object_key': row[6]
                 })
             return backup_files
         except sqlite3.Error as e:
             logger.error(f"获取备份文件失败: {str(e)}")
             return []
+
+    def get_backup_catalog(self, start_time=None, end_time=None, path_prefix=None, earliest=False):
+        """每个文件在时间范围内的一个备份版本（一次窗口查询，使用 original_path、backup_time 索引）
+
+        Args:
+            start_time: 备份时间下限（含），None 表示不限
+            end_time: 备份时间上限（含），None 表示不限
+            path_prefix: 只返回该目录下（或该文件）的记录，None 表示所有文件
+            earliest: 为 True 时取范围内最早的版本，否则取最新的版本
+
+        Returns:
+            备份记录字典列表（字段与 get_backup_files_by_time_range 相同），按原始路径排序
+        """
+        conditions = ['(? IS NULL OR backup_time >= ?)', '(? IS NULL OR backup_time <= ?)']
+        params = [start_time, start_time, end_time, end_time]
+        prefix = path_prefix.strip('/') if path_prefix else ''
+        if prefix:
+            # 目录本身或 "<目录>/" 开头的路径，用范围条件以便使用索引（'0' 是 '/' 之后的字符）
+            conditions.append('(original_path = ? OR (original_path >= ? AND original_path < ?))')
+            params.extend([prefix, prefix + '/', prefix + '0'])
+        order = 'ASC' if earliest else 'DESC'
+        try:
+            # 窗口函数只用覆盖索引 (original_path, backup_time, rowid) 选出每个文件的一条记录，再按 id 取整行
+            self.cursor.execute(f'''
+            SELECT original_path, backup_path, size, modified_time, backup_time, hash, object_key
+            FROM backup_files
+            WHERE id IN (
+                SELECT id FROM (
+                    SELECT id, ROW_NUMBER() OVER (
+                        PARTITION BY original_path ORDER BY backup_time {order}, id {order}
+                    ) AS version
+                    FROM backup_files
+                    WHERE {' AND '.join(conditions)}
+                )
+                WHERE version = 1
+            )
+            ORDER BY original_path
+            ''', params)
+            return [{
+                'original_path': row[0],
+                'backup_path': row[1],
+                'size': row[2],
+                'modified_time': row[3],
+                'backup_time': row[4],
+                'hash': row[5],
+                'object_key': row[6]
+            } for row in self.cursor.fetchall()]
+        except sqlite3.Error as e:
+            logger.error(f"查询备份目录失败: {str(e)}")
+            return []
+
+    def prune_backups(self, keep_versions=None, keep_days=None, min_versions=1, now=None):
+        """按保留策略删除备份记录（备份内容由垃圾回收删除）
+
+        每个文件只保留最近 keep_versions 个版本；早于 keep_days 天的版本删除，但至少保留最近 min_versions 个。
+
+        Args:
+            keep_versions: 每个文件最多保留的版本数，None 表示不限
+            keep_days: 保留天数，None 表示不限
+            min_versions: 超过保留天数时至少保留的版本数
+            now: 当前时间戳，默认为 time.time()
+
+        Returns:
+            删除的记录 [(备份路径, 对象), ...]
+
+        Raises:
+            sqlite3.Error: 删除失败（已回滚）
+        """
+        if keep_versions is None and keep_days is None:
+            return []
+        now = time.time() if now is None else now
+        cutoff = now - keep_days * 86400 if keep_days is not None else None
+        try:
+            self.cursor.execute('''
+            SELECT id, backup_path, object_key FROM (
+                SELECT id, backup_path, object_key, backup_time,
+                       ROW_NUMBER() OVER (PARTITION BY original_path ORDER BY backup_time DESC, id DESC) AS version
+                FROM backup_files
+            )
+            WHERE (? IS NOT NULL AND version > ?)
+               OR (? IS NOT NULL AND backup_time < ? AND version > ?)
+            ''', (keep_versions, keep_versions, cutoff, cutoff, min_versions))
+            removed = self.cursor.fetchall()
+            self.cursor.executemany('DELETE FROM backup_files WHERE id = ?', [(row[0],) for row in removed])
+            self.conn.commit()
+            return [(row[1], row[2]) for row in removed]
+        except sqlite3.Error as e:
+            logger.error(f"删除过期备份记录失败: {str(e)}")
+            self.conn.rollback()
+            raise
+
+    def get_backup_object_keys(self):
+        """备份记录引用的所有对象"""
+        self.cursor.execute('SELECT DISTINCT object_key FROM backup_files WHERE object_key IS NOT NULL')
+        return {row[0] for row in self.cursor.fetchall()}
+
+    def get_legacy_backups(self):
+        """没有存入备份存储的旧格式备份
+
+        Returns:
+            [(记录ID, 备份路径), ...]
+        """
+        self.cursor.execute('SELECT id, backup_path FROM backup_files WHERE object_key IS NULL')
+        return self.cursor.fetchall()
+
+    def set_backup_objects(self, rows):
+        """把备份记录改为指向备份存储中的对象
+
+        Args:
+            rows: [(备份路径, 对象, 记录ID), ...]
+
+        Raises:
+            sqlite3.Error: 写入失败（已回滚）
+        """
+        try:
+            self.cursor.executemany('''
+            UPDATE backup_files SET backup_path = ?, object_key = ? WHERE id = ?
+            ''', rows)
+            self.conn.commit()
+        except sqlite3.Error as e:
+            logger.error(f"更新备份记录失败: {str(e)}")
+            self.conn.rollback()
+            raise
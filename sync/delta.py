@@ -0,0 +1,302 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+文件同步工具增量传输模块
+
+rsync 风格的增量传输：服务端把已有文件按块计算签名（弱校验 adler32 + 强校验 MD5），
+客户端用滚动校验在新文件中查找相同的块，只发送块引用和不匹配部分的原始数据，
+服务端用已有文件和增量数据重建新文件，最后校验整个文件的哈希。
+
+增量数据格式（内容长度由文件记录头给出）:
+    块大小（4字节）
+    C 起始块号（4字节） 块数（4字节）    复制服务端文件中连续的块
+    L 长度（4字节） 数据                 原始数据
+"""
+
+import hashlib
+import math
+import mmap
+import struct
+import zlib
+
+from config import DEFAULT_BUFFER_SIZE
+
+# 块签名：adler32（4字节）+ MD5（16字节）
+BLOCK_SIGNATURE = struct.Struct('!I16s')
+DELTA_HEADER = struct.Struct('!I')
+COPY_OP = struct.Struct('!cII')
+LITERAL_OP = struct.Struct('!cI')
+
+MIN_BLOCK_SIZE = 2048
+MAX_BLOCK_SIZE = 128 * 1024
+ADLER_MOD = 65521
+
+# 原始数据超过该长度时先写出一段，避免长时间积累在内存中
+MAX_LITERAL_SIZE = 1024 * 1024
+
+
+class DeltaError(Exception):
+    """增量数据格式错误"""
+
+
+def block_size_for(file_size):
+    """按文件大小选择块大小（约为文件大小的平方根，按1KB取整）
+
+    Args:
+        file_size: 文件大小
+
+    Returns:
+        块大小（字节）
+    """
+    size = int(math.sqrt(file_size)) // 1024 * 1024
+    return max(MIN_BLOCK_SIZE, min(MAX_BLOCK_SIZE, size))
+
+
+def file_signature(path, block_size=None):
+    """计算文件的块签名
+
+    Args:
+        path: 文件路径
+        block_size: 块大小，默认按文件大小选择
+
+    Returns:
+        (文件大小, 块大小, 签名数据)，签名数据为每块一条 BLOCK_SIGNATURE
+    """
+    with open(path, 'rb') as f:
+        file_size = f.seek(0, 2)
+        f.seek(0)
+        if block_size is None:
+            block_size = block_size_for(file_size)
+        parts = []
+        while True:
+            block = f.read(block_size)
+            if not block:
+                break
+            parts.append(BLOCK_SIGNATURE.pack(zlib.adler32(block), hashlib.md5(block).digest()))
+    return file_size, block_size, b''.join(parts)
+
+
+def _index_signature(signature):
+    """弱校验值 -> [(块号, MD5), ...]"""
+    index = {}
+    for block_index, (weak, strong) in enumerate(BLOCK_SIGNATURE.iter_unpack(signature)):
+        index.setdefault(weak, []).append((block_index, strong))
+    return index
+
+
+class _DeltaWriter:
+    """合并连续的块引用，写出增量指令"""
+
+    def __init__(self, out, block_size):
+        self.out = out
+        self.run_start = None
+        self.run_count = 0
+        self.literal_bytes = 0
+        self.copied_blocks = 0
+        out.write(DELTA_HEADER.pack(block_size))
+
+    def copy(self, block_index):
+        self.copied_blocks += 1
+        if self.run_start is not None and block_index == self.run_start + self.run_count:
+            self.run_count += 1
+            return
+        self.flush_copy()
+        self.run_start = block_index
+        self.run_count = 1
+
+    def flush_copy(self):
+        if self.run_start is not None:
+            self.out.write(COPY_OP.pack(b'C', self.run_start, self.run_count))
+            self.run_start = None
+
+    def literal(self, data):
+        if not data:
+            return
+        self.flush_copy()
+        self.out.write(LITERAL_OP.pack(b'L', len(data)))
+        self.out.write(data)
+        self.literal_bytes += len(data)
+
+    def close(self):
+        self.flush_copy()
+
+
+def compute_delta(path, basis_size, block_size, signature, out):
+    """计算文件相对于服务端已有文件的增量数据
+
+    先按整块计算 adler32，不匹配时逐字节滚动，直到找到匹配的块；
+    逐字节滚动只发生在修改过的区域附近。
+
+    Args:
+        path: 客户端文件路径
+        basis_size: 服务端文件大小
+        block_size: 服务端签名的块大小
+        signature: 服务端签名数据
+        out: 写入增量数据的文件对象
+
+    Returns:
+        (原始数据字节数, 复制的块数)
+    """
+    index = _index_signature(signature)
+    block_count = len(signature) // BLOCK_SIGNATURE.size
+    # 服务端最后一块可能不足一整块
+    tail_size = basis_size - (block_count - 1) * block_size if block_count else 0
+    writer = _DeltaWriter(out, block_size)
+
+    with open(path, 'rb') as f:
+        size = f.seek(0, 2)
+        if size == 0:
+            writer.close()
+            return 0, 0
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            _match_blocks(data, size, block_size, index, tail_size, block_count, writer)
+        finally:
+            data.close()
+    writer.close()
+    return writer.literal_bytes, writer.copied_blocks
+
+
+def _find_block(candidates, window, expected):
+    strong = hashlib.md5(window).digest()
+    match = None
+    for block_index, block_strong in candidates:
+        if block_strong == strong:
+            if block_index == expected:
+                return block_index
+            if match is None:
+                match = block_index
+    return match
+
+
+def _match_blocks(data, size, block_size, index, tail_size, block_count, writer):
+    pos = 0
+    literal_start = 0
+    expected = 0
+    a = b = 0
+    rolling = False
+    last_full = size - block_size
+
+    while pos <= last_full:
+        if not rolling:
+            weak = zlib.adler32(data[pos:pos + block_size])
+            a = weak & 0xFFFF
+            b = weak >> 16
+        else:
+            weak = (b << 16) | a
+
+        candidates = index.get(weak)
+        if candidates:
+            block_index = _find_block(candidates, data[pos:pos + block_size], expected)
+            if block_index is not None and (block_index < block_count - 1 or tail_size == block_size):
+                if literal_start < pos:
+                    _write_literal(writer, data, literal_start, pos)
+                writer.copy(block_index)
+                expected = block_index + 1
+                pos += block_size
+                literal_start = pos
+                rolling = False
+                continue
+
+        if pos == last_full:
+            break
+        # 滚动一个字节：移出 data[pos]，移入 data[pos + block_size]
+        out_byte = data[pos]
+        a = (a - out_byte + data[pos + block_size]) % ADLER_MOD
+        b = (b - block_size * out_byte + a - 1) % ADLER_MOD
+        pos += 1
+        rolling = True
+        if pos - literal_start >= MAX_LITERAL_SIZE:
+            _write_literal(writer, data, literal_start, pos)
+            literal_start = pos
+
+    # 文件末尾与服务端最后一个不完整块相同
+    if block_count and tail_size < block_size and size - literal_start >= tail_size:
+        tail_start = size - tail_size
+        window = data[tail_start:size]
+        candidates = index.get(zlib.adler32(window))
+        if candidates and _find_block(candidates, window, block_count - 1) == block_count - 1:
+            if literal_start < tail_start:
+                _write_literal(writer, data, literal_start, tail_start)
+            writer.copy(block_count - 1)
+            literal_start = size
+
+    if literal_start < size:
+        _write_literal(writer, data, literal_start, size)
+
+
+def _write_literal(writer, data, start, end):
+    while start < end:
+        stop = min(end, start + MAX_LITERAL_SIZE)
+        writer.literal(data[start:stop])
+        start = stop
+
+
+def apply_delta(stream, delta_size, basis, out, hasher=None):
+    """用已有文件和增量数据重建新文件
+
+    总是读完 delta_size 字节，保证后续记录的边界正确。
+
+    Args:
+        stream: 增量数据来源（缓冲读取对象）
+        delta_size: 增量数据长度
+        basis: 服务端已有文件（以二进制读方式打开）
+        out: 写入新文件的文件对象
+        hasher: 计算新文件哈希的对象，默认MD5
+
+    Returns:
+        (新文件大小, 新文件哈希的十六进制摘要)
+
+    Raises:
+        DeltaError: 增量数据格式错误（长度不正确、未知指令、块引用超出原文件范围）
+        ConnectionError: 增量数据未接收完连接就中断
+    """
+    remaining = delta_size
+
+    def read(count):
+        nonlocal remaining
+        if count > remaining:
+            raise DeltaError("增量数据长度不正确")
+        data = stream.read(count)
+        if len(data) < count:
+            raise ConnectionError("接收增量数据时连接中断")
+        remaining -= count
+        return data
+
+    if hasher is None:
+        hasher = hashlib.md5()
+    written = 0
+    block_size, = DELTA_HEADER.unpack(read(DELTA_HEADER.size))
+    if block_size <= 0:
+        raise DeltaError("增量数据块大小不正确")
+    basis_blocks = -(-basis.seek(0, 2) // block_size)
+
+    while remaining > 0:
+        op = read(1)
+        if op == b'C':
+            start, count = struct.unpack('!II', read(8))
+            if start + count > basis_blocks:
+                raise DeltaError("块引用超出原文件范围")
+            basis.seek(start * block_size)
+            left = count * block_size
+            while left > 0:
+                chunk = basis.read(min(left, DEFAULT_BUFFER_SIZE * 64))
+                if not chunk:
+                    break
+                out.write(chunk)
+                hasher.update(chunk)
+                written += len(chunk)
+                left -= len(chunk)
+        elif op == b'L':
+            length, = struct.unpack('!I', read(4))
+            while length > 0:
+                chunk = read(min(length, DEFAULT_BUFFER_SIZE * 64))
+                out.write(chunk)
+                hasher.update(chunk)
+                written += len(chunk)
+                length -= len(chunk)
+        else:
+            raise DeltaError(f"未知的增量指令: {op!r}")
+
+    return written, hasher.hexdigest()
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+文件同步工具排除规则模块
+
+把 exclude.conf 中的规则编译为便于查找的结构，供目录扫描和文件对比共用：
+- 扩展名：集合（不区分大小写）
+- 目录名：集合，路径中任意一级目录名匹配即排除
+- 特定路径：按路径分级的前缀树，路径本身及其下的所有文件都排除
+- 通配符：合并编译为一个正则表达式，不含/的模式匹配文件名或目录名，含/的模式匹配相对路径
+"""
+
+import fnmatch
+import os
+import re
+
+from config import load_exclude_config
+
+# 前缀树中表示一条规则结束的键
+_END = ''
+
+
+def _split(path):
+    """把相对路径拆分为各级名称"""
+    path = str(path)
+    if os.sep != '/':
+        path = path.replace(os.sep, '/')
+    return path.strip('/').split('/')
+
+
+def _compile_patterns(patterns):
+    """把多个通配符模式合并编译为一个正则表达式，没有模式时返回 None"""
+    if not patterns:
+        return None
+    return re.compile('|'.join(f'(?:{fnmatch.translate(pattern)})' for pattern in patterns))
+
+
+class ExcludeMatcher:
+    """编译后的排除规则"""
+
+    def __init__(self, extensions=(), directories=(), paths=(), patterns=()):
+        """
+        Args:
+            extensions: 排除的扩展名，如 .db
+            directories: 排除的目录名
+            paths: 排除的相对路径（用/分隔）
+            patterns: 排除的通配符模式
+        """
+        # 原始规则，发送给服务端构建相同范围的文件清单
+        self.rules = {
+            "extensions": list(extensions),
+            "directories": list(directories),
+            "paths": list(paths),
+            "patterns": list(patterns)
+        }
+        self.extensions = {ext.lower() for ext in extensions}
+        self.directories = set(directories)
+
+        self.path_trie = {}
+        for path in paths:
+            node = self.path_trie
+            for part in _split(path):
+                node = node.setdefault(part, {})
+            node[_END] = True
+
+        self.name_regex = _compile_patterns([p for p in patterns if '/' not in p])
+        self.path_regex = _compile_patterns([p.strip('/') for p in patterns if '/' in p])
+        self.rule_count = len(self.extensions) + len(self.directories) + len(paths) + len(patterns)
+
+    @classmethod
+    def from_config(cls, config_file='exclude.conf'):
+        """从配置文件加载并编译排除规则"""
+        return cls(*load_exclude_config(config_file))
+
+    def match_file(self, path):
+        """检查文件是否应该被排除
+
+        Args:
+            path: 文件相对路径
+
+        Returns:
+            如果文件应该被排除，返回True，否则返回False
+        """
+        parts = _split(path)
+        name = parts[-1]
+        dot = name.rfind('.')
+        # 与 Path.suffix 一致：以点开头或结尾的名称没有扩展名
+        if 0 < dot < len(name) - 1 and name[dot:].lower() in self.extensions:
+            return True
+        return self._match_parts(parts)
+
+    def match_directory(self, path):
+        """检查目录是否应该被排除，排除的目录扫描时不再进入
+
+        Args:
+            path: 目录相对路径
+
+        Returns:
+            如果目录应该被排除，返回True，否则返回False
+        """
+        return self._match_parts(_split(path))
+
+    def _match_parts(self, parts):
+        if not self.directories.isdisjoint(parts):
+            return True
+
+        if self.path_trie:
+            node = self.path_trie
+            for part in parts:
+                node = node.get(part)
+                if node is None:
+                    break
+                if _END in node:
+                    return True
+
+        if self.name_regex is not None:
+            for part in parts:
+                if self.name_regex.match(part):
+                    return True
+        if self.path_regex is not None and self.path_regex.match('/'.join(parts)):
+            return True
+        return False
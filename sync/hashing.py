@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+文件同步工具哈希模块
+
+- 支持 MD5 和 BLAKE2b。MD5 哈希值保持原来的32位十六进制格式，其他算法加上前缀
+  （如 "blake2b:..."），服务端按哈希值的前缀选择校验算法
+- HashEngine 按 (路径, 大小, 修改时间, inode) 缓存哈希值，未命中的文件分批在线程池中计算
+  （hashlib 计算时释放GIL），大文件用 mmap 读取
+"""
+
+import hashlib
+import mmap
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from config import HASH_ALGORITHMS, HASH_WORKERS, logger
+
+DEFAULT_HASH_ALGORITHM = 'md5'
+# 小于该大小的文件一次读入，否则用 mmap
+MMAP_MIN_SIZE = 4 * 1024 * 1024
+# 线程池每个任务处理的文件数和数据量上限，小文件成批提交以减少调度开销
+BATCH_FILES = 256
+BATCH_BYTES = 16 * 1024 * 1024
+
+
+def new_hasher(algorithm=DEFAULT_HASH_ALGORITHM):
+    """创建哈希对象
+
+    Args:
+        algorithm: md5 或 blake2b
+
+    Returns:
+        hashlib 哈希对象
+    """
+    if algorithm == 'blake2b':
+        # 32字节摘要，比默认的64字节短，强度足够
+        return hashlib.blake2b(digest_size=32)
+    if algorithm == 'md5':
+        return hashlib.md5()
+    raise ValueError(f"不支持的哈希算法: {algorithm}")
+
+
+def format_hash(algorithm, hex_digest):
+    """哈希值的字符串形式，MD5 不加前缀以兼容旧版本"""
+    if algorithm == DEFAULT_HASH_ALGORITHM:
+        return hex_digest
+    return f"{algorithm}:{hex_digest}"
+
+
+def hash_algorithm_of(hash_value):
+    """根据哈希值的前缀判断算法"""
+    if hash_value and ':' in hash_value:
+        return hash_value.split(':', 1)[0]
+    return DEFAULT_HASH_ALGORITHM
+
+
+def hasher_for(hash_value):
+    """创建与给定哈希值同一算法的哈希对象，用于校验收到的文件
+
+    Args:
+        hash_value: 期望的哈希值
+
+    Returns:
+        (算法, 哈希对象)，算法不支持时使用MD5（校验必然失败）
+    """
+    algorithm = hash_algorithm_of(hash_value)
+    if algorithm not in HASH_ALGORITHMS:
+        algorithm = DEFAULT_HASH_ALGORITHM
+    return algorithm, new_hasher(algorithm)
+
+
+def choose_hash_algorithm(server_algorithms):
+    """按本地优先顺序选择服务端也支持的算法，旧服务端不返回列表时使用 MD5"""
+    for algorithm in HASH_ALGORITHMS:
+        if algorithm in (server_algorithms or []):
+            return algorithm
+    return DEFAULT_HASH_ALGORITHM
+
+
+def hash_file(file_path, algorithm=DEFAULT_HASH_ALGORITHM):
+    """计算文件哈希值
+
+    Args:
+        file_path: 文件路径
+        algorithm: 哈希算法
+
+    Returns:
+        哈希值字符串
+    """
+    hasher = new_hasher(algorithm)
+    with open(file_path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size >= MMAP_MIN_SIZE:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                hasher.update(data)
+        else:
+            hasher.update(f.read())
+    return format_hash(algorithm, hasher.hexdigest())
+
+
+class HashEngine:
+    """带缓存的并行哈希计算"""
+
+    def __init__(self, db, algorithm=DEFAULT_HASH_ALGORITHM, workers=HASH_WORKERS):
+        """
+        Args:
+            db: FileDatabase，哈希缓存保存在其 file_hashes 表中
+            algorithm: 哈希算法
+            workers: 线程数，None 表示CPU核数
+        """
+        self.db = db
+        self.algorithm = algorithm
+        self.workers = workers or os.cpu_count() or 1
+        self.hits = 0
+        self.misses = 0
+
+    def hash_files(self, root, paths):
+        """计算一组文件的哈希值
+
+        Args:
+            root: 根目录
+            paths: 相对路径列表
+
+        Returns:
+            相对路径 -> {'size', 'modified_time', 'hash'}，不存在或无法读取的文件不返回
+        """
+        if not paths:
+            return {}
+        cache = self.db.get_cached_hashes(self.algorithm)
+        results = {}
+        pending = []
+
+        for rel_path in paths:
+            try:
+                stat = os.stat(os.path.join(root, rel_path))
+            except OSError:
+                continue
+            key = (stat.st_size, stat.st_mtime_ns, stat.st_ino)
+            cached = cache.get(rel_path)
+            if cached and cached[0] == key:
+                results[rel_path] = {'size': stat.st_size, 'modified_time': stat.st_mtime, 'hash': cached[1]}
+            else:
+                pending.append((rel_path, stat, key))
+
+        self.hits = len(results)
+        self.misses = len(pending)
+        if not pending:
+            return results
+
+        started = time.time()
+        rows = []
+        if self.workers == 1:
+            hashed = zip(pending, self._hash_batch(root, pending))
+        else:
+            batches = self._batches(pending)
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                done = list(executor.map(lambda batch: self._hash_batch(root, batch), batches))
+            hashed = ((item, hash_value) for batch, values in zip(batches, done)
+                      for item, hash_value in zip(batch, values))
+
+        for (rel_path, stat, key), hash_value in hashed:
+            if hash_value is None:
+                continue
+            results[rel_path] = {'size': stat.st_size, 'modified_time': stat.st_mtime, 'hash': hash_value}
+            rows.append((rel_path, key[0], key[1], key[2], self.algorithm, hash_value))
+
+        self.db.store_hashes(rows)
+        logger.info(f"计算了 {len(rows)} 个文件的哈希值（{self.algorithm}，{self.workers} 个线程，"
+                    f"{time.time() - started:.2f}秒），缓存命中 {self.hits} 个")
+        return results
+
+    @staticmethod
+    def _batches(pending):
+        """按文件数和数据量把待计算的文件分批"""
+        batches = []
+        batch = []
+        batch_bytes = 0
+        for item in pending:
+            batch.append(item)
+            batch_bytes += item[1].st_size
+            if len(batch) >= BATCH_FILES or batch_bytes >= BATCH_BYTES:
+                batches.append(batch)
+                batch = []
+                batch_bytes = 0
+        if batch:
+            batches.append(batch)
+        return batches
+
+    def _hash_batch(self, root, batch):
+        """计算一批文件的哈希值，无法读取的文件返回 None"""
+        values = []
+        for rel_path, _, _ in batch:
+            try:
+                values.append(hash_file(os.path.join(root, rel_path), self.algorithm))
+            except OSError as e:
+                logger.warning(f"计算文件哈希失败: {rel_path}, 错误: {str(e)}")
+                values.append(None)
+        return values
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+文件同步工具清单模块
+
+按目录构建 Merkle 树：目录的摘要由其中文件的 (名称, 大小, 修改时间) 和子目录的 (名称, 摘要) 计算。
+客户端先发送根目录摘要，服务端摘要相同时直接回复相同，否则回复该目录的文件列表（含哈希值）和
+子目录摘要，客户端只对摘要不同的子目录继续请求。文件没有变化时一次往返就能完成对比。
+
+哈希值不参与摘要计算：客户端只对大小或修改时间变化的文件计算哈希，摘要中包含哈希值会导致
+双方摘要永远不同。
+"""
+
+import hashlib
+import os
+
+
+def _normalize(path):
+    """统一使用/分隔路径"""
+    path = str(path)
+    if os.sep != '/':
+        path = path.replace(os.sep, '/')
+    return path.strip('/')
+
+
+def child_path(directory, name):
+    """目录下的子路径"""
+    return f"{directory}/{name}" if directory else name
+
+
+class Manifest:
+    """文件清单及其目录 Merkle 树"""
+
+    def __init__(self, files):
+        """
+        Args:
+            files: 可迭代的 (路径, 大小, 修改时间, 哈希值)，路径为相对路径
+        """
+        # 目录 -> {文件名: (原始路径, 大小, 修改时间, 哈希值)}
+        self.files = {}
+        # 目录 -> {子目录名, ...}
+        self.subdirs = {}
+
+        for path, size, modified_time, hash_value in files:
+            directory, _, name = _normalize(path).rpartition('/')
+            self.files.setdefault(directory, {})[name] = (path, size, modified_time, hash_value)
+            # 登记各级上级目录，遇到已登记的目录说明更上级也已登记
+            while directory:
+                parent, _, dir_name = directory.rpartition('/')
+                children = self.subdirs.setdefault(parent, set())
+                if dir_name in children:
+                    break
+                children.add(dir_name)
+                directory = parent
+
+        # 从最深的目录开始计算摘要，子目录的摘要总是先算好
+        self.digests = {}
+        directories = set(self.files) | set(self.subdirs) | {''}
+        for directory in sorted(directories, key=lambda d: d.count('/') + bool(d), reverse=True):
+            self.digests[directory] = self._digest(directory)
+
+    def _digest(self, directory):
+        digest = hashlib.blake2b(digest_size=16)
+        for name, (_, size, modified_time, _) in sorted(self.files.get(directory, {}).items()):
+            digest.update(f"f\0{name}\0{size}\0{round(modified_time * 1000)}\n".encode('utf-8', 'surrogateescape'))
+        for name in sorted(self.subdirs.get(directory, ())):
+            digest.update(f"d\0{name}\0{self.digests[child_path(directory, name)]}\n".encode('utf-8', 'surrogateescape'))
+        return digest.hexdigest()
+
+    def digest(self, directory=''):
+        """目录的摘要，目录不存在时返回 None"""
+        return self.digests.get(directory)
+
+    def listing(self, directory):
+        """目录的文件列表和子目录摘要
+
+        Args:
+            directory: 目录相对路径（用/分隔），根目录为空字符串
+
+        Returns:
+            {"files": {文件名: [大小, 修改时间, 哈希值]}, "dirs": {子目录名: 摘要}}
+        """
+        return {
+            "files": {name: [size, modified_time, hash_value]
+                      for name, (_, size, modified_time, hash_value) in self.files.get(directory, {}).items()},
+            "dirs": {name: self.digests[child_path(directory, name)] for name in self.subdirs.get(directory, ())}
+        }
+
+    def files_under(self, directory):
+        """目录及其所有子目录中的文件
+
+        Returns:
+            [(原始路径, 大小, 修改时间, 哈希值), ...]
+        """
+        result = []
+        stack = [directory]
+        while stack:
+            current = stack.pop()
+            result.extend(self.files.get(current, {}).values())
+            stack.extend(child_path(current, name) for name in self.subdirs.get(current, ()))
+        return result
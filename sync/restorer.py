@@ -4,98 +4,191 @@
 """
 文件同步工具恢复模块
 
-负责文件恢复功能，包括按时间范围恢复文件等
+负责文件恢复功能，包括按时间范围恢复文件、恢复到某个时间点等：
+- 要恢复的版本由 FileDatabase.get_backup_catalog 一次窗口查询得到（每个文件一条），可以只恢复某个目录
+- 多个文件在线程池中并行恢复（os.copy_file_range 复制），大小和修改时间已与备份相同的文件跳过
+- 恢复完成后在一个事务中更新数据库
+- dry_run 时只列出将要恢复的文件
 """
 
 import os
 import time
-import shutil
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
-from config import logger
+from backup_store import BackupStore, maintain_backups
+from config import RESTORE_WORKERS, logger
 from database import FileDatabase
+from utils import copy_file
+
+# 每恢复多少个文件记录一次进度
+PROGRESS_INTERVAL = 1000
+
+
+def format_time(timestamp):
+    return time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(timestamp))
+
 
 class FileRestorer:
     """文件恢复工具"""
 
-    def __init__(self):
-        """初始化恢复工具"""
+    def __init__(self, sync_dir=None, data_dir=None):
+        """初始化恢复工具
+
+        Args:
+            sync_dir: 同步目录，默认为脚本所在目录的上一级目录
+            data_dir: 数据库和备份所在目录，默认为脚本所在目录
+        """
         # 获取当前脚本所在目录
         self.script_dir = Path(__file__).resolve().parent
+        self.sync_dir = Path(sync_dir) if sync_dir else self.script_dir.parent
+        self.data_dir = Path(data_dir) if data_dir else self.script_dir
 
         # 初始化数据库
-        self.db = FileDatabase(self.script_dir / "file_sync.db")
+        self.db = FileDatabase(self.data_dir / "file_sync.db")
 
         # 设置备份目录
-        self.backup_dir = self.script_dir / "backups"
+        self.backup_dir = self.data_dir / "backups"
+        self.backup_store = BackupStore(self.backup_dir, self.data_dir)
 
         logger.info("文件恢复工具初始化完成")
 
-    def restore_files_by_time_range(self, start_time, end_time):
-        """根据时间范围恢复文件
+    def restore_files_by_time_range(self, start_time, end_time, path_prefix=None, dry_run=False):
+        """根据时间范围恢复文件，每个文件恢复为该范围内最新的备份
 
         Args:
             start_time: 开始时间戳
             end_time: 结束时间戳
+            path_prefix: 只恢复该目录下的文件，None 表示所有文件
+            dry_run: 只列出将要恢复的文件
 
         Returns:
-            恢复的文件数量
+            恢复的文件数量（dry_run 时为将要恢复的数量）
         """
-        # 获取备份文件列表
-        backup_files = self.db.get_backup_files_by_time_range(start_time, end_time)
-
-        if not backup_files:
-            logger.info(f"在指定时间范围内没有找到备份文件: {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(start_time))} - {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(end_time))}")
+        backups = self.db.get_backup_catalog(start_time, end_time, path_prefix)
+        if not backups:
+            logger.info(f"在指定时间范围内没有找到备份文件: {format_time(start_time)} - {format_time(end_time)}")
             return 0
 
-        logger.info(f"找到 {len(backup_files)} 个备份文件")
+        logger.info(f"找到 {len(backups)} 个文件的备份")
+        return self.restore_backups(backups, dry_run)
 
-        # 按原始路径分组，只保留每个路径最新的备份
-        latest_backups = {}
-        for backup in backup_files:
-            original_path = backup['original_path']
-            if original_path not in latest_backups or backup['backup_time'] > latest_backups[original_path]['backup_time']:
-                latest_backups[original_path] = backup
+    def restore_to_time(self, as_of, path_prefix=None, dry_run=False):
+        """把文件恢复为 as_of 时刻的内容
 
-        # 恢复文件
-        restored_count = 0
-        parent_dir = self.script_dir.parent
+        备份是文件被覆盖前的内容，所以文件在 as_of 之后第一次被覆盖时的备份就是它在 as_of 时刻的内容；
+        as_of 之后没有被覆盖过的文件保持不变，as_of 之后新建的文件不会删除。
 
-        for original_path, backup in latest_backups.items():
-            # 构建完整的目标路径
-            full_dest_path = parent_dir / original_path
+        Args:
+            as_of: 时间戳
+            path_prefix: 只恢复该目录下的文件，None 表示所有文件
+            dry_run: 只列出将要恢复的文件
 
-            # 构建完整的备份文件路径
-            backup_path = self.script_dir / backup['backup_path']
+        Returns:
+            恢复的文件数量（dry_run 时为将要恢复的数量）
+        """
+        backups = self.db.get_backup_catalog(start_time=as_of, path_prefix=path_prefix, earliest=True)
+        if not backups:
+            logger.info(f"{format_time(as_of)} 之后没有文件被覆盖，无需恢复")
+            return 0
 
-            if not backup_path.exists():
-                logger.warning(f"备份文件不存在: {backup_path}")
-                continue
+        logger.info(f"{format_time(as_of)} 之后有 {len(backups)} 个文件被覆盖")
+        return self.restore_backups(backups, dry_run)
 
-            # 确保目标目录存在
-            full_dest_path.parent.mkdir(parents=True, exist_ok=True)
+    def restore_backups(self, backups, dry_run=False, workers=RESTORE_WORKERS):
+        """并行恢复备份，完成后在一个事务中更新数据库
 
+        Args:
+            backups: get_backup_catalog 返回的备份记录，每个文件一条
+            dry_run: 只列出将要恢复的文件
+            workers: 线程数
+
+        Returns:
+            恢复的文件数量（含已是该版本而跳过的文件；dry_run 时为将要恢复的数量）
+        """
+        if dry_run:
+            for backup in backups:
+                source = "备份存储" if backup.get('object_key') else backup['backup_path']
+                logger.info(f"[试运行] {backup['original_path']} <- {format_time(backup['backup_time'])} 的备份"
+                            f"（{backup['size']} 字节，{source}）")
+            logger.info(f"试运行：将恢复 {len(backups)} 个文件")
+            return len(backups)
+
+        started = time.time()
+        rows = []
+        skipped = 0
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="restore") as executor:
+            futures = [executor.submit(self.restore_file, backup) for backup in backups]
+            for backup, future in zip(backups, futures):
+                original_path = backup['original_path']
+                try:
+                    restored = future.result()
+                except Exception as e:
+                    logger.error(f"恢复文件失败: {original_path}, 错误: {str(e)}")
+                    continue
+                if restored is None:
+                    continue
+                if not restored:
+                    skipped += 1
+                rows.append((original_path, backup['size'], backup['modified_time'], backup['hash'], time.time()))
+                if len(rows) % PROGRESS_INTERVAL == 0:
+                    logger.info(f"已恢复文件 ({len(rows)}/{len(backups)})")
+
+        if rows:
             try:
-                # 复制备份文件到原始位置
-                shutil.copy2(backup_path, full_dest_path)
+                self.db.record_received_files(rows)
+            except Exception as e:
+                logger.error(f"更新数据库失败: {str(e)}")
 
-                # 恢复文件修改时间
-                os.utime(full_dest_path, (time.time(), backup['modified_time']))
+        logger.info(f"文件恢复完成，共恢复 {len(rows)} 个文件（其中 {skipped} 个已是该版本），"
+                    f"耗时 {time.time() - started:.2f} 秒")
+        return len(rows)
 
-                # 更新数据库
-                self.db.cursor.execute('''
-                INSERT OR REPLACE INTO files (path, size, modified_time, hash, last_sync_time)
-                VALUES (?, ?, ?, ?, ?)
-                ''', (original_path, backup['size'], backup['modified_time'], backup['hash'], time.time()))
+    def restore_file(self, backup):
+        """恢复一个文件并设置修改时间
 
-                restored_count += 1
-                logger.info(f"已恢复文件 ({restored_count}/{len(latest_backups)}): {original_path}")
-            except Exception as e:
-                logger.error(f"恢复文件失败: {original_path}, 错误: {str(e)}")
+        直接覆盖原文件（与写临时文件再替换相比少一次创建和改名）；中途失败的文件大小或修改时间与备份不同，
+        再次恢复时会重新复制。
+
+        Args:
+            backup: 备份记录
+
+        Returns:
+            True 表示已恢复；False 表示文件的大小和修改时间已与备份相同，未复制；None 表示备份不存在
+        """
+        full_dest_path = self.sync_dir / backup['original_path']
+        try:
+            current = full_dest_path.stat()
+        except FileNotFoundError:
+            current = None
+        if current is not None and current.st_size == backup['size'] \
+                and abs(current.st_mtime - backup['modified_time']) < 0.001:
+            return False
+
+        # 确保目标目录存在
+        full_dest_path.parent.mkdir(parents=True, exist_ok=True)
+        object_key = backup.get('object_key')
+        try:
+            if object_key:
+                # 从备份存储中取出原内容（压缩保存的对象需要解压）
+                self.backup_store.restore(object_key, full_dest_path)
+            else:
+                # 旧格式的备份
+                copy_file(self.data_dir / backup['backup_path'], full_dest_path)
+        except FileNotFoundError:
+            logger.warning(f"备份文件不存在: {backup['backup_path']}")
+            return None
+        # 恢复文件修改时间
+        os.utime(full_dest_path, (time.time(), backup['modified_time']))
+        return True
+
+    def maintain_backups(self):
+        """立即执行一次备份维护（导入旧备份、保留策略、清理未引用对象）
 
-        self.db.conn.commit()
-        logger.info(f"文件恢复完成，共恢复 {restored_count} 个文件")
-        return restored_count
+        Returns:
+            统计信息字典
+        """
+        return maintain_backups(self.db, self.backup_store)
 
     def close(self):
         """关闭恢复工具"""
@@ -13,22 +13,35 @@ import socket
 import json
 import threading
 import queue
-import shutil
 from pathlib import Path
 
-from config import DEFAULT_PORT, DEFAULT_BUFFER_SIZE, logger, setup_file_logger
+from backup_store import BackupStore, maintain_backups
+from compression import DecompressReader, available_codecs, get_codec
+from config import (
+    DEFAULT_PORT, PROTOCOL_VERSION, ACK_BATCH_SIZE, HASH_ALGORITHMS, TRANSFER_BUFFER_SIZE, BACKUP_GC_INTERVAL, logger,
+    setup_file_logger
+)
 from database import FileDatabase
-from utils import calculate_file_hash, send_data, receive_data
+from delta import DeltaError, apply_delta, file_signature
+from exclude import ExcludeMatcher
+from hashing import format_hash, hasher_for
+from manifest import Manifest
+from utils import (
+    calculate_file_hash, configure_socket, send_data, receive_data, receive_record_header, send_file, receive_to_file,
+    END_OF_RECORDS, DELTA_RECORD, COMPRESSED_RECORD
+)
 
 class SyncServer:
-    """同步服务端"""
+    """同步服务端（每个客户端连接一个线程，见 AsyncSyncServer）"""
 
-    def __init__(self, port=DEFAULT_PORT, log_dir=None):
+    def __init__(self, port=DEFAULT_PORT, log_dir=None, sync_dir=None, data_dir=None):
         """初始化服务端
 
         Args:
             port: 服务端监听端口
             log_dir: 日志目录，默认为当前目录下的logs文件夹
+            sync_dir: 同步目录，默认为脚本所在目录的上一级目录
+            data_dir: 数据库和备份所在目录，默认为脚本所在目录
         """
         self.port = port
 
@@ -44,22 +57,22 @@ class SyncServer:
         # 设置文件日志
         setup_file_logger(self.log_dir)
 
-        # 创建socket
-        self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-
         # 客户端连接队列
         self.clients = queue.Queue()
 
         # 获取当前脚本所在目录
         self.script_dir = Path(__file__).resolve().parent
+        self.sync_dir = Path(sync_dir) if sync_dir else self.script_dir.parent
+        self.data_dir = Path(data_dir) if data_dir else self.script_dir
 
         # 设置备份目录
-        self.backup_dir = self.script_dir / "backups"
+        self.backup_dir = self.data_dir / "backups"
         self.backup_dir.mkdir(exist_ok=True)
+        self.backup_store = BackupStore(self.backup_dir, self.data_dir)
 
         # 初始化数据库
-        self.db = FileDatabase(self.script_dir / "file_sync.db")
+        self.db_path = self.data_dir / "file_sync.db"
+        self.db = FileDatabase(self.db_path)
 
         # 扫描上一级目录
         self.scan_parent_directory()
@@ -68,13 +81,15 @@ class SyncServer:
 
     def scan_parent_directory(self):
         """扫描上一级目录"""
-        parent_dir = self.script_dir.parent
-        logger.info(f"开始扫描上一级目录: {parent_dir}")
-        file_count = self.db.scan_directory(parent_dir)
+        logger.info(f"开始扫描上一级目录: {self.sync_dir}")
+        file_count = self.db.scan_directory(self.sync_dir)
         logger.info(f"扫描完成，共发现 {file_count} 个文件")
 
     def start(self):
-        """启动服务端"""
+        """启动服务端（每个客户端连接一个线程）"""
+        # 创建socket
+        self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
         try:
             # 绑定地址和端口
             self.server_socket.bind(('0.0.0.0', self.port))
@@ -87,6 +102,10 @@ class SyncServer:
             client_handler.daemon = True
             client_handler.start()
 
+            # 启动备份维护线程
+            if BACKUP_GC_INTERVAL:
+                threading.Thread(target=self.backup_maintenance_loop, daemon=True).start()
+
             # 接受客户端连接
             while True:
                 client_socket, client_address = self.server_socket.accept()
@@ -121,9 +140,12 @@ class SyncServer:
             client_address: 客户端地址
         """
         client_ip = client_address[0]
+        configure_socket(client_socket)
 
         # 为当前线程创建单独的数据库连接
-        thread_db = FileDatabase(self.script_dir / "file_sync.db")
+        thread_db = FileDatabase(self.db_path)
+        # 连接内多次请求共用的状态（如清单对比构建的 Merkle 树）
+        session = {}
 
         try:
             # 持续处理客户端请求，直到连接关闭或出错
@@ -146,10 +168,16 @@ class SyncServer:
 
                 if request_type == 'time_sync':
                     # 处理时间同步请求
-                    self.handle_time_sync(client_socket, request)
+                    self.handle_time_sync(client_socket, request, session)
+                elif request_type == 'manifest':
+                    # 处理清单对比请求
+                    self.handle_manifest(client_socket, request, thread_db, session)
                 elif request_type == 'db_download':
-                    # 处理数据库下载请求
+                    # 处理数据库下载请求（旧版本客户端）
                     self.handle_db_download(client_socket)
+                elif request_type == 'block_signatures':
+                    # 处理块签名请求（增量传输）
+                    self.handle_block_signatures(client_socket, request)
                 elif request_type == 'file_sync':
                     # 处理文件同步请求
                     self.handle_file_sync(client_socket, client_ip, request, thread_db)
@@ -173,25 +201,105 @@ class SyncServer:
             client_socket.close()
             logger.info(f"客户端 {client_ip} 连接已关闭")
 
-    def handle_time_sync(self, client_socket, request):
+    def handle_time_sync(self, client_socket, request, session=None):
         """处理时间同步请求
 
         Args:
             client_socket: 客户端socket
             request: 请求数据
+            session: 连接内共用的状态，记录客户端是否支持压缩的消息
+        """
+        if session is not None:
+            session['compress_messages'] = self.accepts_compression(request)
+        send_data(client_socket, json.dumps(self.time_sync_reply(request)))
+
+    @staticmethod
+    def accepts_compression(request):
+        """客户端在时间同步请求中声明了支持的压缩算法（旧客户端没有），之后较大的回复可以压缩发送"""
+        return bool(request.get('compression')) and bool(available_codecs())
+
+    @staticmethod
+    def time_sync_reply(request):
+        """生成时间同步请求的回复
+
+        Args:
+            request: 请求数据
+
+        Returns:
+            回复数据
         """
         client_time = request.get('client_time')
         server_time = time.time()
-
-        response = {
+        logger.info(f"时间同步完成，时间差: {server_time - client_time:.2f}秒")
+        return {
             "status": "ok",
             "server_time": server_time,
             "client_time": client_time,
-            "time_diff": server_time - client_time
+            "time_diff": server_time - client_time,
+            # 客户端从中选择计算文件哈希的算法
+            "hash_algorithms": HASH_ALGORITHMS,
+            # 客户端从中选择传输压缩算法
+            "compression": available_codecs()
         }
 
-        send_data(client_socket, json.dumps(response))
-        logger.info(f"时间同步完成，时间差: {server_time - client_time:.2f}秒")
+    def handle_manifest(self, client_socket, request, db, session):
+        """处理清单对比请求
+
+        按客户端的排除规则从数据库构建目录 Merkle 树（同一连接内复用），对请求中的每个目录，
+        摘要与客户端相同时回复 None，否则回复该目录的文件列表和子目录摘要。
+
+        Args:
+            client_socket: 客户端socket
+            request: 请求数据，dirs 为 {目录: 客户端摘要}
+            db: 数据库连接
+            session: 连接内共用的状态
+        """
+        rules = request.get('exclude') or {}
+        key = json.dumps(rules, sort_keys=True)
+        try:
+            if session.get('manifest_key') != key:
+                session['manifest'] = self.load_manifest(db, rules)
+                session['manifest_key'] = key
+        except Exception as e:
+            logger.error(f"构建文件清单失败: {str(e)}")
+            send_data(client_socket, json.dumps({"status": "error", "message": str(e)}))
+            return
+
+        send_data(client_socket, json.dumps(self.manifest_reply(session['manifest'], request)),
+                  compress=session.get('compress_messages', False))
+
+    @staticmethod
+    def load_manifest(db, rules):
+        """按排除规则从数据库构建文件清单
+
+        Args:
+            db: 数据库连接
+            rules: 客户端的排除规则（ExcludeMatcher 的参数）
+
+        Returns:
+            Manifest 对象
+        """
+        exclude = ExcludeMatcher(**rules)
+        db.cursor.execute('SELECT path, size, modified_time, hash FROM files')
+        return Manifest(row for row in db.cursor.fetchall() if not exclude.match_file(row[0]))
+
+    @staticmethod
+    def manifest_reply(manifest, request):
+        """对比请求中的目录摘要，生成清单对比的回复
+
+        Args:
+            manifest: 服务端文件清单
+            request: 请求数据，dirs 为 {目录: 客户端摘要}
+
+        Returns:
+            {"status": "ok", "dirs": {目录: None 或 文件列表和子目录摘要}}
+        """
+        dirs = {}
+        for directory, digest in (request.get('dirs') or {}).items():
+            dirs[directory] = None if manifest.digest(directory) == digest else manifest.listing(directory)
+        changed = sum(1 for listing in dirs.values() if listing is not None)
+        logger.info(f"清单对比: 请求 {len(dirs)} 个目录，其中 {changed} 个不同")
+        return {"status": "ok", "dirs": dirs}
 
     def handle_db_download(self, client_socket):
         """处理数据库下载请求
@@ -200,7 +308,7 @@ class SyncServer:
             client_socket: 客户端socket
         """
         try:
-            db_path = self.script_dir / "file_sync.db"
+            db_path = self.db_path
             logger.info(f"收到数据库下载请求，数据库路径: {db_path}")
 
             if not db_path.exists():
@@ -235,15 +343,7 @@ class SyncServer:
             # 发送数据库文件
             try:
                 with open(db_path, 'rb') as f:
-                    sent_size = 0
-                    while True:
-                        chunk = f.read(DEFAULT_BUFFER_SIZE)
-                        if not chunk:
-                            break
-                        client_socket.sendall(chunk)
-                        sent_size += len(chunk)
-                        if sent_size % (DEFAULT_BUFFER_SIZE * 10) == 0:  # 每发送约40KB记录一次日志
-                            logger.info(f"已发送 {sent_size}/{file_size} 字节 ({sent_size/file_size*100:.1f}%)")
+                    sent_size = send_file(client_socket, f, file_size)
 
                 logger.info(f"数据库文件发送完成，总共发送: {sent_size} 字节")
             except Exception as e:
@@ -257,9 +357,55 @@ class SyncServer:
                 logger.error("无法发送错误信息到客户端")
                 pass
 
+    def handle_block_signatures(self, client_socket, request):
+        """返回服务端已有文件的块签名，客户端据此计算增量数据
+
+        先发送JSON（每个文件的大小、块大小和签名长度，服务端没有的文件不返回），
+        再依次发送各文件的签名数据。
+
+        Args:
+            client_socket: 客户端socket
+            request: 请求数据，files 为文件相对路径列表
+        """
+        entries, signatures = self.collect_signatures(request.get('files', []))
+        send_data(client_socket, json.dumps({"status": "ok", "files": entries}))
+        for signature in signatures:
+            client_socket.sendall(signature)
+        logger.info(f"已发送 {len(entries)} 个文件的块签名")
+
+    def collect_signatures(self, paths):
+        """计算服务端已有文件的块签名，不存在或不在同步目录内的文件跳过
+
+        Args:
+            paths: 文件相对路径列表
+
+        Returns:
+            (每个文件的 {path, size, block_size, length}, 对应的签名数据列表)
+        """
+        sync_root = self.sync_dir.resolve()
+        entries = []
+        signatures = []
+        for rel_path in paths:
+            full_path = self.sync_dir / rel_path
+            try:
+                full_path.resolve().relative_to(sync_root)
+                size, block_size, signature = file_signature(full_path)
+            except (OSError, ValueError):
+                continue
+            entries.append({"path": rel_path, "size": size, "block_size": block_size, "length": len(signature)})
+            signatures.append(signature)
+        return entries, signatures
+
     def handle_file_sync(self, client_socket, client_ip, request, thread_db=None):
         """处理文件同步请求
 
+        客户端在请求中带上 protocol_version，双方取较小的版本：
+        版本1逐个文件握手（ready_for_file → 文件内容 → file_received），
+        版本2由客户端连续发送文件记录，服务端每 ACK_BATCH_SIZE 个文件确认一次，
+        版本3的记录还可以是增量数据。
+        旧客户端不带版本号，按版本1处理。
+        版本2以上客户端可以在请求中指定压缩算法，服务端支持时在回复中确认，之后的记录可以压缩发送。
+
         Args:
             client_socket: 客户端socket
             client_ip: 客户端IP
@@ -270,15 +416,122 @@ class SyncServer:
         db = thread_db if thread_db is not None else self.db
         files_to_sync = request.get('files', [])
         file_count = len(files_to_sync)
+        protocol_version = min(int(request.get('protocol_version') or 1), PROTOCOL_VERSION)
+        codec = self.transfer_codec(request, protocol_version)
 
-        logger.info(f"客户端 {client_ip} 请求同步 {file_count} 个文件")
+        logger.info(f"客户端 {client_ip} 请求同步 {file_count} 个文件，协议版本: {protocol_version}，"
+                    f"压缩: {codec.name if codec else '无'}")
 
         # 发送准备就绪信息
-        send_data(client_socket, json.dumps({"status": "ready"}))
+        send_data(client_socket, json.dumps({
+            "status": "ready",
+            "protocol_version": protocol_version,
+            "ack_batch": ACK_BATCH_SIZE,
+            "compression": codec.name if codec else None
+        }))
+
+        if protocol_version >= 2:
+            received_files = self.receive_files_pipelined(client_socket, files_to_sync, db, codec)
+        else:
+            received_files = self.receive_files(client_socket, files_to_sync, db)
+
+        # 发送同步完成信息
+        send_data(client_socket, json.dumps({
+            "status": "sync_complete",
+            "received_files": received_files
+        }))
+
+        logger.info(f"客户端 {client_ip} 同步完成，共接收 {received_files}/{file_count} 个文件")
+
+    @staticmethod
+    def transfer_codec(request, protocol_version):
+        """文件同步请求中客户端指定的压缩算法
+
+        Args:
+            request: 请求数据
+            protocol_version: 协商后的协议版本
+
+        Returns:
+            压缩算法对象，未指定、服务端不支持或协议版本1时返回 None
+        """
+        name = request.get('compression')
+        if protocol_version < 2 or name not in available_codecs():
+            return None
+        return get_codec(name)
+
+    def backup_existing_file(self, db, rel_path, full_dest_path):
+        """覆盖前备份服务端已有的文件
 
-        # 接收文件
+        Args:
+            db: 数据库连接
+            rel_path: 文件相对路径
+            full_dest_path: 文件完整路径
+        """
+        backup = self.make_backup(rel_path, full_dest_path)
+        if backup is not None:
+            db.backup_file(*backup)
+
+    def make_backup(self, rel_path, full_dest_path):
+        """把服务端已有的文件存入备份存储，不写数据库
+
+        Args:
+            rel_path: 文件相对路径
+            full_dest_path: 文件完整路径
+
+        Returns:
+            备份记录 (原始路径, 备份路径, 大小, 修改时间, 哈希值, 备份对象)，即 FileDatabase.backup_file 的参数；
+            文件不存在时返回 None
+        """
+        if not full_dest_path.exists():
+            return None
+
+        original_file_stat = full_dest_path.stat()
+        key, object_path, created = self.backup_store.put(full_dest_path)
+        logger.info(f"已备份文件: {rel_path} -> {key}" + ("" if created else "（内容已存在，未重复保存）"))
+        return (
+            rel_path,
+            self.backup_store.relative_path(object_path),
+            original_file_stat.st_size,
+            original_file_stat.st_mtime,
+            key,
+            key
+        )
+
+    def run_backup_maintenance(self):
+        """执行一次备份维护（导入旧备份、保留策略、清理未引用对象），使用单独的数据库连接
+
+        Returns:
+            统计信息字典，失败时返回 None
+        """
+        db = FileDatabase(self.db_path)
+        try:
+            return maintain_backups(db, self.backup_store)
+        except Exception as e:
+            logger.error(f"备份维护失败: {str(e)}")
+            return None
+        finally:
+            db.close()
+
+    def backup_maintenance_loop(self):
+        """定期执行备份维护（后台线程）"""
+        while True:
+            self.run_backup_maintenance()
+            time.sleep(BACKUP_GC_INTERVAL)
+
+    def receive_files(self, client_socket, files_to_sync, db):
+        """逐个文件握手接收（协议版本1）
+
+        Args:
+            client_socket: 客户端socket
+            files_to_sync: 请求中的文件列表
+            db: 数据库连接
+
+        Returns:
+            成功接收的文件数量
+        """
         received_files = 0
-        parent_dir = self.script_dir.parent
+        file_count = len(files_to_sync)
+        buffer = memoryview(bytearray(TRANSFER_BUFFER_SIZE))
 
         for file_info in files_to_sync:
             rel_path = file_info.get('path')
@@ -287,47 +540,23 @@ class SyncServer:
             modified_time = file_info.get('modified_time')
 
             # 构建完整的目标路径
-            full_dest_path = parent_dir / rel_path
+            full_dest_path = self.sync_dir / rel_path
 
             # 确保目标目录存在
             full_dest_path.parent.mkdir(parents=True, exist_ok=True)
 
             # 如果文件已存在，备份它
-            if full_dest_path.exists():
-                # 生成备份文件名
-                backup_filename = f"{full_dest_path.name}_{int(time.time())}"
-                backup_path = self.backup_dir / backup_filename
-
-                # 复制文件到备份目录
-                shutil.copy2(full_dest_path, backup_path)
-
-                # 记录备份信息
-                original_file_stat = full_dest_path.stat()
-                db.backup_file(
-                    rel_path,
-                    str(backup_path.relative_to(self.script_dir)),
-                    original_file_stat.st_size,
-                    original_file_stat.st_mtime,
-                    calculate_file_hash(full_dest_path)
-                )
-
-                logger.info(f"已备份文件: {rel_path} -> {backup_path}")
+            self.backup_existing_file(db, rel_path, full_dest_path)
 
             # 发送准备接收文件的信息
             send_data(client_socket, json.dumps({"status": "ready_for_file"}))
 
             # 接收文件内容
             with open(full_dest_path, 'wb') as f:
-                received_size = 0
-                while received_size < file_size:
-                    chunk = client_socket.recv(min(DEFAULT_BUFFER_SIZE, file_size - received_size))
-                    if not chunk:
-                        break
-                    f.write(chunk)
-                    received_size += len(chunk)
+                receive_to_file(client_socket, file_size, f, buffer=buffer)
 
             # 验证文件哈希
-            received_hash = calculate_file_hash(full_dest_path)
+            received_hash = calculate_file_hash(full_dest_path, hasher_for(file_hash)[0])
             if received_hash != file_hash:
                 logger.warning(f"文件哈希不匹配: {rel_path}")
                 send_data(client_socket, json.dumps({"status": "hash_mismatch"}))
@@ -336,20 +565,219 @@ class SyncServer:
                 os.utime(full_dest_path, (time.time(), modified_time))
 
                 # 更新数据库
-                db.cursor.execute('''
-                INSERT OR REPLACE INTO files (path, size, modified_time, hash, last_sync_time)
-                VALUES (?, ?, ?, ?, ?)
-                ''', (rel_path, file_size, modified_time, file_hash, time.time()))
-                db.conn.commit()
+                db.record_received_files([(rel_path, file_size, modified_time, file_hash, time.time())])
 
                 send_data(client_socket, json.dumps({"status": "file_received"}))
                 received_files += 1
                 logger.info(f"已接收文件 ({received_files}/{file_count}): {rel_path}")
 
-        # 发送同步完成信息
-        send_data(client_socket, json.dumps({
-            "status": "sync_complete",
-            "received_files": received_files
-        }))
+        return received_files
 
-        logger.info(f"客户端 {client_ip} 同步完成，共接收 {received_files}/{file_count} 个文件")
+    def receive_files_pipelined(self, client_socket, files_to_sync, db, codec=None):
+        """流水线接收（协议版本2）
+
+        客户端连续发送记录（记录头 + 文件内容），以 END_OF_RECORDS 结束，
+        不等待每个文件的确认。服务端边接收边计算哈希，每 ACK_BATCH_SIZE 个文件
+        批量写数据库并回复一次 {"status": "ack", "results": [[序号, 状态], ...]}。
+        带 COMPRESSED_RECORD 标志的记录边接收边解压。
+
+        Args:
+            client_socket: 客户端socket
+            files_to_sync: 请求中的文件列表
+            db: 数据库连接
+            codec: 协商的压缩算法对象，None 表示不压缩
+
+        Returns:
+            成功接收的文件数量
+        """
+        received_files = 0
+        file_count = len(files_to_sync)
+        results = []
+        rows = []
+        backups = []
+        # 整个连接复用一个接收缓冲区
+        buffer = memoryview(bytearray(TRANSFER_BUFFER_SIZE))
+
+        def flush():
+            if rows or backups:
+                db.record_received_files(rows, backups)
+                rows.clear()
+                backups.clear()
+            if results:
+                send_data(client_socket, json.dumps({"status": "ack", "results": results}))
+                results.clear()
+
+        # 客户端收到 sync_complete 之前不会再发送请求，缓冲读取不会读走后续请求的数据
+        stream = client_socket.makefile('rb', buffering=256 * 1024)
+        try:
+            while True:
+                header = receive_record_header(stream)
+                if header is None:
+                    raise ConnectionError("接收文件记录时连接中断")
+                index, file_size = header
+                if index == END_OF_RECORDS:
+                    break
+
+                is_delta = index & DELTA_RECORD
+                is_compressed = index & COMPRESSED_RECORD
+                index &= ~(DELTA_RECORD | COMPRESSED_RECORD)
+                file_info = files_to_sync[index] if index < file_count else {}
+                rel_path = file_info.get('path')
+                source = stream
+                if is_compressed:
+                    if codec is None:
+                        raise ConnectionError("收到未协商压缩算法的压缩记录")
+                    source = DecompressReader(stream, codec, file_size)
+                if is_delta:
+                    status = self.receive_delta_record(source, file_info, file_size, rows, backups)
+                else:
+                    status = self.receive_file_record(source, file_info, file_size, rows, backups, buffer)
+                if is_compressed:
+                    source.finish()
+                results.append([index, status])
+                if status == "file_received":
+                    received_files += 1
+                    logger.debug(f"已接收文件 ({received_files}/{file_count}): {rel_path}")
+
+                if len(results) >= ACK_BATCH_SIZE:
+                    flush()
+                    logger.info(f"已接收 {received_files}/{file_count} 个文件")
+        finally:
+            stream.close()
+
+        flush()
+        return received_files
+
+    def receive_file_record(self, stream, file_info, file_size, rows, backups, buffer=None):
+        """接收一条文件记录的内容并验证哈希
+
+        无论写入是否成功都会读完 file_size 字节，保证后续记录的边界正确。
+
+        Args:
+            stream: 缓冲读取对象
+            file_info: 请求中该文件的信息，序号无效时为空字典
+            file_size: 记录中的内容长度
+            rows: 待写入数据库的文件记录，成功时追加
+            backups: 待写入数据库的备份记录，覆盖已有文件时追加
+            buffer: 可复用的接收缓冲区
+
+        Returns:
+            file_received、hash_mismatch 或 error
+        """
+        target = self.open_target(file_info.get('path'), backups)
+        algorithm, hasher = hasher_for(file_info.get('hash'))
+        try:
+            receive_to_file(stream, file_size, target, hasher if target else None, buffer)
+        finally:
+            if target:
+                target.close()
+
+        if target is None:
+            return "error"
+        return self.complete_received_file(file_info, file_size, format_hash(algorithm, hasher.hexdigest()), rows)
+
+    def open_target(self, rel_path, backups):
+        """创建目标目录、备份已有文件，打开目标文件准备写入
+
+        Args:
+            rel_path: 文件相对路径，序号无效时为 None
+            backups: 待写入数据库的备份记录，覆盖已有文件时追加
+
+        Returns:
+            以二进制写方式打开的文件对象，无法写入时返回 None
+        """
+        if not rel_path:
+            logger.error("文件记录的序号无效")
+            return None
+        full_dest_path = self.sync_dir / rel_path
+        try:
+            full_dest_path.parent.mkdir(parents=True, exist_ok=True)
+            backup = self.make_backup(rel_path, full_dest_path)
+            if backup is not None:
+                backups.append(backup)
+            return open(full_dest_path, 'wb')
+        except OSError as e:
+            logger.error(f"无法写入文件: {rel_path}, 错误: {str(e)}")
+            return None
+
+    def complete_received_file(self, file_info, file_size, received_hash, rows):
+        """校验接收到的文件，通过后设置修改时间并追加数据库记录
+
+        Args:
+            file_info: 请求中该文件的信息
+            file_size: 接收的字节数
+            received_hash: 接收内容的哈希值
+            rows: 待写入数据库的文件记录，成功时追加
+
+        Returns:
+            file_received 或 hash_mismatch
+        """
+        rel_path = file_info.get('path')
+        if file_size != file_info.get('size') or received_hash != file_info.get('hash'):
+            logger.warning(f"文件哈希不匹配: {rel_path}")
+            return "hash_mismatch"
+
+        modified_time = file_info.get('modified_time')
+        os.utime(self.sync_dir / rel_path, (time.time(), modified_time))
+        rows.append((rel_path, file_size, modified_time, file_info.get('hash'), time.time()))
+        return "file_received"
+
+    def receive_delta_record(self, stream, file_info, delta_size, rows, backups):
+        """接收一条增量记录，用服务端已有文件重建新文件
+
+        新文件先写入同目录的临时文件，哈希校验通过后备份旧文件再替换。
+        无法重建时也会读完增量数据，保证后续记录的边界正确。
+
+        Args:
+            stream: 缓冲读取对象
+            file_info: 请求中该文件的信息，序号无效时为空字典
+            delta_size: 增量数据长度
+            rows: 待写入数据库的文件记录，成功时追加
+            backups: 待写入数据库的备份记录，替换已有文件时追加
+
+        Returns:
+            file_received、hash_mismatch 或 error
+        """
+        rel_path = file_info.get('path')
+        full_dest_path = self.sync_dir / rel_path if rel_path else None
+        basis = None
+        if full_dest_path is not None:
+            try:
+                basis = open(full_dest_path, 'rb')
+            except OSError as e:
+                logger.error(f"增量传输的原文件无法读取: {rel_path}, 错误: {str(e)}")
+        if basis is None:
+            self.discard_record(stream, delta_size)
+            return "error"
+
+        temp_path = full_dest_path.with_name(full_dest_path.name + ".sync_tmp")
+        algorithm, hasher = hasher_for(file_info.get('hash'))
+        try:
+            with basis, open(temp_path, 'wb') as out:
+                size, hex_digest = apply_delta(stream, delta_size, basis, out, hasher)
+                received_hash = format_hash(algorithm, hex_digest)
+        except DeltaError as e:
+            temp_path.unlink(missing_ok=True)
+            raise ConnectionError(f"增量数据无效: {rel_path}, {str(e)}")
+        except Exception:
+            temp_path.unlink(missing_ok=True)
+            raise
+
+        if size != file_info.get('size') or received_hash != file_info.get('hash'):
+            logger.warning(f"增量重建后哈希不匹配: {rel_path}")
+            temp_path.unlink(missing_ok=True)
+            return "hash_mismatch"
+
+        backup = self.make_backup(rel_path, full_dest_path)
+        if backup is not None:
+            backups.append(backup)
+        os.replace(temp_path, full_dest_path)
+        modified_time = file_info.get('modified_time')
+        os.utime(full_dest_path, (time.time(), modified_time))
+        rows.append((rel_path, size, modified_time, file_info.get('hash'), time.time()))
+        return "file_received"
+
+    @staticmethod
+    def discard_record(stream, size):
+        """读取并丢弃一条记录的内容"""
+        receive_to_file(stream, size)
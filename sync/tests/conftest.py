@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+同步工具测试公共夹具
+
+SyncPair 在临时目录中创建服务端和客户端：线程版服务端由这里监听随机端口并把连接交给
+handle_client，asyncio 版服务端在后台线程中运行。客户端直接连接服务端，
+sync() 按 SyncClient.start 的顺序执行一次完整同步（不重试）。
+"""
+
+import logging
+import os
+import socket
+import sqlite3
+import sys
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+SYNC_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(SYNC_DIR))
+
+from async_server import AsyncSyncServer  # noqa: E402
+from client import SyncClient  # noqa: E402
+from config import logger  # noqa: E402
+from server import SyncServer  # noqa: E402
+from utils import configure_socket, send_data  # noqa: E402
+
+# 只输出警告和错误（服务端线程在测试结束后还可能写日志）
+logger.setLevel(logging.WARNING)
+
+
+class SyncPair:
+    """临时目录中的一对服务端和客户端"""
+
+    def __init__(self, root):
+        self.root = Path(root)
+        self.server_root = self.root / "server"
+        self.client_root = self.root / "client"
+        for directory in (self.server_root, self.client_root, self.root / "server_data", self.root / "client_data"):
+            directory.mkdir()
+        self.server = None
+        self.server_thread = None
+        self.listener = None
+        self.clients = []
+
+    def create_server(self, asyncio_server=False, **options):
+        """创建服务端并开始监听（服务端初始化时扫描 server_root），options 为服务端构造参数，如 max_clients"""
+        server_class = AsyncSyncServer if asyncio_server else SyncServer
+        self.server = server_class(port=0, log_dir=self.root / "logs", sync_dir=self.server_root,
+                                   data_dir=self.root / "server_data", **options)
+        if asyncio_server:
+            self.server_thread = threading.Thread(target=self.server.start, args=('127.0.0.1',), daemon=True)
+            self.server_thread.start()
+            assert self.server.listening.wait(10)
+            self.port = self.server.port
+        else:
+            self.listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self.listener.bind(('127.0.0.1', 0))
+            self.listener.listen(16)
+            self.port = self.listener.getsockname()[1]
+            threading.Thread(target=self._serve, daemon=True).start()
+        return self.server
+
+    def _serve(self):
+        while True:
+            try:
+                conn, address = self.listener.accept()
+            except OSError:
+                return
+            threading.Thread(target=self.server.handle_client, args=(conn, address), daemon=True).start()
+
+    def create_client(self, sync_dir=None, data_dir=None, **options):
+        """创建客户端（初始化时扫描 sync_dir，默认 client_root），options 设置为客户端属性，如 protocol_version"""
+        client = SyncClient('127.0.0.1', self.port, exclude_config=self.root / "exclude.conf",
+                            sync_dir=sync_dir or self.client_root, data_dir=data_dir or self.root / "client_data")
+        for name, value in options.items():
+            setattr(client, name, value)
+        self.clients.append(client)
+        return client
+
+    def connect(self):
+        sock = socket.create_connection(('127.0.0.1', self.port))
+        configure_socket(sock)
+        return sock
+
+    def sync(self, client):
+        """执行一次完整同步，返回需要同步的文件列表"""
+        sock = self.connect()
+        try:
+            client.sync_time(sock)
+            files_to_sync = client.compare_manifest(sock)
+            client.sync_files(sock, files_to_sync)
+            send_data(sock, '{"type": "close"}')
+        finally:
+            sock.close()
+        return files_to_sync
+
+    def server_records(self):
+        """服务端数据库中的文件记录：{路径: (大小, 哈希)}"""
+        conn = sqlite3.connect(self.root / "server_data" / "file_sync.db")
+        try:
+            return {path: (size, hash_value) for path, size, hash_value in conn.execute('SELECT path, size, hash FROM files')}
+        finally:
+            conn.close()
+
+    def close(self):
+        if self.server_thread is not None:
+            self.server.stop()
+            self.server_thread.join(30)
+        elif self.server is not None:
+            self.server.db.close()
+        if self.listener is not None:
+            self.listener.close()
+        for client in self.clients:
+            client.db.close()
+
+
+def write_files(root, files):
+    """按 {相对路径: 内容} 写入文件"""
+    for rel_path, data in files.items():
+        path = Path(root) / rel_path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(data)
+
+
+def read_files(root):
+    """读取目录下的全部文件：{相对路径: 内容}"""
+    root = Path(root)
+    return {path.relative_to(root).as_posix(): path.read_bytes() for path in root.rglob('*') if path.is_file()}
+
+
+def touch(root, paths, offset):
+    """把文件修改时间设为当前时间加 offset 秒（超过对比的时间阈值）"""
+    modified_time = time.time() + offset
+    for rel_path in paths:
+        os.utime(Path(root) / rel_path, (modified_time, modified_time))
+
+
+@pytest.fixture(autouse=True)
+def _restore_logger():
+    """服务端初始化时会给日志对象添加文件日志，测试结束后移除"""
+    handlers = list(logger.handlers)
+    yield
+    for handler in logger.handlers[len(handlers):]:
+        handler.close()
+    logger.handlers[:] = handlers
+
+
+@pytest.fixture
+def sync_pair(tmp_path):
+    pair = SyncPair(tmp_path)
+    yield pair
+    pair.close()
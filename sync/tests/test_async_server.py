@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+asyncio 服务端：各协议版本的完整同步、多个客户端同时同步、连接数限制、统计请求和关闭
+"""
+
+import json
+import socket
+import threading
+
+import pytest
+
+import async_server
+from compression import available_codecs
+from tests.conftest import read_files, touch, write_files
+from tests.test_protocol import make_files
+from utils import receive_data, send_data
+
+
+def _request(sock, request):
+    send_data(sock, json.dumps(request))
+    return json.loads(receive_data(sock))
+
+
+@pytest.mark.parametrize("protocol", [1, 2, 3])
+@pytest.mark.parametrize("compression", [False, True])
+def test_round_trip(sync_pair, protocol, compression):
+    files = make_files()
+    write_files(sync_pair.client_root, files)
+    sync_pair.create_server(asyncio_server=True)
+    options = {"protocol_version": protocol, "compression_algorithms": available_codecs() if compression else []}
+    assert {f['path'] for f in sync_pair.sync(sync_pair.create_client(**options))} == set(files)
+    assert read_files(sync_pair.server_root) == files
+
+    # 大于 STREAM_BUFFER_SIZE 的文件边接收边写入，版本3时发送增量记录
+    changed = {"large/text.log.txt": files["large/text.log.txt"] + b" appended", "empty.txt": b"no longer empty"}
+    files.update(changed)
+    write_files(sync_pair.client_root, changed)
+    touch(sync_pair.client_root, changed, 3600)
+    assert sorted(f['path'] for f in sync_pair.sync(sync_pair.create_client(**options))) == sorted(changed)
+    assert read_files(sync_pair.server_root) == files
+    records = sync_pair.server_records()
+    assert {path: size for path, (size, _) in records.items()} == {path: len(data) for path, data in files.items()}
+
+
+def test_concurrent_clients(sync_pair):
+    sync_pair.create_server(asyncio_server=True)
+    expected = {}
+    errors = []
+
+    def run(index):
+        sync_dir = sync_pair.root / f"client{index}"
+        data_dir = sync_pair.root / f"client{index}_data"
+        data_dir.mkdir()
+        files = {f"user{index}/file{number}.txt": f"{index}-{number}".encode() * 100 for number in range(20)}
+        write_files(sync_dir, files)
+        expected.update(files)
+        try:
+            client = sync_pair.create_client(sync_dir=sync_dir, data_dir=data_dir)
+            try:
+                sync_pair.sync(client)
+            finally:
+                client.db.close()
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=run, args=(index,)) for index in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(60)
+    # 客户端数据库在各自的线程中已关闭
+    sync_pair.clients.clear()
+
+    assert errors == []
+    assert read_files(sync_pair.server_root) == expected
+    assert len(sync_pair.server_records()) == len(expected)
+
+    sock = sync_pair.connect()
+    try:
+        metrics = _request(sock, {"type": "stats"})["metrics"]
+    finally:
+        sock.close()
+    assert metrics["files_received"] == len(expected)
+    assert metrics["connections_peak"] >= 1
+    assert metrics["requests"]["file_sync"] == 8
+    # 同时提交的记录合并为一个事务
+    assert metrics["db_batches"] <= metrics["db_records"]
+
+
+def test_busy_server_rejects_waiting_client(sync_pair, monkeypatch):
+    monkeypatch.setattr(async_server, "CLIENT_WAIT_TIMEOUT", 0.2)
+    sync_pair.create_server(asyncio_server=True, max_clients=1)
+    first = sync_pair.connect()
+    second = sync_pair.connect()
+    try:
+        assert _request(first, {"type": "stats"})["status"] == "ok"
+        assert json.loads(receive_data(second)) == {"status": "error", "message": "Server busy"}
+        # 第一个连接断开后名额释放
+        first.close()
+        third = sync_pair.connect()
+        try:
+            assert _request(third, {"type": "stats"})["metrics"]["connections_rejected"] == 1
+        finally:
+            third.close()
+    finally:
+        first.close()
+        second.close()
+
+
+def test_invalid_and_unknown_requests(sync_pair):
+    sync_pair.create_server(asyncio_server=True)
+    sock = sync_pair.connect()
+    try:
+        send_data(sock, "not json")
+        assert json.loads(receive_data(sock)) == {"status": "error", "message": "Invalid JSON data"}
+        assert _request(sock, {"type": "unknown"}) == {"status": "error", "message": "Unknown request type"}
+        # 出错后连接仍可使用
+        assert _request(sock, {"type": "stats"})["status"] == "ok"
+    finally:
+        sock.close()
+
+
+def test_stop_closes_idle_connections(sync_pair):
+    write_files(sync_pair.client_root, {"a.txt": b"a"})
+    sync_pair.create_server(asyncio_server=True)
+    sync_pair.sync(sync_pair.create_client())
+    sock = sync_pair.connect()
+    try:
+        assert _request(sock, {"type": "stats"})["status"] == "ok"
+        sync_pair.server.stop()
+        sync_pair.server_thread.join(30)
+        assert not sync_pair.server_thread.is_alive()
+        sock.settimeout(5)
+        assert sock.recv(1) == b""
+        # 数据库写入任务已把记录写完
+        assert set(sync_pair.server_records()) == {"a.txt"}
+        with pytest.raises(OSError):
+            socket.create_connection(('127.0.0.1', sync_pair.port), timeout=1).close()
+    finally:
+        sock.close()
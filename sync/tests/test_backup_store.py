@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+备份存储：按内容去重、压缩保存、保留策略、未引用对象的垃圾回收和旧格式备份的导入
+"""
+
+import hashlib
+import os
+import random
+import time
+
+import pytest
+
+from backup_store import COMPRESSED_SUFFIX, BackupStore, maintain_backups
+from database import FileDatabase
+from tests.conftest import read_files, touch, write_files
+
+TEXT = b"".join(f"row {index}: repair task ok\n".encode() for index in range(5000))
+DAY = 86400
+
+
+@pytest.fixture
+def store(tmp_path):
+    return BackupStore(tmp_path / "data" / "backups")
+
+
+@pytest.fixture
+def db(tmp_path):
+    (tmp_path / "data").mkdir(exist_ok=True)
+    database = FileDatabase(tmp_path / "data" / "file_sync.db")
+    yield database
+    database.close()
+
+
+def _restored(store, key, tmp_path):
+    dest = tmp_path / "restored"
+    store.restore(key, dest)
+    return dest.read_bytes()
+
+
+def test_put_deduplicates(store, tmp_path):
+    write_files(tmp_path / "src", {"a/report.txt": TEXT, "b/report.txt": TEXT, "c/other.txt": TEXT + b"!"})
+    key, path, created = store.put(tmp_path / "src/a/report.txt")
+    assert created and path.name.endswith(COMPRESSED_SUFFIX)
+    assert path.stat().st_size < len(TEXT) / 3
+
+    # 相同内容（不同目录下的同名文件）只保存一份
+    assert store.put(tmp_path / "src/b/report.txt") == (key, path, False)
+    other, _, created = store.put(tmp_path / "src/c/other.txt")
+    assert created and other != key
+    assert store.usage()[0] == 2
+    assert store.relative_path(path).startswith("backups/objects/")
+    assert _restored(store, key, tmp_path) == TEXT
+    assert _restored(store, other, tmp_path) == TEXT + b"!"
+
+
+@pytest.mark.parametrize("name,data", [
+    ("archive.zip", TEXT),
+    ("random.bin", random.Random(3).randbytes(100 * 1024)),
+    ("tiny.txt", b"tiny"),
+    ("empty.txt", b""),
+])
+def test_incompressible_content_is_stored_raw(store, tmp_path, name, data):
+    write_files(tmp_path / "src", {name: data})
+    key, path, _ = store.put(tmp_path / "src" / name)
+    assert not path.name.endswith(COMPRESSED_SUFFIX)
+    assert _restored(store, key, tmp_path) == data
+
+
+def test_uncompressed_store(tmp_path):
+    store = BackupStore(tmp_path / "backups", compress=False)
+    write_files(tmp_path / "src", {"a.txt": TEXT})
+    key, path, _ = store.put(tmp_path / "src/a.txt")
+    assert path.read_bytes() == TEXT
+    assert store.find(key) == path
+
+
+def test_invalid_object_key(store):
+    for key in ("md5:abcdef", "blake2b:../../etc/passwd", "blake2b:"):
+        with pytest.raises(ValueError):
+            store.object_paths(key)
+    with pytest.raises(FileNotFoundError):
+        store.restore("blake2b:" + "0" * 32, store.backup_dir / "out")
+
+
+def test_collect_garbage(store, tmp_path):
+    write_files(tmp_path / "src", {f"{index}.txt": TEXT + bytes([index]) for index in range(3)})
+    keys = [store.put(tmp_path / f"src/{index}.txt")[0] for index in range(3)]
+    (store.tmp_dir / "leftover").write_bytes(b"partial")
+    now = time.time() + 2 * 3600
+
+    # 宽限期内的未引用对象保留
+    assert store.collect_garbage({keys[0]}, grace=3 * 3600, now=now) == (0, 0)
+    assert store.usage()[0] == 3
+
+    removed, freed = store.collect_garbage({keys[0]}, grace=3600, now=now)
+    assert removed == 2 and freed > 0
+    assert [store.find(key) is not None for key in keys] == [True, False, False]
+    assert not (store.tmp_dir / "leftover").exists()
+
+    # 复用对象会刷新修改时间，重新开始宽限期
+    old = time.time() - 2 * 3600
+    os.utime(store.find(keys[0]), (old, old))
+    store.put(tmp_path / "src/0.txt")
+    assert store.collect_garbage(set(), grace=3600) == (0, 0)
+
+
+def _add_backups(db, path, ages, now):
+    """按 ages（天）添加备份记录，每个版本引用不同的对象"""
+    for age in ages:
+        key = "blake2b:" + hashlib.blake2b(f"{path}:{age}".encode(), digest_size=16).hexdigest()
+        db.backup_file(path, f"backups/objects/{key[8:10]}/{key[8:]}", 1, now, key, key)
+        _set_backup_time(db, db.cursor.lastrowid, now - age * DAY)
+    db.conn.commit()
+
+
+def _set_backup_time(db, backup_id, backup_time):
+    db.cursor.execute('UPDATE backup_files SET backup_time = ? WHERE id = ?', (backup_time, backup_id))
+
+
+def _versions(db):
+    db.cursor.execute('SELECT original_path, COUNT(*) FROM backup_files GROUP BY original_path')
+    return dict(db.cursor.fetchall())
+
+
+def test_prune_backups(db):
+    now = time.time()
+    _add_backups(db, "a.txt", range(10), now)
+    _add_backups(db, "b.txt", [200, 300, 400], now)
+    _add_backups(db, "c.txt", [1], now)
+
+    assert db.prune_backups(None, None, now=now) == []
+    removed = db.prune_backups(keep_versions=5, keep_days=None, now=now)
+    assert len(removed) == 5
+    assert _versions(db) == {"a.txt": 5, "b.txt": 3, "c.txt": 1}
+
+    # 早于保留天数的版本删除，但每个文件至少保留 min_versions 个
+    removed = db.prune_backups(keep_versions=None, keep_days=3, min_versions=1, now=now)
+    assert len(removed) == 3
+    assert _versions(db) == {"a.txt": 4, "b.txt": 1, "c.txt": 1}
+    assert all(key.startswith("blake2b:") for _, key in removed)
+    assert len(db.get_backup_object_keys()) == 6
+
+    db.prune_backups(keep_versions=None, keep_days=0, min_versions=2, now=now)
+    assert _versions(db) == {"a.txt": 2, "b.txt": 1, "c.txt": 1}
+
+
+def test_import_legacy_backups(store, db, tmp_path):
+    legacy = store.backup_dir / "report.txt_20250521_120000"
+    legacy.write_bytes(TEXT)
+    db.backup_file("docs/report.txt", "backups/report.txt_20250521_120000", len(TEXT), time.time())
+    # 备份目录之外的路径不处理
+    db.backup_file("outside.txt", "../outside.txt", 1, time.time())
+
+    assert store.import_legacy(db) == 1
+    assert not legacy.exists()
+    (key,) = db.get_backup_object_keys()
+    assert _restored(store, key, tmp_path) == TEXT
+    assert db.get_legacy_backups() == [(2, "../outside.txt")]
+
+
+def test_maintain_backups(store, db, tmp_path):
+    now = time.time()
+    write_files(tmp_path / "src", {f"{index}.txt": TEXT + bytes([index]) for index in range(4)})
+    for index in range(4):
+        key, path, _ = store.put(tmp_path / f"src/{index}.txt")
+        db.backup_file("report.txt", store.relative_path(path), len(TEXT) + 1, now, key, key)
+        _set_backup_time(db, db.cursor.lastrowid, now - index * DAY)
+    db.conn.commit()
+
+    later = now + 2 * 3600
+    stats = maintain_backups(db, store, keep_versions=2, keep_days=None, grace=3600, now=later)
+    assert (stats["pruned"], stats["removed_objects"], stats["objects"]) == (2, 2, 2)
+    assert stats["bytes"] == store.usage()[1]
+    assert len(db.get_backup_object_keys()) == 2
+
+
+def test_server_backups_are_deduplicated(sync_pair):
+    original = {"a/report.txt": TEXT, "b/report.txt": TEXT, "c/notes.txt": b"notes"}
+    write_files(sync_pair.server_root, original)
+    changed = {"a/report.txt": TEXT + b"a", "b/report.txt": TEXT + b"b", "c/notes.txt": b"new notes"}
+    write_files(sync_pair.client_root, changed)
+    touch(sync_pair.client_root, changed, 3600)
+    server = sync_pair.create_server()
+    sync_pair.sync(sync_pair.create_client())
+    assert read_files(sync_pair.server_root) == changed
+
+    server.db.cursor.execute('SELECT original_path, object_key FROM backup_files ORDER BY original_path')
+    backups = dict(server.db.cursor.fetchall())
+    assert set(backups) == set(original)
+    # 不同目录下的同名文件内容相同，只保存一个对象
+    assert backups["a/report.txt"] == backups["b/report.txt"]
+    assert server.backup_store.usage()[0] == 2
+    for path, key in backups.items():
+        assert _restored(server.backup_store, key, sync_pair.root) == original[path]
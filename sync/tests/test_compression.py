@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+传输压缩：算法协商、压缩帧的流式收发、解压长度限制、压缩策略和压缩的JSON消息
+"""
+
+import hashlib
+import io
+import json
+import random
+import socket
+import time
+import zlib
+
+import pytest
+
+import compression
+from compression import (
+    END_OF_FRAMES, FRAME_HEADER, MAX_FRAME_SIZE, CompressionError, CompressionPolicy, DecompressReader,
+    available_codecs, choose_codec, get_codec, pack_frame, send_compressed
+)
+from config import COMPRESSION_MIN_SIZE, COMPRESSION_SAMPLE_SIZE, MESSAGE_COMPRESSION_MIN_SIZE
+from tests.conftest import read_files, write_files
+from utils import (
+    COMPRESSED_MESSAGE, COMPRESSED_RECORD, END_OF_RECORDS, MESSAGE_LENGTH, pack_message, receive_data,
+    receive_to_file, send_data, send_record_header, unpack_message
+)
+
+TEXT = b"".join(f"line {index}: material {index % 17} ok\n".encode() for index in range(20000))
+
+
+class _Wire:
+    """收集 sendall 发送的数据"""
+
+    def __init__(self):
+        self.data = bytearray()
+
+    def sendall(self, data):
+        self.data += data
+
+
+def _compressed(data, count=None):
+    wire = _Wire()
+    send_compressed(wire, io.BytesIO(data), len(data) if count is None else count, get_codec('zlib'))
+    return bytes(wire.data)
+
+
+def test_choose_codec():
+    assert available_codecs()[-1] == 'zlib'
+    assert choose_codec(['zlib'], ['zstd', 'zlib']) == 'zlib'
+    # 旧版本不返回支持的算法
+    assert choose_codec(['zlib'], None) is None
+    assert choose_codec([], ['zlib']) is None
+    # 本机没有安装的算法不会被选中
+    assert choose_codec(['brotli', 'zlib'], ['brotli', 'zlib']) == 'zlib'
+    assert get_codec(None) is None
+    assert get_codec('brotli') is None
+    assert get_codec('zlib', 9).level == 9
+
+
+def test_stream_round_trip():
+    wire = _compressed(TEXT)
+    assert len(wire) < len(TEXT) / 5
+    assert wire.endswith(END_OF_FRAMES)
+    reader = DecompressReader(io.BytesIO(wire), get_codec('zlib'), len(TEXT))
+    out = io.BytesIO()
+    hasher = hashlib.md5()
+    receive_to_file(reader, len(TEXT), out, hasher, memoryview(bytearray(1000)))
+    reader.finish()
+    assert out.getvalue() == TEXT
+    assert hasher.hexdigest() == hashlib.md5(TEXT).hexdigest()
+
+
+def test_file_shorter_than_record_is_padded():
+    wire = _compressed(b"abc", count=10)
+    reader = DecompressReader(io.BytesIO(wire), get_codec('zlib'), 10)
+    assert reader.read(10) == b"abc" + bytes(7)
+    reader.finish()
+
+
+def test_decompressed_data_is_capped():
+    # 高压缩比的数据：不到1MB的压缩帧解压后为 64MB
+    bomb = _compressed(bytes(64 * 1024 * 1024))
+    assert len(bomb) < 1024 * 1024
+    reader = DecompressReader(io.BytesIO(bomb), get_codec('zlib'), 1000)
+    with pytest.raises(CompressionError):
+        reader.read(1000)
+
+    # 解压后比记录长度长
+    reader = DecompressReader(io.BytesIO(_compressed(TEXT)), get_codec('zlib'), len(TEXT) - 1)
+    with pytest.raises(CompressionError):
+        receive_to_file(reader, len(TEXT) - 1)
+
+    # 记录长度已读完，结束帧之前还有数据
+    reader = DecompressReader(io.BytesIO(_compressed(TEXT)), get_codec('zlib'), len(TEXT))
+    reader.read(len(TEXT) - 10)
+    with pytest.raises(CompressionError):
+        reader.finish()
+
+
+def test_short_and_invalid_streams():
+    # 解压后比记录长度短
+    reader = DecompressReader(io.BytesIO(_compressed(b"abc")), get_codec('zlib'), 10)
+    with pytest.raises(ConnectionError):
+        receive_to_file(reader, 10)
+
+    reader = DecompressReader(io.BytesIO(pack_frame(b"not zlib data") + END_OF_FRAMES), get_codec('zlib'), 10)
+    with pytest.raises(CompressionError):
+        reader.read(10)
+
+    reader = DecompressReader(io.BytesIO(FRAME_HEADER.pack(MAX_FRAME_SIZE + 1)), get_codec('zlib'), 10)
+    with pytest.raises(CompressionError):
+        reader.read(10)
+
+    # 帧不完整：CompressionError 也是 ConnectionError
+    reader = DecompressReader(io.BytesIO(_compressed(TEXT)[:100]), get_codec('zlib'), len(TEXT))
+    with pytest.raises(ConnectionError):
+        reader.read(len(TEXT))
+
+
+def test_compression_policy():
+    policy = CompressionPolicy(get_codec('zlib'))
+    assert not policy.should_try("photo.JPG", 10 * 1024 * 1024)
+    assert not policy.should_try("notes.txt", COMPRESSION_MIN_SIZE - 1)
+    assert policy.should_try("notes.txt", COMPRESSION_MIN_SIZE)
+    assert policy.skipped_files == 2
+
+    assert policy.compress_sample(random.Random(1).randbytes(COMPRESSION_SAMPLE_SIZE)) is None
+    assert policy.compress_sample(TEXT[:COMPRESSION_SAMPLE_SIZE]) is not None
+    assert policy.skipped_files == 3
+
+    f = io.BytesIO(TEXT)
+    assert policy.read_sample(f)
+    assert f.tell() == 0
+
+    policy.record(1000, 250)
+    assert "1 个文件" in policy.summary() and "25%" in policy.summary()
+
+
+def test_message_compression():
+    small = json.dumps({"status": "ok"})
+    packed = pack_message(small, compress=True)
+    length_field, = MESSAGE_LENGTH.unpack(packed[:MESSAGE_LENGTH.size])
+    assert not length_field & COMPRESSED_MESSAGE
+
+    large = json.dumps({"files": [{"path": f"dir/file{index}.txt", "size": index} for index in range(2000)]})
+    assert len(large) >= MESSAGE_COMPRESSION_MIN_SIZE
+    packed = pack_message(large, compress=True)
+    length_field, = MESSAGE_LENGTH.unpack(packed[:MESSAGE_LENGTH.size])
+    assert length_field & COMPRESSED_MESSAGE
+    assert len(packed) < len(large) / 3
+    assert unpack_message(length_field, packed[MESSAGE_LENGTH.size:]) == large
+
+
+def test_message_decompression_is_capped(monkeypatch):
+    monkeypatch.setattr(compression, "MAX_MESSAGE_SIZE", 1000)
+    bomb = zlib.compress(b" " * 100000)
+    with pytest.raises(CompressionError):
+        unpack_message(len(bomb) | COMPRESSED_MESSAGE, bomb)
+    with pytest.raises(CompressionError):
+        unpack_message(10 | COMPRESSED_MESSAGE, b"not zlib!!")
+    with pytest.raises(CompressionError):
+        unpack_message(10 | COMPRESSED_MESSAGE, zlib.compress(b"x" * 500)[:-4])
+
+    # receive_data 遇到无效的压缩消息时返回空JSON对象
+    left, right = socket.socketpair()
+    with left, right:
+        left.sendall(MESSAGE_LENGTH.pack(len(bomb) | COMPRESSED_MESSAGE) + bomb)
+        assert receive_data(right) == "{}"
+
+
+def test_compressed_records_are_sent(sync_pair, monkeypatch):
+    recorded = []
+    record = CompressionPolicy.record
+
+    def record_size(policy, raw_size, wire_size):
+        recorded.append(raw_size)
+        record(policy, raw_size, wire_size)
+
+    monkeypatch.setattr(CompressionPolicy, "record", record_size)
+    files = {
+        "big.txt": TEXT,
+        "small.txt": TEXT[:2000],
+        "tiny.txt": b"tiny",
+        "random.bin": random.Random(2).randbytes(200 * 1024),
+        "archive.zip": TEXT[:5000],
+    }
+    write_files(sync_pair.client_root, files)
+    sync_pair.create_server()
+    sync_pair.sync(sync_pair.create_client(protocol_version=2))
+    assert read_files(sync_pair.server_root) == files
+    # 只有可压缩且不是已压缩格式的文件压缩发送
+    assert sorted(recorded) == [2000, len(TEXT)]
+
+
+@pytest.mark.parametrize("asyncio_server", [False, True])
+def test_server_rejects_oversized_record(sync_pair, asyncio_server):
+    sync_pair.create_server(asyncio_server=asyncio_server)
+    data = b"x" * 100
+    file_info = {"path": "bomb.txt", "size": len(data), "modified_time": time.time(),
+                 "hash": hashlib.md5(data).hexdigest()}
+    sock = sync_pair.connect()
+    try:
+        send_data(sock, json.dumps({"type": "file_sync", "files": [file_info], "protocol_version": 2,
+                                    "compression": "zlib"}))
+        assert json.loads(receive_data(sock))["compression"] == "zlib"
+        send_record_header(sock, COMPRESSED_RECORD, len(data))
+        sock.sendall(_compressed(bytes(8 * 1024 * 1024)))
+        send_record_header(sock, END_OF_RECORDS, 0)
+        sock.settimeout(10)
+        reply = json.loads(receive_data(sock))
+        assert reply["status"] == "error"
+    finally:
+        sock.close()
+    assert sync_pair.server_records() == {}
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+增量传输：按块签名计算增量数据、用原文件重建，以及格式错误的增量数据
+"""
+
+import hashlib
+import io
+import random
+import struct
+
+import pytest
+
+from client import SyncClient
+from delta import COPY_OP, DELTA_HEADER, LITERAL_OP, DeltaError, apply_delta, compute_delta, file_signature
+from tests.conftest import read_files, touch, write_files
+
+BLOCK_SIZE = 2048
+BASIS = random.Random(7).randbytes(BLOCK_SIZE * 20 + 500)
+
+
+def _edit(data, offset, remove=0, insert=b""):
+    return data[:offset] + insert + data[offset + remove:]
+
+
+def _delta(tmp_path, basis, new, block_size=BLOCK_SIZE):
+    """返回 (增量数据, 原始数据字节数, 复制的块数)"""
+    basis_path = tmp_path / "basis.bin"
+    new_path = tmp_path / "new.bin"
+    basis_path.write_bytes(basis)
+    new_path.write_bytes(new)
+    basis_size, block_size, signature = file_signature(basis_path, block_size)
+    out = io.BytesIO()
+    literal_bytes, copied_blocks = compute_delta(new_path, basis_size, block_size, signature, out)
+    return out.getvalue(), literal_bytes, copied_blocks
+
+
+def _apply(delta, basis):
+    out = io.BytesIO()
+    size, digest = apply_delta(io.BytesIO(delta), len(delta), io.BytesIO(basis), out)
+    assert size == len(out.getvalue())
+    assert digest == hashlib.md5(out.getvalue()).hexdigest()
+    return out.getvalue()
+
+
+@pytest.mark.parametrize("new,max_literal", [
+    (BASIS, 0),
+    (_edit(BASIS, 5000, insert=b"inserted"), BLOCK_SIZE + 8),
+    (_edit(BASIS, 9000, remove=300), BLOCK_SIZE),
+    (_edit(BASIS, 100, remove=10, insert=b"replaced"), BLOCK_SIZE + 8),
+    (b"prefix" + BASIS, 6),
+    (BASIS + b"appended", 8 + 500),
+    (BASIS[:BLOCK_SIZE * 5 + 100], 100),
+    (BASIS[BLOCK_SIZE * 3:], 0),
+    (BASIS[:1000], 1000),
+    (b"", 0),
+])
+def test_delta_reconstructs_file(tmp_path, new, max_literal):
+    delta, literal_bytes, copied_blocks = _delta(tmp_path, BASIS, new)
+    assert _apply(delta, BASIS) == new
+    # 只发送修改过的区域附近的数据
+    assert literal_bytes <= max_literal
+    assert literal_bytes + copied_blocks * BLOCK_SIZE >= len(new) - BLOCK_SIZE
+
+
+def test_delta_reuses_moved_blocks(tmp_path):
+    blocks = [BASIS[i:i + BLOCK_SIZE] for i in range(0, BLOCK_SIZE * 20, BLOCK_SIZE)]
+    new = b"".join(reversed(blocks))
+    delta, literal_bytes, copied_blocks = _delta(tmp_path, BASIS, new)
+    assert (literal_bytes, copied_blocks) == (0, 20)
+    assert _apply(delta, BASIS) == new
+
+
+def test_delta_against_empty_basis(tmp_path):
+    delta, literal_bytes, copied_blocks = _delta(tmp_path, b"", BASIS)
+    assert (literal_bytes, copied_blocks) == (len(BASIS), 0)
+    assert _apply(delta, b"") == BASIS
+
+
+@pytest.mark.parametrize("delta,error", [
+    (DELTA_HEADER.pack(0), DeltaError),
+    (DELTA_HEADER.pack(BLOCK_SIZE) + b"X", DeltaError),
+    # 指令超出增量数据长度
+    (DELTA_HEADER.pack(BLOCK_SIZE) + LITERAL_OP.pack(b"L", 100) + b"short", DeltaError),
+    (DELTA_HEADER.pack(BLOCK_SIZE) + COPY_OP.pack(b"C", 0, 1)[:5], DeltaError),
+    # 块引用超出原文件
+    (DELTA_HEADER.pack(BLOCK_SIZE) + COPY_OP.pack(b"C", 20, 2), DeltaError),
+    (DELTA_HEADER.pack(BLOCK_SIZE) + COPY_OP.pack(b"C", 0xFFFFFFFF, 1), DeltaError),
+])
+def test_malformed_delta_is_rejected(delta, error):
+    with pytest.raises(error):
+        _apply(delta, BASIS)
+
+
+def test_truncated_delta_stream():
+    delta = DELTA_HEADER.pack(BLOCK_SIZE) + LITERAL_OP.pack(b"L", 100) + b"x" * 100
+    with pytest.raises(ConnectionError):
+        apply_delta(io.BytesIO(delta[:50]), len(delta), io.BytesIO(BASIS), io.BytesIO())
+
+
+def test_last_partial_block_is_copied(tmp_path):
+    # 原文件最后一块不足一整块，新文件末尾与它相同
+    new = _edit(BASIS, 10, insert=b"abc")
+    delta, literal_bytes, copied_blocks = _delta(tmp_path, BASIS, new)
+    assert copied_blocks == 20
+    assert _apply(delta, BASIS) == new
+    assert struct.unpack('!I', delta[:4]) == (BLOCK_SIZE,)
+
+
+def test_sync_sends_delta_records(sync_pair, monkeypatch):
+    data = random.Random(3).randbytes(1024 * 1024)
+    write_files(sync_pair.client_root, {"big.bin": data})
+    write_files(sync_pair.server_root, {"big.bin": _edit(data, 500000, remove=100, insert=b"old")})
+    touch(sync_pair.server_root, ["big.bin"], -3600)
+    sync_pair.create_server()
+
+    sent = []
+    send_delta_record = SyncClient.send_delta_record
+
+    def record_delta(self, *args, **kwargs):
+        result = send_delta_record(self, *args, **kwargs)
+        sent.append(result)
+        return result
+
+    monkeypatch.setattr(SyncClient, "send_delta_record", record_delta)
+    client = sync_pair.create_client(compression_algorithms=[])
+    assert [f['path'] for f in sync_pair.sync(client)] == ["big.bin"]
+    assert sent == [True]
+    assert read_files(sync_pair.server_root) == {"big.bin": data}
+    assert sync_pair.server_records()["big.bin"][0] == len(data)
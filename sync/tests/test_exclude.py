@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+排除规则：ExcludeMatcher 与原来逐条检查的实现结果一致，通配符规则和配置文件解析
+"""
+
+import random
+from pathlib import Path
+
+import pytest
+
+from exclude import ExcludeMatcher
+
+EXTENSIONS = ['.db', '.log', '.pyc']
+DIRECTORIES = ['__pycache__', '.git', 'node_modules', 'backups']
+PATHS = ['docs/private', 'src/generated/api', 'build']
+
+
+def old_exclude_file(path, extensions=EXTENSIONS, directories=DIRECTORIES, paths=PATHS):
+    """原来的 SyncClient.should_exclude_file（去掉日志）"""
+    str_path = str(path)
+    for excluded_path in paths:
+        if str_path == excluded_path or str_path.startswith(excluded_path + '/'):
+            return True
+    if Path(path).suffix.lower() in extensions:
+        return True
+    for part in Path(path).parts:
+        if part in directories:
+            return True
+    return False
+
+
+def old_exclude_directory(path, directories=DIRECTORIES, paths=PATHS):
+    """原来的 SyncClient.should_exclude_directory（去掉日志）"""
+    str_path = str(path)
+    for excluded_path in paths:
+        if str_path == excluded_path or str_path.startswith(excluded_path + '/'):
+            return True
+    return Path(path).name in directories
+
+
+@pytest.fixture
+def matcher():
+    return ExcludeMatcher(EXTENSIONS, DIRECTORIES, PATHS)
+
+
+@pytest.mark.parametrize("path", [
+    "a.txt", "data.db", "DATA.DB", "archive.db.bak", ".db", "file.", "noext",
+    "src/__pycache__/x.py", "__pycache__", "a/node_modules/b/c.js", "node_modules_old/x.js",
+    "docs/private", "docs/private/a.txt", "docs/private_notes.txt", "docs/privatex/a.txt",
+    "src/generated/api/v1/x.py", "src/generated/apis.py", "build", "build/out.bin", "builder/x",
+    "backups/2025/a.txt", "x/.git/config", ".gitignore",
+])
+def test_file_rules_match_old_implementation(matcher, path):
+    assert matcher.match_file(path) == old_exclude_file(path)
+
+
+def test_random_paths_match_old_implementation(matcher):
+    rng = random.Random(5)
+    names = ['docs', 'private', 'src', 'generated', 'api', 'build', 'node_modules', '__pycache__', 'a', 'b']
+    suffixes = ['.py', '.txt', '.db', '.LOG', '.pyc', '', '.tar.gz']
+    for _ in range(20000):
+        parts = [rng.choice(names) for _ in range(rng.randint(0, 4))]
+        path = '/'.join(parts + [f"f{rng.randrange(50)}{rng.choice(suffixes)}"])
+        assert matcher.match_file(path) == old_exclude_file(path), path
+        if parts:
+            directory = '/'.join(parts)
+            # 扫描时上级目录已被排除的不会再进入，只比较上级目录都未排除的目录
+            parents = ['/'.join(parts[:i]) for i in range(1, len(parts))]
+            if not any(old_exclude_directory(parent) for parent in parents):
+                assert matcher.match_directory(directory) == old_exclude_directory(directory), directory
+
+
+def test_glob_patterns():
+    matcher = ExcludeMatcher(patterns=['*.tmp', '~$*', 'build*/*.o', '/cache/*'])
+    # 不含/的模式匹配文件名或任意一级目录名
+    assert matcher.match_file("a/b/report.tmp")
+    assert matcher.match_file("docs/~$draft.docx")
+    assert matcher.match_directory("x/y.tmp")
+    assert not matcher.match_file("report.tmp.txt")
+    # 含/的模式匹配整个相对路径
+    assert matcher.match_file("build1/main.o")
+    assert not matcher.match_file("src/build1/main.o")
+    assert matcher.match_file("cache/data.bin")
+    assert matcher.rule_count == 4
+
+
+def test_load_config(tmp_path):
+    config = tmp_path / "exclude.conf"
+    config.write_text("# 注释\n\next: .bak\ndir: dist\npath: docs/old\nglob: *.swp\next: .db\n", encoding="utf-8")
+    matcher = ExcludeMatcher.from_config(config)
+    # 配置文件中的规则追加在默认规则之后，重复的规则只保留一条
+    assert matcher.rules["extensions"].count('.db') == 1
+    assert '.bak' in matcher.rules["extensions"]
+    for path in ("a.BAK", "dist/x.js", "docs/old/a.txt", ".notes.swp", "x.db"):
+        assert matcher.match_file(path), path
+    assert not matcher.match_file("docs/older/a.txt")
+    # 服务端用客户端发送的规则构建相同范围的清单
+    assert ExcludeMatcher(**matcher.rules).rules == matcher.rules
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+文件哈希：算法协商、哈希值格式、HashEngine 的缓存和并行计算
+"""
+
+import hashlib
+import os
+
+import pytest
+
+import hashing
+from database import FileDatabase
+from hashing import HashEngine, choose_hash_algorithm, format_hash, hash_file, hasher_for
+from tests.conftest import write_files
+
+
+@pytest.fixture
+def db(tmp_path):
+    database = FileDatabase(tmp_path / "hashes.db")
+    yield database
+    database.close()
+
+
+@pytest.fixture
+def tree(tmp_path):
+    root = tmp_path / "tree"
+    files = {f"dir{index % 3}/file{index}.txt": f"content {index}".encode() * (index + 1) for index in range(20)}
+    write_files(root, files)
+    return root, files
+
+
+def _md5(data):
+    return hashlib.md5(data).hexdigest()
+
+
+def hash_file_bytes(data, algorithm):
+    hasher = hashing.new_hasher(algorithm)
+    hasher.update(data)
+    return format_hash(algorithm, hasher.hexdigest())
+
+
+def test_hash_formats(tmp_path):
+    path = tmp_path / "a.txt"
+    path.write_bytes(b"hello")
+    # MD5 保持原来的格式，其他算法加前缀
+    assert hash_file(path) == _md5(b"hello")
+    assert hash_file(path, 'blake2b') == "blake2b:" + hashlib.blake2b(b"hello", digest_size=32).hexdigest()
+    with pytest.raises(ValueError):
+        hash_file(path, 'sha1')
+
+
+def test_large_files_use_mmap(tmp_path, monkeypatch):
+    monkeypatch.setattr(hashing, "MMAP_MIN_SIZE", 1024)
+    data = os.urandom(5000)
+    path = tmp_path / "big.bin"
+    path.write_bytes(data)
+    assert hash_file(path) == _md5(data)
+
+
+@pytest.mark.parametrize("server_algorithms,expected", [
+    (None, 'md5'), (['md5'], 'md5'), (['md5', 'blake2b'], 'blake2b'), (['sha3'], 'md5'),
+])
+def test_choose_hash_algorithm(server_algorithms, expected):
+    assert choose_hash_algorithm(server_algorithms) == expected
+
+
+def test_hasher_for():
+    assert hasher_for(_md5(b""))[0] == 'md5'
+    algorithm, hasher = hasher_for(format_hash('blake2b', "00"))
+    hasher.update(b"x")
+    assert format_hash(algorithm, hasher.hexdigest()) == hash_file_bytes(b"x", 'blake2b')
+    # 不支持的算法按MD5校验（必然不一致）
+    assert hasher_for("sha3:00")[0] == 'md5'
+
+
+def test_cache_hits_and_invalidation(db, tree):
+    root, files = tree
+    paths = sorted(files)
+    engine = HashEngine(db, 'md5', workers=2)
+    results = engine.hash_files(root, paths)
+    assert (engine.hits, engine.misses) == (0, len(paths))
+    assert {path: info['hash'] for path, info in results.items()} == {path: _md5(data) for path, data in files.items()}
+
+    engine = HashEngine(db, 'md5', workers=2)
+    assert engine.hash_files(root, paths) == results
+    assert (engine.hits, engine.misses) == (len(paths), 0)
+
+    # 修改时间或内容变化的文件重新计算
+    changed = paths[0]
+    (root / changed).write_bytes(b"new content")
+    os.utime(root / changed, ns=(0, 1_000_000_000))
+    engine = HashEngine(db, 'md5', workers=2)
+    results = engine.hash_files(root, paths)
+    assert (engine.hits, engine.misses) == (len(paths) - 1, 1)
+    assert results[changed]['hash'] == _md5(b"new content")
+
+    # 不同算法分别缓存
+    engine = HashEngine(db, 'blake2b', workers=2)
+    results = engine.hash_files(root, paths)
+    assert engine.misses == len(paths)
+    assert results[changed]['hash'] == hash_file_bytes(b"new content", 'blake2b')
+
+
+def test_missing_files_are_skipped(db, tree):
+    root, files = tree
+    results = HashEngine(db, workers=1).hash_files(root, sorted(files) + ["missing.txt"])
+    assert set(results) == set(files)
+    assert HashEngine(db).hash_files(root, []) == {}
+
+
+def test_parallel_batches_match_serial(db, tree, monkeypatch):
+    root, files = tree
+    monkeypatch.setattr(hashing, "BATCH_FILES", 3)
+    parallel = HashEngine(db, 'blake2b', workers=4).hash_files(root, sorted(files))
+    serial = {path: hash_file(root / path, 'blake2b') for path in files}
+    assert {path: info['hash'] for path, info in parallel.items()} == serial
+    assert [len(batch) for batch in HashEngine._batches([(path, os.stat(root / path), None) for path in files])] == \
+        [3] * 6 + [2]
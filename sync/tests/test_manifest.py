@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+文件清单：目录 Merkle 树的摘要，以及客户端与服务端按摘要逐层对比
+"""
+
+import json
+
+import pytest
+
+from manifest import Manifest
+from server import SyncServer
+from tests.conftest import touch, write_files
+from utils import send_data
+
+FILES = [
+    ("a.txt", 1, 100.0, "h1"),
+    ("docs/b.txt", 2, 100.0, "h2"),
+    ("docs/deep/c.txt", 3, 100.0, "h3"),
+    ("src/d.py", 4, 100.0, "h4"),
+]
+
+
+def _replace(files, path, **changes):
+    fields = ("path", "size", "modified_time", "hash")
+    return [tuple(changes.get(name, value) for name, value in zip(fields, row)) if row[0] == path else row
+            for row in files]
+
+
+def test_digest_ignores_order_and_hashes():
+    manifest = Manifest(FILES)
+    assert Manifest(reversed(FILES)).digests == manifest.digests
+    # 哈希值不参与摘要计算
+    assert Manifest(_replace(FILES, "docs/deep/c.txt", hash=None)).digests == manifest.digests
+    assert set(manifest.digests) == {"", "docs", "docs/deep", "src"}
+    assert manifest.digest("missing") is None
+
+
+def test_change_propagates_to_ancestors_only():
+    before = Manifest(FILES)
+    after = Manifest(_replace(FILES, "docs/deep/c.txt", modified_time=200.0))
+    changed = {directory for directory in before.digests if before.digest(directory) != after.digest(directory)}
+    assert changed == {"", "docs", "docs/deep"}
+    # 新增空子目录以外的文件同样改变上级目录的摘要
+    added = Manifest(FILES + [("src/new/e.py", 5, 100.0, "h5")])
+    assert added.digest("docs") == before.digest("docs")
+    assert added.digest("src") != before.digest("src")
+
+
+def test_listing_and_files_under():
+    manifest = Manifest(FILES)
+    assert manifest.listing("docs") == {"files": {"b.txt": [2, 100.0, "h2"]},
+                                        "dirs": {"deep": manifest.digest("docs/deep")}}
+    assert sorted(row[0] for row in manifest.files_under("docs")) == ["docs/b.txt", "docs/deep/c.txt"]
+    assert manifest.listing("missing") == {"files": {}, "dirs": {}}
+
+
+@pytest.fixture
+def manifest_rounds(monkeypatch):
+    """记录服务端每轮清单对比请求的目录"""
+    rounds = []
+    manifest_reply = SyncServer.manifest_reply
+
+    def record(manifest, request):
+        rounds.append(sorted(request["dirs"]))
+        return manifest_reply(manifest, request)
+
+    monkeypatch.setattr(SyncServer, "manifest_reply", staticmethod(record))
+    return rounds
+
+
+def _compare(pair, client):
+    sock = pair.connect()
+    try:
+        client.sync_time(sock)
+        return client.compare_manifest(sock)
+    finally:
+        send_data(sock, json.dumps({"type": "close"}))
+        sock.close()
+
+
+def _tree():
+    files = {f"dir{index}/sub{index % 2}/file{index}.txt": f"{index}".encode() for index in range(10)}
+    files["top.txt"] = b"top"
+    return files
+
+
+def test_unchanged_tree_needs_one_round(sync_pair, manifest_rounds):
+    files = _tree()
+    write_files(sync_pair.client_root, files)
+    sync_pair.create_server()
+    sync_pair.sync(sync_pair.create_client())
+    manifest_rounds.clear()
+
+    assert _compare(sync_pair, sync_pair.create_client()) == []
+    assert manifest_rounds == [[""]]
+
+
+def test_only_changed_directories_are_listed(sync_pair, manifest_rounds):
+    files = _tree()
+    write_files(sync_pair.client_root, files)
+    sync_pair.create_server()
+    sync_pair.sync(sync_pair.create_client())
+    manifest_rounds.clear()
+
+    write_files(sync_pair.client_root, {"dir3/sub1/file3.txt": b"changed", "dir9/new/extra.txt": b"new"})
+    touch(sync_pair.client_root, ["dir3/sub1/file3.txt"], 3600)
+    files_to_sync = _compare(sync_pair, sync_pair.create_client())
+    assert sorted(f["path"] for f in files_to_sync) == ["dir3/sub1/file3.txt", "dir9/new/extra.txt"]
+    # 服务端没有的目录不再逐层请求
+    assert manifest_rounds == [[""], ["dir3", "dir9"], ["dir3/sub1"]]
+
+
+def test_server_applies_client_exclude_rules(sync_pair, manifest_rounds):
+    write_files(sync_pair.client_root, {"a.txt": b"a"})
+    # 服务端有客户端排除的文件，不影响摘要
+    write_files(sync_pair.server_root, {"a.txt": b"a", "cache.db": b"db", "__pycache__/x.pyc": b"x"})
+    touch(sync_pair.client_root, ["a.txt"], 0)
+    sync_pair.create_server()
+    client = sync_pair.create_client()
+    sync_pair.sync(client)
+    manifest_rounds.clear()
+    assert _compare(sync_pair, sync_pair.create_client()) == []
+    assert manifest_rounds == [[""]]
+
+
+def test_old_server_falls_back_to_database_download(sync_pair, monkeypatch):
+    def unsupported(self, client_socket, request, db, session):
+        send_data(client_socket, json.dumps({"status": "error", "message": "Unknown request type"}))
+
+    monkeypatch.setattr(SyncServer, "handle_manifest", unsupported)
+    write_files(sync_pair.client_root, {"a.txt": b"a", "b/c.txt": b"c"})
+    write_files(sync_pair.server_root, {"a.txt": b"a"})
+    sync_pair.create_server()
+    client = sync_pair.create_client()
+    sock = sync_pair.connect()
+    try:
+        client.sync_time(sock)
+        assert client.compare_manifest(sock) is None
+        server_db_path = client.download_server_db(sock)
+        assert [f["path"] for f in client.compare_files(server_db_path)] == ["b/c.txt"]
+    finally:
+        sock.close()
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+文件传输协议：版本1逐个握手、版本2流水线、版本3增量记录在压缩和不压缩时的完整同步，哈希不匹配和批量确认
+"""
+
+import json
+import random
+
+import pytest
+
+from compression import available_codecs
+from config import ACK_BATCH_SIZE, SMALL_FILE_SIZE
+from tests.conftest import read_files, touch, write_files
+from utils import receive_data, send_data
+
+
+def make_files(seed=1):
+    """空文件、与记录头合并发送的小文件和单独发送的大文件"""
+    rng = random.Random(seed)
+    text = b" ".join(rng.choice([b"task", b"material", b"2025-05-21", b"ok"]) for _ in range(80000))
+    return {
+        "empty.txt": b"",
+        "small/a.txt": b"hello",
+        "small/b.bin": rng.randbytes(SMALL_FILE_SIZE),
+        "large/text.log.txt": text[:400 * 1024],
+        "large/random.bin": rng.randbytes(300 * 1024),
+    }
+
+
+@pytest.mark.parametrize("protocol", [1, 2, 3])
+@pytest.mark.parametrize("compression", [False, True])
+def test_round_trip(sync_pair, protocol, compression):
+    files = make_files()
+    write_files(sync_pair.client_root, files)
+    sync_pair.create_server()
+    options = {"protocol_version": protocol, "compression_algorithms": available_codecs() if compression else []}
+    client = sync_pair.create_client(**options)
+    assert {f['path'] for f in sync_pair.sync(client)} == set(files)
+    assert read_files(sync_pair.server_root) == files
+    records = sync_pair.server_records()
+    assert {path: size for path, (size, _) in records.items()} == {path: len(data) for path, data in files.items()}
+
+    # 修改后再次同步：只发送变化的文件（版本3时大文件发送增量记录）
+    changed = {
+        "large/random.bin": files["large/random.bin"][:1000] + b"changed" + files["large/random.bin"][1007:],
+        "small/a.txt": b"hello again",
+    }
+    files.update(changed)
+    write_files(sync_pair.client_root, changed)
+    touch(sync_pair.client_root, changed, 3600)
+    client = sync_pair.create_client(**options)
+    assert sorted(f['path'] for f in sync_pair.sync(client)) == ["large/random.bin", "small/a.txt"]
+    assert read_files(sync_pair.server_root) == files
+
+
+def test_hash_mismatch_is_rejected(sync_pair):
+    files = {f"dir/file{index}.txt": f"content {index}".encode() for index in range(3)}
+    write_files(sync_pair.client_root, files)
+    sync_pair.create_server()
+    client = sync_pair.create_client(compression_algorithms=[])
+    sock = sync_pair.connect()
+    try:
+        client.sync_time(sock)
+        files_to_sync = client.compare_manifest(sock)
+        # 对比之后文件又被修改：内容与请求中的哈希不一致
+        (sync_pair.client_root / "dir/file1.txt").write_bytes(b"content X")
+        client.sync_files(sock, files_to_sync)
+    finally:
+        sock.close()
+    assert set(sync_pair.server_records()) == {"dir/file0.txt", "dir/file2.txt"}
+
+
+def test_batched_acks(sync_pair):
+    # 多于一批确认的文件数，最后一批不满
+    files = {f"many/{index:04d}.txt": str(index).encode() for index in range(ACK_BATCH_SIZE * 2 + 5)}
+    write_files(sync_pair.client_root, files)
+    sync_pair.create_server()
+    client = sync_pair.create_client(protocol_version=2, compression_algorithms=[])
+    assert len(sync_pair.sync(client)) == len(files)
+    assert read_files(sync_pair.server_root) == files
+    assert len(sync_pair.server_records()) == len(files)
+
+
+def test_old_client_gets_protocol_1(sync_pair):
+    sync_pair.create_server()
+    sock = sync_pair.connect()
+    try:
+        # 旧客户端的请求不带协议版本
+        send_data(sock, json.dumps({"type": "file_sync", "files": []}))
+        reply = json.loads(receive_data(sock))
+        assert (reply["status"], reply["protocol_version"], reply["compression"]) == ("ready", 1, None)
+        assert json.loads(receive_data(sock)) == {"status": "sync_complete", "received_files": 0}
+    finally:
+        sock.close()
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+恢复：每个文件在时间范围内的备份版本查询（与逐条筛选的结果对比）、恢复到时间点和按目录恢复
+"""
+
+import random
+
+import pytest
+
+from restorer import FileRestorer
+from tests.conftest import read_files, write_files
+
+DAY = 86400
+T0 = 1_750_000_000.0
+
+
+@pytest.fixture
+def restorer(tmp_path):
+    (tmp_path / "data").mkdir()
+    (tmp_path / "sync").mkdir()
+    file_restorer = FileRestorer(sync_dir=tmp_path / "sync", data_dir=tmp_path / "data")
+    yield file_restorer
+    file_restorer.close()
+
+
+def _add_backup(restorer, path, backup_time, data=None, modified_time=None):
+    """添加一条备份记录，data 不为 None 时把内容存入备份存储"""
+    db = restorer.db
+    key = backup_path = None
+    if data is not None:
+        source = restorer.data_dir / "source"
+        source.write_bytes(data)
+        key, object_path, _ = restorer.backup_store.put(source)
+        backup_path = restorer.backup_store.relative_path(object_path)
+    size = len(data) if data is not None else 0
+    db.backup_file(path, backup_path or f"backups/{path}_{backup_time}", size,
+                   backup_time - DAY if modified_time is None else modified_time, key, key)
+    db.cursor.execute('UPDATE backup_files SET backup_time = ? WHERE id = ?', (backup_time, db.cursor.lastrowid))
+    db.conn.commit()
+
+
+def _reference_catalog(history, start_time, end_time, prefix, earliest):
+    """原来的做法：取出所有记录后逐条筛选"""
+    prefix = prefix.strip('/') if prefix else ''
+    selected = {}
+    for path, backup_time in history:
+        if start_time is not None and backup_time < start_time:
+            continue
+        if end_time is not None and backup_time > end_time:
+            continue
+        if prefix and path != prefix and not path.startswith(prefix + '/'):
+            continue
+        best = selected.get(path)
+        if best is None or (backup_time < best if earliest else backup_time > best):
+            selected[path] = backup_time
+    return sorted(selected.items())
+
+
+def test_catalog_matches_reference(restorer):
+    rng = random.Random(5)
+    paths = ["docs", "docs/a.txt", "docs/sub/b.txt", "docs2/c.txt", "docs-old/d.txt", "e.txt", "src/docs/f.txt"]
+    history = []
+    for _ in range(400):
+        path = rng.choice(paths)
+        backup_time = T0 + rng.randrange(30 * DAY)
+        if (path, backup_time) not in history:
+            history.append((path, backup_time))
+            _add_backup(restorer, path, backup_time)
+
+    for _ in range(200):
+        start_time = rng.choice([None, T0 + rng.randrange(30 * DAY)])
+        end_time = rng.choice([None, T0 + rng.randrange(30 * DAY)])
+        prefix = rng.choice([None, "docs", "docs/", "/docs/sub", "docs/a.txt", "src", "missing"])
+        earliest = rng.random() < 0.5
+        catalog = restorer.db.get_backup_catalog(start_time, end_time, prefix, earliest)
+        assert [(row['original_path'], row['backup_time']) for row in catalog] == \
+            _reference_catalog(history, start_time, end_time, prefix, earliest)
+
+
+def test_catalog_breaks_ties_by_id(restorer):
+    _add_backup(restorer, "a.txt", T0, b"first")
+    _add_backup(restorer, "a.txt", T0, b"second")
+    (latest,) = restorer.db.get_backup_catalog()
+    (earliest,) = restorer.db.get_backup_catalog(earliest=True)
+    assert (latest['size'], earliest['size']) == (len(b"second"), len(b"first"))
+
+
+@pytest.fixture
+def history(restorer):
+    """report.txt 在 T0+1天、T0+3天被覆盖，notes/plan.txt 在 T0+2天被覆盖，other.txt 从未被覆盖"""
+    _add_backup(restorer, "report.txt", T0 + DAY, b"report v1", T0)
+    _add_backup(restorer, "report.txt", T0 + 3 * DAY, b"report v2", T0 + 2 * DAY)
+    _add_backup(restorer, "notes/plan.txt", T0 + 2 * DAY, b"plan v1", T0)
+    current = {"report.txt": b"report v3", "notes/plan.txt": b"plan v2", "other.txt": b"other"}
+    write_files(restorer.sync_dir, current)
+    return current
+
+
+@pytest.mark.parametrize("as_of,expected", [
+    (T0, {"report.txt": b"report v1", "notes/plan.txt": b"plan v1"}),
+    (T0 + 2.5 * DAY, {"report.txt": b"report v2"}),
+    (T0 + 4 * DAY, {}),
+])
+def test_restore_to_time(restorer, history, as_of, expected):
+    assert restorer.restore_to_time(as_of, dry_run=True) == len(expected)
+    assert read_files(restorer.sync_dir) == history
+
+    assert restorer.restore_to_time(as_of) == len(expected)
+    assert read_files(restorer.sync_dir) == {**history, **expected}
+    records = {record['path']: record['size'] for record in restorer.db.get_all_files()}
+    assert records == {path: len(data) for path, data in expected.items()}
+    # 再次恢复时文件已是该版本，不再复制
+    assert restorer.restore_to_time(as_of) == len(expected)
+
+
+def test_restore_directory_only(restorer, history):
+    assert restorer.restore_to_time(T0, path_prefix="notes") == 1
+    assert read_files(restorer.sync_dir) == {**history, "notes/plan.txt": b"plan v1"}
+
+
+def test_restore_by_time_range(restorer, history):
+    # 范围内最新的备份
+    assert restorer.restore_files_by_time_range(T0, T0 + 2.5 * DAY) == 2
+    assert read_files(restorer.sync_dir) == {**history, "report.txt": b"report v1", "notes/plan.txt": b"plan v1"}
+    assert restorer.restore_files_by_time_range(T0 + 10 * DAY, T0 + 20 * DAY) == 0
+
+
+def test_restore_legacy_and_missing_backups(restorer):
+    legacy = restorer.backup_dir / "legacy.txt_20250521_120000"
+    legacy.write_bytes(b"legacy")
+    restorer.db.backup_file("legacy.txt", "backups/legacy.txt_20250521_120000", 6, T0)
+    # 备份内容已不存在的记录跳过
+    _add_backup(restorer, "gone.txt", T0 + DAY)
+    assert restorer.restore_to_time(T0 - DAY) == 1
+    assert read_files(restorer.sync_dir) == {"legacy.txt": b"legacy"}
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+目录扫描：增量更新、保留未变化文件的哈希、删除记录、排除目录不进入、无法读取的目录
+"""
+
+import os
+
+import pytest
+
+from database import FileDatabase
+from tests.conftest import write_files
+
+FILES = {
+    "a.txt": b"a",
+    "docs/b.txt": b"bb",
+    "docs/deep/c.txt": b"ccc",
+    "cache/skip.txt": b"x",
+    "cache/inner/skip2.txt": b"y",
+    "notes.log": b"log",
+}
+
+
+@pytest.fixture
+def db(tmp_path):
+    database = FileDatabase(tmp_path / "scan.db")
+    yield database
+    database.close()
+
+
+@pytest.fixture
+def root(tmp_path):
+    root = tmp_path / "root"
+    write_files(root, FILES)
+    return root
+
+
+def _files(db):
+    return {f['path']: (f['size'], f['hash']) for f in db.get_all_files()}
+
+
+def _deleted(db):
+    db.cursor.execute('SELECT path FROM deleted_files ORDER BY path')
+    return [row[0] for row in db.cursor.fetchall()]
+
+
+def _path(rel_path):
+    return rel_path.replace('/', os.sep)
+
+
+def test_incremental_scan(db, root):
+    assert db.scan_directory(root) == len(FILES)
+    assert set(_files(db)) == {_path(path) for path in FILES}
+
+    # 服务端已记录的哈希值在文件未变化时保留
+    db.cursor.execute('UPDATE files SET hash = ?', ("known",))
+    db.conn.commit()
+    (root / "docs/b.txt").write_bytes(b"changed")
+    (root / "a.txt").unlink()
+    write_files(root, {"new.txt": b"new"})
+
+    assert db.scan_directory(root) == len(FILES)
+    files = _files(db)
+    assert files[_path("docs/b.txt")] == (7, None)
+    assert files[_path("docs/deep/c.txt")] == (3, "known")
+    assert files["new.txt"] == (3, None)
+    assert "a.txt" not in files
+    assert _deleted(db) == ["a.txt"]
+
+
+def test_excluded_directories_are_not_entered(db, root):
+    checked = []
+
+    def exclude_file(rel_path):
+        checked.append(rel_path)
+        return rel_path.endswith(".log")
+
+    def exclude_directory(rel_path):
+        return rel_path == "cache"
+
+    assert db.scan_directory(root, exclude_file, exclude_directory) == 3
+    assert set(_files(db)) == {"a.txt", _path("docs/b.txt"), _path("docs/deep/c.txt")}
+    assert not any(path.startswith("cache") for path in checked)
+
+
+def test_newly_excluded_files_are_dropped(db, root):
+    db.scan_directory(root)
+    # 规则修改后被排除的文件直接移除，不记录为删除
+    db.scan_directory(root, lambda rel_path: rel_path.endswith(".log"), lambda rel_path: rel_path == "cache")
+    assert set(_files(db)) == {"a.txt", _path("docs/b.txt"), _path("docs/deep/c.txt")}
+    assert _deleted(db) == []
+
+
+def test_unreadable_directory_keeps_records(db, root, monkeypatch):
+    db.scan_directory(root)
+    scandir = os.scandir
+
+    def failing_scandir(path):
+        if os.path.basename(path) == "docs":
+            raise PermissionError("denied")
+        return scandir(path)
+
+    monkeypatch.setattr(os, "scandir", failing_scandir)
+    (root / "a.txt").unlink()
+    db.scan_directory(root)
+    files = _files(db)
+    assert _path("docs/b.txt") in files and _path("docs/deep/c.txt") in files
+    assert _deleted(db) == ["a.txt"]
+
+
+@pytest.mark.skipif(not hasattr(os, "symlink"), reason="不支持符号链接")
+def test_directory_symlinks_are_not_followed(db, root):
+    os.symlink(root / "docs", root / "link")
+    db.scan_directory(root)
+    assert not any(path.startswith("link") for path in _files(db))
+
+
+def test_missing_directory(db, tmp_path):
+    assert db.scan_directory(tmp_path / "missing") == 0
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+socket 收发：sendfile 和 recv_into 缓冲区、空文件、消息长度上限
+"""
+
+import io
+import json
+import socket
+import struct
+
+import pytest
+
+from config import MAX_MESSAGE_SIZE
+from tests.conftest import read_files, write_files
+from utils import receive_data, receive_exact, receive_to_file, send_data, send_file
+
+CONTENT = bytes(range(256)) * 1000
+
+
+@pytest.fixture
+def socket_pair():
+    left, right = socket.socketpair()
+    yield left, right
+    left.close()
+    right.close()
+
+
+def _file(tmp_path, data):
+    path = tmp_path / "data.bin"
+    path.write_bytes(data)
+    return path
+
+
+@pytest.mark.parametrize("as_bytes_io", [False, True])
+def test_send_file_from_current_position(tmp_path, socket_pair, as_bytes_io):
+    left, right = socket_pair
+    path = _file(tmp_path, CONTENT)
+    with (io.BytesIO(CONTENT) if as_bytes_io else open(path, 'rb')) as f:
+        f.seek(100)
+        # 普通文件用 sendfile，其他文件对象读入缓冲区发送
+        assert send_file(left, f, 5000) == 5000
+    assert receive_exact(right, 5000) == CONTENT[100:5100]
+
+
+def test_send_file_short_file(tmp_path, socket_pair):
+    left, right = socket_pair
+    with open(_file(tmp_path, b"abc"), 'rb') as f:
+        assert send_file(left, f, 10) == 3
+    assert right.recv(10) == b"abc"
+
+
+def test_send_empty_file(tmp_path, socket_pair):
+    left, right = socket_pair
+    with open(_file(tmp_path, b""), 'rb') as f:
+        assert send_file(left, f, 0) == 0
+    send_data(left, '{"status": "ok"}')
+    assert json.loads(receive_data(right)) == {"status": "ok"}
+
+
+def test_receive_to_file_with_small_buffer(socket_pair):
+    left, right = socket_pair
+    left.sendall(CONTENT[:10000])
+    out = io.BytesIO()
+    receive_to_file(right, 10000, out, buffer=memoryview(bytearray(333)))
+    assert out.getvalue() == CONTENT[:10000]
+
+
+def test_receive_to_file_connection_lost(socket_pair):
+    left, right = socket_pair
+    left.sendall(b"x" * 10)
+    left.close()
+    with pytest.raises(ConnectionError):
+        receive_to_file(right, 20, io.BytesIO())
+
+
+def test_oversized_message_closes_connection(socket_pair):
+    left, right = socket_pair
+    # 只发送长度前缀，不能按它分配缓冲区
+    left.sendall(struct.pack('!I', MAX_MESSAGE_SIZE + 1))
+    assert receive_data(right) == "{}"
+    assert right.recv(1) == b""
+
+
+def test_protocol_1_syncs_empty_files(sync_pair):
+    files = {"empty.txt": b"", "docs/note.txt": b"hello", "docs/empty.cfg": b""}
+    write_files(sync_pair.client_root, files)
+    sync_pair.create_server()
+    client = sync_pair.create_client(protocol_version=1)
+    assert len(sync_pair.sync(client)) == 3
+    assert read_files(sync_pair.server_root) == files
+    # 服务端已记录，再次同步没有需要发送的文件
+    assert sync_pair.sync(client) == []
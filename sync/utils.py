@@ -7,41 +7,134 @@
 包含通用工具函数
 """
 
-import hashlib
+import errno
+import io
 import json
+import os
+import shutil
 import socket
-from config import DEFAULT_BUFFER_SIZE, DEFAULT_ENCODING, logger
+import struct
+from compression import CompressionError, compress_message, decompress_message
+from config import (
+    DEFAULT_ENCODING, TRANSFER_BUFFER_SIZE, SOCKET_BUFFER_SIZE, TCP_NODELAY, USE_SENDFILE, USE_COPY_FILE_RANGE,
+    MAX_MESSAGE_SIZE, logger
+)
+from hashing import DEFAULT_HASH_ALGORITHM, hash_file
 
-def calculate_file_hash(file_path):
+# 流水线传输的文件记录头：文件序号（对应请求中 files 的下标）、内容长度
+RECORD_HEADER = struct.Struct('!IQ')
+# 记录流结束标记（作为文件序号）
+END_OF_RECORDS = 0xFFFFFFFF
+# 文件序号的最高位表示增量记录（协议版本3）
+DELTA_RECORD = 0x80000000
+# 文件序号的次高位表示内容为压缩帧（见 compression 模块，协商了压缩算法时使用）
+COMPRESSED_RECORD = 0x40000000
+# copy_file_range 不可用（跨文件系统、内核或文件系统不支持）时的错误码，改为普通复制
+_COPY_FILE_RANGE_UNSUPPORTED = {errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP, errno.EPERM}
+
+def calculate_file_hash(file_path, algorithm=DEFAULT_HASH_ALGORITHM):
     """计算文件哈希值
 
     Args:
         file_path: 文件路径
+        algorithm: 哈希算法，默认MD5
 
     Returns:
-        文件的MD5哈希值
+        文件的哈希值
+    """
+    return hash_file(file_path, algorithm)
+
+# 消息长度前缀
+MESSAGE_LENGTH = struct.Struct('!I')
+# 长度前缀的最高位表示消息内容经过 zlib 压缩（对方在时间同步时声明支持压缩后才使用）
+COMPRESSED_MESSAGE = 0x80000000
+
+def configure_socket(sock):
+    """按配置设置 socket 选项（TCP_NODELAY、发送和接收缓冲区），不支持的选项忽略
+
+    Args:
+        sock: socket对象
     """
-    hash_md5 = hashlib.md5()
-    with open(file_path, "rb") as f:
-        for chunk in iter(lambda: f.read(4096), b""):
-            hash_md5.update(chunk)
-    return hash_md5.hexdigest()
+    options = []
+    if TCP_NODELAY:
+        options.append((socket.IPPROTO_TCP, socket.TCP_NODELAY, 1))
+    if SOCKET_BUFFER_SIZE:
+        options.append((socket.SOL_SOCKET, socket.SO_SNDBUF, SOCKET_BUFFER_SIZE))
+        options.append((socket.SOL_SOCKET, socket.SO_RCVBUF, SOCKET_BUFFER_SIZE))
+    for level, option, value in options:
+        try:
+            sock.setsockopt(level, option, value)
+        except OSError as e:
+            logger.debug(f"设置socket选项失败: {option}, 错误: {str(e)}")
 
-def send_data(sock, data):
-    """发送数据
+def send_data(sock, data, compress=False):
+    """发送数据（4字节长度前缀 + 内容，一次发送）
 
     Args:
         sock: socket对象
         data: 要发送的数据
+        compress: 对方支持时传入True，较大的消息压缩后发送
+    """
+    sock.sendall(pack_message(data, compress))
+
+def pack_message(data, compress=False):
+    """编码一条消息：长度前缀 + 内容，compress 为True且压缩有效时内容为压缩数据
+
+    Args:
+        data: 消息字符串
+        compress: 是否尝试压缩
+
+    Returns:
+        要发送的字节串
     """
     data_bytes = data.encode(DEFAULT_ENCODING)
-    length = len(data_bytes)
+    packed = compress_message(data_bytes) if compress else None
+    if packed is not None:
+        return MESSAGE_LENGTH.pack(len(packed) | COMPRESSED_MESSAGE) + packed
+    return MESSAGE_LENGTH.pack(len(data_bytes)) + data_bytes
+
+def unpack_message(length_field, data):
+    """解码一条消息的内容
+
+    Args:
+        length_field: 长度前缀的值（含压缩标志）
+        data: 消息内容
+
+    Returns:
+        消息字符串
 
-    # 发送数据长度
-    sock.sendall(length.to_bytes(4, byteorder='big'))
+    Raises:
+        CompressionError: 压缩数据无效
+    """
+    if length_field & COMPRESSED_MESSAGE:
+        data = decompress_message(data)
+    return data.decode(DEFAULT_ENCODING)
 
-    # 发送数据
-    sock.sendall(data_bytes)
+def _receive_into(sock, view):
+    """把数据接收到 view 中直到填满
+
+    Returns:
+        实际接收的字节数，小于 view 长度说明连接已关闭
+    """
+    received = 0
+    size = len(view)
+    while received < size:
+        count = sock.recv_into(view[received:])
+        if not count:
+            break
+        received += count
+    return received
+
+def close_connection(sock):
+    """关闭连接的收发两端，之后对方和本端的读取都会立即得到连接关闭
+
+    Args:
+        sock: socket对象
+    """
+    try:
+        sock.shutdown(socket.SHUT_RDWR)
+    except OSError:
+        pass  # 连接已断开
 
 def receive_data(sock):
     """接收数据
@@ -53,26 +146,183 @@ def receive_data(sock):
         接收到的数据，如果连接关闭则返回空JSON字符串
     """
     # 接收数据长度
-    length_data = sock.recv(4)
-    if not length_data:
-        logger.warning("接收数据时连接已关闭")
+    header = bytearray(MESSAGE_LENGTH.size)
+    received = _receive_into(sock, memoryview(header))
+    if received < MESSAGE_LENGTH.size:
+        if received:
+            logger.warning("接收数据时连接中断")
+        else:
+            logger.warning("接收数据时连接已关闭")
         return "{}"  # 返回空JSON对象字符串，而不是None
 
-    length = int.from_bytes(length_data, byteorder='big')
+    length_field, = MESSAGE_LENGTH.unpack(header)
+    length = length_field & ~COMPRESSED_MESSAGE
+    if length > MAX_MESSAGE_SIZE:
+        # 长度前缀来自对方，不能按它分配缓冲区；后续数据已无法定位消息边界，直接断开
+        logger.warning(f"消息过大: {length} 字节，断开连接")
+        close_connection(sock)
+        return "{}"
 
-    # 接收数据
-    data = b''
-    while len(data) < length:
-        chunk = sock.recv(min(DEFAULT_BUFFER_SIZE, length - len(data)))
-        if not chunk:
-            logger.warning("接收数据时连接中断")
-            break
-        data += chunk
+    # 接收数据，直接写入预先分配的缓冲区
+    data = bytearray(length)
+    received = _receive_into(sock, memoryview(data))
+    if received < length:
+        logger.warning("接收数据时连接中断")
+        del data[received:]
 
     if not data:
         return "{}"  # 如果没有接收到数据，返回空JSON对象字符串
 
-    return data.decode(DEFAULT_ENCODING)
+    try:
+        return unpack_message(length_field, data)
+    except CompressionError as e:
+        logger.error(str(e))
+        return "{}"
+
+def receive_exact(sock, size):
+    """接收指定长度的二进制数据
+
+    Args:
+        sock: socket对象
+        size: 数据长度
+
+    Returns:
+        接收到的数据，连接中断时返回None
+    """
+    buffer = bytearray(size)
+    if _receive_into(sock, memoryview(buffer)) < size:
+        logger.warning("接收数据时连接中断")
+        return None
+    return bytes(buffer)
+
+def send_file(sock, f, count, buffer=None):
+    """从文件当前位置发送 count 字节
+
+    普通文件用 socket.sendfile（由内核直接从页缓存发送），其他文件对象读入缓冲区发送。
+
+    Args:
+        sock: socket对象
+        f: 以二进制读方式打开的文件对象
+        count: 发送的字节数
+        buffer: 可复用的缓冲区（memoryview），默认按需分配
+
+    Returns:
+        实际发送的字节数，文件比 count 短时小于 count
+    """
+    if count <= 0:
+        # socket.sendfile 的 count 为 0 时抛出 ValueError（空文件）
+        return 0
+
+    if USE_SENDFILE and isinstance(f, (io.BufferedReader, io.FileIO)):
+        return sock.sendfile(f, f.tell(), count)
+
+    if not hasattr(f, 'readinto'):
+        # 如 Python 3.11 之前的 SpooledTemporaryFile
+        sent = 0
+        while sent < count:
+            chunk = f.read(min(TRANSFER_BUFFER_SIZE, count - sent))
+            if not chunk:
+                break
+            sock.sendall(chunk)
+            sent += len(chunk)
+        return sent
+
+    if buffer is None:
+        buffer = memoryview(bytearray(min(count, TRANSFER_BUFFER_SIZE) or 1))
+    sent = 0
+    while sent < count:
+        n = f.readinto(buffer[:min(len(buffer), count - sent)])
+        if not n:
+            break
+        sock.sendall(buffer[:n])
+        sent += n
+    return sent
+
+def receive_to_file(source, size, out=None, hasher=None, buffer=None):
+    """接收 size 字节写入文件，同时计算哈希
+
+    无论是否写入都会读完 size 字节，保证后续数据的边界正确。
+
+    Args:
+        source: socket对象，或 socket.makefile('rb') 返回的缓冲读取对象
+        size: 字节数
+        out: 写入的文件对象，None 表示丢弃
+        hasher: 哈希对象，None 表示不计算
+        buffer: 可复用的缓冲区（memoryview），默认按需分配
+
+    Raises:
+        ConnectionError: 连接中断
+    """
+    if buffer is None:
+        buffer = memoryview(bytearray(min(size, TRANSFER_BUFFER_SIZE) or 1))
+    read_into = source.recv_into if isinstance(source, socket.socket) else source.readinto
+    remaining = size
+    while remaining > 0:
+        n = read_into(buffer[:min(len(buffer), remaining)])
+        if not n:
+            raise ConnectionError("接收文件内容时连接中断")
+        remaining -= n
+        chunk = buffer[:n]
+        if hasher is not None:
+            hasher.update(chunk)
+        if out is not None:
+            out.write(chunk)
+
+def copy_file(src_path, dst_path):
+    """复制文件内容（不复制修改时间等元数据）
+
+    Linux 上用 os.copy_file_range 在内核中复制，btrfs、XFS 等文件系统直接共享数据块（reflink），
+    不支持时（跨文件系统、旧内核等）改为 shutil.copyfile。
+
+    Args:
+        src_path: 源文件路径
+        dst_path: 目标文件路径
+
+    Returns:
+        复制的字节数
+    """
+    if USE_COPY_FILE_RANGE and hasattr(os, 'copy_file_range'):
+        with open(src_path, 'rb') as src, open(dst_path, 'wb') as dst:
+            size = os.fstat(src.fileno()).st_size
+            copied = 0
+            try:
+                while copied < size:
+                    n = os.copy_file_range(src.fileno(), dst.fileno(), size - copied)
+                    if not n:
+                        break
+                    copied += n
+                return copied
+            except OSError as e:
+                if copied or e.errno not in _COPY_FILE_RANGE_UNSUPPORTED:
+                    raise
+    shutil.copyfile(src_path, dst_path)
+    return os.path.getsize(dst_path)
+
+def send_record_header(sock, index, size, payload=b''):
+    """发送文件记录头，小文件可以连同内容一起发送
+
+    Args:
+        sock: socket对象
+        index: 文件序号，END_OF_RECORDS 表示记录流结束
+        size: 文件内容长度
+        payload: 紧跟在记录头后面发送的内容
+    """
+    sock.sendall(RECORD_HEADER.pack(index, size) + payload)
+
+def receive_record_header(stream):
+    """接收文件记录头
+
+    Args:
+        stream: socket.makefile('rb') 返回的缓冲读取对象
+
+    Returns:
+        (文件序号, 内容长度)，连接关闭时返回None
+    """
+    header = stream.read(RECORD_HEADER.size)
+    if len(header) < RECORD_HEADER.size:
+        logger.warning("接收文件记录时连接中断")
+        return None
+    return RECORD_HEADER.unpack(header)
 
 def parse_json_response(response_data):
     """解析JSON响应数据